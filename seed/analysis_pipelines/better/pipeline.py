@@ -6,13 +6,16 @@ See also https://github.com/seed-platform/seed/main/LICENSE.md
 """
 import copy
 import logging
-from datetime import timedelta
+from collections import defaultdict
+from datetime import datetime, timedelta
 
 import dateutil.parser
 from celery import chain, shared_task
 from django.core.files.base import ContentFile
 from django.db.models import Count
+from pytz import timezone
 
+from config.settings.common import TIME_ZONE
 from seed.analysis_pipelines.better.buildingsync import (
     SEED_TO_BSYNC_RESOURCE_TYPE,
     _build_better_input
@@ -29,6 +32,7 @@ from seed.analysis_pipelines.better.helpers import (
     _store_better_portfolio_analysis_results,
     _store_better_portfolio_building_analysis_results
 )
+from seed.analysis_pipelines.calendarize import SECONDS_IN_A_DAY
 from seed.analysis_pipelines.pipeline import (
     AnalysisPipeline,
     AnalysisPipelineException,
@@ -37,7 +41,8 @@ from seed.analysis_pipelines.pipeline import (
     task_create_analysis_property_views
 )
 from seed.analysis_pipelines.utils import (
-    calendarize_and_extrapolate_meter_readings,
+    SimpleMeterReading,
+    calendarize_and_extrapolate_meter_readings_batch,
     get_json_path
 )
 from seed.models import (
@@ -47,7 +52,9 @@ from seed.models import (
     AnalysisPropertyView,
     Column,
     Cycle,
-    Meter
+    Meter,
+    MeterReading,
+    MeterReadingRollup
 )
 
 logger = logging.getLogger(__name__)
@@ -182,21 +189,21 @@ def get_meter_readings(property_id, preprocess_meters, config):
             f'Analysis configuration error: invalid dates selected for meter readings: {err}')
 
     if preprocess_meters:
+        if config.get('select_meters') == 'date_range':
+            # the readings of all the meters are loaded with one query and calendarized at once
+            meter_readings = MeterReading.objects.filter(meter__in=meters, start_time__range=[value1, value2])
+            readings_by_meter_id = defaultdict(list)
+            for meter_id, start_time, end_time, reading in meter_readings.values_list('meter_id', 'start_time', 'end_time', 'reading'):
+                readings_by_meter_id[meter_id].append(SimpleMeterReading(start_time, end_time, reading))
+            monthly_readings_by_meter_id = calendarize_and_extrapolate_meter_readings_batch(readings_by_meter_id)
+        else:
+            monthly_readings_by_meter_id = _extrapolated_monthly_rollups(meters)
+
         for meter in meters:
-            if config.get('select_meters') == 'date_range':
-                try:
-                    meter_readings = meter.meter_readings.filter(start_time__range=[value1, value2])
-                except Exception as err:
-                    logger.error(f"!!! Error retrieving meter readings: {err}")
-                    # continue but analysis will fail
-                    continue
-            else:
-                meter_readings = meter.meter_readings
-            if meter_readings.count() == 0:
+            if not monthly_readings_by_meter_id.get(meter.id):
                 continue
-            monthly_readings = calendarize_and_extrapolate_meter_readings(meter_readings.all())
             # filtering on readings >= 1.0 b/c BETTER flails when readings are less than 1 currently
-            monthly_readings = [reading for reading in monthly_readings if reading.reading >= 1.0]
+            monthly_readings = [reading for reading in monthly_readings_by_meter_id[meter.id] if reading.reading >= 1.0]
             if len(monthly_readings) >= 12:
                 selected_meters_and_readings.append({
                     'meter_type': meter.type,
@@ -233,6 +240,35 @@ def get_meter_readings(property_id, preprocess_meters, config):
     return selected_meters_and_readings
 
 
+def _extrapolated_monthly_rollups(meters):
+    """Estimate the usage of each meter in each calendar month from the monthly rollups of its
+    readings, by extrapolating the average usage per second over the month covered by the
+    readings to the whole month
+
+    :param meters: QuerySet[Meter]
+    :returns: dict[int:list[SimpleMeterReading]], the monthly readings of each meter id, in order
+    """
+    tz = timezone(TIME_ZONE)
+    monthly_readings_by_meter_id = defaultdict(list)
+    rollups = (
+        MeterReadingRollup.objects
+        .filter(meter__in=meters, interval=MeterReadingRollup.MONTH, seconds__gt=0)
+        .order_by('meter_id', 'period_start')
+        .values_list('meter_id', 'period_start', 'reading', 'seconds')
+    )
+    for meter_id, period_start, reading, seconds in rollups:
+        local_start = period_start.astimezone(tz)
+        start_time = datetime(local_start.year, local_start.month, 1)
+        end_time = datetime(local_start.year + 1, 1, 1) if local_start.month == 12 else datetime(local_start.year, local_start.month + 1, 1)
+        # the days of the month rather than its local seconds, which are off by an hour in the months of DST changes
+        month_seconds = (end_time - start_time).days * SECONDS_IN_A_DAY
+        monthly_readings_by_meter_id[meter_id].append(
+            SimpleMeterReading(start_time, end_time, reading / seconds * month_seconds)
+        )
+
+    return monthly_readings_by_meter_id
+
+
 @shared_task(bind=True)
 @analysis_pipeline_task(Analysis.CREATING)
 def _prepare_all_properties(self, analysis_view_ids_by_property_view_id, analysis_id):
@@ -0,0 +1,167 @@
+# !/usr/bin/env python
+# encoding: utf-8
+"""
+SEED Platform (TM), Copyright (c) Alliance for Sustainable Energy, LLC, and other contributors.
+See also https://github.com/seed-platform/seed/main/LICENSE.md
+
+Calendarization of meter readings with NumPy. The readings are given as arrays of their start
+times, end times and values (and optionally of the meter, or any other group, of each reading),
+and are split into calendar months and aggregated by month with vectorized operations.
+
+Times are datetime64[s] without a timezone: the wall clock time of the readings in the timezone
+they are given in, like the helpers of seed.analysis_pipelines.utils have always used.
+"""
+from collections import namedtuple
+
+import numpy as np
+
+SECONDS_IN_A_DAY = 86400
+
+# the part of each reading within each calendar month it covers
+MonthlySplit = namedtuple('MonthlySplit', ['reading_indexes', 'months', 'starts', 'ends', 'seconds', 'values'])
+
+
+def to_datetime64(datetimes):
+    """
+    :param datetimes: iterable of datetime.datetime, aware or naive
+    :return: np.array of datetime64[s], the wall clock times to the second
+    """
+    return np.array(
+        [value.replace(tzinfo=None, microsecond=0) for value in datetimes],
+        dtype='datetime64[s]',
+    ).reshape(-1)
+
+
+def to_datetimes(values):
+    """
+    :param values: np.array of datetime64
+    :return: list of naive datetime.datetime
+    """
+    return values.astype('datetime64[s]').tolist()
+
+
+def reading_arrays(meter_readings):
+    """Arrays of the start times, end times and values of readings
+
+    :param meter_readings: Iterable[SimpleMeterReading | MeterReading]
+    :return: tuple, (starts, ends, values), a missing value is NaN
+    """
+    meter_readings = list(meter_readings)
+    starts = to_datetime64(reading.start_time for reading in meter_readings)
+    ends = to_datetime64(reading.end_time for reading in meter_readings)
+    values = np.array(
+        [np.nan if reading.reading is None else reading.reading for reading in meter_readings],
+        dtype=np.float64,
+    )
+    return starts, ends, values
+
+
+def split_by_month(starts, ends, values):
+    """Split the readings at the start of each calendar month. The value of each part is the
+    value of the reading times the fraction of the reading time within the month. A reading
+    which ends at the start of a month has no part in that month.
+
+    :param starts: np.array of datetime64[s]
+    :param ends: np.array of datetime64[s]
+    :param values: np.array of float
+    :return: MonthlySplit, the parts ordered by reading then by month
+    """
+    first_months = starts.astype('datetime64[M]')
+    month_counts = np.maximum((ends.astype('datetime64[M]') - first_months).astype(np.int64) + 1, 0)
+    reading_indexes = np.repeat(np.arange(len(starts)), month_counts)
+    month_offsets = np.arange(len(reading_indexes)) - np.repeat(np.cumsum(month_counts) - month_counts, month_counts)
+    months = first_months[reading_indexes] + month_offsets
+
+    part_starts = np.maximum(months.astype('datetime64[s]'), starts[reading_indexes])
+    part_ends = np.minimum((months + 1).astype('datetime64[s]'), ends[reading_indexes])
+    seconds = (part_ends - part_starts).astype(np.float64)
+
+    covered = seconds != 0
+    reading_indexes, months, part_starts, part_ends, seconds = (
+        reading_indexes[covered], months[covered], part_starts[covered], part_ends[covered], seconds[covered]
+    )
+    durations = (ends - starts).astype(np.float64)[reading_indexes]
+    part_values = seconds / durations * values[reading_indexes]
+
+    return MonthlySplit(reading_indexes, months, part_starts, part_ends, seconds, part_values)
+
+
+def _group_months(groups, months):
+    """Unique (group, month) pairs, sorted, and the pair of each item"""
+    pairs = np.stack([groups, months.astype(np.int64)], axis=1).reshape(-1, 2)
+    unique_pairs, inverse = np.unique(pairs, axis=0, return_inverse=True)
+    return unique_pairs[:, 0], unique_pairs[:, 1].astype('datetime64[M]'), inverse.reshape(-1)
+
+
+def _group_indexes(count, groups):
+    if groups is None:
+        return np.zeros(count, dtype=np.int64)
+    return np.asarray(groups, dtype=np.int64).reshape(-1)
+
+
+def calendarize(starts, ends, values, groups=None):
+    """Total of the readings of each group in each calendar month the readings cover. The
+    parts of the readings are summed in the order of the start times of the readings.
+
+    :param starts: np.array of datetime64[s]
+    :param ends: np.array of datetime64[s]
+    :param values: np.array of float
+    :param groups: np.array of int, optional, group index of each reading, e.g. the meter
+    :return: tuple, (groups, months, totals), np.arrays sorted by group then month
+    """
+    order = np.argsort(starts, kind='stable')
+    starts, ends, values = starts[order], ends[order], values[order]
+    groups = _group_indexes(len(order), groups)[order]
+
+    split = split_by_month(starts, ends, values)
+    month_groups, months, inverse = _group_months(groups[split.reading_indexes], split.months)
+    totals = np.bincount(inverse, weights=split.values, minlength=len(months))
+    return month_groups, months, totals
+
+
+def calendarize_and_extrapolate(starts, ends, values, groups=None, coverage_threshold=0.0):
+    """Estimated total of the readings of each group in each calendar month, from the average
+    value per second of the readings within the month. The readings of a group must not overlap.
+
+    :param starts: np.array of datetime64[s]
+    :param ends: np.array of datetime64[s]
+    :param values: np.array of float
+    :param groups: np.array of int, optional, group index of each reading, e.g. the meter
+    :param coverage_threshold: float, fraction of a month that must be covered by the readings
+        of a group for the month to be included
+    :return: tuple, (groups, months, estimates), np.arrays sorted by group then month
+    """
+    groups = _group_indexes(len(starts), groups)
+
+    split = split_by_month(starts, ends, values)
+    month_groups, months, inverse = _group_months(groups[split.reading_indexes], split.months)
+    total_values = np.bincount(inverse, weights=split.values, minlength=len(months))
+    total_seconds = np.bincount(inverse, weights=split.seconds, minlength=len(months))
+
+    days_in_months = ((months + 1).astype('datetime64[D]') - months.astype('datetime64[D]')).astype(np.int64)
+    seconds_in_months = days_in_months * SECONDS_IN_A_DAY
+    included = total_seconds / seconds_in_months >= coverage_threshold
+
+    estimates = total_values[included] / total_seconds[included] * seconds_in_months[included]
+    return month_groups[included], months[included], estimates
+
+
+def count_days_covered(starts, ends):
+    """Number of distinct days touched by the readings, counting the days of both the start and
+    the end of each reading
+
+    :param starts: np.array of datetime64[s]
+    :param ends: np.array of datetime64[s]
+    :return: int
+    """
+    if len(starts) == 0:
+        return 0
+    first_days = starts.astype('datetime64[D]').astype(np.int64)
+    last_days = ends.astype('datetime64[D]').astype(np.int64)
+    order = np.argsort(first_days, kind='stable')
+    first_days, last_days = first_days[order], last_days[order]
+
+    # only the days after the last day of all the previous readings are new
+    previous_last_days = np.concatenate([[np.iinfo(np.int64).min + 1], np.maximum.accumulate(last_days)[:-1]])
+    new_first_days = np.maximum(first_days, previous_last_days + 1)
+    return int(np.clip(last_days - new_first_days + 1, 0, None).sum())
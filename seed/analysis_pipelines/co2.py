@@ -9,16 +9,17 @@ import logging
 
 from celery import chain, shared_task
 
+from seed.analysis_pipelines.calendarize import (
+    count_days_covered,
+    reading_arrays
+)
 from seed.analysis_pipelines.pipeline import (
     AnalysisPipeline,
     AnalysisPipelineException,
     analysis_pipeline_task,
     task_create_analysis_property_views
 )
-from seed.analysis_pipelines.utils import (
-    SimpleMeterReading,
-    get_days_in_reading
-)
+from seed.analysis_pipelines.utils import SimpleMeterReading
 from seed.models import (
     Analysis,
     AnalysisMessage,
@@ -246,7 +247,6 @@ def _calculate_co2(meter_readings, region_code):
     """
     total_reading = 0
     total_average = 0
-    days_affected_by_readings = set()
     for meter_reading in meter_readings:
         reading_mwh = meter_reading.reading / 3.412 / 1000  # convert from kBtu to MWh
         total_reading += reading_mwh
@@ -255,9 +255,9 @@ def _calculate_co2(meter_readings, region_code):
         if rate is None:
             raise Exception(f'Failed to find CO2 rate for {region_code} in {year}')
         total_average += (reading_mwh * rate)
-        for day in get_days_in_reading(meter_reading):
-            days_affected_by_readings.add(day)
-    total_seconds_covered = len(days_affected_by_readings) * datetime.timedelta(days=1).total_seconds()
+
+    starts, ends, _ = reading_arrays(meter_readings)
+    total_seconds_covered = count_days_covered(starts, ends) * datetime.timedelta(days=1).total_seconds()
     fraction_of_time_covered = total_seconds_covered / TIME_PERIOD.total_seconds()
     return {
         'average_annual_kgco2e': round(total_average),
@@ -9,16 +9,17 @@ import logging
 
 from celery import chain, shared_task
 
+from seed.analysis_pipelines.calendarize import (
+    count_days_covered,
+    reading_arrays
+)
 from seed.analysis_pipelines.pipeline import (
     AnalysisPipeline,
     AnalysisPipelineException,
     analysis_pipeline_task,
     task_create_analysis_property_views
 )
-from seed.analysis_pipelines.utils import (
-    SimpleMeterReading,
-    get_days_in_reading
-)
+from seed.analysis_pipelines.utils import SimpleMeterReading
 from seed.models import (
     Analysis,
     AnalysisMessage,
@@ -131,13 +132,11 @@ def _calculate_eui(meter_readings, gross_floor_area):
         }
     """
     total_reading = 0
-    days_affected_by_readings = set()
     for meter_reading in meter_readings:
         total_reading += meter_reading.reading
-        for day in get_days_in_reading(meter_reading):
-            days_affected_by_readings.add(day)
 
-    total_seconds_covered = len(days_affected_by_readings) * datetime.timedelta(days=1).total_seconds()
+    starts, ends, _ = reading_arrays(meter_readings)
+    total_seconds_covered = count_days_covered(starts, ends) * datetime.timedelta(days=1).total_seconds()
     fraction_of_time_covered = total_seconds_covered / TIME_PERIOD.total_seconds()
     return {
         'eui': round(total_reading / gross_floor_area, 2),
@@ -2,12 +2,19 @@
 SEED Platform (TM), Copyright (c) Alliance for Sustainable Energy, LLC, and other contributors.
 See also https://github.com/seed-platform/seed/main/LICENSE.md
 """
-import datetime
-from calendar import monthrange
-from collections import defaultdict, namedtuple
+from collections import namedtuple
 from statistics import mean, pstdev
 
-from dateutil import relativedelta
+import numpy as np
+
+from seed.analysis_pipelines.calendarize import (
+    calendarize,
+    calendarize_and_extrapolate,
+    reading_arrays,
+    split_by_month,
+    to_datetime64,
+    to_datetimes
+)
 
 
 def get_json_path(json_path, data):
@@ -73,71 +80,42 @@ def _split_reading(meter_reading, snap_intervals=True):
     :param snap_intervals: bool
     :return: List[SimpleMeterReading], in sorted order by start_date
     """
-    reading_unaware_start_time = datetime.datetime(
-        meter_reading.start_time.year,
-        meter_reading.start_time.month,
-        meter_reading.start_time.day,
-        meter_reading.start_time.hour,
-        meter_reading.start_time.minute,
-        meter_reading.start_time.second,
-    )
-    reading_unaware_end_time = datetime.datetime(
-        meter_reading.end_time.year,
-        meter_reading.end_time.month,
-        meter_reading.end_time.day,
-        meter_reading.end_time.hour,
-        meter_reading.end_time.minute,
-        meter_reading.end_time.second,
-    )
+    split = split_by_month(*reading_arrays([meter_reading]))
+    if snap_intervals:
+        starts, ends = split.months, split.months + 1
+    else:
+        # the parts are within the reading, so only the first and last parts aren't on month starts
+        starts, ends = split.starts, split.ends
+
+    return [
+        SimpleMeterReading(start_time, end_time, reading)
+        for start_time, end_time, reading in zip(to_datetimes(starts), to_datetimes(ends), split.values.tolist())
+    ]
+
+
+def _monthly_readings(months, values):
+    return [
+        SimpleMeterReading(start_time, end_time, reading)
+        for start_time, end_time, reading in zip(to_datetimes(months), to_datetimes(months + 1), values.tolist())
+    ]
+
 
-    reading_first_month = datetime.datetime(meter_reading.start_time.year, meter_reading.start_time.month, 1)
-    reading_last_month = datetime.datetime(meter_reading.end_time.year, meter_reading.end_time.month, 1)
-    last_month_affected = reading_last_month + relativedelta.relativedelta(months=1)
-
-    # collect all consecutive months this reading "touches"
-    current_month = reading_first_month
-    months_affected = []
-    while current_month < last_month_affected:
-        next_month = current_month + relativedelta.relativedelta(months=1)
-        months_affected.append((current_month, next_month))
-        current_month = next_month
-
-    # For each month this reading affects create a new "reading" for that month
-    split_readings = []
-    meter_reading_delta = reading_unaware_end_time - reading_unaware_start_time
-    for idx, (month_start, month_end) in enumerate(months_affected):
-        # estimate the reading value for this month by calculating
-        # the fraction of the original reading this month covers and multiplying
-        # the "total" (i.e., original) reading by that fraction
-        overlap_start = max(month_start, reading_unaware_start_time)
-        overlap_end = min(month_end, reading_unaware_end_time)
-        # overlap_delta is essentially the union of time covered by this month and
-        # the time covered by the original reading
-        overlap_delta = overlap_end - overlap_start
-
-        if overlap_delta.total_seconds() == 0:
-            # there can be no overlap if we are given a reading which ends
-            # on the first of a month and we're creating a reading for that month
-            # it ends on.
-            assert idx == len(months_affected) - 1, 'This should not occur, our assumptions were invalid. Please revisit this.'
-            continue
-
-        fraction_of_reading_time = overlap_delta.total_seconds() / meter_reading_delta.total_seconds()
-        month_reading = fraction_of_reading_time * meter_reading.reading
-
-        # determine the start/end time we should report for this reading
-        reported_start_time, reported_end_time = month_start, month_end
-        if not snap_intervals:
-            if idx == 0:
-                # this is the first month included, use the original start time
-                reported_start_time = reading_unaware_start_time
-            if idx == len(months_affected) - 1:
-                # this is the last month included, use the original end time
-                reported_end_time = reading_unaware_end_time
-
-        split_readings.append(SimpleMeterReading(reported_start_time, reported_end_time, month_reading))
-
-    return split_readings
+def _batch_arrays(meter_readings_by_key):
+    """Arrays of the readings of all the keys, and the index of the key of each reading"""
+    keys = list(meter_readings_by_key.keys())
+    all_meter_readings, groups = [], []
+    for index, key in enumerate(keys):
+        meter_readings = list(meter_readings_by_key[key])
+        all_meter_readings += meter_readings
+        groups += [index] * len(meter_readings)
+    return keys, reading_arrays(all_meter_readings), np.array(groups, dtype=np.int64)
+
+
+def _monthly_readings_by_key(keys, groups, months, values):
+    monthly_readings_by_key = {key: [] for key in keys}
+    for group, start_time, end_time, reading in zip(groups.tolist(), to_datetimes(months), to_datetimes(months + 1), values.tolist()):
+        monthly_readings_by_key[keys[group]].append(SimpleMeterReading(start_time, end_time, reading))
+    return monthly_readings_by_key
 
 
 def calendarize_meter_readings(meter_readings):
@@ -149,27 +127,8 @@ def calendarize_meter_readings(meter_readings):
     :param: meter_readings, Iterable[SimpleMeterReading | MeterReading]
     :return: List[SimpleMeterReading]
     """
-    all_meter_readings = sorted(meter_readings, key=lambda reading: reading.start_time)
-    aggregated_readings_by_start_time = defaultdict(lambda: 0)
-    for meter_reading in all_meter_readings:
-        sr = _split_reading(meter_reading)
-        for monthly_reading in sr:
-            aggregated_readings_by_start_time[monthly_reading.start_time] += monthly_reading.reading
-
-    aggregated_readings_list = []
-    for start_time, reading in aggregated_readings_by_start_time.items():
-        aggregated_readings_list.append(
-            SimpleMeterReading(
-                start_time,
-                start_time + relativedelta.relativedelta(months=1),
-                reading
-            )
-        )
-
-    return aggregated_readings_list
-
-
-SECONDS_IN_A_DAY = 86400
+    _, months, totals = calendarize(*reading_arrays(meter_readings))
+    return _monthly_readings(months, totals)
 
 
 def calendarize_and_extrapolate_meter_readings(meter_readings, coverage_threshold=0.0):
@@ -188,49 +147,39 @@ def calendarize_and_extrapolate_meter_readings(meter_readings, coverage_threshol
         by the readings to be included.
     :return: List[SimpleMeterReading]
     """
-    split_meter_readings = []
-    for meter_reading in meter_readings:
-        # set snap_intervals to False so we can preserve the number of seconds
-        # in each split up reading
-        for split_reading in _split_reading(meter_reading, snap_intervals=False):
-            split_meter_readings.append(split_reading)
-
-    totals_by_month = defaultdict(lambda: {'total_usage': 0, 'total_seconds': 0})
-    for meter_reading in split_meter_readings:
-        start = meter_reading.start_time
-        month_start = datetime.datetime(start.year, start.month, 1)
-        totals_by_month[month_start]['total_usage'] += meter_reading.reading
-        totals_by_month[month_start]['total_seconds'] += (
-            meter_reading.end_time - meter_reading.start_time
-        ).total_seconds()
-
-    # calculate estimated total usage for each month
-    estimated_monthly_readings = []
-    for month_start, totals in totals_by_month.items():
-        (_, days_in_month) = monthrange(month_start.year, month_start.month)
-        seconds_in_month = days_in_month * SECONDS_IN_A_DAY
-
-        # WARNING: this bit assumes we have non-overlapping readings! Otherwise
-        # the fraction of month cannot be determined by "total seconds" of readings
-        # in the month!
-        fraction_of_month_covered = totals['total_seconds'] / seconds_in_month
-        if fraction_of_month_covered < coverage_threshold:
-            # we don't have enough data, skip this month
-            continue
-
-        average_usage_per_second = totals['total_usage'] / totals['total_seconds']
-
-        estimated_monthly_reading = average_usage_per_second * seconds_in_month
-        estimated_monthly_readings.append(
-            SimpleMeterReading(
-                month_start,
-                month_start + relativedelta.relativedelta(months=1),
-                estimated_monthly_reading
-            )
-        )
+    _, months, estimates = calendarize_and_extrapolate(
+        *reading_arrays(meter_readings),
+        coverage_threshold=coverage_threshold
+    )
+    return _monthly_readings(months, estimates)
 
-    estimated_monthly_readings.sort(key=lambda reading: reading.start_time)
-    return estimated_monthly_readings
+
+def calendarize_meter_readings_batch(meter_readings_by_key):
+    """calendarize_meter_readings for many sets of readings (e.g., the readings of
+    each property of an analysis) at once
+
+    :param meter_readings_by_key: dict, key to Iterable[SimpleMeterReading | MeterReading]
+    :return: dict, key to List[SimpleMeterReading]
+    """
+    keys, arrays, groups = _batch_arrays(meter_readings_by_key)
+    return _monthly_readings_by_key(keys, *calendarize(*arrays, groups=groups))
+
+
+def calendarize_and_extrapolate_meter_readings_batch(meter_readings_by_key, coverage_threshold=0.0):
+    """calendarize_and_extrapolate_meter_readings for many sets of readings (e.g., the
+    readings of each meter of an analysis) at once
+
+    :param meter_readings_by_key: dict, key to Iterable[SimpleMeterReading | MeterReading],
+        the readings of each key must not overlap
+    :param coverage_threshold: float, fraction of a month that must be covered
+        by the readings to be included.
+    :return: dict, key to List[SimpleMeterReading]
+    """
+    keys, arrays, groups = _batch_arrays(meter_readings_by_key)
+    return _monthly_readings_by_key(
+        keys,
+        *calendarize_and_extrapolate(*arrays, groups=groups, coverage_threshold=coverage_threshold)
+    )
 
 
 def reject_outliers(meter_readings, reject=1):
@@ -272,27 +221,30 @@ def interpolate_monthly_readings(meter_readings):
     if len(meter_readings) == 0:
         return []
 
+    for reading in meter_readings:
+        assert reading.start_time.day == 1, f'Meter readings should start on the first day of the month; found one starting on {reading.start_time.day}'
+
+    reading_months = to_datetime64(reading.start_time for reading in meter_readings).astype('datetime64[M]')
+    months = np.arange(reading_months[0], reading_months[-1] + 1)
+    # each month takes the latest reading starting on or before it
+    reading_indexes = np.searchsorted(reading_months, months, side='right') - 1
+
+    first_start_time = meter_readings[0].start_time
     interpolated_readings = []
-    current_reading_index = 0
-    current_time = meter_readings[current_reading_index].start_time
-    while current_reading_index < len(meter_readings):
-        current_reading = meter_readings[current_reading_index]
-        assert current_reading.start_time.day == 1, f'Meter readings should start on the first day of the month; found one starting on {current_reading.start_time.day}'
-
-        if current_time == current_reading.start_time:
-            interpolated_readings.append(current_reading)
-            current_reading_index += 1
+    for month, next_month, reading_index in zip(months, (months + 1).tolist(), reading_indexes.tolist()):
+        reading = meter_readings[reading_index]
+        if reading_months[reading_index] == month:
+            interpolated_readings.append(reading)
         else:
             # interpolate reading
-            prev_reading = interpolated_readings[-1]
+            month = month.tolist()
             interpolated_readings.append(
                 SimpleMeterReading(
-                    current_time,
-                    current_time + relativedelta.relativedelta(months=1),
-                    prev_reading.reading
+                    first_start_time.replace(year=month.year, month=month.month),
+                    first_start_time.replace(year=next_month.year, month=next_month.month),
+                    reading.reading
                 )
             )
-        current_time += relativedelta.relativedelta(months=1)
 
     return interpolated_readings
 
@@ -303,21 +255,8 @@ def get_days_in_reading(meter_reading):
     :param meter_reading: List[SimpleMeterReading | MeterReading]
     :return: List[datetime.datetime], days (at midnight, timezone unaware)
     """
-    start = datetime.datetime(
-        meter_reading.start_time.year,
-        meter_reading.start_time.month,
-        meter_reading.start_time.day,
-    )
-    end = datetime.datetime(
-        meter_reading.end_time.year,
-        meter_reading.end_time.month,
-        meter_reading.end_time.day,
+    days = np.arange(
+        to_datetime64([meter_reading.start_time])[0].astype('datetime64[D]'),
+        to_datetime64([meter_reading.end_time])[0].astype('datetime64[D]') + 1,
     )
-
-    all_days = []
-    current_day = start
-    while current_day <= end:
-        all_days.append(current_day)
-        current_day += relativedelta.relativedelta(days=1)
-
-    return all_days
+    return to_datetimes(days)
@@ -14,6 +14,7 @@ from django.contrib.postgres.aggregates.general import ArrayAgg
 from django.db import IntegrityError, transaction
 from django.db.models import Subquery
 
+from seed.data_importer.matching_index import MatchingCriteriaIndex
 from seed.data_importer.models import ImportFile
 from seed.decorators import lock_and_track
 from seed.lib.merging import merging
@@ -45,9 +46,13 @@ from seed.utils.match import (
 )
 from seed.utils.merge import merge_states_with_views
 from seed.utils.ubid import get_jaccard_index, merge_ubid_models
+from seed.utils.ubid_batch import is_jaccard_match
 
 _log = get_task_logger(__name__)
 
+# Number of groups of matching -States whose -States are loaded with one query when merging
+MERGE_GROUPS_BATCH_SIZE = 500
+
 
 def log_debug(message):
     _log.debug('{}: {}'.format(message, dt.datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
@@ -341,13 +346,22 @@ def inclusive_match_and_merge(unmatched_state_ids, org, StateClass, sub_progress
     # Collapse groups of matches found in the previous step into 1 -State per group
     merges_within_file = 0
     priorities = Column.retrieve_priorities(org)
+    matched_id_groups = list(matched_id_groups)
     batch_size = math.ceil(len(matched_id_groups) / 100)
+    states_by_id = {}
     for idx, ids in enumerate(matched_id_groups):
         if len(ids) == 1:
             # If there's only 1, no merging is needed, so just promote the ID.
             promoted_ids += ids
         else:
-            states = [s for s in StateClass.objects.filter(pk__in=ids).order_by('-id')]
+            if ids[0] not in states_by_id:
+                # Load the -States of this and the following groups that need merging at once
+                states_by_id = StateClass.objects.in_bulk([
+                    state_id
+                    for group in matched_id_groups[idx:idx + MERGE_GROUPS_BATCH_SIZE] if len(group) > 1
+                    for state_id in group
+                ])
+            states = sorted((states_by_id[state_id] for state_id in ids), key=lambda state: -state.id)
             merge_state = states.pop()
 
             merges_within_file += len(states)
@@ -430,34 +444,29 @@ def states_to_views(unmatched_state_ids, org, cycle, StateClass, sub_progress_ke
     unmatched_states = StateClass.objects.filter(pk__in=unmatched_state_ids).exclude(
         pk__in=Subquery(handled_states.values('id'))
     )
+    promote_state_ids = list(promote_states.values_list('id', flat=True))
+
+    # Load the matching criteria of the -States that are attached to -Views once and index them
+    # on their matching criteria, instead of searching the existing -States for every state.
+    existing_index = MatchingCriteriaIndex.for_cycle_views(StateClass, ViewClass, cycle, column_names)
 
     # For the remaining -States, search for a match within the -States that are attached to -Views.
     # If one match is found, pass that along.
     # If multiple matches are found, merge them together, pass along the resulting record.
     # Otherwise, add current -State to be promoted as is.
     merged_between_existing_count = 0
-    merge_state_pairs = []
-    batch_size = math.ceil(len(unmatched_states) / 100)
-
-    for idx, state in enumerate(unmatched_states):
-        matching_criteria = matching_filter_criteria(state, column_names)
-        # compare ubids via jaccard index instead of a direct match, drop from matching criteria
-        check_jaccard = False
-        if 'ubid' in matching_criteria.keys():
-            check_jaccard = True if matching_criteria.get('ubid') else False
-            ubid = matching_criteria.pop('ubid')
-
-        existing_state_matches = StateClass.objects.filter(
-            pk__in=Subquery(existing_cycle_views.values('state_id')),
-            **matching_criteria,
-        )
+    merge_state_id_pairs = []
+    unmatched_criteria = list(existing_index.criteria_of(unmatched_states))
+    if existing_index.has_ubid:
+        existing_index.decode_ubids(ubid for _state_id, _key, ubid in unmatched_criteria)
+    batch_size = math.ceil(len(unmatched_criteria) / 100)
 
-        if check_jaccard:
-            existing_state_matches = [
-                state
-                for state in existing_state_matches
-                if check_jaccard_match(ubid, state.ubid, org.ubid_threshold)
-            ]
+    for idx, (state_id, key, ubid) in enumerate(unmatched_criteria):
+        existing_state_matches = existing_index.candidates(key)
+
+        # compare ubids via jaccard index instead of a direct match
+        if existing_index.has_ubid and ubid:
+            existing_state_matches = existing_index.ubid_matches(key, ubid, org.ubid_threshold)
 
         count = len(existing_state_matches)
 
@@ -466,35 +475,54 @@ def states_to_views(unmatched_state_ids, org, cycle, StateClass, sub_progress_ke
             existing_state_ids = [state.id for state in sorted(existing_state_matches, key=lambda state: state.updated)]
             # The following merge action ignores merge protection and prioritizes -States by most recent AuditLog
             merged_state = merge_states_with_views(existing_state_ids, org.id, 'System Match', StateClass)
-            merge_state_pairs.append((merged_state, state))
+            merge_state_id_pairs.append((merged_state.id, state_id))
+
+            # The merged -State replaces the existing -States in the cycle's -Views
+            existing_index.remove(existing_state_ids)
+            existing_index.add_states(StateClass.objects.filter(pk=merged_state.id))
         elif count == 1:
-            merge_state_pairs.append((existing_state_matches[0], state))
+            merge_state_id_pairs.append((existing_state_matches[0].id, state_id))
         else:
-            promote_states = promote_states | StateClass.objects.filter(pk=state.id)
+            promote_state_ids.append(state_id)
 
         if batch_size > 0 and idx % batch_size == 0:
             sub_progress_data.step('Matching Data (3/6): Merging Unmatched States')
 
     sub_progress_data = update_sub_progress_total(100, sub_progress_key, finish=True)
 
+    # Load the -States and -Views of the merge pairs in batches
+    states_by_id = StateClass.objects.in_bulk(
+        {state_id for pair in merge_state_id_pairs for state_id in pair}
+    )
+    views_by_state_id = {
+        view.state_id: view
+        for view in ViewClass.objects.filter(state_id__in={pair[0] for pair in merge_state_id_pairs})
+    }
+    promote_states = StateClass.objects.filter(pk__in=promote_state_ids)
+
     # Process -States into -Views either directly (promoted_ids) or post-merge (merge_state_pairs).
-    _log.debug("There are %s merge_state_pairs and %s promote_states" % (len(merge_state_pairs), promote_states.count()))
+    _log.debug("There are %s merge_state_pairs and %s promote_states" % (len(merge_state_id_pairs), len(promote_state_ids)))
     priorities = Column.retrieve_priorities(org.pk)
     processed_views = []
     promoted_ids = []
     merged_state_ids = []
     try:
         with transaction.atomic():
-            batch_size = math.ceil(len(merge_state_pairs) / 100)
-            for idx, state_pair in enumerate(merge_state_pairs):
-                existing_state, newer_state = state_pair
-                existing_view = ViewClass.objects.get(state_id=existing_state.id)
+            # If multiple incoming -States match the same existing -State, each one is merged into
+            # the result of the previous merge
+            merged_into = {}
+            batch_size = math.ceil(len(merge_state_id_pairs) / 100)
+            for idx, (existing_state_id, newer_state_id) in enumerate(merge_state_id_pairs):
+                existing_view = views_by_state_id[existing_state_id]
+                existing_state = merged_into.get(existing_state_id, states_by_id[existing_state_id])
+                newer_state = states_by_id[newer_state_id]
 
                 # Merge -States and assign new/merged -State to existing -View
                 merged_state = save_state_match(existing_state, newer_state, priorities)
                 merge_ubid_models([existing_state.id], merged_state.id, StateClass)
                 existing_view.state = merged_state
                 existing_view.save()
+                merged_into[existing_state_id] = merged_state
 
                 processed_views.append(existing_view)
                 merged_state_ids.append(merged_state.id)
@@ -503,7 +531,7 @@ def states_to_views(unmatched_state_ids, org, cycle, StateClass, sub_progress_ke
 
             sub_progress_data = update_sub_progress_total(100, sub_progress_key, finish=True)
 
-            batch_size = math.ceil(len(promote_states) / 100)
+            batch_size = math.ceil(len(promote_state_ids) / 100)
             for idx, state in enumerate(promote_states):
                 promoted_ids.append(state.id)
                 created_view = state.promote(cycle)
@@ -635,9 +663,4 @@ def save_state_match(state1, state2, priorities):
 
 def check_jaccard_match(ubid, state_ubid, ubid_threshold):
     jaccard_index = get_jaccard_index(ubid, state_ubid)
-
-    # If threshold is 0 then it will match any UBID with overlap
-    if ubid_threshold == 0:
-        return jaccard_index > ubid_threshold
-    else:
-        return jaccard_index >= ubid_threshold
+    return is_jaccard_match(jaccard_index, ubid_threshold)
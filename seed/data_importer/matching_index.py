@@ -0,0 +1,174 @@
+# !/usr/bin/env python
+# encoding: utf-8
+"""
+SEED Platform (TM), Copyright (c) Alliance for Sustainable Energy, LLC, and other contributors.
+See also https://github.com/seed-platform/seed/main/LICENSE.md
+"""
+from collections import defaultdict, namedtuple
+from itertools import count
+
+from django.db.models import Subquery
+
+from seed.utils.ubid_batch import (
+    CodeAreaIndex,
+    decode_code_areas,
+    is_jaccard_match,
+    jaccard_indexes
+)
+
+IndexedState = namedtuple('IndexedState', ['id', 'ubid', 'updated'])
+
+
+class MatchingCriteriaIndex(object):
+    """In-memory blocking index of -States keyed on their matching criteria values
+
+    The index replaces a query per incoming -State (filtering the existing -States on the
+    matching criteria) with a single query that loads the matching criteria of all the
+    -States to index. Two -States are candidates for a match when all of their matching
+    criteria, except for the UBID, are equal (None is only equal to None, like the IS NULL
+    filter). The UBID is stored with each indexed -State so that the candidates can then be
+    compared with the Jaccard index. The code areas of the UBIDs are indexed too, so that only
+    the candidates whose code area overlaps are compared.
+
+    usage:
+            index = MatchingCriteriaIndex.for_cycle_views(PropertyState, PropertyView, cycle, column_names)
+            for state_id, key, ubid in index.criteria_of(PropertyState.objects.filter(pk__in=ids)):
+                candidates = index.candidates(key)
+                ubid_matches = index.ubid_matches(key, ubid, org.ubid_threshold)
+    """
+
+    def __init__(self, StateClass, column_names):
+        self.StateClass = StateClass
+        self.has_ubid = 'ubid' in column_names
+        # sort the columns so that keys built from different queries line up
+        self.key_columns = sorted(c for c in column_names if c != 'ubid')
+        self._buckets = defaultdict(dict)
+        self._key_by_id = {}
+        self._position_by_id = {}
+        self._positions = count()
+
+        # UBID lookups, used only when the UBID is a matching criteria
+        self.code_areas = {}
+        self._code_area_index = CodeAreaIndex()
+        self._ids_by_ubid = defaultdict(set)
+        self._ids_without_ubid = set()
+
+    @classmethod
+    def for_cycle_views(cls, StateClass, ViewClass, cycle, column_names):
+        """Build the index of the -States that are attached to the -Views of a cycle
+
+        :param StateClass: PropertyState or TaxLotState
+        :param ViewClass: PropertyView or TaxLotView
+        :param cycle: Cycle instance or id
+        :param column_names: iterable, matching criteria column names of the organization
+        :return: MatchingCriteriaIndex
+        """
+        index = cls(StateClass, column_names)
+        existing_states = StateClass.objects.filter(
+            pk__in=Subquery(ViewClass.objects.filter(cycle_id=cycle).values('state_id'))
+        )
+        index.add_states(existing_states)
+        return index
+
+    def _fields(self):
+        return ['id', 'updated', 'ubid'] + self.key_columns
+
+    def criteria_of(self, queryset):
+        """Yield the id, matching criteria key and UBID of each -State of the queryset
+
+        :param queryset: QuerySet of StateClass
+        :return: generator of tuples, (id, key, ubid)
+        """
+        for row in queryset.values_list(*self._fields()).iterator():
+            yield row[0], tuple(row[3:]), row[2]
+
+    def add_states(self, queryset):
+        """Load the matching criteria of the -States of the queryset into the index
+
+        :param queryset: QuerySet of StateClass
+        """
+        rows = list(queryset.values_list(*self._fields()).iterator())
+        if self.has_ubid:
+            self.decode_ubids(row[2] for row in rows)
+        for row in rows:
+            self._add(IndexedState(row[0], row[2], row[1]), tuple(row[3:]))
+
+    def decode_ubids(self, ubids):
+        """Decode the code areas of UBIDs with one query per batch, so that ubid_matches doesn't
+        query the database. The UBIDs of the indexed -States are decoded when they are added.
+
+        :param ubids: iterable of str
+        """
+        missing = {ubid for ubid in ubids if ubid and ubid not in self.code_areas}
+        if missing:
+            self.code_areas.update(decode_code_areas(missing))
+
+    def _add(self, indexed_state, key):
+        self._buckets[key][indexed_state.id] = indexed_state
+        self._key_by_id[indexed_state.id] = key
+        self._position_by_id[indexed_state.id] = next(self._positions)
+        if self.has_ubid:
+            if not indexed_state.ubid:
+                self._ids_without_ubid.add(indexed_state.id)
+            else:
+                self._ids_by_ubid[indexed_state.ubid].add(indexed_state.id)
+                if indexed_state.ubid in self.code_areas:
+                    self._code_area_index.add(indexed_state.id, self.code_areas[indexed_state.ubid])
+
+    def remove(self, state_ids):
+        """Remove -States from the index, e.g., after they were merged into a new -State
+
+        :param state_ids: iterable of ints
+        """
+        for state_id in state_ids:
+            key = self._key_by_id.pop(state_id, None)
+            if key is not None:
+                indexed_state = self._buckets[key].pop(state_id, None)
+                if not self._buckets[key]:
+                    del self._buckets[key]
+                self._position_by_id.pop(state_id, None)
+                if indexed_state is not None and self.has_ubid:
+                    self._ids_without_ubid.discard(state_id)
+                    self._ids_by_ubid[indexed_state.ubid].discard(state_id)
+                    self._code_area_index.remove(state_id)
+
+    def candidates(self, key):
+        """-States of the index with the same matching criteria key
+
+        :param key: tuple, from criteria_of
+        :return: list of IndexedState
+        """
+        return list(self._buckets.get(key, {}).values())
+
+    def ubid_matches(self, key, ubid, ubid_threshold):
+        """-States of the index with the same matching criteria key and a UBID which matches the UBID,
+        like check_jaccard_match for each candidate. A -State without a UBID or with the same UBID
+        always matches, otherwise the code areas must overlap for the Jaccard index to be above 0.
+
+        :param key: tuple, from criteria_of
+        :param ubid: str, UBID of the incoming -State, decoded with decode_ubids beforehand
+        :param ubid_threshold: float, Jaccard index threshold of the organization
+        :return: list of IndexedState
+        """
+        bucket = self._buckets.get(key)
+        if not bucket:
+            return []
+        if not ubid:
+            return list(bucket.values())
+
+        state_ids = self._ids_without_ubid | self._ids_by_ubid.get(ubid, set())
+        if ubid in self.code_areas:
+            state_ids |= self._code_area_index.overlapping(self.code_areas[ubid])
+        candidates = sorted(
+            (bucket[state_id] for state_id in state_ids if state_id in bucket),
+            key=lambda indexed_state: self._position_by_id[indexed_state.id]
+        )
+
+        indexes = jaccard_indexes([(ubid, candidate.ubid) for candidate in candidates], self.code_areas)
+        return [
+            candidate for candidate, jaccard_index in zip(candidates, indexes)
+            if is_jaccard_match(jaccard_index, ubid_threshold)
+        ]
+
+    def __len__(self):
+        return len(self._key_by_id)
@@ -0,0 +1,159 @@
+# !/usr/bin/env python
+# encoding: utf-8
+"""
+SEED Platform (TM), Copyright (c) Alliance for Sustainable Energy, LLC, and other contributors.
+See also https://github.com/seed-platform/seed/main/LICENSE.md
+
+Bulk loading of meter and sensor readings. The readings are streamed into a temporary table with
+COPY and then merged into their table with one INSERT ... ON CONFLICT statement, instead of
+formatting every reading into the SQL of the upsert. The rollups of the readings are then
+refreshed once for the whole period of the loaded readings.
+"""
+import csv
+import io
+
+from django.db import connection, transaction
+
+from seed.lib.mcm.utils import batch
+from seed.utils.reading_rollups import (
+    refresh_meter_rollups,
+    refresh_sensor_rollups
+)
+
+# number of rows sent per COPY statement
+COPY_CHUNK_SIZE = 10000
+
+METER_READING_COLUMNS = ['meter_id', 'start_time', 'end_time', 'reading', 'source_unit', 'conversion_factor']
+
+
+def copy_rows(cursor, table, columns, rows, force_not_null=None, chunk_size=COPY_CHUNK_SIZE):
+    """Stream rows into a table with COPY, in chunks. None is copied as NULL.
+
+    :param cursor: database cursor
+    :param table: str, name of the table
+    :param columns: list of str
+    :param rows: iterable of tuples, the values of the columns, which are written as CSV
+    :param force_not_null: list of str, optional, columns whose empty values are copied as
+        empty strings instead of NULL
+    :param chunk_size: int, number of rows per COPY statement
+    """
+    options = 'FORMAT csv'
+    if force_not_null:
+        options += f", FORCE_NOT_NULL ({', '.join(force_not_null)})"
+    sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH ({options})"
+
+    for rows_chunk in batch(rows, chunk_size):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows_chunk)
+        buffer.seek(0)
+        cursor.copy_expert(sql, buffer)
+
+
+def upsert_meter_readings(meter_id, readings):
+    """Create or update the readings of a meter. A reading with the same meter, start time and
+    end time as an existing reading updates it.
+
+    :param meter_id: int
+    :param readings: iterable of dicts, with the start_time, end_time, reading, source_unit and
+        conversion_factor of each reading
+    :return: int, number of readings created or updated
+    :raises: ProgrammingError if readings have the same start and end time
+    """
+    rows = (
+        (meter_id, reading['start_time'], reading['end_time'], reading['reading'], reading['source_unit'], reading['conversion_factor'])
+        for reading in readings
+    )
+    columns = ', '.join(METER_READING_COLUMNS)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            'CREATE TEMPORARY TABLE tmp_meterreading ('
+            ' meter_id integer, start_time timestamp with time zone, end_time timestamp with time zone,'
+            ' reading double precision, source_unit text, conversion_factor double precision'
+            ') ON COMMIT DROP'
+        )
+        copy_rows(cursor, 'tmp_meterreading', METER_READING_COLUMNS, rows)
+        cursor.execute(
+            f'INSERT INTO seed_meterreading({columns})'
+            f' SELECT {columns} FROM tmp_meterreading'
+            ' ON CONFLICT (meter_id, start_time, end_time)'
+            ' DO UPDATE SET reading = EXCLUDED.reading, source_unit = EXCLUDED.source_unit, conversion_factor = EXCLUDED.conversion_factor'
+        )
+        count = cursor.rowcount
+        cursor.execute('SELECT MIN(start_time), MAX(end_time) FROM tmp_meterreading')
+        start, end = cursor.fetchone()
+        cursor.execute('DROP TABLE tmp_meterreading')
+
+        if start is not None:
+            refresh_meter_rollups([meter_id], start, end)
+
+    return count
+
+
+def upsert_sensor_readings(sensor_id, readings, is_occupied_data):
+    """Create or update the readings of a sensor. A reading with the same sensor and timestamp
+    as an existing reading updates it.
+
+    The timestamps and the values are parsed by the database. The occupancy of each reading is
+    the occupancy set by the latest change before its timestamp, which is looked up for all the
+    readings at once.
+
+    :param sensor_id: int
+    :param readings: iterable of tuples, (timestamp, reading)
+    :param is_occupied_data: list of tuples, (iso timestamp, bool), the changes of the occupancy
+        of the data logger, in order
+    :return: int, number of readings created or updated
+    :raises: ProgrammingError if readings have the same timestamp, DataError if a timestamp or
+        a value is invalid
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        # empty values are copied as is, so that they are invalid readings instead of nulls
+        cursor.execute('CREATE TEMPORARY TABLE tmp_sensorreading (timestamp text, reading text) ON COMMIT DROP')
+        copy_rows(cursor, 'tmp_sensorreading', ['timestamp', 'reading'], readings, force_not_null=['timestamp', 'reading'])
+
+        cursor.execute(
+            'CREATE TEMPORARY TABLE tmp_occupancy ('
+            ' position integer, timestamp timestamp with time zone, is_occupied boolean'
+            ') ON COMMIT DROP'
+        )
+        copy_rows(
+            cursor,
+            'tmp_occupancy',
+            ['position', 'timestamp', 'is_occupied'],
+            ((position, timestamp, is_occupied) for position, (timestamp, is_occupied) in enumerate(is_occupied_data)),
+        )
+        cursor.execute('CREATE INDEX ON tmp_occupancy (timestamp, position)')
+
+        # a reading before the first change takes the occupancy of the last change
+        cursor.execute(
+            """
+            INSERT INTO seed_sensorreading(sensor_id, timestamp, reading, is_occupied)
+            SELECT %s, readings.timestamp, readings.reading, COALESCE(occupancy.is_occupied, last_occupancy.is_occupied)
+            FROM (
+                SELECT
+                    tmp_sensorreading.timestamp::timestamp with time zone AS timestamp,
+                    tmp_sensorreading.reading::double precision AS reading
+                FROM tmp_sensorreading
+            ) AS readings
+            LEFT JOIN LATERAL (
+                SELECT tmp_occupancy.is_occupied
+                FROM tmp_occupancy
+                WHERE tmp_occupancy.timestamp < readings.timestamp
+                ORDER BY tmp_occupancy.timestamp DESC, tmp_occupancy.position DESC
+                LIMIT 1
+            ) AS occupancy ON true
+            LEFT JOIN (
+                SELECT tmp_occupancy.is_occupied FROM tmp_occupancy ORDER BY tmp_occupancy.position DESC LIMIT 1
+            ) AS last_occupancy ON true
+            ON CONFLICT (sensor_id, timestamp) DO UPDATE SET reading = EXCLUDED.reading
+            """,
+            [sensor_id]
+        )
+        count = cursor.rowcount
+        cursor.execute('SELECT MIN(timestamp::timestamp with time zone), MAX(timestamp::timestamp with time zone) FROM tmp_sensorreading')
+        start, end = cursor.fetchone()
+        cursor.execute('DROP TABLE tmp_sensorreading, tmp_occupancy')
+
+        if start is not None:
+            refresh_sensor_rollups([sensor_id], start, end)
+
+    return count
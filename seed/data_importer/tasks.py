@@ -8,13 +8,11 @@ from __future__ import absolute_import
 
 import collections
 import copy
-import hashlib
 import json
 import os
 import tempfile
 import traceback
 import zipfile
-from bisect import bisect_left
 from builtins import str
 from collections import defaultdict, namedtuple
 from datetime import date, datetime
@@ -25,13 +23,10 @@ from _csv import Error
 from celery import chain as celery_chain
 from celery import chord, group, shared_task
 from celery.utils.log import get_task_logger
-from dateutil import parser
-from django.contrib.gis.geos import GEOSGeometry
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.db import DataError, IntegrityError, connection, transaction
+from django.db import DataError, IntegrityError, transaction
 from django.db.utils import ProgrammingError
 from django.utils import timezone as tz
-from django.utils.timezone import make_naive
 from past.builtins import basestring
 
 from seed.building_sync import validation_client
@@ -46,6 +41,10 @@ from seed.data_importer.models import (
     ImportFile,
     ImportRecord
 )
+from seed.data_importer.readings_loader import (
+    upsert_meter_readings,
+    upsert_sensor_readings
+)
 from seed.data_importer.sensor_readings_parser import SensorsReadingsParser
 from seed.data_importer.utils import usage_point_id
 from seed.lib.mcm import cleaners, mapper, reader
@@ -84,10 +83,12 @@ from seed.models import (
     TaxLotAuditLog,
     TaxLotProperty,
     TaxLotState,
-    TaxLotView
+    TaxLotView,
+    UbidModel
 )
 from seed.models.auditlog import AUDIT_IMPORT
 from seed.models.data_quality import DataQualityCheck, Rule
+from seed.utils.address import normalize_address_str
 from seed.utils.buildings import get_source_type
 from seed.utils.geocode import (
     MapQuestAPIKeyError,
@@ -95,12 +96,16 @@ from seed.utils.geocode import (
     geocode_buildings
 )
 from seed.utils.match import update_sub_progress_total
+from seed.utils.state_hash import empty_state_hash, hash_state_object
 from seed.utils.ubid import decode_unique_ids
 
 _log = get_task_logger(__name__)
 
 STR_TO_CLASS = {'TaxLotState': TaxLotState, 'PropertyState': PropertyState}
 
+# Number of rows per INSERT when bulk creating the mapped states and their audit logs
+MAP_BULK_CREATE_BATCH_SIZE = 500
+
 
 @shared_task(ignore_result=True)
 def check_data_chunk(model, ids, dq_id):
@@ -351,10 +356,15 @@ def map_row_chunk(ids, file_pk, source_type, prog_key, **kwargs):
                 data = PropertyState.objects.filter(id__in=ids).only('extra_data',
                                                                      'bounding_box').iterator()
 
-                # Since we are importing CSV, then each extra_data field will have the same fields.
-                # So save the map_model_obj outside of for loop to pass into the `save_column_names`
-                # methods
-                map_model_obj = None
+                # Collect the mapped states for the whole chunk so that the states and their
+                # audit logs can be written with bulk inserts instead of one INSERT per row. Keep
+                # the id of the raw state each mapped state came from for BuildingSync files.
+                StateClass = STR_TO_CLASS[table]
+                mapped_states = []
+                raw_state_ids = []
+
+                # The hash of an empty state is only computed once per table (and process)
+                empty_hash = empty_state_hash(StateClass)
 
                 # Loop over all the rows
                 for original_row in data:
@@ -379,7 +389,7 @@ def map_row_chunk(ids, file_pk, source_type, prog_key, **kwargs):
                         map_model_obj = mapper.map_row(
                             row,
                             mappings,
-                            STR_TO_CLASS[table],
+                            StateClass,
                             extra_data_fields,
                             cleaner=map_cleaner,
                             **kwargs
@@ -403,10 +413,7 @@ def map_row_chunk(ids, file_pk, source_type, prog_key, **kwargs):
                         # make sure that the object hasn't already been created. For example, in
                         # the test data the tax lot id is the same for many rows. Make sure
                         # to only create/save the object if it hasn't been created before.
-                        if hash_state_object(map_model_obj, include_extra_data=False) == \
-                            hash_state_object(
-                                STR_TO_CLASS[table](organization=map_model_obj.organization),
-                                include_extra_data=False):
+                        if hash_state_object(map_model_obj, include_extra_data=False) == empty_hash:
                             # Skip this object as it has no data...
                             _log.warning(
                                 "Skipping property or taxlot during mapping because it is identical to another row")
@@ -420,62 +427,22 @@ def map_row_chunk(ids, file_pk, source_type, prog_key, **kwargs):
                                 _store_raw_footprint_and_create_rule(footprint_details, table, org, import_file,
                                                                      original_row, map_model_obj)
 
-                        # There was an error with a field being too long [> 255 chars].
-                        map_model_obj.save()
-
-                        # if importing BuildingSync create a BuildingFile for the property
-                        if source_type == BUILDINGSYNC_RAW:
-                            raw_ps_id = original_row.id
-                            xml_filename = import_file.raw_property_state_to_filename.get(str(raw_ps_id))
-                            if xml_filename is None:
-                                raise Exception('Expected ImportFile to have the raw PropertyStates id in its raw_property_state_to_filename dict')
-
-                            from_zipfile = import_file.uploaded_filename.endswith('.zip')
-                            # if user uploaded a zipfile, find the xml file related to this property and use it
-                            # else, the user uploaded a sole xml file and we can just use that one.
-                            if from_zipfile:
-                                with zipfile.ZipFile(import_file.file, 'r', zipfile.ZIP_STORED) as openzip:
-                                    new_file = SimpleUploadedFile(
-                                        name=xml_filename,
-                                        content=openzip.read(xml_filename),
-                                        content_type='application/xml')
-                            else:
-                                xml_filename = import_file.uploaded_filename
-                                if xml_filename == '':
-                                    raise Exception('Expected ImportFiles uploaded_filename to be non-empty')
-                                new_file = SimpleUploadedFile(
-                                    name=xml_filename,
-                                    content=import_file.file.read(),
-                                    content_type='application/xml'
-                                )
-
-                            building_file = BuildingFile.objects.create(
-                                file=new_file,
-                                filename=xml_filename,
-                                file_type=BuildingFile.BUILDINGSYNC,
-                            )
-
-                            # link the property state to the building file
-                            building_file.property_state = map_model_obj
-                            building_file.save()
-
-                        # Create an audit log record for the new map_model_obj that was created.
-
-                        AuditLogClass = PropertyAuditLog if isinstance(
-                            map_model_obj, PropertyState) else TaxLotAuditLog
-                        AuditLogClass.objects.create(
-                            organization=org,
-                            state=map_model_obj,
-                            name='Import Creation',
-                            description='Creation from Import file.',
-                            import_filename=import_file,
-                            record_type=AUDIT_IMPORT
-                        )
+                        mapped_states.append(map_model_obj)
+                        raw_state_ids.append(original_row.id)
+
+                if not mapped_states:
+                    continue
+
+                # There was an error with a field being too long [> 255 chars].
+                _bulk_create_mapped_states(StateClass, mapped_states, org, import_file)
+
+                # if importing BuildingSync create a BuildingFile for each property
+                if source_type == BUILDINGSYNC_RAW:
+                    for map_model_obj, raw_ps_id in zip(mapped_states, raw_state_ids):
+                        _create_building_file_for_mapped_state(import_file, raw_ps_id, map_model_obj)
 
-                # Make sure that we've saved all of the extra_data column names from the first item
-                # in list
-                if map_model_obj:
-                    Column.save_column_names(map_model_obj)
+                # Make sure that we've saved all of the extra_data column names of the chunk
+                Column.save_column_names_for_states(mapped_states)
     except IntegrityError as e:
         progress_data.finish_with_error('Could not map_row_chunk with error', str(e))
         raise IntegrityError("Could not map_row_chunk with error: %s" % str(e))
@@ -493,6 +460,99 @@ def map_row_chunk(ids, file_pk, source_type, prog_key, **kwargs):
     return True
 
 
+def _bulk_create_mapped_states(StateClass, mapped_states, org, import_file):
+    """Save the mapped states of a chunk and their import audit logs with bulk inserts
+
+    bulk_create does not call the state's save() method nor send the pre/post save signals, so
+    the work that those do for a newly created state (normalized address, hash and the preferred
+    UbidModel with the decoded UBID geometry) is done here for the whole chunk.
+
+    :param StateClass: PropertyState or TaxLotState
+    :param mapped_states: list, unsaved StateClass instances
+    :param org: Organization instance
+    :param import_file: ImportFile instance the states were mapped from
+    """
+    for map_model_obj in mapped_states:
+        if map_model_obj.address_line_1 is not None:
+            map_model_obj.normalized_address = normalize_address_str(map_model_obj.address_line_1)
+        else:
+            map_model_obj.normalized_address = None
+        map_model_obj.hash_object = hash_state_object(map_model_obj)
+
+    StateClass.objects.bulk_create(mapped_states, batch_size=MAP_BULK_CREATE_BATCH_SIZE)
+
+    # Create an audit log record for each new state that was created.
+    AuditLogClass = PropertyAuditLog if StateClass == PropertyState else TaxLotAuditLog
+    AuditLogClass.objects.bulk_create(
+        [
+            AuditLogClass(
+                organization=org,
+                state=map_model_obj,
+                name='Import Creation',
+                description='Creation from Import file.',
+                import_filename=import_file,
+                record_type=AUDIT_IMPORT
+            ) for map_model_obj in mapped_states
+        ],
+        batch_size=MAP_BULK_CREATE_BATCH_SIZE
+    )
+
+    # New states have no UbidModels yet, so each state with a UBID gets a single preferred one
+    state_field = 'property' if StateClass == PropertyState else 'taxlot'
+    ubid_states = [map_model_obj for map_model_obj in mapped_states if map_model_obj.ubid]
+    if ubid_states:
+        UbidModel.objects.bulk_create(
+            [
+                UbidModel(ubid=map_model_obj.ubid, preferred=True, **{state_field: map_model_obj})
+                for map_model_obj in ubid_states
+            ],
+            batch_size=MAP_BULK_CREATE_BATCH_SIZE
+        )
+        # Update lat/long/centroid
+        decode_unique_ids(StateClass.objects.filter(id__in=[s.id for s in ubid_states]))
+
+
+def _create_building_file_for_mapped_state(import_file, raw_ps_id, map_model_obj):
+    """Create the BuildingFile of a BuildingSync import and link it to the mapped property state
+
+    :param import_file: ImportFile instance
+    :param raw_ps_id: int, id of the raw PropertyState that the mapped state came from
+    :param map_model_obj: PropertyState, saved mapped state
+    """
+    xml_filename = import_file.raw_property_state_to_filename.get(str(raw_ps_id))
+    if xml_filename is None:
+        raise Exception('Expected ImportFile to have the raw PropertyStates id in its raw_property_state_to_filename dict')
+
+    from_zipfile = import_file.uploaded_filename.endswith('.zip')
+    # if user uploaded a zipfile, find the xml file related to this property and use it
+    # else, the user uploaded a sole xml file and we can just use that one.
+    if from_zipfile:
+        with zipfile.ZipFile(import_file.file, 'r', zipfile.ZIP_STORED) as openzip:
+            new_file = SimpleUploadedFile(
+                name=xml_filename,
+                content=openzip.read(xml_filename),
+                content_type='application/xml')
+    else:
+        xml_filename = import_file.uploaded_filename
+        if xml_filename == '':
+            raise Exception('Expected ImportFiles uploaded_filename to be non-empty')
+        new_file = SimpleUploadedFile(
+            name=xml_filename,
+            content=import_file.file.read(),
+            content_type='application/xml'
+        )
+
+    building_file = BuildingFile.objects.create(
+        file=new_file,
+        filename=xml_filename,
+        file_type=BuildingFile.BUILDINGSYNC,
+    )
+
+    # link the property state to the building file
+    building_file.property_state = map_model_obj
+    building_file.save()
+
+
 def _store_raw_footprint_and_create_rule(footprint_details, table, org, import_file, original_row, map_model_obj):
     column_name = footprint_details['raw_field'] + ' (Invalid Footprint)'
 
@@ -766,6 +826,60 @@ def _save_raw_data_chunk(chunk, file_pk, progress_key):
     return raw_property_state_to_filename
 
 
+@shared_task(ignore_result=True)
+def _save_raw_data_csv_range(start, end, fieldnames, dialect_kwargs, file_pk, progress_key):
+    """
+    Read a byte range of a CSV import file and save its rows as raw data. Only the offsets are
+    sent to the worker, so neither the task message nor the worker hold more than one chunk.
+
+    :param start: int, byte offset of the first row of the chunk
+    :param end: int, byte offset after the last row of the chunk
+    :param fieldnames: list, the headers of the file
+    :param dialect_kwargs: dict, csv formatting parameters of the file
+    :param file_pk: ImportFile Primary Key
+    :param progress_key: string, Progress Key to append progress
+    :return: Dict, raw property state ID to source filename (always empty for CSV files)
+    """
+    import_file = ImportFile.objects.get(pk=file_pk)
+    with import_file.file.open('rb') as f:
+        chunk = reader.read_csv_range(f, start, end, fieldnames, dialect_kwargs)
+
+    return _save_raw_data_chunk(chunk, file_pk, progress_key)
+
+
+def _save_raw_data_chunk_tasks(import_file, parser, progress_key):
+    """
+    Create the signatures of the tasks that save the raw data of a parsed file, 100 rows per
+    task, and count the rows of the file into ``import_file.num_rows``.
+
+    CSV files are streamed: the file is scanned once for the byte offsets of every chunk and the
+    tasks only carry those offsets, so the rows are never all in memory or in the task messages.
+    The other parsers already hold all of their rows in memory, so their rows are sent in the tasks.
+
+    :param import_file: ImportFile instance, not saved by this method
+    :param parser: parser of the file (MCMParser, GeoJSONParser or BuildingSyncParser)
+    :param progress_key: string, Progress Key to append progress
+    :return: list of task signatures
+    """
+    import_file.num_rows = 0
+    tasks = []
+    if isinstance(parser, reader.MCMParser) and isinstance(parser.reader, reader.CSVParser):
+        fieldnames = parser.reader.csvreader.fieldnames
+        dialect_kwargs = parser.reader.dialect_kwargs
+        with import_file.file.open('rb') as f:
+            for start, end, num_rows in reader.csv_chunk_offsets(f, 100, dialect_kwargs['quotechar']):
+                import_file.num_rows += num_rows
+                tasks.append(_save_raw_data_csv_range.s(
+                    start, end, fieldnames, dialect_kwargs, import_file.pk, progress_key
+                ))
+    else:
+        for batch_chunk in batch(parser.data, 100):
+            import_file.num_rows += len(batch_chunk)
+            tasks.append(_save_raw_data_chunk.s(batch_chunk, import_file.pk, progress_key))
+
+    return tasks
+
+
 @shared_task(ignore_result=True)
 def finish_raw_save(results, file_pk, progress_key):
     """
@@ -967,24 +1081,8 @@ def _save_sensor_readings_task(readings_tuples, data_logger_id, sensor_column_na
         try:
             with transaction.atomic():
                 is_occupied_data = DataLogger.objects.get(id=data_logger_id).is_occupied_data
-                [occupied_timestamps, is_occupied_arr] = list(zip(*is_occupied_data))
-                occupied_timestamps = [datetime.fromisoformat(t) for t in occupied_timestamps]
-
-                reading_strings = []
-                for timestamp, value in readings_tuples:
-                    is_occupied = is_occupied_arr[bisect_left(occupied_timestamps, parser.parse(timestamp)) - 1]
-                    reading_strings.append(f"({sensor.id}, '{timestamp}', '{value}', '{is_occupied}')")
-
-                sql = (
-                    'INSERT INTO seed_sensorreading(sensor_id, timestamp, reading, is_occupied)' +
-                    ' VALUES ' + ', '.join(reading_strings) +
-                    ' ON CONFLICT (sensor_id, timestamp)' +
-                    ' DO UPDATE SET reading = EXCLUDED.reading' +
-                    ' RETURNING reading;'
-                )
-                with connection.cursor() as cursor:
-                    cursor.execute(sql)
-                    result[sensor_column_name] = {'count': len(cursor.fetchall())}
+                count = upsert_sensor_readings(sensor.id, readings_tuples, is_occupied_data)
+                result[sensor_column_name] = {'count': count}
         except ProgrammingError as e:
             if 'ON CONFLICT DO UPDATE command cannot affect row a second time' in str(e):
                 result[sensor_column_name] = {'error': 'Import failed. Unable to import data with duplicate start and end date pairs.'}
@@ -1034,22 +1132,7 @@ def _save_greenbutton_data_task(readings, meter_id, meter_usage_point_id, progre
 
     try:
         with transaction.atomic():
-            reading_strings = [
-                f"({meter_id}, '{reading['start_time'].isoformat(' ')}', '{reading['end_time'].isoformat(' ')}', {reading['reading']}, '{reading['source_unit']}', {reading['conversion_factor']})"
-                for reading
-                in readings
-            ]
-
-            sql = (
-                'INSERT INTO seed_meterreading(meter_id, start_time, end_time, reading, source_unit, conversion_factor)' +
-                ' VALUES ' + ', '.join(reading_strings) +
-                ' ON CONFLICT (meter_id, start_time, end_time)' +
-                ' DO UPDATE SET reading = EXCLUDED.reading, source_unit = EXCLUDED.source_unit, conversion_factor = EXCLUDED.conversion_factor' +
-                ' RETURNING reading;'
-            )
-            with connection.cursor() as cursor:
-                cursor.execute(sql)
-                result[result_summary_key] = {'count': len(cursor.fetchall())}
+            result[result_summary_key] = {'count': upsert_meter_readings(meter_id, readings)}
     except ProgrammingError as e:
         if 'ON CONFLICT DO UPDATE command cannot affect row a second time' in str(e):
             result[result_summary_key] = {'error': 'Import failed. Unable to import data with duplicate start and end date pairs.'}
@@ -1092,27 +1175,13 @@ def _save_pm_meter_usage_data_task(meter_readings, file_pk, progress_key):
 
             meter, _created = Meter.objects.get_or_create(**meter_only_details)
 
-            reading_strings = [
-                f"({meter.id}, '{reading['start_time'].isoformat(' ')}', '{reading['end_time'].isoformat(' ')}', {reading['reading']}, '{reading['source_unit']}', {reading['conversion_factor']})"
-                for reading
-                in readings
-            ]
-
-            sql = (
-                'INSERT INTO seed_meterreading(meter_id, start_time, end_time, reading, source_unit, conversion_factor)' +
-                ' VALUES ' + ', '.join(reading_strings) +
-                ' ON CONFLICT (meter_id, start_time, end_time)' +
-                ' DO UPDATE SET reading = EXCLUDED.reading, source_unit = EXCLUDED.source_unit, conversion_factor = EXCLUDED.conversion_factor' +
-                ' RETURNING reading;'
+            count = upsert_meter_readings(meter.id, readings)
+            key = "{} - {} - {}".format(
+                meter.property_id,
+                meter.source_id,
+                meter.get_type_display()
             )
-            with connection.cursor() as cursor:
-                cursor.execute(sql)
-                key = "{} - {} - {}".format(
-                    meter.property_id,
-                    meter.source_id,
-                    meter.get_type_display()
-                )
-                result[key] = {'count': len(cursor.fetchall())}
+            result[key] = {'count': count}
     except ProgrammingError as e:
         if 'ON CONFLICT DO UPDATE command cannot affect row a second time' in str(e):
             type_lookup = dict(Meter.ENERGY_TYPES)
@@ -1285,23 +1354,15 @@ def _save_raw_data_create_tasks(file_pk, progress_key):
         import_file.has_generated_headers = parser.has_generated_headers
 
     cache_first_rows(import_file, parser)
-    import_file.num_rows = 0
     import_file.num_columns = parser.num_columns()
 
-    chunks = []
-    for batch_chunk in batch(parser.data, 100):
-        import_file.num_rows += len(batch_chunk)
-        chunks.append(batch_chunk)
+    # Add in the save raw data chunks to the background tasks
+    tasks = _save_raw_data_chunk_tasks(import_file, parser, progress_data.key)
     import_file.save()
 
-    progress_data.total = len(chunks)
+    progress_data.total = len(tasks)
     progress_data.save()
 
-    # Add in the save raw data chunks to the background tasks
-    tasks = []
-    for chunk in chunks:
-        tasks.append(_save_raw_data_chunk.s(chunk, file_pk, progress_data.key))
-
     return chord(tasks, interval=15)(finish_raw_save.s(file_pk, progress_data.key))
 
 
@@ -1336,24 +1397,19 @@ def save_raw_espm_data_synchronous(file_pk: int) -> dict:
             import_file.has_generated_headers = parser.has_generated_headers
 
         cache_first_rows(import_file, parser)
-        import_file.num_rows = 0
         import_file.num_columns = parser.num_columns()
 
-        chunks = []
-        for batch_chunk in batch(parser.data, 100):
-            import_file.num_rows += len(batch_chunk)
-            chunks.append(batch_chunk)
+        tasks = _save_raw_data_chunk_tasks(import_file, parser, progress_data.key)
         import_file.save()
 
-        progress_data.total = len(chunks)
+        progress_data.total = len(tasks)
         progress_data.save()
 
         # Save the raw data chunks. This should only happen
         # on a small amount of data since it is running in the foreground
-        for chunk in chunks:
-            _save_raw_data_chunk(chunk, file_pk, progress_data.key)
+        results = [task() for task in tasks]
 
-        finish_raw_save(file_pk, progress_data.key)
+        finish_raw_save(results, file_pk, progress_data.key)
     except Error as e:
         progress_data.finish_with_error('File Content Error: ' + str(e), traceback.format_exc())
     except KeyError as e:
@@ -1554,48 +1610,6 @@ def finish_matching(result, import_file_id, progress_key):
     return progress_data.finish_with_success()
 
 
-def hash_state_object(obj, include_extra_data=True):
-    def add_dictionary_repr_to_hash(hash_obj, dict_obj):
-        assert isinstance(dict_obj, dict)
-
-        for (key, value) in sorted(dict_obj.items(), key=lambda x_y: x_y[0]):
-            if isinstance(value, dict):
-                add_dictionary_repr_to_hash(hash_obj, value)
-            else:
-                # TODO: Do we need to normalize_unicode_and_characters (formerly unidecode) here?
-                hash_obj.update(str(normalize_unicode_and_characters(key)).encode('utf-8'))
-                if isinstance(value, basestring):
-                    hash_obj.update(normalize_unicode_and_characters(value).encode('utf-8'))
-                else:
-                    hash_obj.update(str(value).encode('utf-8'))
-        return hash_obj
-
-    def _get_field_from_obj(field_obj, field):
-        if not hasattr(field_obj, field):
-            return 'FOO'  # Return a random value so we can distinguish between this and None.
-        else:
-            return getattr(field_obj, field)
-
-    m = hashlib.md5()
-    for f in Column.retrieve_db_field_name_for_hash_comparison():
-        obj_val = _get_field_from_obj(obj, f)
-        m.update(f.encode('utf-8'))
-        if isinstance(obj_val, datetime):
-            # if this is a datetime, then make sure to save the string as a naive datetime.
-            # Somehow, somewhere the data are being saved in mapping with a timezone,
-            # then in matching they are removed (but the time is updated correctly)
-            m.update(str(make_naive(obj_val).astimezone(tz.utc).isoformat()).encode('utf-8'))
-        elif isinstance(obj_val, GEOSGeometry):
-            m.update(GEOSGeometry(obj_val, srid=4326).wkt.encode('utf-8'))
-        else:
-            m.update(str(obj_val).encode('utf-8'))
-
-    if include_extra_data:
-        add_dictionary_repr_to_hash(m, obj.extra_data)
-
-    return m.hexdigest()
-
-
 @shared_task
 def _map_additional_models(ids, file_pk, progress_key, cycle_id=None):
     """
@@ -36,6 +36,7 @@ from seed.models import (
     TaxLotState
 )
 from seed.tests.util import DataMappingBaseTestCase
+from seed.utils.state_hash import empty_state_hash, rehash_states
 
 logger = logging.getLogger(__name__)
 
@@ -84,6 +85,33 @@ class TestCaseMultipleDuplicateMatching(DataMappingBaseTestCase):
         hash_res = tasks.hash_state_object(ps6)
         self.assertEqual(len(hash_res), 32)
 
+    def test_empty_state_hash(self):
+        self.assertEqual(empty_state_hash(PropertyState),
+                         tasks.hash_state_object(PropertyState(organization=self.org), include_extra_data=False))
+        self.assertEqual(empty_state_hash(TaxLotState),
+                         tasks.hash_state_object(TaxLotState(organization=self.org), include_extra_data=False))
+        self.assertNotEqual(empty_state_hash(PropertyState), empty_state_hash(TaxLotState))
+
+    def test_rehash_states(self):
+        ps1 = PropertyState.objects.create(
+            organization=self.org,
+            address_line_1='123 fake st',
+            extra_data={"a": "result"},
+        )
+        ps2 = PropertyState.objects.create(
+            organization=self.org,
+            address_line_1='456 fake st',
+        )
+        expected_hash = ps1.hash_object
+        PropertyState.objects.filter(pk=ps1.pk).update(hash_object='stale')
+
+        states = PropertyState.objects.filter(pk__in=[ps1.pk, ps2.pk])
+        self.assertEqual(rehash_states(states, batch_size=1), 1)
+
+        ps1.refresh_from_db()
+        self.assertEqual(ps1.hash_object, expected_hash)
+        self.assertEqual(rehash_states(states), 0)
+
     def test_hash_various_states(self):
         """The hashing should not affect the data_state, source, type and various other states"""
         ps1 = PropertyState.objects.create(
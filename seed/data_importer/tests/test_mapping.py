@@ -14,7 +14,12 @@ from quantityfield.units import ureg
 from seed.data_importer import tasks
 from seed.data_importer.tests.util import FAKE_MAPPINGS
 from seed.lib.mcm import mapper
-from seed.models import ASSESSED_RAW, DATA_STATE_IMPORT, Column
+from seed.models import (
+    ASSESSED_RAW,
+    DATA_STATE_IMPORT,
+    Column,
+    PropertyAuditLog
+)
 from seed.models.column_mappings import get_column_mapping
 from seed.test_helpers.fake import (
     FakePropertyFactory,
@@ -84,6 +89,14 @@ class TestMapping(DataMappingBaseTestCase):
         self.assertEqual(state.extra_data['year_built'], props.first().year_built)
         self.assertEqual(state.extra_data['random_extra'], props.first().extra_data['random_extra'])
 
+        # the bulk created state still gets its hash, normalized address, and import audit log
+        mapped_state = props.first()
+        self.assertIsNotNone(mapped_state.hash_object)
+        self.assertEqual(mapped_state.hash_object, tasks.hash_state_object(mapped_state))
+        self.assertEqual(
+            PropertyAuditLog.objects.filter(state=mapped_state, name='Import Creation').count(), 1
+        )
+
         # from seed.utils.generic import pp
         # for p in props:
         #     pp(p)
@@ -0,0 +1,53 @@
+# !/usr/bin/env python
+# encoding: utf-8
+"""
+SEED Platform (TM), Copyright (c) Alliance for Sustainable Energy, LLC, and other contributors.
+See also https://github.com/seed-platform/seed/main/LICENSE.md
+"""
+from seed.data_importer.matching_index import MatchingCriteriaIndex
+from seed.models import ASSESSED_RAW, PropertyState, PropertyView
+from seed.test_helpers.fake import (
+    FakePropertyStateFactory,
+    FakePropertyViewFactory
+)
+from seed.tests.util import DataMappingBaseTestCase
+from seed.utils.match import matching_criteria_column_names
+
+
+class TestMatchingCriteriaIndex(DataMappingBaseTestCase):
+    def setUp(self):
+        selfvars = self.set_up(ASSESSED_RAW)
+        self.user, self.org, self.import_file, self.import_record, self.cycle = selfvars
+
+        self.property_state_factory = FakePropertyStateFactory(organization=self.org)
+        self.property_view_factory = FakePropertyViewFactory(organization=self.org, cycle=self.cycle)
+        self.column_names = matching_criteria_column_names(self.org.id, 'PropertyState')
+
+    def test_index_groups_cycle_states_by_matching_criteria(self):
+        state_1 = self.property_state_factory.get_property_state(
+            no_default_data=True, pm_property_id='1234', address_line_1='123 Match Street'
+        )
+        state_2 = self.property_state_factory.get_property_state(
+            no_default_data=True, pm_property_id='5678'
+        )
+        self.property_view_factory.get_property_view(state=state_1)
+        self.property_view_factory.get_property_view(state=state_2)
+
+        # a -State that isn't attached to a -View of the cycle is not indexed
+        self.property_state_factory.get_property_state(
+            no_default_data=True, pm_property_id='1234', address_line_1='123 Match Street'
+        )
+
+        index = MatchingCriteriaIndex.for_cycle_views(PropertyState, PropertyView, self.cycle, self.column_names)
+        self.assertEqual(len(index), 2)
+
+        incoming = self.property_state_factory.get_property_state(
+            no_default_data=True, pm_property_id='1234', address_line_1='123 Match Street'
+        )
+        [(state_id, key, _ubid)] = index.criteria_of(PropertyState.objects.filter(pk=incoming.id))
+        self.assertEqual(state_id, incoming.id)
+        self.assertEqual([s.id for s in index.candidates(key)], [state_1.id])
+
+        index.remove([state_1.id])
+        self.assertEqual(index.candidates(key), [])
+        self.assertEqual(len(index), 1)
@@ -0,0 +1,86 @@
+# !/usr/bin/env python
+# encoding: utf-8
+"""
+SEED Platform (TM), Copyright (c) Alliance for Sustainable Energy, LLC, and other contributors.
+See also https://github.com/seed-platform/seed/main/LICENSE.md
+"""
+from datetime import datetime
+
+from django.db import DataError
+from django.db.utils import ProgrammingError
+from django.test import TestCase
+from django.utils.timezone import make_aware
+from pytz import timezone
+
+from config.settings.common import TIME_ZONE
+from seed.data_importer.readings_loader import (
+    upsert_meter_readings,
+    upsert_sensor_readings
+)
+from seed.landing.models import SEEDUser as User
+from seed.models import DataLogger, Meter, Sensor
+from seed.test_helpers.fake import FakePropertyFactory
+from seed.utils.organizations import create_organization
+
+
+class TestReadingsLoader(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_superuser(
+            email='test_user@demo.com', username='test_user@demo.com', password='test_pass'
+        )
+        self.org, _, _ = create_organization(self.user)
+        self.property = FakePropertyFactory(organization=self.org).get_property()
+        self.tz_obj = timezone(TIME_ZONE)
+
+    def test_upsert_meter_readings_creates_and_updates_readings(self):
+        meter = Meter.objects.create(property=self.property, type=Meter.ELECTRICITY_GRID, source=Meter.PORTFOLIO_MANAGER)
+        readings = [
+            {
+                'start_time': make_aware(datetime(2020, month, 1), timezone=self.tz_obj),
+                'end_time': make_aware(datetime(2020, month + 1, 1), timezone=self.tz_obj),
+                'reading': 100.5 * month,
+                'source_unit': 'kWh (thousand Watt-hours)',
+                'conversion_factor': 3.412,
+            }
+            for month in range(1, 4)
+        ]
+        self.assertEqual(upsert_meter_readings(meter.id, readings), 3)
+
+        readings[0]['reading'] = 12
+        self.assertEqual(upsert_meter_readings(meter.id, readings[:1]), 1)
+
+        self.assertEqual(
+            list(meter.meter_readings.order_by('start_time').values_list('start_time', 'reading', 'source_unit')),
+            [
+                (readings[0]['start_time'], 12, 'kWh (thousand Watt-hours)'),
+                (readings[1]['start_time'], 201, 'kWh (thousand Watt-hours)'),
+                (readings[2]['start_time'], 301.5, 'kWh (thousand Watt-hours)'),
+            ]
+        )
+
+        with self.assertRaises(ProgrammingError):
+            upsert_meter_readings(meter.id, readings[1:2] * 2)
+
+    def test_upsert_sensor_readings_sets_occupancy_of_each_reading(self):
+        data_logger = DataLogger.objects.create(property=self.property, display_name='logger')
+        sensor = Sensor.objects.create(data_logger=data_logger, display_name='s1', column_name='s1')
+        is_occupied_data = [
+            ('2020-01-01T08:00:00-08:00', True),
+            ('2020-01-01T17:00:00-08:00', False),
+        ]
+        readings = [
+            ('2020-01-01T07:00:00-08:00', '1'),
+            ('2020-01-01T08:00:00-08:00', '2'),
+            ('2020-01-01T09:00:00-08:00', '3.5'),
+            ('2020-01-01T18:00:00-08:00', '4'),
+        ]
+
+        self.assertEqual(upsert_sensor_readings(sensor.id, readings, is_occupied_data), 4)
+
+        self.assertEqual(
+            list(sensor.sensor_readings.order_by('timestamp').values_list('reading', 'is_occupied')),
+            [(1, False), (2, False), (3.5, True), (4, False)]
+        )
+
+        with self.assertRaises(DataError):
+            upsert_sensor_readings(sensor.id, [('2020-01-01T10:00:00-08:00', '')], is_occupied_data)
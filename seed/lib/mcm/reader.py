@@ -8,6 +8,7 @@ The Reader module is intended to contain only code which reads data
 out of CSV files. Fuzzy matches, application to data models happens
 elsewhere.
 """
+import io
 import json
 import logging
 import mmap
@@ -481,6 +482,7 @@ class CSVParser(object):
         )
         self.has_generated_headers = generated_headers
         self.csvfile.seek(0)  # not positive this is required, but adding it just in case
+        self.dialect = dialect
         self.csvreader = DictReader(self.csvfile, dialect=dialect, fieldnames=fieldnames)
 
     def seek_to_beginning(self):
@@ -499,6 +501,99 @@ class CSVParser(object):
         """original ordered list of headers with leading and trailing spaces stripped"""
         return [entry.strip() for entry in self.csvreader.fieldnames]
 
+    @property
+    def dialect_kwargs(self):
+        """the sniffed dialect as a dict of csv formatting parameters that can be serialized
+
+        :return: dict, keyword arguments for csv.DictReader
+        """
+        return {
+            'delimiter': self.dialect.delimiter,
+            'quotechar': self.dialect.quotechar,
+            'doublequote': self.dialect.doublequote,
+            'escapechar': self.dialect.escapechar,
+            'skipinitialspace': self.dialect.skipinitialspace,
+            'quoting': self.dialect.quoting,
+        }
+
+
+def csv_chunk_offsets(binary_file, chunk_size, quotechar='"'):
+    """Scan a CSV file and yield the byte ranges that hold ``chunk_size`` data records each.
+
+    Only a single line of the file is in memory at a time. A record ends at a line break that
+    is not inside of a quoted field, so quoted values with line breaks are never split across
+    two ranges. The header record and empty lines are not counted as data records.
+
+    usage:
+            with open('data.csv', 'rb') as f:
+                for start, end, num_rows in csv_chunk_offsets(f, 100):
+                    rows = read_csv_range(f, start, end, fieldnames, dialect_kwargs)
+
+    :param binary_file: file opened in binary mode
+    :param chunk_size: int, number of data records per range
+    :param quotechar: str, character used to quote fields
+    :return: generator of tuples, (start byte offset, end byte offset, number of records)
+    """
+    quote = (quotechar or '"').encode('utf-8')
+    binary_file.seek(0)
+
+    position = 0
+    record_start = 0
+    in_quotes = False
+    is_header = True
+    is_blank = False
+    start = None
+    num_rows = 0
+    for line in iter(binary_file.readline, b''):
+        if not in_quotes:
+            record_start = position
+            is_blank = line.strip(b'\r\n') == b''
+        position += len(line)
+
+        # an odd number of quotes opens or closes a quoted field that continues on the next line
+        if line.count(quote) % 2:
+            in_quotes = not in_quotes
+        if in_quotes:
+            continue
+
+        if is_header:
+            is_header = False
+            continue
+        if is_blank:
+            continue
+
+        if start is None:
+            start = record_start
+        num_rows += 1
+        if num_rows == chunk_size:
+            yield start, position, num_rows
+            start = None
+            num_rows = 0
+
+    # an unterminated quoted field at the end of the file is its own (last) record
+    if in_quotes and not is_header:
+        if start is None:
+            start = record_start
+        num_rows += 1
+
+    if num_rows:
+        yield start, position, num_rows
+
+
+def read_csv_range(binary_file, start, end, fieldnames, dialect_kwargs):
+    """Read the CSV records between two byte offsets that were found by csv_chunk_offsets
+
+    :param binary_file: file opened in binary mode
+    :param start: int, byte offset of the first record
+    :param end: int, byte offset after the last record
+    :param fieldnames: list, the (cleaned) headers of the file
+    :param dialect_kwargs: dict, csv formatting parameters (see CSVParser.dialect_kwargs)
+    :return: list of dicts, one per record
+    """
+    binary_file.seek(start)
+    text = io.TextIOWrapper(io.BytesIO(binary_file.read(end - start)), newline=None)
+    return list(DictReader(text, fieldnames=fieldnames, **dialect_kwargs))
+
 
 class MCMParser(object):
     """
@@ -4,11 +4,12 @@
 SEED Platform (TM), Copyright (c) Alliance for Sustainable Energy, LLC, and other contributors.
 See also https://github.com/seed-platform/seed/main/LICENSE.md
 """
+import io
 import os
 
 from django.test import TestCase
 
-from seed.lib.mcm.reader import MCMParser
+from seed.lib.mcm.reader import MCMParser, csv_chunk_offsets, read_csv_range
 
 
 class CSVParserTest(TestCase):
@@ -67,6 +68,38 @@ class CSVParserTest(TestCase):
 
         self.assertEqual(self.parser.first_five_rows, expectation)
 
+    def test_it_streams_chunks_by_byte_offsets(self):
+        with open(self.file.name, "rb") as binary_file:
+            offsets = list(csv_chunk_offsets(binary_file, 1))
+            self.assertEqual([num_rows for _, _, num_rows in offsets], [1, 1])
+
+            data = []
+            for start, end, _ in offsets:
+                data += read_csv_range(
+                    binary_file, start, end, self.parser.reader.csvreader.fieldnames, self.parser.reader.dialect_kwargs
+                )
+
+        self.assertEqual(data, [dict(row) for row in self.parser.data])
+
+
+class CSVChunkOffsetsTest(TestCase):
+    def test_quoted_line_breaks_and_blank_lines_are_not_split(self):
+        binary_file = io.BytesIO(b'a,b\r\n1,"x\r\ny"\r\n\r\n2,z\r\n3,"q""r"\r\n4,w')
+
+        offsets = list(csv_chunk_offsets(binary_file, 2))
+        self.assertEqual([num_rows for _, _, num_rows in offsets], [2, 2])
+
+        data = []
+        for start, end, _ in offsets:
+            data += read_csv_range(binary_file, start, end, ['a', 'b'], {'delimiter': ','})
+
+        self.assertEqual(data, [
+            {'a': '1', 'b': 'x\ny'},
+            {'a': '2', 'b': 'z'},
+            {'a': '3', 'b': 'q"r'},
+            {'a': '4', 'b': 'w'},
+        ])
+
 
 class CSVMissingHeadersParserTest(TestCase):
     def setUp(self):
@@ -15,9 +15,12 @@ from seed.lib.superperms.orgs.models import (
     ROLE_MEMBER,
     ROLE_OWNER,
     ROLE_VIEWER,
-    Organization,
     OrganizationUser
 )
+from seed.lib.superperms.orgs.org_cache import (
+    get_organization,
+    get_organization_user
+)
 from seed.lib.superperms.orgs.permissions import get_org_id
 
 # Allow Super Users to ignore permissions.
@@ -174,21 +177,18 @@ def _validate_permissions(perm_name, request, requires_org):
         elif perm_name != 'requires_owner_or_superuser_without_org':
             return _make_resp('perm_denied')
 
+    # the organization and the membership are resolved once per request, see org_cache
     org_id = get_org_id(request)
-    try:
-        org = Organization.objects.get(pk=org_id)
-    except Organization.DoesNotExist:
+    org = get_organization(request, org_id)
+    if org is None:
         return _make_resp('org_dne')
 
     # Skip perms checks if settings allow super_users to bypass.
     if request.user.is_superuser and ALLOW_SUPER_USER_PERMS:
         return
 
-    try:
-        org_user = OrganizationUser.objects.get(
-            user=request.user, organization=org
-        )
-    except OrganizationUser.DoesNotExist:
+    org_user = get_organization_user(request, org)
+    if org_user is None:
         return _make_resp('user_dne')
 
     if not PERMS.get(perm_name, lambda x: False)(org_user):
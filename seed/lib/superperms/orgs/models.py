@@ -9,9 +9,13 @@ import logging
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.db import models
-from django.db.models.signals import pre_delete
+from django.db.models.signals import post_delete, post_save, pre_delete
 
 from seed.lib.superperms.orgs.exceptions import TooManyNestedOrgs
+from seed.lib.superperms.orgs.org_cache import (
+    ORG_CACHE_TIMEOUT,
+    invalidate_organization
+)
 
 _log = logging.getLogger(__name__)
 
@@ -331,3 +335,21 @@ def organization_pre_delete(sender, instance, **kwargs):
 
 
 pre_delete.connect(organization_pre_delete, sender=Organization)
+
+
+def organization_post_write(sender, instance, **kwargs):
+    invalidate_organization(instance.pk)
+    # the memberships of the child organizations are cached with their parent
+    if ORG_CACHE_TIMEOUT:
+        for child_org_id in instance.child_orgs.values_list('pk', flat=True):
+            invalidate_organization(child_org_id)
+
+
+def organization_user_post_write(sender, instance, **kwargs):
+    invalidate_organization(instance.organization_id)
+
+
+post_save.connect(organization_post_write, sender=Organization)
+post_delete.connect(organization_post_write, sender=Organization)
+post_save.connect(organization_user_post_write, sender=OrganizationUser)
+post_delete.connect(organization_user_post_write, sender=OrganizationUser)
@@ -0,0 +1,154 @@
+# !/usr/bin/env python
+# encoding: utf-8
+"""
+SEED Platform (TM), Copyright (c) Alliance for Sustainable Energy, LLC, and other contributors.
+See also https://github.com/seed-platform/seed/main/LICENSE.md
+
+Resolution of the Organization and the OrganizationUser of a request. The permission decorators,
+the permission classes and OrgMixin all look up the same rows, so they are memoized for the
+request being handled by the thread and looked up once per request.
+
+When ORG_CACHE_TIMEOUT is set (in seconds, with the SEED_ORG_CACHE_TIMEOUT setting), the rows
+are also kept in the Django cache for that long, under a version key of the organization which
+is replaced whenever the organization or one of its memberships is written, so stale entries are
+never read and simply expire.
+"""
+import threading
+import weakref
+from uuid import uuid4
+
+from django.conf import settings
+from django.db import transaction
+
+from seed.utils.cache import get_cache_raw, set_cache_raw
+
+ORG_CACHE_TIMEOUT = getattr(settings, 'SEED_ORG_CACHE_TIMEOUT', 0)
+
+# rows resolved for the request being handled by the thread
+_local = threading.local()
+
+
+def _request_cache(request):
+    # a DRF Request and the HttpRequest it wraps share the same rows
+    request = getattr(request, '_request', request)
+    request_ref = getattr(_local, 'request_ref', None)
+    if request_ref is None or request_ref() is not request:
+        _local.request_ref = weakref.ref(request)
+        _local.rows = {}
+    return _local.rows
+
+
+def _clear_request_cache():
+    _local.request_ref = None
+    _local.rows = {}
+
+
+def _organization_id(org_id):
+    # callers pass the Organization, or its id as an int or a str
+    org_id = getattr(org_id, 'pk', org_id)
+    try:
+        return int(org_id)
+    except (TypeError, ValueError):
+        return None
+
+
+def _version_key(org_id):
+    return f'org_resolution_version:{org_id}'
+
+
+def _bump_version(org_id):
+    set_cache_raw(_version_key(org_id), uuid4().hex, None)
+
+
+def _shared_key(org_id, name):
+    """Key of a row in the Django cache, or None if the shared cache is disabled"""
+    if not ORG_CACHE_TIMEOUT or org_id is None:
+        return None
+    version = get_cache_raw(_version_key(org_id))
+    if version is None:
+        version = uuid4().hex
+        set_cache_raw(_version_key(org_id), version, None)
+    return f'org_resolution:{org_id}:{version}:{name}'
+
+
+def invalidate_organization(org_id):
+    """Invalidate the cached Organization and OrganizationUsers of an organization, including the
+    rows resolved for the current request. The version is bumped right away and again once the
+    current transaction commits, so that rows read from the database before the commit are not
+    kept.
+
+    :param org_id: int or Organization
+    """
+    _clear_request_cache()
+    org_id = _organization_id(org_id)
+    if org_id is None or not ORG_CACHE_TIMEOUT:
+        return
+    _bump_version(org_id)
+    transaction.on_commit(lambda: _bump_version(org_id))
+
+
+def _resolve(request, org_id, name, fetch):
+    """Row from the request, the Django cache or fetch(), None if it does not exist. Missing rows
+    are not memoized, so a membership created during the request is found.
+    """
+    request_cache = _request_cache(request)
+    key = (name, _organization_id(org_id))
+    row = request_cache.get(key)
+    if row is not None:
+        return row
+
+    shared_key = _shared_key(key[1], name)
+    row = get_cache_raw(shared_key) if shared_key else None
+    if row is None:
+        row = fetch()
+        if row is not None and shared_key:
+            set_cache_raw(shared_key, row, ORG_CACHE_TIMEOUT)
+
+    if row is not None:
+        request_cache[key] = row
+    return row
+
+
+def get_organization(request, org_id):
+    """Organization of the request
+
+    :param request: Request or HttpRequest
+    :param org_id: int or str, id of the organization
+    :return: Organization, or None if it does not exist
+    """
+    from seed.lib.superperms.orgs.models import Organization
+
+    def fetch():
+        try:
+            return Organization.objects.get(pk=org_id)
+        except Organization.DoesNotExist:
+            return None
+
+    return _resolve(request, org_id, 'organization', fetch)
+
+
+def get_organization_user(request, org_id):
+    """OrganizationUser of the user of the request in an organization, with its organization and
+    the parent of its organization
+
+    :param request: Request or HttpRequest
+    :param org_id: int, str or Organization
+    :return: OrganizationUser, or None if the user is not a member of the organization
+    """
+    from seed.lib.superperms.orgs.models import OrganizationUser
+
+    org_id = getattr(org_id, 'pk', org_id)
+
+    def fetch():
+        try:
+            return OrganizationUser.objects.select_related('organization__parent_org').get(
+                user=request.user, organization_id=org_id
+            )
+        except OrganizationUser.DoesNotExist:
+            return None
+
+    org_user = _resolve(request, org_id, f'organization_user:{request.user.pk}', fetch)
+    if org_user is not None:
+        # the user of the request is current, unlike the user of a cached row
+        org_user.user = request.user
+    return org_user
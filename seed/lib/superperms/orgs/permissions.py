@@ -19,9 +19,11 @@ from rest_framework.permissions import BasePermission
 from seed.lib.superperms.orgs.models import (
     ROLE_MEMBER,
     ROLE_OWNER,
-    ROLE_VIEWER,
-    Organization,
-    OrganizationUser
+    ROLE_VIEWER
+)
+from seed.lib.superperms.orgs.org_cache import (
+    get_organization,
+    get_organization_user
 )
 
 # Allow Super Users to ignore permissions.
@@ -186,20 +188,15 @@ class SEEDOrgPermissions(BasePermission):
         if not org_id:
             org = get_user_org(request.user)
             org_id = getattr(org, 'pk')
-        try:
-            org_user = OrganizationUser.objects.get(
-                user=request.user, organization__id=org_id
-            )
+        org_user = get_organization_user(request, org_id)
+        if org_user is not None:
             has_perm = org_user.role_level >= required_perm
-        except OrganizationUser.DoesNotExist:
+        else:
             self.message = 'No relationship to organization'
             # return the right error message. we wait until here to check for
             # organization so the extra db call is not made if not needed.
-            if not org:
-                try:
-                    org = Organization.objects.get(id=org_id)
-                except Organization.DoesNotExist:
-                    self.message = 'Organization does not exist'
+            if not org and get_organization(request, org_id) is None:
+                self.message = 'Organization does not exist'
         return has_perm
 
     def has_permission(self, request, view):
@@ -7,34 +7,39 @@ from django.core.management.base import BaseCommand
 from django.db import transaction
 
 from seed.models import PropertyState, TaxLotState
+from seed.utils.state_hash import rehash_states
 
 
 class Command(BaseCommand):
     help = 'Rehashes all Property and Tax Lot states, and reports how many were modified'
 
-    def handle(self, *args, **options):
-        properties_updated = 0
-        taxlots_updated = 0
+    def add_arguments(self, parser):
+        parser.add_argument('--org_id',
+                            help='Only rehash the states of this organization',
+                            action='store',
+                            dest='org_id')
+
+        parser.add_argument('--batch_size',
+                            help='Number of states to load and update at a time',
+                            action='store',
+                            dest='batch_size',
+                            type=int,
+                            default=1000)
 
+    def handle(self, *args, **options):
         with transaction.atomic():
             property_states = PropertyState.objects.all()
-            self.stdout.write("Re-hashing %s Property States" % len(property_states))
-
-            for state in property_states:
-                old_hash = state.hash_object
-                state.save(update_fields=['hash_object'])
-                if state.hash_object != old_hash:
-                    properties_updated += 1
+            if options['org_id']:
+                property_states = property_states.filter(organization_id=options['org_id'])
+            self.stdout.write("Re-hashing %s Property States" % property_states.count())
 
+            properties_updated = rehash_states(property_states, batch_size=options['batch_size'])
             self.stdout.write("  %s Property States updated" % properties_updated)
 
             taxlot_states = TaxLotState.objects.all()
-            self.stdout.write("Re-hashing %s Tax Lot States" % len(taxlot_states))
-
-            for state in taxlot_states:
-                old_hash = state.hash_object
-                state.save(update_fields=['hash_object'])
-                if state.hash_object != old_hash:
-                    taxlots_updated += 1
+            if options['org_id']:
+                taxlot_states = taxlot_states.filter(organization_id=options['org_id'])
+            self.stdout.write("Re-hashing %s Tax Lot States" % taxlot_states.count())
 
+            taxlots_updated = rehash_states(taxlot_states, batch_size=options['batch_size'])
             self.stdout.write("  %s Tax Lot States updated" % taxlots_updated)
@@ -0,0 +1,37 @@
+# Generated by Django 3.2.23 on 2024-01-22 10:12
+
+import django.core.serializers.json
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('seed', '0214_delete_filtergroup_labels'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='compliancemetric',
+            name='results_signature',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+        migrations.CreateModel(
+            name='ComplianceMetricResult',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('property_state_id', models.IntegerField()),
+                ('state_updated', models.DateTimeField(null=True)),
+                ('status', models.CharField(max_length=1, null=True)),
+                ('data', models.JSONField(default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('compliance_metric', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='results', to='seed.compliancemetric')),
+                ('cycle', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='seed.cycle')),
+                ('property_view', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='seed.propertyview')),
+            ],
+            options={
+                'unique_together': {('compliance_metric', 'property_view')},
+                'index_together': {('compliance_metric', 'cycle')},
+            },
+        ),
+    ]
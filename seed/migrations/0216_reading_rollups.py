@@ -0,0 +1,127 @@
+# Generated by Django 3.2.23 on 2024-02-05 09:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# the readings are prorated into the hours (in UTC, which has the same hours as the local time)
+# and the months (in the local time) that they overlap, in proportion to the overlapping seconds
+PRORATE_METER_READINGS_SQL = """
+    INSERT INTO {rollup_table} (meter_id, interval, period_start, reading, seconds)
+    SELECT meter_id, %(interval)s, period_start, SUM(reading / total_seconds * overlap_seconds), SUM(overlap_seconds)
+    FROM (
+        SELECT
+            r.meter_id,
+            r.reading,
+            p.local_start AT TIME ZONE %(tz)s AS period_start,
+            ROUND(EXTRACT(EPOCH FROM r.end_time - r.start_time)) AS total_seconds,
+            ROUND(EXTRACT(EPOCH FROM
+                LEAST(r.end_time, (p.local_start + %(step)s::interval) AT TIME ZONE %(tz)s)
+                - GREATEST(r.start_time, p.local_start AT TIME ZONE %(tz)s)
+            )) AS overlap_seconds
+        FROM {reading_table} r
+        CROSS JOIN LATERAL generate_series(
+            date_trunc(%(interval)s, r.start_time AT TIME ZONE %(tz)s),
+            r.end_time AT TIME ZONE %(tz)s,
+            %(step)s::interval
+        ) AS p(local_start)
+        WHERE r.reading IS NOT NULL
+    ) overlaps
+    WHERE total_seconds > 0 AND overlap_seconds > 0
+    GROUP BY meter_id, period_start
+"""
+
+SENSOR_HOURS_SQL = """
+    INSERT INTO {rollup_table} (sensor_id, interval, period_start, is_occupied, reading_sum, reading_count)
+    SELECT
+        sensor_id, 'hour',
+        date_trunc('hour', timestamp AT TIME ZONE 'UTC') AT TIME ZONE 'UTC' AS hour,
+        is_occupied, SUM(reading), COUNT(reading)
+    FROM {reading_table}
+    GROUP BY sensor_id, hour, is_occupied
+"""
+
+ROLL_UP_SQL = """
+    INSERT INTO {rollup_table} ({id_column}, interval, period_start{keys}, {sums})
+    SELECT
+        {id_column}, %(to_interval)s,
+        date_trunc(%(to_interval)s, period_start AT TIME ZONE %(tz)s) AT TIME ZONE %(tz)s AS rolled_up_period_start{keys},
+        {sum_aggregates}
+    FROM {rollup_table}
+    WHERE interval = %(from_interval)s
+    GROUP BY {id_column}, rolled_up_period_start{keys}
+"""
+
+
+def roll_up(cursor, rollup_table, id_column, from_interval, to_interval, key_columns, sum_columns):
+    keys = ''.join(f', {column}' for column in key_columns)
+    cursor.execute(
+        ROLL_UP_SQL.format(
+            rollup_table=rollup_table,
+            id_column=id_column,
+            keys=keys,
+            sums=', '.join(sum_columns),
+            sum_aggregates=', '.join(f'SUM({column})' for column in sum_columns),
+        ),
+        {'from_interval': from_interval, 'to_interval': to_interval, 'tz': settings.TIME_ZONE}
+    )
+
+
+def build_rollups(apps, schema_editor):
+    meter_readings = apps.get_model('seed', 'MeterReading')._meta.db_table
+    meter_rollups = apps.get_model('seed', 'MeterReadingRollup')._meta.db_table
+    sensor_readings = apps.get_model('seed', 'SensorReading')._meta.db_table
+    sensor_rollups = apps.get_model('seed', 'SensorReadingRollup')._meta.db_table
+
+    with schema_editor.connection.cursor() as cursor:
+        for interval, step, tz in [('hour', '1 hour', 'UTC'), ('month', '1 month', settings.TIME_ZONE)]:
+            cursor.execute(
+                PRORATE_METER_READINGS_SQL.format(rollup_table=meter_rollups, reading_table=meter_readings),
+                {'interval': interval, 'step': step, 'tz': tz}
+            )
+        roll_up(cursor, meter_rollups, 'meter_id', 'hour', 'day', [], ['reading', 'seconds'])
+        roll_up(cursor, meter_rollups, 'meter_id', 'month', 'year', [], ['reading', 'seconds'])
+
+        cursor.execute(SENSOR_HOURS_SQL.format(rollup_table=sensor_rollups, reading_table=sensor_readings))
+        for from_interval, to_interval in [('hour', 'day'), ('day', 'month'), ('month', 'year')]:
+            roll_up(cursor, sensor_rollups, 'sensor_id', from_interval, to_interval, ['is_occupied'], ['reading_sum', 'reading_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('seed', '0215_compliancemetricresult'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MeterReadingRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('interval', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day'), ('month', 'Month'), ('year', 'Year')], max_length=5)),
+                ('period_start', models.DateTimeField()),
+                ('reading', models.FloatField()),
+                ('seconds', models.FloatField()),
+                ('meter', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reading_rollups', to='seed.meter')),
+            ],
+            options={
+                'unique_together': {('meter', 'interval', 'period_start')},
+            },
+        ),
+        migrations.CreateModel(
+            name='SensorReadingRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('interval', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day'), ('month', 'Month'), ('year', 'Year')], max_length=5)),
+                ('period_start', models.DateTimeField()),
+                ('is_occupied', models.BooleanField()),
+                ('reading_sum', models.FloatField(null=True)),
+                ('reading_count', models.IntegerField()),
+                ('sensor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reading_rollups', to='seed.sensor')),
+            ],
+            options={
+                'unique_together': {('sensor', 'interval', 'period_start', 'is_occupied')},
+            },
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
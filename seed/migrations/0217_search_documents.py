@@ -0,0 +1,77 @@
+# Generated by Django 3.2.23 on 2024-02-12 10:15
+
+import django.contrib.postgres.indexes
+from django.conf import settings
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+# the fields of the search documents when the documents were added
+PROPERTY_SEARCH_FIELDS = [
+    'pm_property_id',
+    'pm_parent_property_id',
+    'jurisdiction_property_id',
+    'custom_id_1',
+    'ubid',
+    'property_name',
+    'address_line_1',
+    'address_line_2',
+    'city',
+    'postal_code',
+]
+
+TAXLOT_SEARCH_FIELDS = [
+    'jurisdiction_tax_lot_id',
+    'custom_id_1',
+    'ubid',
+    'block_number',
+    'address_line_1',
+    'address_line_2',
+    'city',
+    'postal_code',
+]
+
+
+def build_search_documents(apps, schema_editor):
+    # the identifiers and address of the -States, and the values of the configured extra data
+    # keys, lowercased and separated by spaces
+    extra_data_keys = getattr(settings, 'SEED_SEARCH_EXTRA_DATA_KEYS', [])
+    for model_name, fields in [('PropertyState', PROPERTY_SEARCH_FIELDS), ('TaxLotState', TAXLOT_SEARCH_FIELDS)]:
+        table = apps.get_model('seed', model_name)._meta.db_table
+        values = [f"NULLIF(BTRIM({field}), '')" for field in fields]
+        values += ["NULLIF(BTRIM(extra_data ->> %s), '')"] * len(extra_data_keys)
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {table} SET search_document = NULLIF(LOWER(CONCAT_WS(' ', {', '.join(values)})), '')",
+                list(extra_data_keys)
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('seed', '0216_reading_rollups'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='propertystate',
+            name='search_document',
+            field=models.TextField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='taxlotstate',
+            name='search_document',
+            field=models.TextField(blank=True, editable=False, null=True),
+        ),
+        # the documents are built before the indexes, which are faster to build than to maintain
+        migrations.RunPython(build_search_documents, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='propertystate',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_document'], name='propertystate_search_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='taxlotstate',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_document'], name='taxlotstate_search_trgm', opclasses=['gin_trgm_ops']),
+        ),
+    ]
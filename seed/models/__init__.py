@@ -31,6 +31,7 @@ from .meters import *  # noqa
 from .salesforce_configs import *  # noqa
 from .salesforce_mappings import *  # noqa
 from .sensors import *  # noqa
+from .reading_rollups import *  # noqa
 from .simulations import *  # noqa
 from .building_file import *  # noqa
 from .inventory_document import *  # noqa
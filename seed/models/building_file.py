@@ -29,6 +29,7 @@ from seed.models import (
     PropertyState,
     Scenario
 )
+from seed.utils.reading_rollups import refresh_meter_rollups
 
 _log = logging.getLogger(__name__)
 
@@ -348,6 +349,7 @@ class BuildingFile(models.Model):
                     for mr in valid_readings
                 }
                 MeterReading.objects.bulk_create(valid_reading_models)
+                refresh_meter_rollups([meter.id])
 
         # merge or create the property state's view
         if property_view:
@@ -16,13 +16,20 @@ from django.apps import apps
 from django.core.exceptions import ValidationError
 from django.db import IntegrityError, models, transaction
 from django.db.models import Q
-from django.db.models.signals import pre_save
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_save
+)
 from django.utils.translation import gettext_lazy as _
 from past.builtins import basestring
 
 from seed.lib.superperms.orgs.models import Organization as SuperOrganization
 from seed.models.column_mappings import ColumnMapping
 from seed.models.models import Unit
+from seed.utils.column_cache import column_metadata, invalidate_column_metadata
+from seed.utils.pagination import invalidate_inventory_counts
 
 INVENTORY_DISPLAY = {
     'PropertyState': 'Property',
@@ -57,6 +64,7 @@ class Column(models.Model):
     EXCLUDED_COLUMN_RETURN_FIELDS = [
         'hash_object',
         'normalized_address',
+        'search_document',
         # Records below are old and should not be used
         'source_eui_modeled_orig',
         'site_eui_orig',
@@ -96,6 +104,7 @@ class Column(models.Model):
     # Column.retrieve_all method. Note that not all the endpoints are respecting this at the moment.
     EXCLUDED_API_FIELDS = [
         'normalized_address',
+        'search_document',
     ]
 
     # These are the columns that are removed when looking to see if the records are the same
@@ -141,6 +150,7 @@ class Column(models.Model):
         'extra_data',
         'lot_number',
         'normalized_address',
+        'search_document',
         'geocoded_address',
         'geocoded_postal_code',
         'geocoded_side_of_street',
@@ -765,6 +775,10 @@ class Column(models.Model):
 
         from seed.models.properties import PropertyState
         from seed.models.tax_lots import DATA_STATE_MATCHING, TaxLotState
+        from seed.utils.column_rewrite import (
+            requires_state_save,
+            rewrite_state_column
+        )
         STR_TO_CLASS = {'TaxLotState': TaxLotState, 'PropertyState': PropertyState}
 
         def _serialize_for_extra_data(column_value):
@@ -825,13 +839,15 @@ class Column(models.Model):
                         merge_protection=self.merge_protection
                     )
 
-                # go through the data and move it to the new field. I'm not sure yet on how long this is
-                # going to take to run, so we may have to move this to a background task
+                # go through the data and move it to the new field
                 orig_data = STR_TO_CLASS[self.table_name].objects.filter(
                     organization=self.organization,
                     data_state=DATA_STATE_MATCHING
                 )
-                if new_column.is_extra_data:
+                if not requires_state_save(self, new_column):
+                    # move the data with bulk updates
+                    rewrite_state_column(orig_data, self, new_column)
+                elif new_column.is_extra_data:
                     if self.is_extra_data:
                         for datum in orig_data:
                             datum.extra_data[new_column.column_name] = datum.extra_data.get(self.column_name, None)
@@ -859,6 +875,8 @@ class Column(models.Model):
         except DimensionalityError:
             return [False, "The column data can't be converted to the new column due to conversion constraints (e.g., converting square feet to kBtu etc.)."]
 
+        invalidate_inventory_counts(organization_id=self.organization_id)
+
         # Return true if this operation was successful
         return [True, 'Successfully renamed column and moved data']
 
@@ -1165,49 +1183,95 @@ class Column(models.Model):
         """
         db_columns = Column.retrieve_db_field_table_and_names_from_db_tables()
         for key in model_obj.extra_data:
-            # Check if the extra_data field in the model object is a database column
-            is_extra_data = (model_obj.__class__.__name__, key[:511]) not in db_columns
-
-            # handle the special edge-case where an old organization may have duplicate columns
-            # in the database. We should make this a migration in the future and put a validation
-            # in the db.
-            for i in range(0, 5):
-                while True:
-                    try:
-                        Column.objects.get_or_create(
-                            table_name=model_obj.__class__.__name__,
+            Column._save_column_name(model_obj.__class__.__name__, key, model_obj.organization, db_columns)
+
+    @staticmethod
+    def save_column_names_for_states(model_objs):
+        """Save unique column names for the extra_data of a batch of states in this organization.
+
+        Same as save_column_names, but the extra_data keys of all the states are combined and
+        the columns that already exist are looked up with a single query, so that only the
+        new keys go through get_or_create.
+
+        :param model_objs: list of PropertyState or TaxLotState instances of a single organization
+        """
+        if not model_objs:
+            return
+
+        table_name = model_objs[0].__class__.__name__
+        organization = model_objs[0].organization
+        keys = set()
+        for model_obj in model_objs:
+            keys.update(key[:511] for key in model_obj.extra_data)
+        if not keys:
+            return
+
+        existing_columns = set(
+            Column.objects.filter(
+                table_name=table_name,
+                column_name__in=keys,
+                organization=organization,
+            ).values_list('column_name', 'is_extra_data')
+        )
+
+        db_columns = Column.retrieve_db_field_table_and_names_from_db_tables()
+        for key in sorted(keys):
+            is_extra_data = (table_name, key) not in db_columns
+            if (key, is_extra_data) not in existing_columns:
+                Column._save_column_name(table_name, key, organization, db_columns)
+
+    @staticmethod
+    def _save_column_name(table_name, key, organization, db_columns):
+        """Get or create the column of an extra_data key, cleaning up duplicate columns if needed
+
+        :param table_name: str, PropertyState or TaxLotState
+        :param key: str, extra_data key
+        :param organization: Organization instance
+        :param db_columns: result of retrieve_db_field_table_and_names_from_db_tables
+        """
+        # Check if the extra_data field in the model object is a database column
+        is_extra_data = (table_name, key[:511]) not in db_columns
+
+        # handle the special edge-case where an old organization may have duplicate columns
+        # in the database. We should make this a migration in the future and put a validation
+        # in the db.
+        for i in range(0, 5):
+            while True:
+                try:
+                    Column.objects.get_or_create(
+                        table_name=table_name,
+                        column_name=key[:511],
+                        is_extra_data=is_extra_data,
+                        organization=organization,
+                    )
+                except Column.MultipleObjectsReturned:
+                    _log.debug(
+                        "Column.MultipleObjectsReturned for {} in save_column_names".format(
+                            key[:511]))
+
+                    columns = Column.objects.filter(table_name=table_name,
+                                                    column_name=key[:511],
+                                                    is_extra_data=is_extra_data,
+                                                    organization=organization)
+                    for c in columns:
+                        if not ColumnMapping.objects.filter(
+                                Q(column_raw=c) | Q(column_mapped=c)).exists():
+                            _log.debug("Deleting column object {}".format(c.column_name))
+                            c.delete()
+
+                    # Check if there are more than one column still
+                    if Column.objects.filter(
+                            table_name=table_name,
                             column_name=key[:511],
                             is_extra_data=is_extra_data,
-                            organization=model_obj.organization,
-                        )
-                    except Column.MultipleObjectsReturned:
-                        _log.debug(
-                            "Column.MultipleObjectsReturned for {} in save_column_names".format(
-                                key[:511]))
-
-                        columns = Column.objects.filter(table_name=model_obj.__class__.__name__,
-                                                        column_name=key[:511],
-                                                        is_extra_data=is_extra_data,
-                                                        organization=model_obj.organization)
-                        for c in columns:
-                            if not ColumnMapping.objects.filter(
-                                    Q(column_raw=c) | Q(column_mapped=c)).exists():
-                                _log.debug("Deleting column object {}".format(c.column_name))
-                                c.delete()
-
-                        # Check if there are more than one column still
-                        if Column.objects.filter(
-                                table_name=model_obj.__class__.__name__,
-                                column_name=key[:511],
-                                is_extra_data=is_extra_data,
-                                organization=model_obj.organization).count() > 1:
-                            raise Exception(
-                                "Could not fix duplicate columns for {}. Contact dev team").format(
-                                key)
-
-                        continue
+                            organization=organization).count() > 1:
+                        raise Exception(
+                            "Could not fix duplicate columns for {}. Contact dev team").format(
+                            key)
 
-                    break
+                    continue
+
+                break
 
     @staticmethod
     def delete_all(organization):
@@ -1390,47 +1454,22 @@ class Column(models.Model):
         :param inventory_type: Inventory Type (property|taxlot) from the requester. This sets the related columns if requested.
         :return: list, list of dict
         """
-        from seed.serializers.columns import ColumnSerializer
-
-        columns_db = Column.objects.filter(organization_id=org_id).exclude(table_name='').exclude(
-            table_name=None)
         columns = []
-        for c in columns_db:
-            if c.column_name in Column.COLUMN_EXCLUDE_FIELDS or c.column_name in Column.EXCLUDED_MAPPING_FIELDS:
+        for cached_c in column_metadata(org_id)['columns']:
+            column_name = cached_c['column_name']
+            if column_name in Column.COLUMN_EXCLUDE_FIELDS or column_name in Column.EXCLUDED_MAPPING_FIELDS:
                 continue
 
-            # Eventually move this over to Column serializer directly
-            new_c = ColumnSerializer(c).data
-
             if inventory_type:
-                related = not (inventory_type.lower() in new_c['table_name'].lower())
+                related = not (inventory_type.lower() in cached_c['table_name'].lower())
                 if related:
                     continue
-                if inventory_type == 'property' and c.column_name in Column.UNMAPPABLE_PROPERTY_FIELDS:
+                if inventory_type == 'property' and column_name in Column.UNMAPPABLE_PROPERTY_FIELDS:
                     continue
-                elif inventory_type == 'taxlot' and c.column_name in Column.UNMAPPABLE_TAXLOT_FIELDS:
+                elif inventory_type == 'taxlot' and column_name in Column.UNMAPPABLE_TAXLOT_FIELDS:
                     continue
 
-            new_c['sharedFieldType'] = new_c['shared_field_type']
-            del new_c['shared_field_type']
-
-            if (new_c['table_name'], new_c['column_name']) in Column.PINNED_COLUMNS:
-                new_c['pinnedLeft'] = True
-
-            # If no display name, use the column name (this is the display name as it was typed
-            # during mapping)
-            if not new_c['display_name']:
-                new_c['display_name'] = new_c['column_name']
-
-            # If no column_description, use the column name (this is the display name as it was typed
-            # during mapping) or display name
-            if not new_c['column_description']:
-                if not new_c['display_name']:
-                    new_c['column_description'] = new_c['column_name']
-                else:
-                    new_c['column_description'] = new_c['display_name']
-
-            columns.append(new_c)
+            columns.append(dict(cached_c))
 
         # Sort by display name
         columns.sort(key=lambda col: col['display_name'].lower())
@@ -1461,46 +1500,23 @@ class Column(models.Model):
         :param exclude_derived: Exclude derived columns.
         :param column_ids: List of Column ids.
         """
-        from seed.serializers.columns import ColumnSerializer
-
-        # Grab all the columns out of the database for the organization that are assigned to a
-        # table_name. Order extra_data last so that extra data duplicate-checking will happen after
+        # All the columns of the organization that are assigned to a table_name, serialized and
+        # ordered with extra_data last so that extra data duplicate-checking will happen after
         # processing standard columns
+        metadata = column_metadata(org_id)
         if column_ids:
-            column_query = Column.objects.filter(organization_id=org_id, id__in=column_ids).exclude(
-                table_name='').exclude(table_name=None)
-        else:
-            column_query = Column.objects.filter(organization_id=org_id).exclude(
-                table_name='').exclude(table_name=None)
-        if exclude_derived:
-            column_query = column_query.exclude(derived_column__isnull=False)
-        columns_db = column_query.order_by('is_extra_data', 'column_name')
+            column_ids = set(column_ids)
+
         columns = []
-        for c in columns_db:
-            if c.column_name in Column.EXCLUDED_COLUMN_RETURN_FIELDS:
+        for cached_c in metadata['columns']:
+            if column_ids and cached_c['id'] not in column_ids:
+                continue
+            if exclude_derived and cached_c['derived_column'] is not None:
+                continue
+            if cached_c['column_name'] in Column.EXCLUDED_COLUMN_RETURN_FIELDS:
                 continue
 
-            # Eventually move this over to Column serializer directly
-            new_c = ColumnSerializer(c).data
-
-            new_c['sharedFieldType'] = new_c['shared_field_type']
-            del new_c['shared_field_type']
-
-            if (new_c['table_name'], new_c['column_name']) in Column.PINNED_COLUMNS:
-                new_c['pinnedLeft'] = True
-
-            # If no display name, use the column name (this is the display name as it was typed
-            # during mapping)
-            if not new_c['display_name']:
-                new_c['display_name'] = new_c['column_name']
-
-            # If no column_description, use the column name (this is the display name as it was typed
-            # during mapping) or display name
-            if not new_c['column_description']:
-                if not new_c['display_name']:
-                    new_c['column_description'] = new_c['column_name']
-                else:
-                    new_c['column_description'] = new_c['display_name']
+            new_c = dict(cached_c)
 
             # Related fields
             new_c['related'] = False
@@ -1514,7 +1530,7 @@ class Column(models.Model):
             include_column = True
             if only_used:
                 # only add the column if it is in a ColumnMapping object
-                include_column = include_column and ColumnMapping.objects.filter(column_mapped=c).exists()
+                include_column = include_column and new_c['id'] in metadata['mapped_column_ids']
             if not include_related:
                 # only add the column if it is not a related column
                 is_not_related = not new_c['related']
@@ -1558,23 +1574,7 @@ class Column(models.Model):
         :param org_id: organization with the columns
         :return: dict
         """
-        columns = Column.retrieve_all(org_id, 'property', False)
-        # The TaxLot and Property are not used in merging, they are just here to prevent errors
-        priorities = {
-            'PropertyState': {'extra_data': {}},
-            'TaxLotState': {'extra_data': {}},
-            'Property': {},
-            'TaxLot': {}
-        }
-        for column in columns:
-            tn = column['table_name']
-            cn = column['column_name']
-            if column['is_extra_data']:
-                priorities[tn]['extra_data'][cn] = column.get('merge_protection', 'Favor New')
-            else:
-                priorities[tn][cn] = column.get('merge_protection', 'Favor New')
-
-        return priorities
+        return copy.deepcopy(column_metadata(org_id)['priorities'])
 
     @staticmethod
     def retrieve_all_by_tuple(org_id):
@@ -1615,3 +1615,34 @@ def validate_model(sender, **kwargs):
 
 
 pre_save.connect(validate_model, sender=Column)
+
+
+def invalidate_organization_columns(sender, instance, **kwargs):
+    invalidate_column_metadata(instance.organization_id)
+
+
+def invalidate_organization_column_mappings(sender, instance, **kwargs):
+    invalidate_column_metadata(instance.super_organization_id)
+
+
+def invalidate_organization_mapped_columns(sender, instance, action, pk_set=None, **kwargs):
+    if not action.startswith('post_'):
+        return
+
+    # the instance is the ColumnMapping, or the Column when the relation is changed from its side
+    if isinstance(instance, ColumnMapping):
+        org_ids = {instance.super_organization_id}
+        if pk_set:
+            org_ids.update(Column.objects.filter(pk__in=pk_set).values_list('organization_id', flat=True))
+    else:
+        org_ids = {instance.organization_id}
+
+    for org_id in org_ids:
+        invalidate_column_metadata(org_id)
+
+
+post_save.connect(invalidate_organization_columns, sender=Column)
+post_delete.connect(invalidate_organization_columns, sender=Column)
+post_save.connect(invalidate_organization_column_mappings, sender=ColumnMapping)
+post_delete.connect(invalidate_organization_column_mappings, sender=ColumnMapping)
+m2m_changed.connect(invalidate_organization_mapped_columns, sender=ColumnMapping.column_mapped.through)
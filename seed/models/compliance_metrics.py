@@ -3,17 +3,28 @@
 SEED Platform (TM), Copyright (c) Alliance for Sustainable Energy, LLC, and other contributors.
 See also https://github.com/seed-platform/seed/main/LICENSE.md
 """
+import hashlib
+import json
 import numbers
 from typing import Union
 
-from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
 from django.http import QueryDict
 
+from seed.lib.mcm.utils import batch
 from seed.lib.superperms.orgs.models import Organization
 from seed.models.columns import Column
 from seed.models.cycles import Cycle
 from seed.models.filter_group import FilterGroup
-from seed.utils.properties import properties_across_cycles_with_filters
+from seed.models.properties import PropertyView
+from seed.utils.properties import (
+    filtered_property_views,
+    property_columns_across_cycles
+)
+
+# number of property views serialized and evaluated at a time when refreshing the results
+RESULTS_REFRESH_BATCH_SIZE = 1000
 
 
 class ComplianceMetric(models.Model):
@@ -40,11 +51,15 @@ class ComplianceMetric(models.Model):
     filter_group = models.ForeignKey(FilterGroup, related_name="filter_group", null=True, on_delete=models.CASCADE)
     x_axis_columns = models.ManyToManyField(Column, related_name="x_axis_columns", blank=True)
     cycles = models.ManyToManyField(Cycle, related_name="cycles", blank=True)
+    # digest of the definition the stored results were computed with, see refresh_results
+    results_signature = models.CharField(max_length=32, blank=True, default='')
 
     def __str__(self):
         return 'Program Metric - %s' % self.name
 
     def evaluate(self):
+        self.refresh_results()
+
         response = {
             'meta': {
                 'organization': self.organization.id,
@@ -58,53 +73,42 @@ class ComplianceMetric(models.Model):
             'cycles': []
         }
 
-        query_dict = QueryDict(mutable=True)
-        if self.filter_group and self.filter_group.query_dict:
-            query_dict.update(self.filter_group.query_dict)
-        # print(f"query dict: {query_dict}")
-
         # grab cycles
         cycle_ids = self.cycles.values_list('pk', flat=True).order_by('start')
         response['graph_data']['labels'] = list(self.cycles.values_list('name', flat=True).order_by('start'))
         response['cycles'] = list(self.cycles.values('id', 'name'))
 
-        # get properties (no filter)
-        # property_response = properties_across_cycles(self.organization_id, -1, cycle_ids)
-        # get properties (applies filter group)
-        display_field_id = Column.objects.get(table_name="PropertyState", column_name=self.organization.property_display_field, organization=self.organization).id
-        # array of columns to return
-        column_ids = [
-            display_field_id
-        ]
+        metric = self._metric()
 
-        if self.actual_energy_column is not None:
-            column_ids.append(self.actual_energy_column.id)
-            if self.target_energy_column is not None:
-                column_ids.append(self.target_energy_column.id)
-
-        if self.actual_emission_column is not None:
-            column_ids.append(self.actual_emission_column.id)
-            if self.target_emission_column is not None:
-                column_ids.append(self.target_emission_column.id)
+        datasets = {'y': {'data': [], 'label': 'compliant'}, 'n': {'data': [], 'label': 'non-compliant'}, 'u': {'data': [], 'label': 'unknown'}}
+        property_response = {cycle_id: [] for cycle_id in cycle_ids}
+        results_by_cycles = {cycle_id: {key: [] for key in datasets} for cycle_id in cycle_ids}
+
+        # the stored results are read in the order of the views, like the filtered views
+        results = self.results.filter(cycle_id__in=cycle_ids).order_by('property_view_id') \
+            .values_list('cycle_id', 'property_view_id', 'status', 'data')
+        for cycle_id, property_view_id, result_status, data in results.iterator():
+            property_response[cycle_id].append(data)
+            if result_status in datasets:
+                results_by_cycles[cycle_id][result_status].append(property_view_id)
+
+        # count compliant, non-compliant, unknown for each property with data
+        for cycle_id in cycle_ids:
+            for key in datasets:
+                datasets[key]['data'].append(len(results_by_cycles[cycle_id][key]))
 
-        for col in self.x_axis_columns.all():
-            column_ids.append(col.id)
+        # save to response
+        response['results_by_cycles'] = results_by_cycles
+        response['properties_by_cycles'] = property_response
+        response['metric'] = metric
 
-        # Unique ids
-        column_ids = [*set(column_ids)]
+        for key in datasets:
+            response['graph_data']['datasets'].append(datasets[key])
 
-        property_response = properties_across_cycles_with_filters(
-            self.organization_id,
-            cycle_ids,
-            query_dict,
-            column_ids
-        )
+        return response
 
-        datasets = {'y': {'data': [], 'label': 'compliant'}, 'n': {'data': [], 'label': 'non-compliant'}, 'u': {'data': [], 'label': 'unknown'}}
-        results_by_cycles = {}
-#        property_datasets = {}
+    def _metric(self):
         # figure out what kind of metric it is (energy? emission? combo? bool?)
-
         metric = {
             'energy_metric': False,
             'emission_metric': False,
@@ -140,51 +144,152 @@ class ComplianceMetric(models.Model):
             else:
                 metric['target_emission_column'] = self.target_emission_column.id
 
-        for cyc in property_response:
-            properties = {}
-            cnts = {'y': 0, 'n': 0, 'u': 0}
-
-            for p in property_response[cyc]:
-                # initialize
-                properties[p['property_view_id']] = None
-                # energy metric
-                if metric['energy_metric']:
-                    properties[p['property_view_id']] = self._calculate_compliance(p, metric['energy_bool'], 'energy')
-                # emission metric
-                if metric['emission_metric'] and properties[p['property_view_id']] != 'u':
-                    temp_val = self._calculate_compliance(p, metric['emission_bool'], 'emission')
-
-                    # reconcile
-                    if temp_val == 'u':
-                        # unknown stays unknown (missing data)
-                        properties[p['property_view_id']] = 'u'
-                    elif properties[p['property_view_id']] is None:
-                        # only emission metric (not energy metric)
-                        properties[p['property_view_id']] = temp_val
-                    else:
-                        # compliant if both are compliant
-                        properties[p['property_view_id']] = temp_val if temp_val == 'n' else properties[p['property_view_id']]
-
-            # count compliant, non-compliant, unknown for each property with data
-            for key in cnts:
-                cnts[key] = sum(map((key).__eq__, properties.values()))
-                # add to dataset
-                datasets[key]['data'].append(cnts[key])
-
-            # reshape and save
-            results_by_cycles[cyc] = {}
-            for key in cnts:
-                results_by_cycles[cyc][key] = [i for i in properties if properties[i] == key]
+        return metric
 
-        # save to response
-        response['results_by_cycles'] = results_by_cycles
-        response['properties_by_cycles'] = property_response
-        response['metric'] = metric
+    def _column_ids(self):
+        display_field_id = Column.objects.get(table_name="PropertyState", column_name=self.organization.property_display_field, organization=self.organization).id
+        # array of columns to return
+        column_ids = [
+            display_field_id
+        ]
 
-        for key in datasets:
-            response['graph_data']['datasets'].append(datasets[key])
+        if self.actual_energy_column is not None:
+            column_ids.append(self.actual_energy_column.id)
+            if self.target_energy_column is not None:
+                column_ids.append(self.target_energy_column.id)
 
-        return response
+        if self.actual_emission_column is not None:
+            column_ids.append(self.actual_emission_column.id)
+            if self.target_emission_column is not None:
+                column_ids.append(self.target_emission_column.id)
+
+        for col in self.x_axis_columns.all():
+            column_ids.append(col.id)
+
+        # Unique ids
+        return [*set(column_ids)]
+
+    def _results_signature(self, column_ids):
+        """Digest of everything the stored results depend on, other than the inventory: the
+        columns, the metric types, the filter group and the organization's display settings.
+        """
+        org = self.organization
+        columns = Column.objects.filter(pk__in=column_ids).select_related('derived_column').order_by('pk')
+        definition = {
+            'columns': [
+                (c.id, c.table_name, c.column_name, c.data_type, c.is_extra_data, getattr(c.derived_column, 'expression', None))
+                for c in columns
+            ],
+            'energy': (self.actual_energy_column_id, self.target_energy_column_id, self.energy_metric_type),
+            'emission': (self.actual_emission_column_id, self.target_emission_column_id, self.emission_metric_type),
+            'filter_group': self.filter_group.query_dict if self.filter_group else None,
+            'display': (
+                org.property_display_field,
+                org.display_units_eui,
+                org.display_units_area,
+                org.display_units_ghg,
+                org.display_units_ghg_intensity,
+                org.display_decimal_places,
+            ),
+        }
+        return hashlib.md5(json.dumps(definition, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def refresh_results(self):
+        """Bring the stored results of the metric up to date. If the definition of the metric
+        (columns, metric types, filter group) or the display settings of the organization changed,
+        all the results are recomputed. Otherwise, only the property views that were added to the
+        metric's cycles, that now match the filter group, or whose -State changed are evaluated,
+        and the results of the views that no longer match are removed.
+        """
+        column_ids = self._column_ids()
+        signature = self._results_signature(column_ids)
+
+        with transaction.atomic():
+            # only one refresh of the metric at a time
+            ComplianceMetric.objects.select_for_update().filter(pk=self.pk).first()
+            stored_signature = ComplianceMetric.objects.filter(pk=self.pk).values_list('results_signature', flat=True).first()
+            if stored_signature != signature:
+                self.results.all().delete()
+                ComplianceMetric.objects.filter(pk=self.pk).update(results_signature=signature)
+                self.results_signature = signature
+
+            query_dict = QueryDict(mutable=True)
+            if self.filter_group and self.filter_group.query_dict:
+                query_dict.update(self.filter_group.query_dict)
+            cycle_ids = list(self.cycles.values_list('pk', flat=True))
+
+            current = {
+                view_id: (cycle_id, state_id, updated)
+                for view_id, cycle_id, state_id, updated in filtered_property_views(self.organization_id, cycle_ids, query_dict)
+                .values_list('id', 'cycle_id', 'state_id', 'state__updated')
+            }
+            stored = {
+                view_id: (cycle_id, state_id, updated)
+                for view_id, cycle_id, state_id, updated in self.results
+                .values_list('property_view_id', 'cycle_id', 'property_state_id', 'state_updated')
+            }
+
+            outdated_ids = [view_id for view_id, key in stored.items() if current.get(view_id) != key]
+            for outdated_ids_batch in batch(outdated_ids, RESULTS_REFRESH_BATCH_SIZE):
+                self.results.filter(property_view_id__in=outdated_ids_batch).delete()
+
+            new_ids = sorted(view_id for view_id, key in current.items() if stored.get(view_id) != key)
+            if not new_ids:
+                return
+
+            metric = self._metric()
+            columns_from_database = Column.retrieve_all(self.organization_id, 'property', False, include_related=False)
+            for new_ids_batch in batch(new_ids, RESULTS_REFRESH_BATCH_SIZE):
+                rows_by_property = property_columns_across_cycles(
+                    self.organization_id,
+                    cycle_ids,
+                    column_ids,
+                    views=PropertyView.objects.filter(pk__in=new_ids_batch),
+                    columns_from_database=columns_from_database
+                )
+                results = []
+                for rows in rows_by_property.values():
+                    for cycle_id, row in rows.items():
+                        # the result is keyed by the -State seen when the views were compared
+                        _, state_id, updated = current[row['property_view_id']]
+                        results.append(ComplianceMetricResult(
+                            compliance_metric=self,
+                            cycle_id=cycle_id,
+                            property_view_id=row['property_view_id'],
+                            property_state_id=state_id,
+                            state_updated=updated,
+                            status=self._property_compliance(row, metric),
+                            data=row,
+                        ))
+                ComplianceMetricResult.objects.bulk_create(results)
+
+    def _property_compliance(self, the_property, metric):
+        """Compliance of a serialized property, combining the energy and the emission metrics
+
+        :param the_property: dict, serialized property view
+        :param metric: dict, from _metric
+        :return: str or None, y - compliant, n - non-compliant, u - unknown, None if the metric
+            has neither an energy nor an emission metric
+        """
+        result = None
+        # energy metric
+        if metric['energy_metric']:
+            result = self._calculate_compliance(the_property, metric['energy_bool'], 'energy')
+        # emission metric
+        if metric['emission_metric'] and result != 'u':
+            temp_val = self._calculate_compliance(the_property, metric['emission_bool'], 'emission')
+
+            # reconcile
+            if temp_val == 'u':
+                # unknown stays unknown (missing data)
+                result = 'u'
+            elif result is None:
+                # only emission metric (not energy metric)
+                result = temp_val
+            else:
+                # compliant if both are compliant
+                result = temp_val if temp_val == 'n' else result
+        return result
 
     def _calculate_compliance(self, the_property, bool_metric, metric_type):
         """Return the compliant, non-compliant, and unknown counts
@@ -246,3 +351,25 @@ class ComplianceMetric(models.Model):
     class Meta:
         ordering = ['-created']
         get_latest_by = 'created'
+
+
+class ComplianceMetricResult(models.Model):
+    """Stored compliance of a property view for a compliance metric, along with the serialized
+    property view that is returned by ComplianceMetric.evaluate. The results are kept up to date
+    by ComplianceMetric.refresh_results.
+    """
+    compliance_metric = models.ForeignKey(ComplianceMetric, on_delete=models.CASCADE, related_name='results')
+    cycle = models.ForeignKey(Cycle, on_delete=models.CASCADE)
+    property_view = models.ForeignKey(PropertyView, on_delete=models.CASCADE, related_name='+')
+    # -State of the view, and its last update, when the result was computed
+    property_state_id = models.IntegerField()
+    state_updated = models.DateTimeField(null=True)
+    # y - compliant, n - non-compliant, u - unknown
+    status = models.CharField(max_length=1, null=True)
+    data = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+
+    class Meta:
+        unique_together = ('compliance_metric', 'property_view',)
+        index_together = [
+            ['compliance_metric', 'cycle'],
+        ]
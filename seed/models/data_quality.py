@@ -8,9 +8,11 @@ import json
 import logging
 import re
 from builtins import str
+from collections import defaultdict
 from datetime import date, datetime
 from random import randint
 
+import numpy as np
 import pytz
 from django.apps import apps
 from django.db import IntegrityError, models
@@ -47,6 +49,121 @@ class UnitMismatchError(Exception):
     pass
 
 
+def _numeric_values(values, quantity_units=None):
+    """
+    Array of the values of a column, for the rules that are checked for all the rows at once.
+    Values that cannot be compared as plain numbers (e.g., strings or quantities in other units)
+    are flagged so that they are checked row by row.
+
+    :param values: list, value of the column for each row
+    :param quantity_units: str, if set, only quantities in these units are numeric. Otherwise,
+        the magnitude of the quantities is used.
+    :return: tuple, (float array with nan for None values, bool array of the values to check by row)
+    """
+    array = np.full(len(values), np.nan)
+    by_row = np.zeros(len(values), dtype=bool)
+    for i, value in enumerate(values):
+        if value is None:
+            continue
+        if isinstance(value, ureg.Quantity):
+            if quantity_units is None or value.units == ureg(quantity_units).units:
+                array[i] = value.magnitude
+            else:
+                by_row[i] = True
+        elif quantity_units is None and isinstance(value, (int, float)):
+            array[i] = value
+        else:
+            by_row[i] = True
+    return array, by_row
+
+
+class _LinkedViews(object):
+    """
+    The -Views of the checked -States and their labels, loaded with one query each for all
+    the rows. The labels that the rules add and remove are collected and written at the end
+    with a bulk insert and a delete per label.
+    """
+
+    def __init__(self, record_type, state_ids):
+        if record_type == 'PropertyState':
+            ViewClass, inventory = PropertyView, 'property'
+            self.label_class = apps.get_model('seed', 'PropertyView_labels')
+            self.view_field = 'propertyview_id'
+        else:
+            ViewClass, inventory = TaxLotView, 'taxlot'
+            self.label_class = apps.get_model('seed', 'TaxLotView_labels')
+            self.view_field = 'taxlotview_id'
+
+        self.view_id_by_state = {}
+        self.parent_org_by_view = {}
+        views = ViewClass.objects.filter(state_id__in=state_ids).order_by('-id').values_list(
+            'id', 'state_id', f'{inventory}__organization_id', f'{inventory}__organization__parent_org_id'
+        )
+        for view_id, state_id, org_id, parent_org_id in views:
+            self.view_id_by_state[state_id] = view_id
+            self.parent_org_by_view[view_id] = parent_org_id or org_id
+
+        self.label_ids_by_view = defaultdict(set)
+        labels = self.label_class.objects.filter(
+            **{f'{self.view_field}__in': list(self.parent_org_by_view)}
+        ).values_list(self.view_field, 'statuslabel_id')
+        for view_id, label_id in labels:
+            self.label_ids_by_view[view_id].add(label_id)
+
+        # (view id, label id) -> True to add the label, False to remove it. Later rules override
+        # earlier ones, as when the labels were written rule by rule.
+        self.changes = {}
+
+    def add_label(self, rule, state_id):
+        """
+        Label the -View of the -State with the status label of the rule
+
+        :param rule: Rule
+        :param state_id: int
+        :return: bool, True if the label is applied
+        """
+        view_id = self.view_id_by_state.get(state_id)
+        if rule.status_label_id is None or view_id is None:
+            return False
+
+        label_org_id = rule.status_label.super_organization_id
+        parent_org_id = self.parent_org_by_view[view_id]
+        if parent_org_id != label_org_id:
+            raise IntegrityError(
+                'Label with super_organization_id={} cannot be applied to a record with parent '
+                'organization_id={}.'.format(
+                    label_org_id,
+                    parent_org_id
+                )
+            )
+        self.changes[(view_id, rule.status_label_id)] = True
+        return True
+
+    def remove_label(self, rule, state_id):
+        """Remove the status label of the rule from the -View of the -State, if it was labeled"""
+        view_id = self.view_id_by_state.get(state_id)
+        if rule.status_label_id in self.label_ids_by_view.get(view_id, ()):
+            self.changes[(view_id, rule.status_label_id)] = False
+
+    def save(self):
+        """Write the label changes"""
+        to_add = []
+        to_remove = defaultdict(list)
+        for (view_id, label_id), add in self.changes.items():
+            if add:
+                if label_id not in self.label_ids_by_view[view_id]:
+                    to_add.append(self.label_class(**{self.view_field: view_id, 'statuslabel_id': label_id}))
+            else:
+                to_remove[label_id].append(view_id)
+
+        self.label_class.objects.bulk_create(to_add, ignore_conflicts=True)
+        for label_id, view_ids in to_remove.items():
+            self.label_class.objects.filter(
+                **{f'{self.view_field}__in': view_ids, 'statuslabel_id': label_id}
+            ).delete()
+        self.changes = {}
+
+
 def format_pint_violation(rule, source_value):
     """
     Format a pint min, max violation for human readability.
@@ -645,8 +762,23 @@ class DataQualityCheck(models.Model):
             self.column_lookup[(record_type, derived_column_name)] = derived_column_name
 
         # grab all the rules once, save query time
-        rules = self.rules.filter(enabled=True, table_name=record_type).order_by('field',
-                                                                                 'severity')
+        rules = list(
+            self.rules.filter(enabled=True, table_name=record_type)
+            .select_related('status_label')
+            .order_by('field', 'severity')
+        )
+
+        rows = list(rows)
+        state_ids = [row.id for row in rows]
+
+        # evaluate the derived columns of the rules for all the rows at once
+        derived_values = {}
+        for derived_column_name in {rule.field for rule in rules if rule.for_derived_column}:
+            values = derived_columns_by_name[derived_column_name].evaluate_batch(rows)
+            derived_values[derived_column_name] = dict(zip(state_ids, values))
+
+        passing = self._rows_passing_rules(record_type, rules, rows, derived_values)
+        linked_views = _LinkedViews(record_type, state_ids)
 
         # Get the list of the field names that will show in every result
         fields = self.get_fieldnames(record_type)
@@ -660,13 +792,74 @@ class DataQualityCheck(models.Model):
                 self.results[row.id]['data_quality_results'] = []
 
             # Run the checks
-            self._check(rules, row, derived_columns_by_name)
+            self._check(rules, row, derived_values, linked_views, passing)
+
+        linked_views.save()
 
         # Prune the results will remove any entries that have zero data_quality_results
         for k, v in self.results.copy().items():
             if not v['data_quality_results']:
                 del self.results[k]
 
+    def _rows_passing_rules(self, record_type, rules, rows, derived_values):
+        """
+        Check the range and required/not null rules on the fields of the -States and on the derived
+        columns for all the rows at once, over arrays of the column values. The rows that pass
+        these rules do not need to be checked one by one.
+
+        :param record_type: one of PropertyState | TaxLotState
+        :param rules: list of Rule
+        :param rows: list of PropertyState or TaxLotState
+        :param derived_values: dict{str: dict{int: float}}, derived column values by -State id
+        :return: dict{int: set}, ids of the rows that pass each rule, by rule id
+        """
+        StateClass = apps.get_model('seed', record_type)
+        model_fields = {
+            f.name: f for f in StateClass._meta.concrete_fields
+            if not f.is_relation
+        }
+
+        passing = {}
+        columns = {}
+        for rule in rules:
+            if rule.for_derived_column:
+                values = [derived_values[rule.field][row.id] for row in rows]
+                base_units = None
+            elif rule.field in model_fields:
+                values = columns.get(rule.field)
+                if values is None:
+                    values = columns[rule.field] = [getattr(row, rule.field) for row in rows]
+                base_units = getattr(model_fields[rule.field], 'base_units', None)
+            else:
+                # extra_data values are typed (and reported when they can't be) row by row
+                continue
+
+            if rule.condition in (Rule.RULE_REQUIRED, Rule.RULE_NOT_NULL):
+                if (rule.table_name, rule.field) not in self.column_lookup:
+                    continue
+                mask = np.array([value is not None and value != '' for value in values], dtype=bool)
+            elif rule.condition == Rule.RULE_RANGE:
+                if rule.for_derived_column or rule.units == '':
+                    array, by_row = _numeric_values(values)
+                elif base_units is not None and ureg(rule.units).units == ureg(base_units).units:
+                    array, by_row = _numeric_values(values, quantity_units=base_units)
+                elif base_units is None and isinstance(model_fields[rule.field], (models.FloatField, models.IntegerField)):
+                    array, by_row = _numeric_values(values)
+                else:
+                    continue
+
+                mask = ~np.isnan(array) & ~by_row
+                if rule.min is not None:
+                    mask[mask] &= array[mask] >= rule.min
+                if rule.max is not None:
+                    mask[mask] &= array[mask] <= rule.max
+            else:
+                continue
+
+            passing[rule.id] = {row.id for row, passed in zip(rows, mask) if passed}
+
+        return passing
+
     def get_fieldnames(self, record_type):
         """Get fieldnames to apply to results."""
         field_names = ['id']
@@ -676,47 +869,32 @@ class DataQualityCheck(models.Model):
     def reset_results(self):
         self.results = {}
 
-    def _check(self, rules, row, derived_columns_by_name):
+    def _check(self, rules, row, derived_values, linked_views, passing):
         """
         Check for errors in the min/max of the values.
 
         :param rules: list, rules to run from database objects
         :param row: PropertyState or TaxLotState, row of data to check
-        :param derived_columns_by_name: dict{str: DerivedColumn}
+        :param derived_values: dict{str: dict{int: float}}, derived column values by -State id
+        :param linked_views: _LinkedViews, -Views and labels of the checked rows
+        :param passing: dict{int: set}, ids of the rows already known to pass each rule, by rule id
         :return: None
         """
-        # check if the row has any rules applied to it
-        model_labels = {'linked_id': None, 'label_ids': []}
-        if row.__class__.__name__ == 'PropertyState':
-            label = apps.get_model('seed', 'PropertyView_labels')
-            if PropertyView.objects.filter(state=row).exists():
-                model_labels['linked_id'] = PropertyView.objects.get(state=row).id
-                model_labels['label_ids'] = list(
-                    label.objects.filter(propertyview_id=model_labels['linked_id']).values_list(
-                        'statuslabel_id', flat=True)
-                )
-                # _log.debug("Property {} has {} labels".format(model_labels['linked_id'],
-                #                                               len(model_labels['label_ids'])))
-        elif row.__class__.__name__ == 'TaxLotState':
-            label = apps.get_model('seed', 'TaxLotView_labels')
-            if TaxLotView.objects.filter(state=row).exists():
-                model_labels['linked_id'] = TaxLotView.objects.get(state=row).id
-                model_labels['label_ids'] = list(
-                    label.objects.filter(taxlotview_id=model_labels['linked_id']).values_list(
-                        'statuslabel_id', flat=True)
-                )
-                # _log.debug("TaxLot {} has {} labels".format(model_labels['linked_id'],
-                #                                             len(model_labels['label_ids'])))
-
         for rule in rules:
             value = None
 
             label_applied = False
             display_name = rule.field
 
+            if row.id in passing.get(rule.id, ()):
+                if rule.condition == Rule.RULE_RANGE and rule.severity == Rule.SEVERITY_VALID:
+                    label_applied = linked_views.add_label(rule, row.id)
+                if not label_applied:
+                    linked_views.remove_label(rule, row.id)
+                continue
+
             if rule.for_derived_column:
-                derived_column = derived_columns_by_name[rule.field]
-                value = derived_column.evaluate(inventory_state=row)
+                value = derived_values[rule.field][row.id]
             else:
                 if hasattr(row, rule.field):
                     value = getattr(row, rule.field)
@@ -741,33 +919,30 @@ class DataQualityCheck(models.Model):
             if (rule.table_name, rule.field) in self.column_lookup:
                 display_name = self.column_lookup[(rule.table_name, rule.field)]
 
-            # get the status_labels for the linked properties and tax lots
-            linked_id = model_labels['linked_id']
-
             if (rule.table_name, rule.field) not in self.column_lookup:
                 # If the rule is not in the column lookup, then it may have been a required
                 # field that wasn't mapped
                 if rule.condition == Rule.RULE_REQUIRED:
                     self.add_result_missing_req(row.id, rule, display_name, value)
-                    label_applied = self.update_status_label(label, rule, linked_id, row.id)
+                    label_applied = self._apply_status_label(linked_views, rule, row.id)
             elif value is None or value == '':
                 if rule.condition == Rule.RULE_REQUIRED:
                     self.add_result_missing_and_none(row.id, rule, display_name, value)
-                    label_applied = self.update_status_label(label, rule, linked_id, row.id)
+                    label_applied = self._apply_status_label(linked_views, rule, row.id)
                 elif rule.condition == Rule.RULE_NOT_NULL:
                     self.add_result_is_null(row.id, rule, display_name, value)
-                    label_applied = self.update_status_label(label, rule, linked_id, row.id)
+                    label_applied = self._apply_status_label(linked_views, rule, row.id)
             elif rule.condition == Rule.RULE_INCLUDE or rule.condition == Rule.RULE_EXCLUDE:
                 if not rule.valid_text(value):
                     self.add_result_string_error(row.id, rule, display_name, value)
-                    label_applied = self.update_status_label(label, rule, linked_id, row.id)
+                    label_applied = self._apply_status_label(linked_views, rule, row.id)
             elif rule.condition == Rule.RULE_RANGE:
                 try:
                     if not rule.minimum_valid(value):
                         if rule.severity == Rule.SEVERITY_ERROR or rule.severity == Rule.SEVERITY_WARNING:
                             s_min, s_max, s_value = rule.format_strings(value)
                             self.add_result_min_error(row.id, rule, display_name, s_value, s_min)
-                            label_applied = self.update_status_label(label, rule, linked_id, row.id)
+                            label_applied = self._apply_status_label(linked_views, rule, row.id)
                 except ComparisonError:
                     s_min, s_max, s_value = rule.format_strings(value)
                     self.add_result_comparison_error(row.id, rule, display_name, s_value, s_min)
@@ -785,7 +960,7 @@ class DataQualityCheck(models.Model):
                         if rule.severity == Rule.SEVERITY_ERROR or rule.severity == Rule.SEVERITY_WARNING:
                             s_min, s_max, s_value = rule.format_strings(value)
                             self.add_result_max_error(row.id, rule, display_name, s_value, s_max)
-                            label_applied = self.update_status_label(label, rule, linked_id, row.id)
+                            label_applied = self._apply_status_label(linked_views, rule, row.id)
                 except ComparisonError:
                     s_min, s_max, s_value = rule.format_strings(value)
                     self.add_result_comparison_error(row.id, rule, display_name, s_value, s_max)
@@ -801,10 +976,25 @@ class DataQualityCheck(models.Model):
                 # Check min and max values for valid data:
                 if rule.minimum_valid(value) and rule.maximum_valid(value):
                     if rule.severity == Rule.SEVERITY_VALID:
-                        label_applied = self.update_status_label(label, rule, linked_id, row.id, False)
+                        label_applied = self._apply_status_label(linked_views, rule, row.id, False)
+
+            if not label_applied:
+                linked_views.remove_label(rule, row.id)
+
+    def _apply_status_label(self, linked_views, rule, row_id, add_to_results=True):
+        """
+        Label the -View of the row with the status label of the rule.
 
-            if not label_applied and rule.status_label_id in model_labels['label_ids']:
-                self.remove_status_label(label, rule, linked_id)
+        :param linked_views: _LinkedViews
+        :param rule: rule object
+        :param row_id: id of the propertystate or taxlotstate
+        :param add_to_results: bool, add the label name to the last result of the row
+        :return: boolean, if labeled was applied
+        """
+        label_applied = linked_views.add_label(rule, row_id)
+        if label_applied and add_to_results:
+            self.results[row_id]['data_quality_results'][-1]['label'] = rule.status_label.name
+        return label_applied
 
     def save_to_cache(self, identifier, organization_id):
         """
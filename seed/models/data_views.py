@@ -4,19 +4,41 @@
 SEED Platform (TM), Copyright (c) Alliance for Sustainable Energy, LLC, and other contributors.
 See also https://github.com/seed-platform/seed/main/LICENSE.md
 """
+import hashlib
+import json
 import logging
+from collections import OrderedDict
 
+from django.core.exceptions import FieldDoesNotExist
 from django.db import models
-from django.db.models import Avg, Count, Max, Min, Sum
+from django.db.models import Avg, Count, F, Max, Min, Sum
+from django.db.models.fields.json import KeyTextTransform
 from django.http import QueryDict
 
 from seed.lib.superperms.orgs.models import Organization
 from seed.models.columns import Column
 from seed.models.cycles import Cycle
+from seed.models.derived_columns import _text_to_float
 from seed.models.filter_group import FilterGroup
 from seed.models.properties import PropertyState, PropertyView
+from seed.utils.cache import get_cache_raw, set_cache_raw
+from seed.utils.column_cache import column_metadata_version
+from seed.utils.pagination import inventory_version
 from seed.utils.search import build_view_filters_and_sorts
 
+# aggregations of the evaluation, by the name used in the results
+AGGREGATIONS = OrderedDict([
+    ('Average', Avg),
+    ('Maximum', Max),
+    ('Minimum', Min),
+    ('Sum', Sum),
+    ('Count', Count),
+])
+
+# evaluations are cached for a limited time, in case the inventory is changed without sending
+# the signals which invalidate the cache (e.g., with QuerySet.update)
+DATA_VIEW_CACHE_TIMEOUT = 60 * 10
+
 
 class DataView(models.Model):
     name = models.CharField(max_length=255, unique=True)
@@ -28,15 +50,27 @@ class DataView(models.Model):
         views_by_filter_group_id, _ = self.views_by_filter()
         return views_by_filter_group_id
 
-    def views_by_filter(self):
+    def views_by_filter(self, filter_groups=None, cycles=None):
+        """Views of each filter group and cycle of the data view
+
+        :param filter_groups: list of FilterGroup, optional, defaults to the data view's filter groups
+        :param cycles: list of Cycle, optional, defaults to the data view's cycles
+        :return: tuple, (dict of filter group id to dict of view id to the view's display field,
+            dict of filter group id to dict of cycle id to the QuerySet of the views)
+        """
+        if filter_groups is None:
+            filter_groups = self._filter_groups()
+        if cycles is None:
+            cycles = list(self.cycles.all())
+
         filter_group_views = {}
         views_by_filter_group_id = {}
-        for filter_group in self.filter_groups.all():
+        for filter_group in filter_groups:
             views_by_filter_group_id[filter_group.id] = {}
             filter_group_views[filter_group.id] = {}
             query_dict = QueryDict(mutable=True)
             query_dict.update(filter_group.query_dict)
-            for cycle in self.cycles.all():
+            for cycle in cycles:
                 filter_views = self._get_filter_group_views(cycle, query_dict)
                 label_views = self._get_label_views(cycle, filter_group)
                 views = self._combine_views(filter_views, label_views)
@@ -89,6 +123,15 @@ class DataView(models.Model):
         #   ]
         # }
 
+        columns = list(columns)
+        filter_groups = self._filter_groups()
+        cycles = list(self.cycles.all())
+
+        cache_key = self._evaluation_cache_key(columns, filter_groups, cycles)
+        response = get_cache_raw(cache_key)
+        if response is not None:
+            return response
+
         response = {
             'meta': {
                 'organization': self.organization.id,
@@ -97,56 +140,81 @@ class DataView(models.Model):
             'views_by_filter_group_id': {},
             'columns_by_id': {},
             'graph_data': {
-                'labels': [cycle.name for cycle in sorted(list(self.cycles.all()), key=lambda x: x.name)],
+                'labels': [cycle.name for cycle in sorted(cycles, key=lambda x: x.name)],
                 'datasets': []
             }
         }
 
-        response['views_by_filter_group_id'], views_by_filter = self.views_by_filter()
+        response['views_by_filter_group_id'], views_by_filter = self.views_by_filter(filter_groups, cycles)
 
-        # assign data based on source column id
+        data = response['columns_by_id']
         for column in columns:
-            data = response['columns_by_id']
-            column_id = column.id
-            data[column_id] = {'filter_groups_by_id': {}, 'unit': None}
-
-            for filter_group in self.filter_groups.all():
-                filter_id = filter_group.id
-                data[column_id]['filter_groups_by_id'][filter_id] = {'cycles_by_id': {}}
-
-                for cycle in self.cycles.all():
-                    data_cycles = data[column_id]['filter_groups_by_id'][filter_id]['cycles_by_id']
-                    data_cycles[cycle.id] = {}
-                    views = views_by_filter[filter_id][cycle.id]
-                    states = PropertyState.objects.filter(propertyview__in=views)
-
-                    for aggregation in [Avg, Max, Min, Sum, Count, 'views_by_default_field']:
-                        self._format_aggregation_name(aggregation)
-                        self._format_filter_group_data(data_cycles, cycle.id, aggregation)
-
-                        if aggregation == 'views_by_default_field':
-                            self._assign_views_by_default_field_values(views, data, data_cycles, column, cycle.id, aggregation)
-                        else:
-                            value = self._evaluate_aggregation(states, aggregation, column)
-                            data_cycles[cycle.id][aggregation.name] = value
-
-        self._format_graph_data(response, columns, views_by_filter)
+            data[column.id] = {'filter_groups_by_id': {}, 'unit': None}
+            for filter_group in filter_groups:
+                data[column.id]['filter_groups_by_id'][filter_group.id] = {'cycles_by_id': {}}
+
+        for filter_group in filter_groups:
+            for cycle in cycles:
+                views = views_by_filter[filter_group.id][cycle.id]
+                aggregates = self._aggregate_columns(views, columns)
+                for column in columns:
+                    data_cycles = data[column.id]['filter_groups_by_id'][filter_group.id]['cycles_by_id']
+                    data_cycles[cycle.id] = dict(aggregates[column.id])
+                    data_cycles[cycle.id]['views_by_default_field'] = {}
+                    self._assign_views_by_default_field_values(views, data, data_cycles, column, cycle.id, 'views_by_default_field')
+
+        self._format_graph_data(response, columns, filter_groups, cycles)
+
+        set_cache_raw(cache_key, response, DATA_VIEW_CACHE_TIMEOUT)
         return response
 
-    def _format_graph_data(self, response, columns, views_by_filter):
+    def _filter_groups(self):
+        return list(self.filter_groups.prefetch_related('and_labels', 'or_labels', 'exclude_labels'))
+
+    def _evaluation_cache_key(self, columns, filter_groups, cycles):
+        """Key of the cached evaluation of the data view. The key changes when the inventory of the
+        organization or of the cycles, the columns of the organization, or the definition of the
+        data view changes.
+        """
+        definition = {
+            'display_field': self.organization.property_display_field,
+            'columns': [
+                (c.id, c.column_name, c.display_name, c.is_extra_data, getattr(c.derived_column, 'id', None))
+                for c in columns
+            ],
+            'filter_groups': [
+                (
+                    fg.id,
+                    fg.name,
+                    fg.query_dict,
+                    sorted(label.id for label in fg.and_labels.all()),
+                    sorted(label.id for label in fg.or_labels.all()),
+                    sorted(label.id for label in fg.exclude_labels.all()),
+                )
+                for fg in filter_groups
+            ],
+            'cycles': [(cycle.id, cycle.name) for cycle in cycles],
+        }
+        digest = hashlib.md5(json.dumps(definition, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        return 'data_view_evaluation:{}:{}:{}:{}'.format(
+            self.id,
+            inventory_version(self.organization_id, [cycle.id for cycle in cycles]),
+            column_metadata_version(self.organization_id),
+            digest,
+        )
+
+    def _format_graph_data(self, response, columns, filter_groups, cycles):
         # {filter_group: filter_group.name, column: column.column_name, aggregation: aggregation.name, data: [1,2,3]},
-        for filter_group in self.filter_groups.all():
+        sorted_cycles = sorted(cycles, key=lambda x: x.name)
+        for filter_group in filter_groups:
             filter_id = filter_group.id
             filter_name = filter_group.name
             for column in columns:
-                for aggregation in [Avg, Max, Min, Sum, Count]:  # NEED TO ADD 'views_by_label' for scatter plot
-                    self._format_aggregation_name(aggregation)
-                    dataset = {'data': [], 'column': column.display_name, 'aggregation': aggregation.name, 'filter_group': filter_name}
-                    for cycle in sorted(list(self.cycles.all()), key=lambda x: x.name):
-                        views = views_by_filter[filter_id][cycle.id]
-                        states = PropertyState.objects.filter(propertyview__in=views)
-                        value = self._evaluate_aggregation(states, aggregation, column)
-                        dataset['data'].append(value)
+                data_cycles = response['columns_by_id'][column.id]['filter_groups_by_id'][filter_id]['cycles_by_id']
+                for aggregation_name in AGGREGATIONS:  # NEED TO ADD 'views_by_label' for scatter plot
+                    dataset = {'data': [], 'column': column.display_name, 'aggregation': aggregation_name, 'filter_group': filter_name}
+                    for cycle in sorted_cycles:
+                        dataset['data'].append(data_cycles[cycle.id][aggregation_name])
                     response['graph_data']['datasets'].append(dataset)
 
     def _format_property_display_field(self, view):
@@ -155,24 +223,17 @@ class DataView(models.Model):
         except AttributeError:
             return view.id
 
-    def _format_aggregation_name(self, aggregation):
-        if aggregation == Avg:
-            aggregation.name = 'Average'
-        elif aggregation == Max:
-            aggregation.name = 'Maximum'
-        elif aggregation == Min:
-            aggregation.name = 'Minimum'
-
     def _assign_views_by_default_field_values(self, views, data, data_cycles, column, cycle_id, aggregation, ):
-        for view in views:
-            # Default assignment on first pass
-            view_key = self._format_property_display_field(view)
-            data_cycles[cycle_id][aggregation][view_key] = data_cycles[cycle_id][aggregation].get(view_key, [])
+        if column.derived_column:
+            derived_values = column.derived_column.evaluate_batch([view.state for view in views])
+        else:
+            derived_values = [None] * len(views)
 
+        for view, derived_value in zip(views, derived_values):
             if column.is_extra_data:
                 state_value = view.state.extra_data.get(column.column_name)
             elif column.derived_column:
-                state_value = column.derived_column.evaluate(view.state)
+                state_value = derived_value
             else:
                 state_value = getattr(view.state, column.column_name)
 
@@ -189,77 +250,86 @@ class DataView(models.Model):
             view_key = self._format_property_display_field(view)
             data_cycles[cycle_id][aggregation][view_key] = value
 
-    def _format_filter_group_data(self, data_cycles, cycle_id, aggregation):
-        if aggregation == 'views_by_default_field':
-            data_cycles[cycle_id][aggregation] = {}
-        else:
-            data_cycles[cycle_id][aggregation.name] = []
+    def _column_expression(self, column):
+        """Float expression of the column's value, relative to the views, and whether the
+        column is numeric. extra_data is cast in the database, non-numeric values are NULL.
 
-    def _evaluate_aggregation(self, states, aggregation, column):
+        :param column: Column
+        :return: tuple, (Expression, bool)
+        """
         if column.is_extra_data:
-            return self._evaluate_extra_data(states, aggregation, column)
+            return _text_to_float(KeyTextTransform(column.column_name, 'state__extra_data')), True
         elif column.derived_column:
-            return self._evaluate_derived_column(states, aggregation, column)
-        else:
-            aggregation = states.aggregate(value=aggregation(column.column_name))
-
-            if aggregation.get('value') or aggregation.get('value') == 0:
-                value = aggregation['value']
-                if isinstance(value, int) or isinstance(value, float):
-                    return round(value, 2)
-                return round(value.m, 2)
-
-    def _evaluate_extra_data(self, states, aggregation, column):
-        extra_data_col = 'extra_data__' + column.column_name
-        q_set = states.values(extra_data_col)
-        values = []
-        for val in list(q_set):
-            try:
-                values.append(float(val[extra_data_col]))
-            except (ValueError, TypeError):
-                pass
-        if values:
-            type_to_aggregate = {Avg: sum(values) / len(values), Count: len(values), Max: max(values), Min: min(values), Sum: sum(values)}
-            return round(type_to_aggregate[aggregation], 2)
-
-    def _evaluate_derived_column(self, states, aggregation, column):
-        # to evluate a derived_column: DerivedColumn.evaluate(propertyState)
-        values = []
-
-        for state in states:
-            val = column.derived_column.evaluate(state)
-            if val is not None:
-                values.append(val)
-
-        if values:
-            type_to_aggregate = {Avg: sum(values) / len(values), Count: len(values), Max: max(values), Min: min(values), Sum: sum(values)}
-            return round(type_to_aggregate[aggregation], 2)
+            return column.derived_column.as_sql_expression('state__'), True
+
+        try:
+            field = PropertyState._meta.get_field(column.column_name)
+        except FieldDoesNotExist:
+            return None, False
+        numeric = isinstance(field, (models.IntegerField, models.FloatField, models.DecimalField))
+        return F(f'state__{column.column_name}'), numeric
+
+    def _aggregate_columns(self, views, columns):
+        """Compute all the aggregations of all the columns for the views in a single query
+
+        :param views: QuerySet of PropertyView
+        :param columns: list of Column
+        :return: dict, column id to dict of aggregation name to value
+        """
+        expressions = {}
+        aggregations = {}
+        for i, column in enumerate(columns):
+            expression, numeric = self._column_expression(column)
+            expressions[column.id] = (i, numeric)
+            if expression is None:
+                continue
+            aggregations[f'c{i}_Count'] = Count(expression)
+            if numeric:
+                for name, aggregation in AGGREGATIONS.items():
+                    if name != 'Count':
+                        aggregations[f'c{i}_{name}'] = aggregation(expression, output_field=models.FloatField())
+
+        values = {}
+        if aggregations:
+            # the filters can join to many rows per view, so aggregate over the distinct views
+            views = PropertyView.objects.filter(pk__in=views.order_by().values('pk'))
+            values = views.aggregate(**aggregations)
+
+        results = {}
+        for column in columns:
+            i, numeric = expressions[column.id]
+            count = values.get(f'c{i}_Count')
+            column_results = {}
+            for name in AGGREGATIONS:
+                value = values.get(f'c{i}_{name}')
+                if (column.is_extra_data or column.derived_column) and not count:
+                    # without any numeric values, the extra data and derived columns have no aggregates
+                    value = None
+                column_results[name] = round(value, 2) if value is not None else None
+            results[column.id] = column_results
+
+        return results
 
     def _combine_views(self, filter_views, label_views):
-        if label_views or label_views == []:
-            return list(set.intersection(*map(set, [label_views, filter_views])))
-        else:
-            return list(filter_views)
+        if label_views is None:
+            return filter_views
+        return filter_views.filter(pk__in=label_views.values('pk'))
 
     def _get_label_views(self, cycle, filter_group):
-        if not (filter_group.and_labels.exists() or filter_group.or_labels.exists() or filter_group.exclude_labels.exists()):
-            return None
-
         and_labels = filter_group.and_labels.all()
         or_labels = filter_group.or_labels.all()
         exclude_labels = filter_group.exclude_labels.all()
-        views = None
-        if and_labels.exists():  # and
-            views = views or cycle.propertyview_set.all()
-            for label in and_labels:
-                views = views.filter(labels=label)
-        if or_labels.exists():  # or
-            views = views or cycle.propertyview_set.all()
+        if not (and_labels or or_labels or exclude_labels):
+            return None
+
+        views = cycle.propertyview_set.all()
+        for label in and_labels:  # and
+            views = views.filter(labels=label)
+        if or_labels:  # or
             views = views.filter(labels__in=or_labels)
-        if exclude_labels.exists():  # exclude
-            views = views or cycle.propertyview_set.all()
+        if exclude_labels:  # exclude
             views = views.exclude(labels__in=exclude_labels)
-        return list(views)
+        return views
 
     def _get_filter_group_views(self, cycle, query_dict):
         org_id = self.organization.id
@@ -269,11 +339,11 @@ class DataView(models.Model):
             only_used=False,
             include_related=False
         )
-        annotations = {}
         try:
             filters, annotations, order_by = build_view_filters_and_sorts(query_dict, columns)
         except Exception:
             logging.error('error with filter group')
+            return PropertyView.objects.none()
 
         views_list = (
             PropertyView.objects.select_related('property', 'state', 'cycle')
@@ -7,11 +7,17 @@ See also https://github.com/seed-platform/seed/main/LICENSE.md
 from __future__ import annotations
 
 import copy
-from typing import Any, Union
+import operator
+from string import Formatter
+from typing import Any, Callable, Iterable, Optional, Union
 
-from django.core.exceptions import ValidationError
+import numpy as np
+from django.core.exceptions import FieldDoesNotExist, ValidationError
 from django.db import models
-from lark import Lark, Transformer, v_args
+from django.db.models.fields.json import KeyTextTransform
+from django.db.models.functions import Abs, Cast
+from django.db.models.signals import post_delete, post_save
+from lark import Lark, Token, Tree
 from lark.exceptions import UnexpectedToken
 from quantityfield.units import ureg
 
@@ -19,6 +25,26 @@ from seed.landing.models import Organization
 from seed.models.columns import Column
 from seed.models.properties import PropertyState
 from seed.models.tax_lots import TaxLotState
+from seed.utils.column_cache import invalidate_column_metadata
+
+
+def _cast_to_float(value: Any) -> Optional[float]:
+    """Helper to turn a value into a float, or None if it is non-numeric
+
+    :param value: <value>
+    :return: float | None
+    """
+    # handle booleans as special case b/c float(True) == 1.0 which we don't want
+    if isinstance(value, bool):
+        return None
+
+    if isinstance(value, ureg.Quantity):
+        value = value.magnitude
+
+    try:
+        return float(value)
+    except Exception:
+        return None
 
 
 def _cast_params_to_floats(params: dict[str, Any]) -> dict[str, float]:
@@ -29,18 +55,193 @@ def _cast_params_to_floats(params: dict[str, Any]) -> dict[str, float]:
     """
     tmp_params = {}
     for key, value in params.items():
-        # handle booleans as special case b/c float(True) == 1.0 which we don't want
-        if isinstance(value, bool):
-            continue
+        value = _cast_to_float(value)
+        if value is not None:
+            tmp_params[key] = value
+    return tmp_params
 
-        if isinstance(value, ureg.Quantity):
-            value = value.magnitude
 
-        try:
-            tmp_params[key] = float(value)
-        except Exception:
-            continue
-    return tmp_params
+def _get_state_value(inventory_state: Union[PropertyState, TaxLotState], column_name: str) -> Any:
+    """Value of a column for the inventory, from the field or else from the extra_data"""
+    if hasattr(inventory_state, column_name):
+        return getattr(inventory_state, column_name)
+    return inventory_state.extra_data.get(column_name)
+
+
+def _compile_scalar(tree: Union[Tree, Token]) -> Callable[[dict[str, float]], float]:
+    """Compile a parsed expression into a function of the parameters dict. Like the evaluation
+    of the expression, missing parameters raise a KeyError and divisions by zero raise a
+    ZeroDivisionError.
+    """
+    rule = tree.data
+    if rule == 'number':
+        number = float(tree.children[0])
+        return lambda params: number
+    if rule == 'param':
+        name = str(tree.children[0])
+
+        def param(params):
+            try:
+                return params[name]
+            except KeyError:
+                raise KeyError("Parameter not found: %s" % name)
+        return param
+
+    children = [_compile_scalar(child) for child in tree.children]
+    if rule in ('min', 'max', 'abs'):
+        func = {'min': min, 'max': max, 'abs': abs}[rule]
+        return lambda params: func(*[child(params) for child in children])
+    if rule == 'neg':
+        child = children[0]
+        return lambda params: -child(params)
+
+    func = {
+        'add': operator.add,
+        'sub': operator.sub,
+        'mul': operator.mul,
+        'div': operator.truediv,
+        'mod': operator.mod,
+        'pow': pow,
+    }[rule]
+    left, right = children
+    return lambda params: func(left(params), right(params))
+
+
+def _compile_array(tree: Union[Tree, Token]) -> Callable[[dict[str, np.ndarray], np.ndarray], np.ndarray]:
+    """Compile a parsed expression into a function of a dict of parameter arrays (NaN where a
+    value is missing). Rows where the scalar evaluation would raise a ZeroDivisionError (or
+    would not return a real number) are flagged in the `invalid` boolean array.
+    """
+    rule = tree.data
+    if rule == 'number':
+        number = float(tree.children[0])
+        return lambda params, invalid: number
+    if rule == 'param':
+        name = str(tree.children[0])
+        return lambda params, invalid: params[name]
+
+    children = [_compile_array(child) for child in tree.children]
+    if rule in ('min', 'max'):
+        func = np.minimum if rule == 'min' else np.maximum
+        return lambda params, invalid: func.reduce(
+            np.broadcast_arrays(*[child(params, invalid) for child in children])
+        )
+    if rule == 'abs':
+        child = children[0]
+        return lambda params, invalid: np.abs(child(params, invalid))
+    if rule == 'neg':
+        child = children[0]
+        return lambda params, invalid: np.negative(child(params, invalid))
+
+    left, right = children
+    if rule in ('div', 'mod'):
+        func = np.true_divide if rule == 'div' else np.mod
+
+        def divide(params, invalid):
+            numerator, denominator = left(params, invalid), right(params, invalid)
+            invalid |= np.asarray(denominator) == 0
+            return func(numerator, denominator)
+        return divide
+    if rule == 'pow':
+        def power(params, invalid):
+            base, exponent = left(params, invalid), right(params, invalid)
+            result = np.power(base, exponent)
+            # 0 ** -x divides by zero and a negative base with a fractional exponent is complex
+            invalid |= ((np.asarray(base) == 0) & (np.asarray(exponent) < 0)) | (
+                np.isnan(result) & ~np.isnan(base) & ~np.isnan(exponent)
+            )
+            return result
+        return power
+
+    func = {'add': np.add, 'sub': np.subtract, 'mul': np.multiply}[rule]
+    return lambda params, invalid: func(left(params, invalid), right(params, invalid))
+
+
+# same strings as the ones accepted by float(), except for inf, nan and underscores
+NUMERIC_TEXT_REGEX = r'^\s*[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?\s*$'
+
+
+class SQLTemplate(models.Func):
+    """Float SQL expression from a template which can use its arguments more than once, e.g.,
+    SQLTemplate('{0} / NULLIF({1}, 0)', F('a'), F('b')). The arguments are compiled once and
+    their SQL and parameters are repeated for each placeholder.
+    """
+    output_field = models.FloatField()
+
+    def __init__(self, template: str, *expressions, **extra):
+        self.sql_template = template
+        super().__init__(*expressions, **extra)
+
+    def as_sql(self, compiler, connection, **extra_context):
+        compiled = [compiler.compile(expression) for expression in self.get_source_expressions()]
+        sql_parts: list[str] = []
+        params: list[Any] = []
+        for literal, field_name, _, _ in Formatter().parse(self.sql_template):
+            sql_parts.append(literal)
+            if field_name is not None:
+                sql, arg_params = compiled[int(field_name)]
+                sql_parts.append(f'({sql})')
+                params.extend(arg_params)
+        return ''.join(sql_parts), params
+
+
+def _text_to_float(expression) -> SQLTemplate:
+    """Cast a text expression to float, or NULL if the text isn't numeric (instead of raising
+    a database error)
+    """
+    return SQLTemplate(
+        'CASE WHEN {0} ~ {1} THEN CAST({0} AS double precision) END',
+        expression, models.Value(NUMERIC_TEXT_REGEX),
+    )
+
+
+def _compile_sql(tree: Union[Tree, Token], params: dict[str, models.Expression]) -> models.Expression:
+    """Compile a parsed expression into a Django expression. The result is NULL in the same
+    cases the evaluation of the expression returns None: if a parameter is NULL or a division
+    by zero occurs.
+
+    :param tree: parsed expression
+    :param params: dict, parameter name to the float expression of its value
+    """
+    rule = tree.data
+    if rule == 'number':
+        return models.Value(float(tree.children[0]), output_field=models.FloatField())
+    if rule == 'param':
+        return params.get(str(tree.children[0]), models.Value(None, output_field=models.FloatField()))
+
+    children = [_compile_sql(child, params) for child in tree.children]
+    if rule in ('min', 'max'):
+        # LEAST and GREATEST ignore NULLs, unlike min() and max()
+        placeholders = [f'{{{i}}}' for i in range(len(children))]
+        return SQLTemplate(
+            'CASE WHEN {} THEN NULL ELSE {}({}) END'.format(
+                ' OR '.join(f'{p} IS NULL' for p in placeholders),
+                'LEAST' if rule == 'min' else 'GREATEST',
+                ', '.join(placeholders),
+            ),
+            *children,
+        )
+    if rule == 'abs':
+        return Abs(children[0], output_field=models.FloatField())
+    if rule == 'neg':
+        return SQLTemplate('-{0}', *children)
+
+    templates = {
+        'add': '{0} + {1}',
+        'sub': '{0} - {1}',
+        'mul': '{0} * {1}',
+        'div': '{0} / NULLIF({1}, 0)',
+        # postgres has no modulo for double precision, and Python's modulo takes the sign of the divisor
+        'mod': '{0} - {1} * FLOOR({0} / NULLIF({1}, 0))',
+        # postgres raises errors for the cases which are a ZeroDivisionError or a complex number in Python
+        'pow': 'CASE WHEN ({0} = 0 AND {1} < 0) OR ({0} < 0 AND {1} <> FLOOR({1})) THEN NULL ELSE POWER({0}, {1}) END',
+    }
+    return SQLTemplate(templates[rule], *children)
+
+
+def _expression_parameters(tree: Union[Tree, Token]) -> set[str]:
+    """Names of the parameters referenced by a parsed expression"""
+    return {str(subtree.children[0]) for subtree in tree.iter_subtrees() if subtree.data == 'param'}
 
 
 class ExpressionEvaluator:
@@ -78,38 +279,12 @@ class ExpressionEvaluator:
     %ignore WS_INLINE
     """
 
-    @v_args(inline=True)
-    class EvaluateTree(Transformer):
-        """Transforms expression tree into a result by applying operations.
-        Should be used with the expression grammar above
-        """
-        from operator import add, mod, mul, neg, sub  # type: ignore[misc]
-        from operator import truediv as div  # type: ignore[misc]
-
-        number = float
-        min = min
-        max = max
-        pow = pow
-        abs = abs
-
-        def __init__(self):
-            self.params = {}
-
-        def param(self, name):
-            try:
-                return self.params[name]
-            except KeyError:
-                raise KeyError("Parameter not found: %s" % name)
-
-        def set_params(self, params):
-            """Set the parameters available when parsing
-
-            :param params: dict, key is parameter name (without $ prefix), value is value
-            """
-            self.params = params
+    # the parser only depends on the grammar, so it is built once and shared
+    _tree_parser = None
 
     def __init__(self, expression: str, validate: bool = True):
-        """Construct an expression evaluator.
+        """Construct an expression evaluator. The expression is parsed once, the first time
+        it is evaluated, and compiled into functions that are reused for every evaluation.
 
         :param expression: str
         :param validate: bool, optional
@@ -118,8 +293,15 @@ class ExpressionEvaluator:
         if validate:
             self.is_valid(expression)
 
-        self._transformer = self.EvaluateTree()
-        self._parser = Lark(self.EXPRESSION_GRAMMAR, parser='lalr', transformer=self._transformer)
+        self._tree = None
+        self._scalar_func = None
+        self._array_func = None
+
+    @classmethod
+    def _get_parser(cls) -> Lark:
+        if cls._tree_parser is None:
+            cls._tree_parser = Lark(cls.EXPRESSION_GRAMMAR, parser='lalr')
+        return cls._tree_parser
 
     @classmethod
     def is_valid(cls, expression: str) -> bool:
@@ -129,12 +311,22 @@ class ExpressionEvaluator:
         :return: bool
         """
         try:
-            Lark(cls.EXPRESSION_GRAMMAR, parser='lalr').parse(expression)
+            cls._get_parser().parse(expression)
         except UnexpectedToken as e:
             raise InvalidExpression(expression, e.pos_in_stream)
 
         return True
 
+    def _get_tree(self) -> Tree:
+        if self._tree is None:
+            self._tree = self._get_parser().parse(self._expression)
+        return self._tree
+
+    @property
+    def parameter_names(self) -> set[str]:
+        """Names of the parameters used in the expression"""
+        return _expression_parameters(self._get_tree())
+
     def evaluate(self, parameters: Union[None, dict[str, float]] = None) -> float:
         """Evaluate the expression with the provided parameters
 
@@ -144,8 +336,45 @@ class ExpressionEvaluator:
         if parameters is None:
             parameters = {}
 
-        self._transformer.set_params(parameters)
-        return self._parser.parse(self._expression)  # type: ignore[return-value]
+        if self._scalar_func is None:
+            self._scalar_func = _compile_scalar(self._get_tree())
+        return self._scalar_func(parameters)
+
+    def evaluate_arrays(self, parameters: dict[str, np.ndarray], size: int) -> tuple[np.ndarray, np.ndarray]:
+        """Evaluate the expression for many rows at once.
+
+        :param parameters: dict, keys are parameter names and values are float arrays of
+            length `size` with NaN for the missing values
+        :param size: int, number of rows
+        :return: tuple, (float array of the results, boolean array that is True for the rows
+            that have no result because of missing parameters or a division by zero)
+        """
+        if self._array_func is None:
+            self._array_func = _compile_array(self._get_tree())
+
+        missing = np.zeros(size, dtype=bool)
+        params = {}
+        for name in self.parameter_names:
+            values = parameters.get(name)
+            if values is None:
+                values = np.full(size, np.nan)
+            params[name] = values
+            missing |= np.isnan(values)
+
+        invalid = np.zeros(size, dtype=bool)
+        with np.errstate(all='ignore'):
+            result = np.broadcast_to(np.asarray(self._array_func(params, invalid), dtype=float), (size,))
+
+        return result, missing | invalid
+
+    def to_sql_expression(self, parameters: dict[str, models.Expression]) -> models.Expression:
+        """Translate the expression into a Django expression which can be used to annotate
+        querysets, e.g., to filter and sort on the result in the database.
+
+        :param parameters: dict, keys are parameter names and values are float expressions
+        :return: Expression, float which is NULL where `evaluate` would not return a value
+        """
+        return _compile_sql(self._get_tree(), parameters)
 
 
 class InvalidExpression(Exception):
@@ -254,26 +483,23 @@ class DerivedColumn(models.Model):
                 ...
             }
         """
+        params = {}
+        for parameter in self._get_column_parameters():
+            params[parameter.parameter_name] = _get_state_value(inventory_state, parameter.source_column.column_name)
+
+        return params
+
+    def _get_column_parameters(self) -> list[DerivedColumnParameter]:
+        """The parameters of the expression with their source columns (and the source columns'
+        derived columns), cached on the instance
+        """
         if not hasattr(self, '_cached_column_parameters'):
-            self._cached_column_parameters = (
+            self._cached_column_parameters = list(
                 DerivedColumnParameter.objects
                 .filter(derived_column=self.id)
-                .prefetch_related('source_column')
+                .select_related('source_column', 'source_column__derived_column')
             )
-
-        params = {}
-        for parameter in self._cached_column_parameters:
-            source_column_name = parameter.source_column.column_name
-            value = None
-
-            if hasattr(inventory_state, source_column_name):
-                value = getattr(inventory_state, source_column_name)
-            else:
-                value = inventory_state.extra_data.get(source_column_name)
-
-            params[parameter.parameter_name] = value
-
-        return params
+        return self._cached_column_parameters
 
     def evaluate(self, inventory_state: Union[None, PropertyState, TaxLotState] = None, parameters: Union[None, dict[str, float]] = None):
         """Evaluate the expression. Caller must provide `parameters`, `inventory_state`,
@@ -329,14 +555,143 @@ class DerivedColumn(models.Model):
                             f'    exception: {e}')
 
     def check_for_source_columns_derived(self, inventory_state=None, merged_parameters={}):
-        dcps = self.derivedcolumnparameter_set.all()
-        for dcp in dcps:
-            column = Column.objects.get(pk=dcp.source_column_id)
-            if column.derived_column:
-                dc = column.derived_column
+        for dcp in self._get_column_parameters():
+            dc = dcp.source_column.derived_column
+            if dc:
                 val = dc.evaluate(inventory_state)
                 merged_parameters[dcp.parameter_name] = val
 
+    def _dependency_order(self) -> list[DerivedColumn]:
+        """This derived column and the derived columns it depends on (through its source
+        columns, recursively), ordered so that each one comes after its dependencies
+        """
+        ordered: list[DerivedColumn] = []
+        visited: set[int] = set()
+        in_progress: set[int] = set()
+
+        def visit(derived_column):
+            if derived_column.id in visited:
+                return
+            if derived_column.id in in_progress:
+                raise Exception(f'Circular reference in derived column {derived_column.id} ({derived_column.name})')
+            in_progress.add(derived_column.id)
+            for dcp in derived_column._get_column_parameters():
+                if dcp.source_column.derived_column:
+                    visit(dcp.source_column.derived_column)
+            in_progress.remove(derived_column.id)
+            visited.add(derived_column.id)
+            ordered.append(derived_column)
+
+        visit(self)
+        return ordered
+
+    def _evaluate_arrays(self, inventory_states: list, derived_results: dict[int, tuple[np.ndarray, np.ndarray]]) -> tuple[np.ndarray, np.ndarray]:
+        """Evaluate the expression for all the states, given the results of the derived
+        columns this one depends on
+
+        :param inventory_states: list of PropertyState | TaxLotState
+        :param derived_results: dict, derived column id to (values, is_none) arrays
+        :return: tuple, (float array of the values, boolean array that is True where the value is None)
+        """
+        if not hasattr(self, '_cached_evaluator'):
+            self._cached_evaluator = ExpressionEvaluator(self.expression)
+
+        size = len(inventory_states)
+        is_none = np.zeros(size, dtype=bool)
+        parameters = {}
+        for dcp in self._get_column_parameters():
+            dc = dcp.source_column.derived_column
+            if dc:
+                values, dc_is_none = derived_results[dc.id]
+                # like evaluate(), a derived source column without a value gives no value
+                is_none |= dc_is_none
+                values = np.where(dc_is_none, np.nan, values)
+            else:
+                column_name = dcp.source_column.column_name
+                values = np.array([
+                    _cast_to_float(_get_state_value(state, column_name)) for state in inventory_states
+                ], dtype=float)
+            parameters[dcp.parameter_name] = values
+
+        values, invalid = self._cached_evaluator.evaluate_arrays(parameters, size)
+        return values, is_none | invalid
+
+    def _source_column_sql_expression(self, source_column: Column, state_prefix: str, visited: set[int]) -> models.Expression:
+        """Float expression of the value of a source column, like `_cast_to_float` of the value
+        that is used by `evaluate`
+        """
+        if source_column.derived_column:
+            return source_column.derived_column._sql_expression(state_prefix, visited)
+
+        StateClass = PropertyState if self.inventory_type == self.PROPERTY_TYPE else TaxLotState
+        column_name = source_column.column_name
+        try:
+            field = StateClass._meta.get_field(column_name)
+        except FieldDoesNotExist:
+            return _text_to_float(KeyTextTransform(column_name, f'{state_prefix}extra_data'))
+
+        # quantity fields are float fields which store the magnitude
+        if isinstance(field, (models.FloatField, models.IntegerField, models.DecimalField)):
+            return Cast(f'{state_prefix}{column_name}', output_field=models.FloatField())
+        if isinstance(field, (models.CharField, models.TextField)):
+            return _text_to_float(models.F(f'{state_prefix}{column_name}'))
+        # other fields (e.g., dates, booleans, relations) are never numeric
+        return models.Value(None, output_field=models.FloatField())
+
+    def _sql_expression(self, state_prefix: str, visited: set[int]) -> models.Expression:
+        if self.id in visited:
+            raise Exception(f'Circular reference in derived column {self.id} ({self.name})')
+        visited = visited | {self.id}
+
+        if not hasattr(self, '_cached_evaluator'):
+            self._cached_evaluator = ExpressionEvaluator(self.expression)
+
+        parameters = {
+            dcp.parameter_name: self._source_column_sql_expression(dcp.source_column, state_prefix, visited)
+            for dcp in self._get_column_parameters()
+        }
+        return self._cached_evaluator.to_sql_expression(parameters)
+
+    def as_sql_expression(self, state_prefix: str = 'state__') -> models.Expression:
+        """Django expression which computes the derived column in the database, so that
+        querysets can be annotated, filtered and sorted on the derived column, e.g.,
+
+            PropertyView.objects.annotate(value=derived_column.as_sql_expression()).filter(value__gt=10)
+
+        Values are cast like in `evaluate`: non-numeric values are NULL, as are the results with
+        missing parameters or divisions by zero.
+
+        :param state_prefix: str, lookup path from the queryset's model to the -State, e.g.,
+            'state__' for views and '' for -States
+        :return: Expression
+        """
+        return self._sql_expression(state_prefix, set())
+
+    def evaluate_batch(self, inventory_states: Iterable[Union[PropertyState, TaxLotState]]) -> list[Optional[float]]:
+        """Evaluate the expression for many inventory states at once. The source column values
+        are loaded into arrays and the expression is applied to whole arrays. Derived columns
+        that are source columns are evaluated first, in dependency order.
+
+        Returns the same values as calling `evaluate(inventory_state=state)` on every state, that
+        is None where a value is missing, non-numeric or a division by zero occurs.
+
+        :param inventory_states: list or QuerySet of PropertyState | TaxLotState
+        :return: list of float | None, in the order of the states
+        """
+        inventory_states = list(inventory_states)
+        if not inventory_states:
+            return []
+
+        derived_results: dict[int, tuple[np.ndarray, np.ndarray]] = {}
+        for derived_column in self._dependency_order():
+            derived_results[derived_column.id] = derived_column._evaluate_arrays(inventory_states, derived_results)
+
+        values, is_none = derived_results[self.id]
+        return [
+            None if none else value
+            for value, none in zip(values.tolist(), is_none.tolist())
+        ]
+
 
 class DerivedColumnParameter(models.Model):
     """
@@ -373,3 +728,11 @@ class DerivedColumnParameter(models.Model):
     def save(self, *args, **kwargs):
         self.full_clean()
         super().save(*args, **kwargs)
+
+
+def invalidate_organization_derived_columns(sender, instance, **kwargs):
+    invalidate_column_metadata(instance.organization_id)
+
+
+post_save.connect(invalidate_organization_derived_columns, sender=DerivedColumn)
+post_delete.connect(invalidate_organization_derived_columns, sender=DerivedColumn)
@@ -0,0 +1,166 @@
+# !/usr/bin/env python
+# encoding: utf-8
+"""
+SEED Platform (TM), Copyright (c) Alliance for Sustainable Energy, LLC, and other contributors.
+See also https://github.com/seed-platform/seed/main/LICENSE.md
+"""
+from collections import defaultdict
+from types import SimpleNamespace
+
+from django.db import models, transaction
+from django.utils import timezone
+
+from seed.utils.address import normalize_address_str
+from seed.utils.pagination import invalidate_inventory_counts
+from seed.utils.search_document import build_search_document
+from seed.utils.state_hash import hash_state_object
+from seed.utils.ubid import decode_state_ubid
+
+# number of -States per INSERT or UPDATE statement of bulk_save_states
+BULK_SAVE_BATCH_SIZE = 1000
+
+COORDINATE_FIELDS = ['latitude', 'longitude', 'long_lat', 'geocoding_confidence']
+
+# fields which save() and the save signals of the -States derive from the other fields, these are
+# always written by bulk_save_states
+DERIVED_FIELDS = [
+    'normalized_address', 'hash_object', 'search_document', 'updated',
+    'latitude', 'longitude', 'long_lat', 'geocoding_confidence', 'bounding_box', 'centroid',
+]
+
+
+def sync_coordinates(instance, original, keep_census_geocoder_confidence=False):
+    """Sync the latitude, longitude and long_lat of a -State which is about to be saved, if
+    applicable
+
+    :param instance: PropertyState or TaxLotState, being saved
+    :param original: the -State as it is in the database, or any object with the latitude,
+        longitude, long_lat and geocoding_confidence of it
+    :param keep_census_geocoder_confidence: bool, whether a Census Geocoder confidence newly set on
+        the -State is kept when the coordinates are changed
+    """
+    latitude_change = original.latitude != instance.latitude
+    longitude_change = original.longitude != instance.longitude
+    long_lat_change = original.long_lat != instance.long_lat
+    lat_and_long_both_populated = instance.latitude is not None and instance.longitude is not None
+    # The 'not long_lat_change' condition removes the case when long_lat is changed by an external API,
+    # so the first block below is when a user manually changes the lat/long and the geocoding confidence
+    # needs to be updated to "manually" (or keep as Census Geocoder)
+    if (latitude_change or longitude_change) and lat_and_long_both_populated and not long_lat_change:
+        instance.long_lat = f"POINT ({instance.longitude} {instance.latitude})"
+        # keep Census Geocoder confidence if newly present in the string
+        if keep_census_geocoder_confidence and instance.geocoding_confidence is not None and \
+                'Census Geocoder' in instance.geocoding_confidence and \
+                'Census Geocoder' not in original.geocoding_confidence:
+            pass
+        else:
+            # If we are here, then we are manually geocoding the -State
+            instance.geocoding_confidence = "Manually geocoded (N/A)"
+
+    elif (latitude_change or longitude_change) and not lat_and_long_both_populated:
+        instance.long_lat = None
+        instance.geocoding_confidence = None
+
+
+class StateManager(models.Manager):
+    """Manager of PropertyState and TaxLotState"""
+
+    def __init__(self, keep_census_geocoder_confidence=False):
+        super().__init__()
+        self.keep_census_geocoder_confidence = keep_census_geocoder_confidence
+
+    def _ubid_field(self):
+        from seed.models.ubid_models import UbidModel
+
+        # the foreign key of the UbidModels to this kind of -State
+        return next(
+            field.name for field in UbidModel._meta.get_fields()
+            if field.many_to_one and field.related_model is self.model
+        )
+
+    def bulk_save_states(self, states, fields=None, batch_size=BULK_SAVE_BATCH_SIZE):
+        """Save many -States at once. Does in bulk what save() and the save signals of the -States
+        do for each -State (normalized address, hash, search document, coordinates, UBID models and
+        inventory counts) with a few queries for the whole batch. The save signals of the -States
+        are not sent.
+
+        :param states: list of PropertyState or TaxLotState, new (without a pk) or existing
+        :param fields: list of str, optional, fields written on the existing -States, defaults to
+            all the fields. The fields derived on save are always written.
+        :param batch_size: int, number of -States per INSERT or UPDATE statement
+        :return: list, the saved -States
+        """
+        from seed.models.ubid_models import UbidModel
+
+        states = list(states)
+        if not states:
+            return states
+
+        ubid_field = self._ubid_field()
+        existing_ids = [state.pk for state in states if state.pk is not None]
+        originals = self.only('id', *COORDINATE_FIELDS).in_bulk(existing_ids) if existing_ids else {}
+        ubid_models = defaultdict(list)
+        for ubid_model in UbidModel.objects.filter(**{f'{ubid_field}_id__in': existing_ids}):
+            ubid_models[getattr(ubid_model, f'{ubid_field}_id')].append(ubid_model)
+
+        now = timezone.now()
+        for state in states:
+            original = originals.get(state.pk)
+            if original is not None:
+                sync_coordinates(state, original, self.keep_census_geocoder_confidence)
+
+            # a new UBID is decoded, then the coordinates are synced again as when the decoded
+            # -State is saved
+            if state.ubid and state.ubid not in {ubid_model.ubid for ubid_model in ubid_models.get(state.pk, [])}:
+                decoded_from = SimpleNamespace(**{field: getattr(state, field) for field in COORDINATE_FIELDS})
+                if decode_state_ubid(state):
+                    sync_coordinates(state, decoded_from, self.keep_census_geocoder_confidence)
+
+            if state.address_line_1 is not None:
+                state.normalized_address = normalize_address_str(state.address_line_1)
+            else:
+                state.normalized_address = None
+            state.hash_object = hash_state_object(state)
+            state.search_document = build_search_document(state)
+            state.updated = now
+
+        existing_states = [state for state in states if state.pk is not None]
+        new_states = [state for state in states if state.pk is None]
+        if fields is None:
+            update_fields = [field.name for field in self.model._meta.concrete_fields if not field.primary_key]
+        else:
+            update_fields = list(dict.fromkeys(list(fields) + DERIVED_FIELDS))
+
+        with transaction.atomic():
+            if existing_states:
+                self.bulk_update(existing_states, update_fields, batch_size=batch_size)
+            if new_states:
+                self.bulk_create(new_states, batch_size=batch_size)
+
+            # the UbidModels are created without their save signal, which would only sync the
+            # UBID of the -State, already equal
+            unpreferred_ids, preferred_ids, new_ubid_models = [], [], []
+            for state in states:
+                state_ubid_models = ubid_models.get(state.pk, [])
+                matching = [ubid_model for ubid_model in state_ubid_models if ubid_model.ubid == state.ubid]
+                if not state.ubid or not matching:
+                    unpreferred_ids += [ubid_model.id for ubid_model in state_ubid_models if ubid_model.preferred]
+                    if state.ubid:
+                        new_ubid_models.append(UbidModel(ubid=state.ubid, preferred=True, **{ubid_field: state}))
+                elif any(not ubid_model.preferred for ubid_model in matching):
+                    preferred_ids += [ubid_model.id for ubid_model in matching]
+                    unpreferred_ids += [
+                        ubid_model.id for ubid_model in state_ubid_models if ubid_model.ubid != state.ubid
+                    ]
+
+            if unpreferred_ids:
+                UbidModel.objects.filter(id__in=unpreferred_ids).update(preferred=False)
+            if preferred_ids:
+                UbidModel.objects.filter(id__in=preferred_ids).update(preferred=True)
+            if new_ubid_models:
+                UbidModel.objects.bulk_create(new_ubid_models, batch_size=batch_size)
+
+        for organization_id in {state.organization_id for state in states}:
+            invalidate_inventory_counts(organization_id=organization_id)
+
+        return states
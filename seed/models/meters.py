@@ -7,6 +7,7 @@ from django.db import connection, models
 from psycopg2.extras import execute_values
 
 from seed.models import Property, Scenario
+from seed.utils.reading_rollups import refresh_meter_rollups
 
 
 class Meter(models.Model):
@@ -185,6 +186,9 @@ class Meter(models.Model):
 
             MeterReading.objects.bulk_create(readings)
 
+        # the readings are copied in bulk without signals, so their rollups are refreshed here
+        refresh_meter_rollups([self.id])
+
 
 class MeterReading(models.Model):
     """
@@ -8,15 +8,14 @@ from __future__ import absolute_import, unicode_literals
 
 import copy
 import logging
-import re
-from os import path
 
-from django.conf import settings
 from django.contrib.gis.db import models as geomodels
+from django.contrib.postgres.indexes import GinIndex
 from django.db import IntegrityError, models, transaction
 from django.db.models import Case, Value, When
 from django.db.models.signals import (
     m2m_changed,
+    post_delete,
     post_save,
     pre_delete,
     pre_save
@@ -32,6 +31,7 @@ from seed.data_importer.models import ImportFile
 from seed.lib.mcm.cleaners import date_cleaner
 from seed.lib.superperms.orgs.models import Organization
 from seed.models.cycles import Cycle
+from seed.models.managers import StateManager, sync_coordinates
 from seed.models.models import (
     DATA_STATE,
     DATA_STATE_MATCHING,
@@ -48,7 +48,11 @@ from seed.utils.generic import (
     obj_to_dict,
     split_model_fields
 )
-from seed.utils.time import convert_datestr, convert_to_js_timestamp
+from seed.utils.pagination import invalidate_inventory_counts
+from seed.utils.search_document import build_search_document
+from seed.utils.state_hash import hash_state_object
+from seed.utils.state_history import state_histories
+from seed.utils.time import convert_datestr
 
 from ..utils.ubid import decode_unique_ids
 from .auditlog import AUDIT_IMPORT, DATA_UPDATE_TYPE
@@ -127,6 +131,7 @@ class Property(models.Model):
                             target_meter.copy_readings(source_meter, overlaps_possible=False)
                         else:
                             source_meter.meter_readings.update(meter=target_meter)
+                            source_meter.reading_rollups.update(meter=target_meter)
                     else:
                         # If self did have a similar meter, copy readings assuming overlaps are possible.
                         target_meter.copy_readings(source_meter, overlaps_possible=True)
@@ -187,6 +192,8 @@ class PropertyState(models.Model):
     address_line_1 = models.CharField(max_length=255, null=True, blank=True, db_collation='natural_sort')
     address_line_2 = models.CharField(max_length=255, null=True, blank=True, db_collation='natural_sort')
     normalized_address = models.CharField(max_length=255, null=True, blank=True, editable=False)
+    # identifiers and address for the quick search, see seed.utils.search_document
+    search_document = models.TextField(null=True, blank=True, editable=False)
 
     city = models.CharField(max_length=255, null=True, blank=True, db_collation='natural_sort')
     state = models.CharField(max_length=255, null=True, blank=True, db_collation='natural_sort')
@@ -316,6 +323,8 @@ class PropertyState(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
 
+    objects = StateManager(keep_census_geocoder_confidence=True)
+
     class Meta:
         index_together = [
             ['hash_object'],
@@ -323,6 +332,9 @@ class PropertyState(models.Model):
             ['import_file', 'data_state', 'merge_state'],
             ['import_file', 'data_state', 'source_type'],
         ]
+        indexes = [
+            GinIndex(fields=['search_document'], name='propertystate_search_trgm', opclasses=['gin_trgm_ops']),
+        ]
 
     def promote(self, cycle, property_id=None):
         """
@@ -431,8 +443,8 @@ class PropertyState(models.Model):
             self.normalized_address = None
 
         # save a hash of the object to the database for quick lookup
-        from seed.data_importer.tasks import hash_state_object
         self.hash_object = hash_state_object(self)
+        self.search_document = build_search_document(self)
 
         return super().save(*args, **kwargs)
 
@@ -451,111 +463,17 @@ class PropertyState(models.Model):
 
         :return: list, history as a list, and the main record
         """
+        return state_histories(PropertyAuditLog, [self], max_records=10, include_file=True)[self.id]
 
-        """Return history in reverse order."""
-        history = []
-        main = {
-            'state_id': self.id,
-            'state_data': self,
-            'date_edited': None,
-        }
-
-        def record_dict(log):
-            filename = file = None
-            if log.import_filename:
-                filename = path.basename(log.import_filename)
-                file = settings.MEDIA_URL + '/'.join(log.import_filename.split('/')[-2:])
-
-            if filename:
-                # Attempt to remove NamedTemporaryFile suffix
-                name, ext = path.splitext(filename)
-                pattern = re.compile('(.*?)(_[a-zA-Z0-9]{7})$')
-                match = pattern.match(name)
-                if match:
-                    filename = match.groups()[0] + ext
-            return {
-                'state_id': log.state.id,
-                'state_data': log.state,
-                'date_edited': convert_to_js_timestamp(log.created),
-                'source': log.get_record_type_display(),
-                'filename': filename,
-                'file': file
-                # 'changed_fields': json.loads(log.description) if log.record_type == AUDIT_USER_EDIT else None
-            }
-
-        log = PropertyAuditLog.objects.select_related('state', 'parent1', 'parent2').filter(
-            state_id=self.id
-        ).order_by('-id').first()
-
-        if log:
-            main = {
-                'state_id': log.state.id,
-                'state_data': log.state,
-                'date_edited': convert_to_js_timestamp(log.created),
-            }
-
-            # Traverse parents and add to history
-            if log.name in ['Manual Match', 'System Match', 'Merge current state in migration']:
-                done_searching = False
-
-                while not done_searching:
-                    # if there is no parents, then break out immediately
-                    if (log.parent1_id is None and log.parent2_id is None) or log.name == 'Manual Edit':
-                        break
-
-                    # initialize the tree to None everytime. If not new tree is found, then we will not iterate
-                    tree = None
-
-                    # Check if parent2 has any other parents or is the original import creation. Start with parent2
-                    # because parent2 will be the most recent import file.
-                    if log.parent2:
-                        if log.parent2.name in ['Import Creation', 'Manual Edit']:
-                            record = record_dict(log.parent2)
-                            history.append(record)
-                        elif log.parent2.name == 'System Match' and log.parent2.parent1.name == 'Import Creation' and \
-                                log.parent2.parent2.name == 'Import Creation':
-                            # Handle case where an import file matches within itself, and proceeds to match with
-                            # existing records
-                            record = record_dict(log.parent2.parent2)
-                            history.append(record)
-                            record = record_dict(log.parent2.parent1)
-                            history.append(record)
-                        else:
-                            tree = log.parent2
-
-                    if log.parent1:
-                        if log.parent1.name in ['Import Creation', 'Manual Edit']:
-                            record = record_dict(log.parent1)
-                            history.append(record)
-                        elif log.parent1.name == 'System Match' and log.parent1.parent1 and log.parent1.parent1.name == 'Import Creation' and \
-                                log.parent1.parent2 and log.parent1.parent2.name == 'Import Creation':
-                            # Handle case where an import file matches within itself, and proceeds to match with
-                            # existing records
-                            record = record_dict(log.parent1.parent2)
-                            history.append(record)
-                            record = record_dict(log.parent1.parent1)
-                            history.append(record)
-                        else:
-                            tree = log.parent1
-
-                    if not tree:
-                        done_searching = True
-                    else:
-                        log = tree
-
-                    # only get 10 histories at max
-                    if len(history) >= 10:
-                        history = history[:10]
-                        break
-
-            elif log.name == 'Manual Edit':
-                record = record_dict(log.parent1)
-                history.append(record)
-            elif log.name == 'Import Creation':
-                record = record_dict(log)
-                history.append(record)
+    @classmethod
+    def histories(cls, states):
+        """
+        Return the history of many property states at once, see `history`
 
-        return history, main
+        :param states: list or QuerySet of PropertyState
+        :return: dict, state id to a tuple, (history as a list, the main record)
+        """
+        return state_histories(PropertyAuditLog, states, max_records=10, include_file=True)
 
     @classmethod
     def coparent(cls, state_id):
@@ -902,6 +820,19 @@ def post_save_property_view(sender, **kwargs):
         kwargs['instance'].property.save()
 
 
+@receiver(post_save, sender=PropertyView)
+@receiver(post_delete, sender=PropertyView)
+def invalidate_property_view_counts(sender, instance, **kwargs):
+    """Adding or removing a PropertyView changes the counts of the inventory of its cycle"""
+    invalidate_inventory_counts(cycle_id=instance.cycle_id)
+
+
+@receiver(post_save, sender=PropertyState)
+def invalidate_property_state_counts(sender, instance, **kwargs):
+    """Changing a PropertyState can change which views match the filters of the inventory"""
+    invalidate_inventory_counts(organization_id=instance.organization_id)
+
+
 class PropertyAuditLog(models.Model):
     organization = models.ForeignKey(Organization, on_delete=models.CASCADE)
     parent1 = models.ForeignKey('PropertyAuditLog', on_delete=models.CASCADE, blank=True, null=True,
@@ -939,28 +870,21 @@ def sync_latitude_longitude_and_long_lat(sender, instance, **kwargs):
         pass  # Occurs on object creation
     else:
         # Sync Latitude, Longitude, and long_lat fields if applicable
-        latitude_change = original_obj.latitude != instance.latitude
-        longitude_change = original_obj.longitude != instance.longitude
-        long_lat_change = original_obj.long_lat != instance.long_lat
-        lat_and_long_both_populated = instance.latitude is not None and instance.longitude is not None
-        # The 'not long_lat_change' condition removes the case when long_lat is changed by an external API,
-        # so the first block below is when a user manually changes the lat/long and the geocoding confidence
-        # needs to be updated to "manually" (or keep as Census Geocoder)
-        if (latitude_change or longitude_change) and lat_and_long_both_populated and not long_lat_change:
-            instance.long_lat = f"POINT ({instance.longitude} {instance.latitude})"
-            # keep Census Geocoder confidence if newly present in the string
-            if instance is not None and instance.geocoding_confidence is not None:
-                if 'Census Geocoder' in instance.geocoding_confidence and 'Census Geocoder' not in original_obj.geocoding_confidence:
-                    instance.geocoding_confidence = instance.geocoding_confidence
-                else:
-                    instance.geocoding_confidence = "Manually geocoded (N/A)"
-            else:
-                # If we are here, then we are manually geocoding the property
-                instance.geocoding_confidence = "Manually geocoded (N/A)"
-
-        elif (latitude_change or longitude_change) and not lat_and_long_both_populated:
-            instance.long_lat = None
-            instance.geocoding_confidence = None
+        sync_coordinates(instance, original_obj, keep_census_geocoder_confidence=True)
 
 
 m2m_changed.connect(compare_orgs_between_label_and_target, sender=PropertyView.labels.through)
+
+
+@receiver(m2m_changed, sender=PropertyView.labels.through)
+def invalidate_property_view_label_counts(sender, instance, action, reverse, pk_set, **kwargs):
+    """Labeling a PropertyView changes which views of its cycle match the label filters"""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        invalidate_inventory_counts(cycle_id=instance.cycle_id)
+    elif pk_set:
+        # the labels were added to or removed from the views through the label
+        cycle_ids = PropertyView.objects.filter(pk__in=pk_set).values_list('cycle_id', flat=True).distinct()
+        for cycle_id in cycle_ids:
+            invalidate_inventory_counts(cycle_id=cycle_id)
@@ -0,0 +1,94 @@
+# !/usr/bin/env python
+# encoding: utf-8
+"""
+SEED Platform (TM), Copyright (c) Alliance for Sustainable Energy, LLC, and other contributors.
+See also https://github.com/seed-platform/seed/main/LICENSE.md
+"""
+from django.db import models
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from seed.models import Meter, MeterReading, Sensor, SensorReading
+from seed.utils.reading_rollups import (
+    refresh_meter_rollups,
+    refresh_sensor_rollups
+)
+
+
+class ReadingRollup(models.Model):
+    """
+    Readings aggregated by hour, day, month and year. The rollups are maintained by
+    seed.utils.reading_rollups when readings are saved. The hours are UTC hours, the days,
+    months and years are in the TIME_ZONE of the settings.
+    """
+    HOUR = 'hour'
+    DAY = 'day'
+    MONTH = 'month'
+    YEAR = 'year'
+
+    INTERVALS = (
+        (HOUR, 'Hour'),
+        (DAY, 'Day'),
+        (MONTH, 'Month'),
+        (YEAR, 'Year'),
+    )
+
+    interval = models.CharField(max_length=5, choices=INTERVALS)
+    period_start = models.DateTimeField()
+
+    class Meta:
+        abstract = True
+
+
+class MeterReadingRollup(ReadingRollup):
+    """
+    Total of the readings of a meter within a period. A reading which overlaps several periods
+    is prorated by the seconds it overlaps each of them.
+    """
+    meter = models.ForeignKey(
+        Meter,
+        on_delete=models.CASCADE,
+        related_name='reading_rollups',
+    )
+
+    reading = models.FloatField()
+
+    # seconds of the period covered by the readings
+    seconds = models.FloatField()
+
+    class Meta:
+        unique_together = ('meter', 'interval', 'period_start')
+
+
+class SensorReadingRollup(ReadingRollup):
+    """
+    Sum and number of the readings of a sensor within a period, for the readings taken while
+    the data logger is occupied and the others.
+    """
+    sensor = models.ForeignKey(
+        Sensor,
+        on_delete=models.CASCADE,
+        related_name='reading_rollups',
+    )
+
+    is_occupied = models.BooleanField()
+
+    reading_sum = models.FloatField(null=True)
+    reading_count = models.IntegerField()
+
+    class Meta:
+        unique_together = ('sensor', 'interval', 'period_start', 'is_occupied')
+
+
+@receiver(post_save, sender=MeterReading)
+def refresh_rollups_of_meter_reading(sender, instance, **kwargs):
+    # readings saved or deleted in bulk refresh the rollups of all the readings at once, see
+    # seed.data_importer.readings_loader. There is no post_delete receiver so that the readings
+    # of deleted meters are still deleted in bulk, their rollups are deleted by the cascade.
+    if instance.meter_id is not None:
+        refresh_meter_rollups([instance.meter_id], instance.start_time, instance.end_time)
+
+
+@receiver(post_save, sender=SensorReading)
+def refresh_rollups_of_sensor_reading(sender, instance, **kwargs):
+    refresh_sensor_rollups([instance.sensor_id], instance.timestamp, instance.timestamp)
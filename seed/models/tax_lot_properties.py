@@ -16,12 +16,15 @@ from django.contrib.gis.db.models import GeometryField
 from django.contrib.gis.geos import GEOSGeometry
 from django.db import models
 from django.db.models import Count
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.utils.timezone import make_naive
 from quantityfield.units import ureg
 
 from seed.models.columns import Column
 from seed.serializers.pint import DEFAULT_UNITS
 from seed.utils.geocode import bounding_box_wkt, long_lat_wkt
+from seed.utils.pagination import invalidate_inventory_counts
 from seed.utils.ubid import centroid_wkt
 
 if TYPE_CHECKING:
@@ -197,6 +200,15 @@ class TaxLotProperty(models.Model):
         obj_note_counts = {x[0]: x[1] for x in Note.objects.filter(**{lookups['obj_query_in']: ids})
                            .values_list(lookups['obj_view_id']).order_by().annotate(Count(lookups['obj_view_id']))}
 
+        # gather the properties with meters, Tax Lots don't have meters
+        property_ids_with_meters = set()
+        if this_cls == 'Property':
+            Meter = apps.get_model('seed', 'Meter')
+            property_ids_with_meters = set(
+                Meter.objects.filter(property_id__in=[obj.property_id for obj in object_list])
+                .values_list('property_id', flat=True)
+            )
+
         # determine merge statuses
         states_qs = lookups['view_class'].objects.filter(id__in=ids)
         merged_state_ids = lookups['audit_log_class'].objects.filter(
@@ -266,7 +278,7 @@ class TaxLotProperty(models.Model):
 
             # This is only applicable to Properties since Tax Lots don't have meters
             if this_cls == 'Property':
-                obj_dict['meters_exist_indicator'] = len(obj.property.meters.all()) > 0
+                obj_dict['meters_exist_indicator'] = obj.property_id in property_ids_with_meters
 
             # bring in GIS data
             obj_dict[lookups['bounding_box']] = bounding_box_wkt(obj.state)
@@ -431,3 +443,10 @@ class TaxLotProperty(models.Model):
                 join_map[getattr(join, lookups['obj_view_id'])] = [join_dict]
 
         return join_map
+
+
+@receiver(post_save, sender=TaxLotProperty)
+@receiver(post_delete, sender=TaxLotProperty)
+def invalidate_taxlot_property_counts(sender, instance, **kwargs):
+    """Pairing or unpairing inventory changes the counts of the inventory filtered on the related inventory"""
+    invalidate_inventory_counts(cycle_id=instance.cycle_id)
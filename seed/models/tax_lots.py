@@ -7,18 +7,23 @@ See also https://github.com/seed-platform/seed/main/LICENSE.md
 from __future__ import absolute_import, unicode_literals
 
 import logging
-import re
-from os import path
 
 from django.contrib.gis.db import models as geomodels
+from django.contrib.postgres.indexes import GinIndex
 from django.db import models
 from django.db.models import Case, Value, When
-from django.db.models.signals import m2m_changed, post_save, pre_save
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_save
+)
 from django.dispatch import receiver
 
 from seed.data_importer.models import ImportFile
 from seed.lib.superperms.orgs.models import Organization
 from seed.models.cycles import Cycle
+from seed.models.managers import StateManager, sync_coordinates
 from seed.models.models import (
     DATA_STATE,
     DATA_STATE_MATCHING,
@@ -34,7 +39,10 @@ from seed.utils.generic import (
     obj_to_dict,
     split_model_fields
 )
-from seed.utils.time import convert_to_js_timestamp
+from seed.utils.pagination import invalidate_inventory_counts
+from seed.utils.search_document import build_search_document
+from seed.utils.state_hash import hash_state_object
+from seed.utils.state_history import state_histories
 
 from ..utils.ubid import decode_unique_ids
 from .auditlog import AUDIT_IMPORT, DATA_UPDATE_TYPE
@@ -76,6 +84,8 @@ class TaxLotState(models.Model):
     address_line_1 = models.CharField(max_length=255, null=True, blank=True, db_collation='natural_sort')
     address_line_2 = models.CharField(max_length=255, null=True, blank=True, db_collation='natural_sort')
     normalized_address = models.CharField(max_length=255, null=True, blank=True, editable=False)
+    # identifiers and address for the quick search, see seed.utils.search_document
+    search_document = models.TextField(null=True, blank=True, editable=False)
 
     city = models.CharField(max_length=255, null=True, blank=True, db_collation='natural_sort')
     state = models.CharField(max_length=255, null=True, blank=True, db_collation='natural_sort')
@@ -100,12 +110,17 @@ class TaxLotState(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
 
+    objects = StateManager()
+
     class Meta:
         index_together = [
             ['hash_object'],
             ['import_file', 'data_state'],
             ['import_file', 'data_state', 'merge_state']
         ]
+        indexes = [
+            GinIndex(fields=['search_document'], name='taxlotstate_search_trgm', opclasses=['gin_trgm_ops']),
+        ]
 
     def __str__(self):
         return 'TaxLot State - %s' % self.pk
@@ -192,8 +207,8 @@ class TaxLotState(models.Model):
             self.normalized_address = None
 
         # save a hash of the object to the database for quick lookup
-        from seed.data_importer.tasks import hash_state_object
         self.hash_object = hash_state_object(self)
+        self.search_document = build_search_document(self)
         return super().save(*args, **kwargs)
 
     def history(self):
@@ -211,99 +226,17 @@ class TaxLotState(models.Model):
 
         :return: list, history as a list, and the main record
         """
+        return state_histories(TaxLotAuditLog, [self])[self.id]
 
-        """Return history in reverse order."""
-        history = []
-        main = {
-            'state_id': self.id,
-            'state_data': self,
-            'date_edited': None,
-        }
-
-        def record_dict(log):
-            filename = None if not log.import_filename else path.basename(log.import_filename)
-            if filename:
-                # Attempt to remove NamedTemporaryFile suffix
-                name, ext = path.splitext(filename)
-                pattern = re.compile('(.*?)(_[a-zA-Z0-9]{7})$')
-                match = pattern.match(name)
-                if match:
-                    filename = match.groups()[0] + ext
-            return {
-                'state_id': log.state.id,
-                'state_data': log.state,
-                'date_edited': convert_to_js_timestamp(log.created),
-                'source': log.get_record_type_display(),
-                'filename': filename,
-                # 'changed_fields': json.loads(log.description) if log.record_type == AUDIT_USER_EDIT else None
-            }
-
-        log = TaxLotAuditLog.objects.select_related('state', 'parent1', 'parent2').filter(
-            state_id=self.id
-        ).order_by('-id').first()
-
-        if log:
-            main = {
-                'state_id': log.state.id,
-                'state_data': log.state,
-                'date_edited': convert_to_js_timestamp(log.created),
-            }
+    @classmethod
+    def histories(cls, states):
+        """
+        Return the history of many taxlot states at once, see `history`
 
-            # Traverse parents and add to history
-            if log.name in ['Manual Match', 'System Match', 'Merge current state in migration']:
-                done_searching = False
-
-                while not done_searching:
-                    # if there is no parents, then break out immediately
-                    if (
-                            log.parent1_id is None and log.parent2_id is None) or log.name == 'Manual Edit':
-                        break
-
-                    # initialize the tree to None everytime. If not new tree is found, then we will not iterate
-                    tree = None
-
-                    # Check if parent2 has any other parents or is the original import creation. Start with parent2
-                    # because parent2 will be the most recent import file.
-                    if log.parent2:
-                        if log.parent2.name in ['Import Creation', 'Manual Edit']:
-                            record = record_dict(log.parent2)
-                            history.append(record)
-                        elif log.parent2.name == 'System Match' and log.parent2.parent1.name == 'Import Creation' and log.parent2.parent2.name == 'Import Creation':
-                            # Handle case where an import file matches within itself, and proceeds to match with
-                            # existing records
-                            record = record_dict(log.parent2.parent2)
-                            history.append(record)
-                            record = record_dict(log.parent2.parent1)
-                            history.append(record)
-                        else:
-                            tree = log.parent2
-
-                    if log.parent1:
-                        if log.parent1.name in ['Import Creation', 'Manual Edit']:
-                            record = record_dict(log.parent1)
-                            history.append(record)
-                        elif log.parent1.name == 'System Match' and log.parent1.parent1.name == 'Import Creation' and log.parent1.parent2.name == 'Import Creation':
-                            # Handle case where an import file matches within itself, and proceeds to match with
-                            # existing records
-                            record = record_dict(log.parent1.parent2)
-                            history.append(record)
-                            record = record_dict(log.parent1.parent1)
-                            history.append(record)
-                        else:
-                            tree = log.parent1
-
-                    if not tree:
-                        done_searching = True
-                    else:
-                        log = tree
-            elif log.name == 'Manual Edit':
-                record = record_dict(log.parent1)
-                history.append(record)
-            elif log.name == 'Import Creation':
-                record = record_dict(log)
-                history.append(record)
-
-        return history, main
+        :param states: list or QuerySet of TaxLotState
+        :return: dict, state id to a tuple, (history as a list, the main record)
+        """
+        return state_histories(TaxLotAuditLog, states)
 
     @classmethod
     def coparent(cls, state_id):
@@ -487,6 +420,19 @@ def post_save_taxlot_view(sender, **kwargs):
         kwargs['instance'].taxlot.save()
 
 
+@receiver(post_save, sender=TaxLotView)
+@receiver(post_delete, sender=TaxLotView)
+def invalidate_taxlot_view_counts(sender, instance, **kwargs):
+    """Adding or removing a TaxLotView changes the counts of the inventory of its cycle"""
+    invalidate_inventory_counts(cycle_id=instance.cycle_id)
+
+
+@receiver(post_save, sender=TaxLotState)
+def invalidate_taxlot_state_counts(sender, instance, **kwargs):
+    """Changing a TaxLotState can change which views match the filters of the inventory"""
+    invalidate_inventory_counts(organization_id=instance.organization_id)
+
+
 class TaxLotAuditLog(models.Model):
     organization = models.ForeignKey(Organization, on_delete=models.CASCADE)
     parent1 = models.ForeignKey('TaxLotAuditLog', on_delete=models.CASCADE, blank=True, null=True,
@@ -526,20 +472,7 @@ def sync_latitude_longitude_and_long_lat(sender, instance, **kwargs):
         pass  # Occurs on object creation
     else:
         # Sync Latitude, Longitude, and long_lat fields if applicable
-        latitude_change = original_obj.latitude != instance.latitude
-        longitude_change = original_obj.longitude != instance.longitude
-        long_lat_change = original_obj.long_lat != instance.long_lat
-        lat_and_long_both_populated = instance.latitude is not None and instance.longitude is not None
-        # The 'not long_lat_change' condition removes the case when long_lat is changed by an external API,
-        # so the first block below is when a user manually changes the lat/long and the geocoding confidence
-        # needs to be updated to "manually" (or keep as Census Geocoder)
-        if (latitude_change or longitude_change) and lat_and_long_both_populated and not long_lat_change:
-            # manual change
-            instance.long_lat = f"POINT ({instance.longitude} {instance.latitude})"
-            instance.geocoding_confidence = "Manually geocoded (N/A)"
-        elif (latitude_change or longitude_change) and not lat_and_long_both_populated:
-            instance.long_lat = None
-            instance.geocoding_confidence = None
+        sync_coordinates(instance, original_obj)
 
 
 m2m_changed.connect(compare_orgs_between_label_and_target, sender=TaxLotView.labels.through)
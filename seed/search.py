@@ -13,7 +13,8 @@ import logging
 import operator
 from functools import reduce
 
-from django.db.models import Q
+from django.db import OperationalError, connection, transaction
+from django.db.models import F, FloatField, Func, Q, Value
 from django.http.request import RawPostDataException
 from past.builtins import basestring
 
@@ -31,6 +32,11 @@ from .models import (
 
 _log = logging.getLogger(__name__)
 
+# number of views returned by a quick search
+QUICK_SEARCH_LIMIT = 50
+# a quick search taking longer than this (in milliseconds) is cancelled by the database
+QUICK_SEARCH_TIMEOUT_MS = 2000
+
 
 def _search(q, fieldnames, queryset):
     """returns a queryset for matching objects
@@ -52,8 +58,8 @@ def search_properties(q, fieldnames=None, queryset=None):
         return PropertyState.objects.none()
     if fieldnames is None:
         fieldnames = [
-            'pm_parent_property_id'
-            'jurisdiction_property_id'
+            'pm_parent_property_id',
+            'jurisdiction_property_id',
             'address_line_1',
             'property_name',
         ]
@@ -66,12 +72,58 @@ def search_taxlots(q, fieldnames=None, queryset=None):
     if fieldnames is None:
         fieldnames = [
             'jurisdiction_tax_lot_id',
-            'address'
-            'block_number'
+            'address_line_1',
+            'block_number',
         ]
     return _search(q, fieldnames, queryset)
 
 
+def search_views(inventory_type, org_id, cycle_id, q, limit=QUICK_SEARCH_LIMIT, timeout_ms=QUICK_SEARCH_TIMEOUT_MS):
+    """Quick search of the views of a cycle with the search documents of their -States (see
+    seed.utils.search_document). The documents are filtered with a substring match, which is
+    answered by their trigram index, and ranked by how well the query matches a word sequence of
+    the document.
+
+    :param inventory_type: str, 'property' or 'taxlot'
+    :param org_id: int, id of the organization
+    :param cycle_id: int, id of the cycle
+    :param q: str, search string
+    :param limit: int, maximum number of views returned
+    :param timeout_ms: int, time after which the search is cancelled
+    :return: tuple, (list of int, ids of the views best match first; bool, True if the search was
+        cancelled)
+    """
+    ViewClass = PropertyView if inventory_type == 'property' else TaxLotView
+    q = ' '.join(q.lower().split())
+    if not q:
+        return [], False
+
+    view_ids = ViewClass.objects.filter(
+        cycle_id=cycle_id,
+        cycle__organization_id=org_id,
+        state__search_document__contains=q,
+    ).annotate(
+        rank=Func(Value(q), F('state__search_document'), function='word_similarity', output_field=FloatField())
+    ).order_by('-rank', 'id').values_list('id', flat=True)[:limit]
+
+    try:
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute('SHOW statement_timeout')
+                statement_timeout = cursor.fetchone()[0]
+                cursor.execute('SELECT set_config(%s, %s, true)', ['statement_timeout', str(int(timeout_ms))])
+                view_ids = list(view_ids)
+                # the timeout would otherwise last until the end of an enclosing transaction
+                cursor.execute('SELECT set_config(%s, %s, true)', ['statement_timeout', statement_timeout])
+    except OperationalError as e:
+        if 'statement timeout' not in str(e):
+            raise
+        _log.warning(f'Quick search of {inventory_type} views in cycle {cycle_id} timed out')
+        return [], True
+
+    return view_ids, False
+
+
 def parse_body(request):
     """parses the request body for search params, q, etc
 
@@ -49,7 +49,7 @@ REMOVE_FIELDS = [field for field in PROPERTY_STATE_FIELDS
                  if field.startswith('propertyauditlog__')]
 # eventually we can remove the measures, building_file, and property_state as soon as we remove
 # the use of PVFIELDS... someday
-REMOVE_FIELDS.extend(['organization', 'import_file', 'measures', 'building_files', 'scenarios'])
+REMOVE_FIELDS.extend(['organization', 'import_file', 'measures', 'building_files', 'scenarios', 'search_document'])
 for field in REMOVE_FIELDS:
     PROPERTY_STATE_FIELDS.remove(field)
 PROPERTY_STATE_FIELDS.extend(['organization_id', 'import_file_id'])
@@ -166,7 +166,7 @@ class PropertyStateSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = PropertyState
-        fields = '__all__'
+        exclude = ['search_document']
         extra_kwargs = {
             'organization': {'read_only': True}
         }
@@ -282,7 +282,7 @@ class PropertyStatePromoteWritableSerializer(serializers.ModelSerializer):
     source_eui_modeled_orig = serializers.FloatField(allow_null=True, read_only=True)
 
     class Meta:
-        fields = '__all__'
+        exclude = ['search_document']
         model = PropertyState
         extra_kwargs = {
             'organization': {'read_only': True}
@@ -327,7 +327,7 @@ class PropertyStateWritableSerializer(serializers.ModelSerializer):
     total_marginal_ghg_emissions_intensity = PintQuantitySerializerField(allow_null=True, required=False)
 
     class Meta:
-        fields = '__all__'
+        exclude = ['search_document']
         model = PropertyState
 
 
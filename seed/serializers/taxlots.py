@@ -31,7 +31,7 @@ class TaxLotStateSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = TaxLotState
-        fields = '__all__'
+        exclude = ['search_document']
 
     def to_representation(self, data):
         """Overwritten to handle extra_data null fields"""
@@ -8,7 +8,10 @@ from __future__ import absolute_import
 
 import itertools
 import math
+import os
 import sys
+import traceback
+import uuid
 from datetime import datetime
 
 import pytz
@@ -40,6 +43,9 @@ from seed.models import (
     TaxLotState,
     TaxLotView
 )
+from seed.utils.column_rewrite import delete_extra_data_key
+from seed.utils.inventory_export import write_inventory_export
+from seed.utils.pagination import invalidate_inventory_counts
 from seed.utils.salesforce import auto_sync_salesforce_properties
 
 logger = get_task_logger(__name__)
@@ -384,6 +390,7 @@ def _evaluate_delete_organization_column(column_pk, org_pk, prog_key, chunk_size
             chunk_ids, column.column_name, column.table_name, progress_data.key
         )
 
+    invalidate_inventory_counts(organization_id=org_pk)
     _finish_delete_column(column_pk, progress_data.key)
 
 
@@ -396,9 +403,7 @@ def _delete_organization_column_chunk(chunk_ids, column_name, table_name, prog_k
         states = TaxLotState.objects.filter(id__in=chunk_ids)
 
     with transaction.atomic():
-        for state in states:
-            del state.extra_data[column_name]
-            state.save(update_fields=['extra_data', 'hash_object'])
+        delete_extra_data_key(states, column_name)
 
     progress_data = ProgressData.from_key(prog_key)
     progress_data.step_with_counter()
@@ -473,3 +478,41 @@ def set_update_to_now(property_view_ids, taxlot_view_ids, progress_key):
 
     progress_data.finish_with_success()
     return progress_data.result()['progress']
+
+
+@shared_task
+def export_inventory(org_id, inventory_type, view_ids, profile_id, export_type, filename,
+                     include_notes, include_meter_readings, progress_key):
+    """Write an inventory export to the media directory. Once finished, the summary of the
+    progress data holds the url to download the file from.
+    """
+    progress_data = ProgressData.from_key(progress_key)
+
+    # each export gets its own directory so that the requested filename can be kept
+    relative_path = os.path.join(
+        'inventory_exports', str(org_id), uuid.uuid4().hex, os.path.basename(filename)
+    )
+    absolute_path = os.path.join(settings.MEDIA_ROOT, relative_path)
+    os.makedirs(os.path.dirname(absolute_path), exist_ok=True)
+
+    try:
+        total_records = write_inventory_export(
+            absolute_path, export_type, org_id, inventory_type,
+            ids=view_ids,
+            profile_id=profile_id,
+            include_notes=include_notes,
+            include_meter_readings=include_meter_readings,
+            progress_data=progress_data,
+        )
+    except Exception as e:
+        logger.exception('Failed to export inventory')
+        progress_data.finish_with_error(str(e), traceback.format_exc())
+        return progress_data.result()
+
+    progress_data.update_summary({
+        'filename': os.path.basename(filename),
+        'path': relative_path,
+        'url': f'/api/v3/media/{relative_path}',
+        'total_records': total_records,
+    })
+    return progress_data.finish_with_success()
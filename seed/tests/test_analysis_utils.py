@@ -12,6 +12,7 @@ from seed.analysis_pipelines.utils import (
     SimpleMeterReading,
     _split_reading,
     calendarize_and_extrapolate_meter_readings,
+    calendarize_and_extrapolate_meter_readings_batch,
     calendarize_meter_readings,
     interpolate_monthly_readings
 )
@@ -345,6 +346,34 @@ class TestAnalysisUtils(TestCase):
         ]
         self.assertListEqual(expected, result)
 
+    def test_calendarize_and_extrapolate_meter_readings_batch_matches_calendarizing_each_meter(self):
+        # -- Setup
+        readings_by_meter = {
+            'electric': [
+                SimpleMeterReading(dt(2021, 1, 15), dt(2021, 2, 15), 10),
+                SimpleMeterReading(dt(2021, 2, 15), dt(2021, 3, 1), 4),
+            ],
+            # these readings overlap the electric readings, but are averaged separately
+            'gas': [
+                SimpleMeterReading(dt(2021, 2, 1), dt(2021, 2, 15), 1),
+            ],
+            'empty': [],
+        }
+
+        # -- Act
+        results = calendarize_and_extrapolate_meter_readings_batch(readings_by_meter)
+
+        # -- Assert
+        expected = {
+            meter: calendarize_and_extrapolate_meter_readings(readings)
+            for meter, readings in readings_by_meter.items()
+        }
+        self.assertDictEqual(expected, results)
+        self.assertListEqual(
+            [SimpleMeterReading(dt(2021, 2, 1), dt(2021, 3, 1), 2)],
+            results['gas']
+        )
+
     def test_interpolate_works_when_one_month_missing(self):
         # -- Setup
         readings = [
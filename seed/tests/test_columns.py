@@ -8,8 +8,8 @@ import os.path
 from datetime import date, datetime
 
 from django.core.exceptions import ValidationError
-from django.db import IntegrityError
-from django.test import TestCase
+from django.db import IntegrityError, transaction
+from django.test import TestCase, TransactionTestCase
 from quantityfield.units import ureg
 
 from seed import models as seed_models
@@ -26,7 +26,10 @@ from seed.test_helpers.fake import (
     FakePropertyStateFactory,
     FakeTaxLotStateFactory
 )
+from seed.utils.address import normalize_address_str
+from seed.utils.column_rewrite import delete_extra_data_key
 from seed.utils.organizations import create_organization
+from seed.utils.state_hash import hash_state_object
 
 
 class TestColumns(TestCase):
@@ -198,6 +201,27 @@ class TestColumns(TestCase):
         self.assertEqual(c.table_name, 'PropertyState')
         self.assertEqual(ps.extra_data['lab'], 'hawkins national laboratory')
 
+    def test_save_columns_for_states(self):
+        ps1 = PropertyState.objects.create(
+            organization=self.fake_org,
+            extra_data={'a': 123, 'lab': 'hawkins national laboratory'}
+        )
+        ps2 = PropertyState.objects.create(
+            organization=self.fake_org,
+            extra_data={'a': 456, 'upside_down': True}
+        )
+        Column.save_column_names_for_states([ps1, ps2])
+
+        # keys from every state are saved, not only the ones of the first state
+        for column_name in ['a', 'lab', 'upside_down']:
+            c = Column.objects.get(organization=self.fake_org, column_name=column_name)
+            self.assertEqual(c.is_extra_data, True)
+            self.assertEqual(c.table_name, 'PropertyState')
+
+        # saving again does not create duplicate columns
+        Column.save_column_names_for_states([ps1, ps2])
+        self.assertEqual(Column.objects.filter(organization=self.fake_org, column_name='a').count(), 1)
+
     def test_save_column_mapping_by_file_exception(self):
         self.mapping_import_file = os.path.abspath("./no-file.csv")
         with self.assertRaisesRegex(Exception, "Mapping file does not exist: .*/no-file.csv"):
@@ -729,6 +753,41 @@ class TestRenameColumns(TestCase):
 
         self.assertListEqual(results, expected_data)
 
+    def test_rename_address_line_1_updates_normalized_address_and_hash(self):
+        state = self.property_state_factory.get_property_state(
+            data_state=DATA_STATE_MATCHING,
+            address_line_1='123 Main Street',
+            extra_data={self.extra_data_column.column_name: '456 Other Street'},
+        )
+        result = self.extra_data_column.rename_column('address_line_1', force=True)
+        self.assertTrue(result[0])
+
+        state = PropertyState.objects.get(id=state.id)
+        self.assertEqual(state.address_line_1, '456 Other Street')
+        self.assertEqual(state.normalized_address, normalize_address_str('456 Other Street'))
+        self.assertNotIn(self.extra_data_column.column_name, state.extra_data)
+        self.assertEqual(state.hash_object, hash_state_object(state))
+
+    def test_delete_extra_data_key(self):
+        states = [
+            self.property_state_factory.get_property_state(
+                data_state=DATA_STATE_MATCHING,
+                extra_data={self.extra_data_column.column_name: i, 'skip': 'value'}
+            )
+            for i in range(3)
+        ]
+        other_state = self.property_state_factory.get_property_state(
+            data_state=DATA_STATE_MATCHING,
+            extra_data={'skip': 'value'}
+        )
+
+        deleted = delete_extra_data_key(PropertyState.objects.filter(organization=self.org), self.extra_data_column.column_name)
+        self.assertEqual(deleted, 3)
+
+        for state in PropertyState.objects.filter(id__in=[s.id for s in states + [other_state]]):
+            self.assertEqual(state.extra_data, {'skip': 'value'})
+            self.assertEqual(state.hash_object, hash_state_object(state))
+
 
 class TestColumnMapping(TestCase):
     """Test ColumnMapping utility methods."""
@@ -1201,6 +1260,69 @@ class TestColumnsByInventory(TestCase):
         self.assertEqual(priors['TaxLotState']['extra_data']['Gross Floor Area'], 'Favor New')
 
 
+class TestColumnMetadataCache(TransactionTestCase):
+    """The cache is only kept for committed columns, so these tests commit their changes."""
+
+    def setUp(self):
+        self.user = User.objects.create(username='test')
+        self.org, _, _ = create_organization(self.user, name='Existing Org')
+        column_a = seed_models.Column.objects.create(
+            column_name='Column A',
+            table_name='PropertyState',
+            organization=self.org,
+            is_extra_data=True,
+        )
+        dm = seed_models.ColumnMapping.objects.create(super_organization=self.org)
+        dm.column_mapped.add(column_a)
+        seed_models.Column.objects.create(
+            column_name='Gross Floor Area',
+            table_name='TaxLotState',
+            organization=self.org,
+            is_extra_data=True
+        )
+
+    def test_retrieve_all_is_cached_until_the_columns_change(self):
+        columns = Column.retrieve_all(self.org.id, 'property', only_used=True)
+        self.assertIn('Column A', [c['column_name'] for c in columns])
+        self.assertNotIn('Gross Floor Area', [c['column_name'] for c in columns])
+
+        # served from the cache
+        with self.assertNumQueries(0):
+            Column.retrieve_all(self.org.id, 'property', only_used=True)
+
+        # mapping to a column invalidates the cache
+        gross_floor_area = Column.objects.get(
+            organization=self.org, table_name='TaxLotState', column_name='Gross Floor Area'
+        )
+        dm = seed_models.ColumnMapping.objects.create(super_organization=self.org)
+        dm.column_mapped.add(gross_floor_area)
+        columns = Column.retrieve_all(self.org.id, 'property', only_used=True)
+        self.assertIn('Gross Floor Area', [c['column_name'] for c in columns])
+
+        # and so does saving a column
+        gross_floor_area.display_name = 'Lot Area'
+        gross_floor_area.save()
+        columns = Column.retrieve_all(self.org.id, 'property', only_used=True)
+        self.assertIn('Lot Area (Tax Lot)', [c['display_name'] for c in columns])
+
+        # the returned columns can be changed without changing the cache
+        columns[0]['display_name'] = 'changed'
+        self.assertNotIn('changed', [c['display_name'] for c in Column.retrieve_all(self.org.id, 'property')])
+
+    def test_columns_of_a_rolled_back_transaction_are_not_cached(self):
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                seed_models.Column.objects.create(
+                    column_name='Rolled Back', table_name='PropertyState', organization=self.org, is_extra_data=True
+                )
+                columns = Column.retrieve_all(self.org.id, 'property')
+                self.assertIn('Rolled Back', [c['column_name'] for c in columns])
+                raise IntegrityError('rollback')
+
+        columns = Column.retrieve_all(self.org.id, 'property')
+        self.assertNotIn('Rolled Back', [c['column_name'] for c in columns])
+
+
 class TestColumnCasting(TestCase):
     def setUp(self):
         self.fake_user = User.objects.create(username='test')
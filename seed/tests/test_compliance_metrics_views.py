@@ -8,9 +8,14 @@ import json
 
 from django.test import TestCase
 from django.urls import reverse
+from quantityfield.units import ureg
 
 from seed.models import Column, ComplianceMetric, FilterGroup, User
-from seed.test_helpers.fake import FakeCycleFactory
+from seed.test_helpers.fake import (
+    FakeCycleFactory,
+    FakePropertyStateFactory,
+    FakePropertyViewFactory
+)
 from seed.utils.organizations import create_organization
 
 
@@ -105,6 +110,56 @@ class ComplianceMetricViewTests(TestCase):
         self.assertEqual(len(compliance_metrics2.cycles.all()), 1)
         self.assertIsNone(compliance_metrics2.filter_group)
 
+    def test_compliance_metric_evaluate_refreshes_stored_results(self):
+        site_eui = Column.objects.get(organization=self.org, table_name='PropertyState', column_name='site_eui')
+        target_eui = Column.objects.create(
+            column_name='target_eui', organization=self.org, table_name='PropertyState',
+            is_extra_data=True, data_type='number',
+        )
+        compliance_metric = ComplianceMetric.objects.create(
+            name='compliance metric 3',
+            organization=self.org,
+            actual_energy_column=site_eui,
+            target_energy_column=target_eui,
+            energy_metric_type=ComplianceMetric.TARGET_GT_ACTUAL,
+        )
+        compliance_metric.cycles.set([self.cycle1])
+
+        state_factory = FakePropertyStateFactory(organization=self.org)
+        view_factory = FakePropertyViewFactory(organization=self.org, cycle=self.cycle1)
+        eui = ureg.Quantity(50, 'kBtu/ft**2/year')
+        compliant = view_factory.get_property_view(state=state_factory.get_property_state(site_eui=eui, extra_data={'target_eui': 60}))
+        non_compliant = view_factory.get_property_view(state=state_factory.get_property_state(site_eui=eui, extra_data={'target_eui': 40}))
+        unknown = view_factory.get_property_view(state=state_factory.get_property_state(site_eui=eui, extra_data={}))
+
+        response = compliance_metric.evaluate()
+        self.assertEqual(
+            {'y': [compliant.id], 'n': [non_compliant.id], 'u': [unknown.id]},
+            response['results_by_cycles'][self.cycle1.id]
+        )
+        self.assertEqual([[1], [1], [1]], [dataset['data'] for dataset in response['graph_data']['datasets']])
+        self.assertEqual(3, len(response['properties_by_cycles'][self.cycle1.id]))
+        compliant_result_id = compliance_metric.results.get(property_view=compliant).id
+
+        # only the results of the changed -State are recomputed
+        non_compliant.state.extra_data['target_eui'] = 70
+        non_compliant.state.save()
+        response = compliance_metric.evaluate()
+        self.assertEqual(
+            {'y': [compliant.id, non_compliant.id], 'n': [], 'u': [unknown.id]},
+            response['results_by_cycles'][self.cycle1.id]
+        )
+        self.assertEqual(compliant_result_id, compliance_metric.results.get(property_view=compliant).id)
+
+        # changing the metric recomputes all the results
+        compliance_metric.energy_metric_type = ComplianceMetric.TARGET_LT_ACTUAL
+        compliance_metric.save()
+        response = compliance_metric.evaluate()
+        self.assertEqual(
+            {'y': [], 'n': [compliant.id, non_compliant.id], 'u': [unknown.id]},
+            response['results_by_cycles'][self.cycle1.id]
+        )
+
     def test_compliance_metric_create_endpoint(self):
         self.assertEqual(2, len(ComplianceMetric.objects.all()))
 
@@ -310,6 +310,38 @@ class DataQualityCheckTests(AssertDictSubsetMixin, DataMappingBaseTestCase):
         labels = [r['label'] for r in dq_results]
         self.assertCountEqual(['Check Site EUI', 'Check Year Built'], labels)
 
+    def test_check_data_applies_and_removes_labels_for_all_rows(self):
+        dq = DataQualityCheck.retrieve(self.org.id)
+        dq.remove_all_rules()
+        valid_label = StatusLabel.objects.create(name='Valid Year Built', super_organization=self.org)
+        dq.add_rule({
+            'table_name': 'PropertyState',
+            'field': 'year_built',
+            'data_type': Rule.TYPE_YEAR,
+            'rule_type': Rule.RULE_TYPE_CUSTOM,
+            'condition': Rule.RULE_RANGE,
+            'min': 1900,
+            'max': 2020,
+            'severity': Rule.SEVERITY_VALID,
+            'status_label': valid_label,
+        })
+
+        views = []
+        for year_built in [1950, 1850, None]:
+            ps = self.property_state_factory.get_property_state(None, no_default_data=True, year_built=year_built)
+            views.append(PropertyView.objects.create(
+                property=self.property_factory.get_property(), cycle=self.cycle, state=ps
+            ))
+        # the labels of the rows that no longer pass are removed
+        views[1].labels.add(valid_label)
+        views[2].labels.add(valid_label)
+
+        dq.check_data('PropertyState', [view.state for view in views])
+
+        self.assertEqual(dq.results, {})
+        labeled_view_ids = set(PropertyView.objects.filter(labels=valid_label).values_list('id', flat=True))
+        self.assertEqual(labeled_view_ids, {views[0].id})
+
     def test_text_match(self):
         dq = DataQualityCheck.retrieve(self.org.id)
         dq.remove_all_rules()
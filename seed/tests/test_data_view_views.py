@@ -6,6 +6,7 @@ See also https://github.com/seed-platform/seed/main/LICENSE.md
 """
 import json
 from datetime import datetime
+from unittest import mock
 
 import pytz
 from django.test import TestCase
@@ -695,6 +696,25 @@ class DataViewEvaluationTests(TestCase):
         self.assertIsNone(cycle5_data['Sum'])
         self.assertEqual({}, cycle5_data['views_by_default_field'])
 
+    def test_evaluation_is_cached_until_the_inventory_changes(self):
+        columns = Column.objects.filter(id=self.site_eui.id)
+        data = self.data_view4.evaluate(columns)
+        cycle1_data = data['columns_by_id'][self.site_eui.id]['filter_groups_by_id'][self.dc_filter_group.id]['cycles_by_id'][self.cycle1.id]
+        self.assertEqual(11.5, cycle1_data['Average'])
+
+        with mock.patch.object(DataView, '_aggregate_columns') as aggregate_columns:
+            self.assertEqual(data, self.data_view4.evaluate(columns))
+            aggregate_columns.assert_not_called()
+
+        # changing a -State of the organization invalidates the cached evaluation
+        ureg = UnitRegistry()
+        self.state10.site_eui = 30 * ureg.kilobritish_thermal_unit / ureg.ft**2 / ureg.year
+        self.state10.save()
+        data = self.data_view4.evaluate(columns)
+        cycle1_data = data['columns_by_id'][self.site_eui.id]['filter_groups_by_id'][self.dc_filter_group.id]['cycles_by_id'][self.cycle1.id]
+        self.assertEqual(16.5, cycle1_data['Average'])
+        self.assertEqual(30, cycle1_data['Maximum'])
+
 
 class DataViewInventoryTests(TestCase):
     """
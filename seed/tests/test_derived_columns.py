@@ -19,6 +19,7 @@ from seed.models.derived_columns import (
     ExpressionEvaluator,
     InvalidExpression
 )
+from seed.models.properties import PropertyState
 from seed.test_helpers.fake import (
     FakeColumnFactory,
     FakeDerivedColumnFactory,
@@ -668,6 +669,116 @@ class TestDerivedColumns(TestCase):
         # Derived Column 2 (defined by a different derived column) can be evaluated
         self.assertEqual(derived_column2.evaluate(property_state), 5)
 
+    def test_derived_column_evaluate_batch_matches_evaluate(self):
+        # -- Setup
+        expression = '$a / $b'
+        column_parameters = {
+            'a': {
+                'source_column': self.col_factory('foo', is_extra_data=True),
+                'value': 10,
+            },
+            'b': {
+                'source_column': self.col_factory('bar', is_extra_data=True),
+                'value': 4,
+            }
+        }
+
+        models = self._derived_column_for_property_factory(expression, column_parameters)
+        derived_column = models['derived_column']
+        property_states = [
+            models['property_state'],
+            # missing parameter
+            self.property_state_factory.get_property_state(extra_data={'foo': 10}),
+            # non-numeric parameter
+            self.property_state_factory.get_property_state(extra_data={'foo': 'HELLO!!!!!', 'bar': 2}),
+            # division by zero
+            self.property_state_factory.get_property_state(extra_data={'foo': 10, 'bar': 0}),
+        ]
+
+        # -- Act
+        results = derived_column.evaluate_batch(property_states)
+
+        # -- Assert
+        self.assertEqual([2.5, None, None, None], results)
+        self.assertEqual([derived_column.evaluate(state) for state in property_states], results)
+        self.assertEqual([], derived_column.evaluate_batch([]))
+
+    def test_derived_column_evaluate_batch_with_derived_column_as_source_column(self):
+        # -- Setup
+        column_parameters = {
+            'a': {
+                'source_column': self.col_factory('foo', is_extra_data=True),
+                'value': 1,
+            },
+        }
+        models = self._derived_column_for_property_factory('$a + 2', column_parameters, name='dc1')
+        property_states = [
+            models['property_state'],
+            self.property_state_factory.get_property_state(extra_data={}),
+        ]
+
+        column_parameters = {
+            'b': {
+                'source_column': Column.objects.get(derived_column=models['derived_column'].id),
+                'value': None
+            },
+        }
+        models = self._derived_column_for_property_factory('$b * 2', column_parameters, name='dc2', create_property_state=False)
+        derived_column2 = models['derived_column']
+
+        # -- Act
+        results = derived_column2.evaluate_batch(property_states)
+
+        # -- Assert
+        self.assertEqual([6, None], results)
+
+    def test_derived_column_as_sql_expression_matches_evaluate(self):
+        # -- Setup
+        expression = 'min($a / $b, 100) + $c % 3 - abs($a) ** 0.5'
+        column_parameters = {
+            'a': {
+                'source_column': self.col_factory('foo', is_extra_data=True),
+                'value': 16,
+            },
+            'b': {
+                'source_column': self.col_factory('bar', is_extra_data=True),
+                'value': '4',
+            },
+            'c': {
+                'source_column': self.numeric_core_columns[0],
+                'value': 5,
+            }
+        }
+
+        models = self._derived_column_for_property_factory(expression, column_parameters)
+        derived_column = models['derived_column']
+        property_states = [
+            models['property_state'],
+            # missing parameter
+            self.property_state_factory.get_property_state(extra_data={'foo': 16}),
+            # non-numeric parameter
+            self.property_state_factory.get_property_state(extra_data={'foo': 'HELLO!!!!!', 'bar': 2}),
+            # division by zero
+            self.property_state_factory.get_property_state(extra_data={'foo': 16, 'bar': 0}),
+        ]
+
+        # -- Act
+        results = dict(
+            PropertyState.objects
+            .filter(id__in=[state.id for state in property_states])
+            .annotate(value=derived_column.as_sql_expression(state_prefix=''))
+            .values_list('id', 'value')
+        )
+
+        # -- Assert
+        for state in property_states:
+            expected = derived_column.evaluate(state)
+            if expected is None:
+                self.assertIsNone(results[state.id])
+            else:
+                self.assertAlmostEqual(expected, results[state.id])
+        self.assertIsNotNone(results[property_states[0].id])
+
     def test_derived_column_duplicate_name(self):
         """Test that a derived column cannot be created with the same name as another column"""
 
@@ -313,6 +313,16 @@ class TestMeasures(TestCase):
         # Assert
         self.assertFalse(is_permitted)
 
+    def test_get_inventory_export_file_checks_org_membership(self):
+        # exported files are stored under the id of the organization they were exported from
+        export_file = f'inventory_exports/{self.org_a.id}/abc123/ExportedData.csv'
+
+        self.assertTrue(check_file_permission(self.user_a, export_file))
+        self.assertFalse(check_file_permission(self.user_b, export_file))
+
+        with self.assertRaises(ModelForFileNotFound):
+            check_file_permission(self.user_a, f'inventory_exports/{self.org_a.id}/ExportedData.csv')
+
     def test_fails_when_path_does_not_match(self):
         # test import files
         with self.assertRaises(ModelForFileNotFound):
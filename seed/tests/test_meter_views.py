@@ -13,6 +13,7 @@ from django.urls import reverse
 from seed.data_importer.utils import \
     kbtu_thermal_conversion_factors as conversion_factors
 from seed.landing.models import SEEDUser as User
+from seed.models import MeterReadingRollup
 from seed.models.scenarios import Scenario
 from seed.test_helpers.fake import FakePropertyViewFactory
 from seed.tests.util import DeleteModelsTestCase
@@ -536,6 +537,7 @@ class TestMeterReadingCRUD(DeleteModelsTestCase):
         response = self.client.post(url, data=json.dumps(payload), content_type='application/json')
         self.assertEqual(response.status_code, 201)
         self.assertEqual(response.json()['reading'], 10)
+        self.assertEqual(MeterReadingRollup.objects.get(meter_id=meter_pk, interval=MeterReadingRollup.DAY).reading, 10)
 
         # now delete the item and verify that there are no more readings in the database
         detail_url = reverse('api:v3:property-meter-readings-detail', kwargs={'property_pk': property_view.id, 'meter_pk': meter_pk, 'pk': '2022-01-05 05:00:00'})
@@ -549,3 +551,4 @@ class TestMeterReadingCRUD(DeleteModelsTestCase):
         response = self.client.get(url, content_type='application/json')
         self.assertEqual(response.status_code, 200)
         self.assertEqual(len(response.json()), 0)
+        self.assertFalse(MeterReadingRollup.objects.filter(meter_id=meter_pk).exists())
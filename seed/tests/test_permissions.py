@@ -18,6 +18,7 @@ from seed.lib.superperms.orgs.models import (
     Organization,
     OrganizationUser
 )
+from seed.lib.superperms.orgs.org_cache import get_organization_user
 from seed.lib.superperms.orgs.permissions import (
     SEEDOrgPermissions,
     SEEDPublicPermissions,
@@ -242,6 +243,32 @@ class SEEDOrgPermissionsTests(TestCase):
         mock_request.user = self.superuser
         self.assertTrue(permissions.has_perm(mock_request))
 
+    @mock.patch('seed.lib.superperms.orgs.permissions.get_org_id')
+    def test_has_perm_resolves_org_user_once_per_request(self, mock_get_org_id):
+        """Test has_perm reuses the org user of the request until a membership changes"""
+        permissions = SEEDOrgPermissions()
+        mock_request = mock.MagicMock()
+        mock_request.user = self.user
+        mock_request.method = 'POST'
+        mock_get_org_id.return_value = self.org.id
+
+        self.assertTrue(permissions.has_perm(mock_request))
+        with self.assertNumQueries(0):
+            self.assertTrue(permissions.has_perm(mock_request))
+            self.assertEqual(get_organization_user(mock_request, self.org.id).organization, self.org)
+
+        # another request resolves the org user again
+        other_request = mock.MagicMock()
+        other_request.user = self.user
+        other_request.method = 'POST'
+        with self.assertNumQueries(1):
+            self.assertTrue(permissions.has_perm(other_request))
+
+        # changing the role is seen by the same request
+        self.org_user.role_level = ROLE_VIEWER
+        self.org_user.save()
+        self.assertFalse(permissions.has_perm(mock_request))
+
     @mock.patch.object(SEEDOrgPermissions, 'has_perm')
     @mock.patch('seed.lib.superperms.orgs.permissions.is_authenticated')
     def test_has_permission(self, mock_is_authenticated, mock_has_perm):
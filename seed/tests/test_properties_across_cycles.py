@@ -0,0 +1,74 @@
+# !/usr/bin/env python
+# encoding: utf-8
+"""
+SEED Platform (TM), Copyright (c) Alliance for Sustainable Energy, LLC, and other contributors.
+See also https://github.com/seed-platform/seed/main/LICENSE.md
+"""
+from django.test import TestCase
+from quantityfield.units import ureg
+
+from seed.landing.models import SEEDUser as User
+from seed.models import Column
+from seed.test_helpers.fake import (
+    FakeCycleFactory,
+    FakePropertyFactory,
+    FakePropertyViewFactory
+)
+from seed.utils.organizations import create_organization
+from seed.utils.properties import (
+    properties_across_cycles_with_columns,
+    property_columns_across_cycles
+)
+
+
+class TestPropertiesAcrossCycles(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_superuser(
+            email='test_user@demo.com', username='test_user@demo.com', password='test_pass'
+        )
+        self.org, _, _ = create_organization(self.user)
+        cycle_factory = FakeCycleFactory(organization=self.org, user=self.user)
+        self.cycle_1 = cycle_factory.get_cycle(name='Cycle 1')
+        self.cycle_2 = cycle_factory.get_cycle(name='Cycle 2')
+        self.property = FakePropertyFactory(organization=self.org).get_property()
+        self.view_factory = FakePropertyViewFactory(organization=self.org, user=self.user)
+
+        self.eui_column = Column.objects.get(organization=self.org, table_name='PropertyState', column_name='site_eui')
+        self.extra_data_column = Column.objects.create(
+            organization=self.org, table_name='PropertyState', column_name='Occupancy', is_extra_data=True, data_type='number'
+        )
+
+    def test_columns_are_fetched_for_all_cycles_and_pivoted_by_property(self):
+        view_1 = self.view_factory.get_property_view(
+            prprty=self.property, cycle=self.cycle_1, site_eui=ureg.Quantity(50, 'kBtu/ft**2/year'), extra_data={'Occupancy': '85.5'}
+        )
+        view_2 = self.view_factory.get_property_view(
+            prprty=self.property, cycle=self.cycle_2, site_eui=None, extra_data={'Occupancy': 'n/a'}
+        )
+        column_ids = [self.eui_column.id, self.extra_data_column.id]
+        cycle_ids = [self.cycle_1.id, self.cycle_2.id]
+
+        eui_key = f'site_eui_{self.eui_column.id}'
+        occupancy_key = f'Occupancy_{self.extra_data_column.id}'
+        columns = Column.retrieve_all(self.org.id, 'property', False, include_related=False)
+        # the organization, and the values of all the cycles
+        with self.assertNumQueries(2):
+            results = property_columns_across_cycles(self.org.id, cycle_ids, column_ids, columns_from_database=columns)
+        self.assertEqual(list(results), [self.property.id])
+        self.assertEqual(results[self.property.id][self.cycle_1.id], {
+            'id': self.property.id,
+            'property_view_id': view_1.id,
+            'property_state_id': view_1.state_id,
+            eui_key: 50,
+            occupancy_key: 85.5,
+        })
+        self.assertEqual(results[self.property.id][self.cycle_2.id][eui_key], None)
+        self.assertEqual(results[self.property.id][self.cycle_2.id][occupancy_key], 'n/a')
+
+        # values out of the range of a double are returned as text instead of failing the query
+        other_view = self.view_factory.get_property_view(cycle=self.cycle_1, extra_data={'Occupancy': '1e999'})
+        results = property_columns_across_cycles(self.org.id, cycle_ids, column_ids, columns_from_database=columns)
+        self.assertEqual(results[other_view.property_id][self.cycle_1.id][occupancy_key], '1e999')
+
+        by_cycle = properties_across_cycles_with_columns(self.org.id, column_ids, cycle_ids)
+        self.assertEqual([row['property_view_id'] for row in by_cycle[self.cycle_2.id]], [view_2.id])
@@ -395,6 +395,42 @@ class PropertyViewTests(DataMappingBaseTestCase):
         self.assertTrue('merged_indicator' in related)
         self.assertFalse(related['merged_indicator'])
 
+    def test_filter_endpoint_pages_by_cursor(self):
+        site_euis = [50, None, 10, 30, None, 20, 40]
+        for site_eui in site_euis:
+            self.property_view_factory.get_property_view(cycle=self.cycle, site_eui=site_eui)
+        site_eui_column = Column.objects.get(organization=self.org, table_name='PropertyState', column_name='site_eui')
+
+        base_url = reverse('api:v3:properties-filter') + '?cycle={}&organization_id={}&order_by=-site_eui_{}&order_by=id'.format(
+            self.cycle.pk, self.org.pk, site_eui_column.id
+        )
+        response = self.client.post(base_url + '&page=1&per_page=100', content_type='application/json')
+        expected_ids = [result['property_view_id'] for result in response.json()['results']]
+        self.assertEqual(len(expected_ids), len(site_euis))
+
+        cursor = ''
+        pages = []
+        while True:
+            response = self.client.post(f'{base_url}&per_page=3&cursor={cursor}', content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            self.assertEqual(data['pagination']['total'], len(site_euis))
+            pages.append([result['property_view_id'] for result in data['results']])
+            if not data['pagination']['has_next']:
+                break
+            cursor = data['pagination']['next_cursor']
+
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertEqual([view_id for page in pages for view_id in page], expected_ids)
+
+        # the cached count is invalidated when a view is added to the cycle
+        self.property_view_factory.get_property_view(cycle=self.cycle, site_eui=60)
+        response = self.client.post(f'{base_url}&per_page=3&cursor=', content_type='application/json')
+        self.assertEqual(response.json()['pagination']['total'], len(site_euis) + 1)
+
+        response = self.client.post(f'{base_url}&per_page=3&cursor=not-a-cursor', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
     def test_list_properties_with_profile_id(self):
         state = self.property_state_factory.get_property_state(extra_data={"field_1": "value_1"})
         prprty = self.property_factory.get_property()
@@ -0,0 +1,114 @@
+# !/usr/bin/env python
+# encoding: utf-8
+"""
+SEED Platform (TM), Copyright (c) Alliance for Sustainable Energy, LLC, and other contributors.
+See also https://github.com/seed-platform/seed/main/LICENSE.md
+"""
+from django.db import OperationalError, connection
+from django.test import TestCase
+from django.urls import reverse
+
+from seed.landing.models import SEEDUser as User
+from seed.models import PropertyState
+from seed.search import search_views
+from seed.test_helpers.fake import (
+    FakeCycleFactory,
+    FakePropertyViewFactory,
+    FakeTaxLotViewFactory
+)
+from seed.utils.organizations import create_organization
+from seed.utils.search_document import refresh_search_documents
+
+
+class TestQuickSearch(TestCase):
+    def setUp(self):
+        user_details = {
+            'username': 'test_user@demo.com',
+            'password': 'test_pass',
+        }
+        self.user = User.objects.create_superuser(email='test_user@demo.com', **user_details)
+        self.org, _, _ = create_organization(self.user)
+        self.client.login(**user_details)
+        self.cycle = FakeCycleFactory(organization=self.org, user=self.user).get_cycle()
+        self.view_factory = FakePropertyViewFactory(cycle=self.cycle, organization=self.org, user=self.user)
+
+    def _statement_timeout(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SHOW statement_timeout')
+            return cursor.fetchone()[0]
+
+    def test_search_document_is_built_on_save(self):
+        view = self.view_factory.get_property_view(pm_property_id='PM-4242', address_line_1='12 Quokka Lane')
+        self.assertIn('pm-4242', view.state.search_document)
+        self.assertIn('12 quokka lane', view.state.search_document)
+
+    def test_search_views_ranks_matching_views(self):
+        exact = self.view_factory.get_property_view(property_name='Quokka Tower', address_line_1='1 Elm St')
+        partial = self.view_factory.get_property_view(property_name='Quokkas Annex', address_line_1='2 Elm St')
+        self.view_factory.get_property_view(property_name='Wombat Hall', address_line_1='3 Elm St')
+
+        statement_timeout = self._statement_timeout()
+        view_ids, timed_out = search_views('property', self.org.id, self.cycle.id, '  QUOKKA ')
+        self.assertFalse(timed_out)
+        self.assertEqual(view_ids, [exact.id, partial.id])
+        # the timeout of the search does not last until the end of the test's transaction
+        self.assertEqual(self._statement_timeout(), statement_timeout)
+
+        # -States updated in bulk are found once their documents are refreshed
+        PropertyState.objects.filter(id=exact.state_id).update(property_name='Numbat Tower')
+        refresh_search_documents(PropertyState.objects.filter(id=exact.state_id))
+        self.assertEqual(search_views('property', self.org.id, self.cycle.id, 'numbat')[0], [exact.id])
+        self.assertEqual(search_views('property', self.org.id + 1, self.cycle.id, 'numbat')[0], [])
+
+    def test_search_views_reports_timed_out_searches(self):
+        self.view_factory.get_property_view(property_name='Quokka Tower')
+
+        def cancel_search(execute, sql, params, many, context):
+            if 'word_similarity' in sql:
+                raise OperationalError('canceling statement due to statement timeout')
+            return execute(sql, params, many, context)
+
+        statement_timeout = self._statement_timeout()
+        with connection.execute_wrapper(cancel_search):
+            self.assertEqual(search_views('property', self.org.id, self.cycle.id, 'quokka'), ([], True))
+        self.assertEqual(self._statement_timeout(), statement_timeout)
+
+        # other errors are raised
+        def fail_search(execute, sql, params, many, context):
+            if 'word_similarity' in sql:
+                raise OperationalError('server closed the connection unexpectedly')
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(fail_search):
+            with self.assertRaises(OperationalError):
+                search_views('property', self.org.id, self.cycle.id, 'quokka')
+
+    def test_quick_search_endpoints(self):
+        views = [self.view_factory.get_property_view(property_name=f'Quokka Tower {i}') for i in range(3)]
+        taxlot_view = FakeTaxLotViewFactory(cycle=self.cycle, organization=self.org, user=self.user).get_taxlot_view(
+            jurisdiction_tax_lot_id='LOT-QUOKKA'
+        )
+
+        url = reverse('api:v3:properties-quick-search')
+        params = {'organization_id': self.org.id, 'cycle': self.cycle.id, 'q': 'quokka tower'}
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {
+            'status': 'success',
+            'view_ids': [view.id for view in views],
+            'timed_out': False,
+        })
+
+        # the limit is kept between 1 and QUICK_SEARCH_LIMIT
+        response = self.client.get(url, {**params, 'limit': -1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['view_ids'], [views[0].id])
+
+        response = self.client.get(url, {**params, 'cycle': 'latest'})
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.get(
+            reverse('api:v3:taxlots-quick-search'),
+            {'organization_id': self.org.id, 'cycle': self.cycle.id, 'q': 'lot-quokka'}
+        )
+        self.assertEqual(response.json()['view_ids'], [taxlot_view.id])
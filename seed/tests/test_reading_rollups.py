@@ -0,0 +1,85 @@
+# !/usr/bin/env python
+# encoding: utf-8
+"""
+SEED Platform (TM), Copyright (c) Alliance for Sustainable Energy, LLC, and other contributors.
+See also https://github.com/seed-platform/seed/main/LICENSE.md
+"""
+from datetime import datetime
+
+from django.test import TestCase
+from django.utils.timezone import make_aware
+from pytz import timezone
+
+from config.settings.common import TIME_ZONE
+from seed.landing.models import SEEDUser as User
+from seed.models import (
+    DataLogger,
+    Meter,
+    MeterReading,
+    MeterReadingRollup,
+    Sensor,
+    SensorReading,
+    SensorReadingRollup
+)
+from seed.test_helpers.fake import FakePropertyFactory
+from seed.utils.organizations import create_organization
+from seed.utils.reading_rollups import refresh_meter_rollups
+
+
+class TestReadingRollups(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_superuser(
+            email='test_user@demo.com', username='test_user@demo.com', password='test_pass'
+        )
+        self.org, _, _ = create_organization(self.user)
+        self.property = FakePropertyFactory(organization=self.org).get_property()
+        self.tz_obj = timezone(TIME_ZONE)
+
+    def _local(self, *args):
+        return make_aware(datetime(*args), timezone=self.tz_obj)
+
+    def test_meter_rollups_prorate_readings_into_periods(self):
+        meter = Meter.objects.create(property=self.property, type=Meter.ELECTRICITY_GRID, source=Meter.PORTFOLIO_MANAGER)
+        MeterReading.objects.create(
+            meter=meter, start_time=self._local(2020, 1, 31, 12), end_time=self._local(2020, 2, 1, 12), reading=24, conversion_factor=1
+        )
+        MeterReading.objects.create(
+            meter=meter, start_time=self._local(2020, 12, 31), end_time=self._local(2021, 1, 2), reading=10, conversion_factor=1
+        )
+
+        rollups = {
+            (rollup.interval, rollup.period_start): (rollup.reading, rollup.seconds)
+            for rollup in MeterReadingRollup.objects.filter(meter=meter)
+        }
+        self.assertEqual(rollups[(MeterReadingRollup.HOUR, self._local(2020, 1, 31, 12))], (1, 3600))
+        self.assertEqual(rollups[(MeterReadingRollup.DAY, self._local(2020, 1, 31))], (12, 12 * 3600))
+        self.assertEqual(rollups[(MeterReadingRollup.MONTH, self._local(2020, 2, 1))], (12, 12 * 3600))
+        self.assertEqual(rollups[(MeterReadingRollup.MONTH, self._local(2020, 12, 1))], (5, 24 * 3600))
+        self.assertEqual(rollups[(MeterReadingRollup.YEAR, self._local(2020, 1, 1))], (29, 48 * 3600))
+        self.assertEqual(rollups[(MeterReadingRollup.YEAR, self._local(2021, 1, 1))], (5, 24 * 3600))
+
+        # readings updated in bulk are rolled up again when the rollups are refreshed
+        meter.meter_readings.update(reading=48)
+        refresh_meter_rollups([meter.id])
+        self.assertEqual(
+            MeterReadingRollup.objects.get(meter=meter, interval=MeterReadingRollup.YEAR, period_start=self._local(2021, 1, 1)).reading,
+            24
+        )
+
+    def test_sensor_rollups_sum_and_count_readings_by_occupancy(self):
+        data_logger = DataLogger.objects.create(property=self.property, display_name='logger')
+        sensor = Sensor.objects.create(data_logger=data_logger, display_name='s1', column_name='s1')
+        for day, hour, reading, is_occupied in [(1, 12, 1, True), (2, 12, 3, True), (3, 12, 10, False), (3, 13, None, False)]:
+            SensorReading.objects.create(
+                sensor=sensor, timestamp=self._local(2020, 3, day, hour), reading=reading, is_occupied=is_occupied
+            )
+
+        self.assertEqual(
+            list(
+                SensorReadingRollup.objects
+                .filter(sensor=sensor, interval=SensorReadingRollup.MONTH)
+                .order_by('is_occupied')
+                .values_list('period_start', 'is_occupied', 'reading_sum', 'reading_count')
+            ),
+            [(self._local(2020, 3, 1), False, 10, 1), (self._local(2020, 3, 1), True, 4, 2)]
+        )
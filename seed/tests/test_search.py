@@ -14,7 +14,12 @@ from django.http.request import QueryDict
 from django.test import TestCase
 
 from seed.landing.models import SEEDUser as User
-from seed.models import Column, PropertyView
+from seed.models import (
+    Column,
+    DerivedColumn,
+    DerivedColumnParameter,
+    PropertyView
+)
 from seed.test_helpers.fake import FakePropertyViewFactory
 from seed.utils.organizations import create_organization
 from seed.utils.search import FilterException, build_view_filters_and_sorts
@@ -383,3 +388,46 @@ class TestInventoryViewSearchParsers(TestCase):
         # -- Assert
         # evaluate the queryset -- no exception should be raised!
         list(cast_property_views)
+
+    def test_filter_and_sorts_parser_works_for_derived_columns(self):
+        # -- Setup
+        test_number_column = Column.objects.create(
+            column_name='test_number',
+            data_type='number',
+            is_extra_data=True,
+            table_name='PropertyState',
+            organization=self.fake_org,
+        )
+        derived_column = DerivedColumn.objects.create(
+            name='double_test_number',
+            expression='$a * 2',
+            organization=self.fake_org,
+            inventory_type=DerivedColumn.PROPERTY_TYPE,
+        )
+        DerivedColumnParameter.objects.create(
+            parameter_name='a',
+            derived_column=derived_column,
+            source_column=test_number_column,
+        )
+        derived_column_id = Column.objects.get(derived_column=derived_column).id
+
+        view_9 = self.property_view_factory.get_property_view(extra_data={'test_number': '9'})
+        view_10 = self.property_view_factory.get_property_view(extra_data={'test_number': 10})
+        # non-numeric values are NULL, like when evaluating the derived column
+        self.property_view_factory.get_property_view(extra_data={'test_number': 'not a number'})
+
+        # -- Act
+        input = QueryDict(f'double_test_number_{derived_column_id}__gte=19&order_by=-double_test_number_{derived_column_id}')
+        columns = Column.retrieve_all(self.fake_org, 'property', only_used=False, include_related=False)
+        filters, annotations, order_by = build_view_filters_and_sorts(input, columns)
+        property_views = PropertyView.objects.annotate(**annotations).filter(filters).order_by(*order_by)
+
+        # -- Assert
+        self.assertEqual([view_10.id], [view.id for view in property_views])
+
+        input = QueryDict(f'order_by=double_test_number_{derived_column_id}')
+        _, annotations, order_by = build_view_filters_and_sorts(input, columns)
+        property_views = PropertyView.objects.annotate(**annotations).filter(
+            id__in=[view_9.id, view_10.id]
+        ).order_by(*order_by)
+        self.assertEqual([view_9.id, view_10.id], [view.id for view in property_views])
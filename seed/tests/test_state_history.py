@@ -0,0 +1,55 @@
+# !/usr/bin/env python
+# encoding: utf-8
+"""
+SEED Platform (TM), Copyright (c) Alliance for Sustainable Energy, LLC, and other contributors.
+See also https://github.com/seed-platform/seed/main/LICENSE.md
+"""
+from django.test import TestCase
+
+from seed.landing.models import SEEDUser as User
+from seed.models import AUDIT_IMPORT, PropertyAuditLog, PropertyState
+from seed.test_helpers.fake import FakePropertyStateFactory
+from seed.utils.organizations import create_organization
+
+
+class TestStateHistory(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_superuser(
+            email='test_user@demo.com', username='test_user@demo.com', password='test_pass'
+        )
+        self.org, _, _ = create_organization(self.user)
+        self.property_state_factory = FakePropertyStateFactory(organization=self.org)
+
+    def _log(self, state, name, parent1=None, parent2=None, import_filename=None):
+        return PropertyAuditLog.objects.create(
+            organization=self.org,
+            state=state,
+            name=name,
+            parent1=parent1,
+            parent2=parent2,
+            import_filename=import_filename,
+            record_type=AUDIT_IMPORT,
+        )
+
+    def test_histories_of_merged_states(self):
+        states = [self.property_state_factory.get_property_state() for _ in range(5)]
+        # two imports merged, then merged with a third import
+        log0 = self._log(states[0], 'Import Creation', import_filename='/tmp/uploads/first_abcdefg.csv')
+        log1 = self._log(states[1], 'Import Creation', import_filename='/tmp/uploads/second.csv')
+        merge = self._log(states[2], 'System Match', parent1=log0, parent2=log1)
+        log3 = self._log(states[3], 'Import Creation')
+        self._log(states[4], 'System Match', parent1=merge, parent2=log3)
+
+        history, main = states[4].history()
+        self.assertEqual(main['state_id'], states[4].id)
+        self.assertEqual([record['state_id'] for record in history], [states[3].id, states[1].id, states[0].id])
+        self.assertEqual(history[2]['filename'], 'first.csv')
+        self.assertEqual(history[1]['file'], '/api/v3/media/uploads/second.csv')
+        self.assertEqual(history[1]['source'], 'ImportFile')
+
+        # the history of many states is loaded with a fixed number of queries
+        with self.assertNumQueries(3):
+            histories = PropertyState.histories(states)
+        self.assertEqual(histories[states[4].id][0], history)
+        self.assertEqual([record['state_id'] for record in histories[states[2].id][0]], [states[1].id, states[0].id])
+        self.assertEqual([record['state_id'] for record in histories[states[0].id][0]], [states[0].id])
@@ -4,13 +4,19 @@
 SEED Platform (TM), Copyright (c) Alliance for Sustainable Energy, LLC, and other contributors.
 See also https://github.com/seed-platform/seed/main/LICENSE.md
 """
+import csv
 import json
+import os
+import tempfile
 import time
 from datetime import datetime
 from random import randint
+from unittest import mock
 
 import pytz
+from django.test import override_settings
 from django.urls import reverse_lazy
+from django.utils.timezone import make_aware
 from xlrd import open_workbook
 
 from seed.landing.models import SEEDUser as User
@@ -18,13 +24,15 @@ from seed.lib.progress_data.progress_data import ProgressData
 from seed.models import (
     Column,
     Cycle,
+    Meter,
+    MeterReading,
     Note,
     PropertyView,
     TaxLotProperty,
     TaxLotView
 )
 from seed.serializers.pint import DEFAULT_UNITS
-from seed.tasks import set_update_to_now
+from seed.tasks import export_inventory, set_update_to_now
 from seed.test_helpers.fake import (
     FakePropertyFactory,
     FakePropertyStateFactory,
@@ -33,6 +41,7 @@ from seed.test_helpers.fake import (
     FakeTaxLotViewFactory
 )
 from seed.tests.util import DataMappingBaseTestCase
+from seed.utils.inventory_export import InventoryExportRelatedData
 from seed.utils.organizations import create_organization
 
 
@@ -159,6 +168,53 @@ class TestTaxLotProperty(DataMappingBaseTestCase):
 
         self.assertTrue(notes_string in data[1])
 
+    def test_export_related_data_is_loaded_for_the_batch(self):
+        other_view = self.property_view_factory.get_property_view()
+        self.property_view.labels.add(
+            self.label_factory.get_statuslabel(name='Zebra'),
+            self.label_factory.get_statuslabel(name='Apple'),
+        )
+        first_note = self.property_view.notes.create(name='Manually Created', note_type=Note.NOTE, text='first')
+        second_note = self.property_view.notes.create(name='Manually Created', note_type=Note.NOTE, text='second')
+
+        meter = Meter.objects.create(
+            property=self.property_view.property,
+            source=Meter.PORTFOLIO_MANAGER,
+            source_id='Source ID',
+            type=Meter.ELECTRICITY_GRID,
+        )
+        for month in [2, 1]:
+            MeterReading.objects.create(
+                meter=meter,
+                start_time=make_aware(datetime(2018, month, 1), timezone=pytz.UTC),
+                end_time=make_aware(datetime(2018, month, 2), timezone=pytz.UTC),
+                reading=month,
+                source_unit='kWh',
+                conversion_factor=1.00
+            )
+
+        # labels, notes, meters and meter readings are each loaded with one query
+        with self.assertNumQueries(4):
+            related_data = InventoryExportRelatedData(
+                PropertyView, [self.property_view, other_view], include_notes=True, include_meters=True
+            )
+
+        self.assertEqual(related_data.labels(self.property_view), ['Apple', 'Zebra'])
+        self.assertEqual(related_data.labels(other_view), [])
+        self.assertEqual(
+            related_data.notes(self.property_view),
+            [
+                first_note.created.astimezone().strftime("%Y-%m-%d %I:%M:%S %p") + "\nfirst",
+                second_note.created.astimezone().strftime("%Y-%m-%d %I:%M:%S %p") + "\nsecond",
+            ]
+        )
+        self.assertEqual(related_data.notes(other_view), [])
+
+        [meter_data] = related_data.meters(self.property_view)
+        self.assertEqual(meter_data['id'], meter.id)
+        self.assertEqual([reading['reading'] for reading in meter_data['readings']], [1, 2])
+        self.assertEqual(related_data.meters(other_view), [])
+
     def test_xlxs_export(self):
         for i in range(50):
             p = self.property_view_factory.get_property_view()
@@ -226,6 +282,36 @@ class TestTaxLotProperty(DataMappingBaseTestCase):
         # ids 52 up to and including 102
         self.assertEqual(len(data['features']), 51)
 
+    def test_export_inventory_task_writes_file_in_batches(self):
+        property_view_ids = [
+            self.property_view_factory.get_property_view().id
+            for _ in range(10)
+        ]
+        # the rows are written in the requested order, not in the order of the ids
+        property_view_ids.reverse()
+
+        progress_data = ProgressData(func_name='export_inventory', unique_id=f'{self.org.id}{randint(10000, 99999)}')
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root), \
+                mock.patch('seed.utils.inventory_export.EXPORT_BATCH_SIZE', 4):
+            result = export_inventory(
+                self.org.id, 'properties', property_view_ids, None, 'csv', 'ExportedData.csv',
+                True, False, progress_data.key
+            )
+            self.assertEqual(result['status'], 'success')
+            summary = result['summary']
+            self.assertEqual(summary['total_records'], 10)
+            self.assertEqual(summary['url'], f"/api/v3/media/{summary['path']}")
+            self.assertTrue(summary['path'].startswith(f'inventory_exports/{self.org.id}/'))
+
+            with open(os.path.join(media_root, summary['path']), newline='') as f:
+                rows = list(csv.DictReader(f))
+
+        # 3 batches + 1
+        self.assertEqual(result['total'], 4)
+        property_ids = dict(PropertyView.objects.filter(id__in=property_view_ids).values_list('id', 'property_id'))
+        self.assertEqual([int(row['id']) for row in rows], [property_ids[view_id] for view_id in property_view_ids])
+        self.assertIn('Property Labels', rows[0])
+
     def test_set_update_to_now(self):
         property_view_ids = [
             self.property_view_factory.get_property_view().id
@@ -20,9 +20,15 @@ from seed.test_helpers.fake import (
     FakeTaxLotStateFactory,
     FakeTaxLotViewFactory
 )
+from seed.utils.address import normalize_address_str
 from seed.utils.geocode import bounding_box_wkt, wkt_to_polygon
 from seed.utils.organizations import create_organization
 from seed.utils.ubid import centroid_wkt, get_jaccard_index, validate_ubid
+from seed.utils.ubid_batch import (
+    CodeAreaIndex,
+    decode_code_areas,
+    jaccard_indexes
+)
 
 
 class UbidViewTests(TestCase):
@@ -725,6 +731,41 @@ class UbidModelSignalCreationTests(TestCase):
         taxlot3.save()
         self.assertEqual(4, UbidModel.objects.count())
 
+    def test_bulk_save_states_matches_signals(self):
+        property_details = self.property_state_factory.get_details()
+        property_details['organization_id'] = self.org.id
+        property_details['ubid'] = 'A+A-1-1-1-1'
+        property1 = PropertyState(**property_details)
+        property1.save()
+        property_details = self.property_state_factory.get_details()
+        property_details['organization_id'] = self.org.id
+        property_details['address_line_1'] = '123 Main Street'
+        property2 = PropertyState(**property_details)
+        self.assertEqual(1, UbidModel.objects.count())
+
+        property1.ubid = '86HJPCWQ+2VV-1-3-2-3'
+        property1.latitude = None
+        PropertyState.objects.bulk_save_states([property1, property2], ['ubid', 'latitude'])
+
+        # the new ubid is preferred and decoded
+        property1.refresh_from_db()
+        self.assertEqual(2, property1.ubidmodel_set.count())
+        self.assertEqual('86HJPCWQ+2VV-1-3-2-3', property1.ubidmodel_set.get(preferred=True).ubid)
+        self.assertAlmostEqual(41.7451, property1.latitude, places=3)
+        self.assertAlmostEqual(-87.5603, property1.longitude, places=3)
+        self.assertEqual('Manually geocoded (N/A)', property1.geocoding_confidence)
+
+        # the new state is created with the derived fields
+        property2.refresh_from_db()
+        self.assertEqual(normalize_address_str('123 Main Street'), property2.normalized_address)
+        self.assertIsNotNone(property2.hash_object)
+        self.assertEqual(0, property2.ubidmodel_set.count())
+
+        # removing the ubid unsets the preferred ubid model
+        property1.ubid = None
+        PropertyState.objects.bulk_save_states([property1], ['ubid'])
+        self.assertFalse(property1.ubidmodel_set.filter(preferred=True).exists())
+
 
 class UbidSqlTests(TestCase):
 
@@ -771,3 +812,35 @@ class UbidSqlTests(TestCase):
         self.assertEqual(0, float(jaccard))
         jaccard = get_jaccard_index(invalid, invalid)
         self.assertEqual(1.0, float(jaccard))
+
+    def test_jaccard_indexes_match_get_jaccard_index(self):
+        ubid_cafe = '85FPPRR9+3C-0-0-0-0'
+        ubid_cafe_larger = '85FPPRR9+3C-1-1-1-1'
+        ubid_cafe_north = '85FPPRR9+4C-0-0-1-0'
+        ubid_ftlb = '85FPPRR9+38-0-0-0-0'
+        invalid = 'invalid'
+        pairs = [
+            (ubid_cafe, ubid_cafe),
+            (ubid_cafe, ubid_cafe_larger),
+            (ubid_cafe, ubid_cafe_north),
+            (ubid_cafe, ubid_ftlb),
+            (ubid_cafe, invalid),
+            (invalid, invalid),
+            (ubid_cafe, None),
+        ]
+
+        with self.assertNumQueries(1):
+            jaccards = jaccard_indexes(pairs)
+        self.assertEqual([float(j) for j in jaccards], [1.0, 1 / 9, 0.5, 0, 0, 1.0, 1.0])
+        for (ubid1, ubid2), jaccard in zip(pairs, jaccards):
+            self.assertEqual(float(get_jaccard_index(ubid1, ubid2)), float(jaccard))
+
+        # only the overlapping code areas are found by the grid index
+        code_areas = decode_code_areas([ubid_cafe, ubid_cafe_larger, ubid_cafe_north, ubid_ftlb, invalid])
+        self.assertNotIn(invalid, code_areas)
+        index = CodeAreaIndex()
+        for ubid in (ubid_cafe_larger, ubid_cafe_north, ubid_ftlb):
+            index.add(ubid, code_areas[ubid])
+        self.assertEqual(index.overlapping(code_areas[ubid_cafe]), {ubid_cafe_larger, ubid_cafe_north})
+        index.remove(ubid_cafe_north)
+        self.assertEqual(index.overlapping(code_areas[ubid_cafe]), {ubid_cafe_larger})
@@ -11,6 +11,12 @@ On subsequent runs on the same machine, API request/responses are
 intercepted/mocked by VCR. To execute an actual HTTP request/response
 (and not use mocked data), delete the vcr_cassette files.
 """
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+
 import vcr
 from django.conf import settings
 from django.contrib.gis.geos import Point, Polygon
@@ -23,6 +29,7 @@ from seed.test_helpers.fake import (
     FakePropertyStateFactory,
     FakeTaxLotStateFactory
 )
+from seed.utils.cache import clear_cache
 from seed.utils.geocode import (
     MapQuestAPIKeyError,
     bounding_box_wkt,
@@ -112,6 +119,9 @@ class WktTests(TestCase):
 
 class GeocodeAddresses(TestCase):
     def setUp(self):
+        # the geocoding results cached by a previous run would skip the recorded requests
+        clear_cache()
+
         user_details = {
             'username': 'test_user@demo.com',
             'password': 'test_pass',
@@ -691,3 +701,104 @@ class GeocodeAddresses(TestCase):
         self.assertIsNone(refreshed_property.latitude)
         self.assertIsNone(long_lat_wkt(refreshed_property))
         self.assertIsNone(refreshed_property.geocoding_confidence)
+
+
+class StubMapQuestHandler(BaseHTTPRequestHandler):
+    """Answers MapQuest batch requests with a geocoded point for each address, after answering
+    the first `rate_limited` requests with a 429"""
+    received = []
+    rate_limited = 0
+
+    def do_GET(self):
+        StubMapQuestHandler.received.append(self.path)
+        if StubMapQuestHandler.rate_limited > 0:
+            StubMapQuestHandler.rate_limited -= 1
+            self.send_response(429)
+            self.end_headers()
+            return
+
+        query = parse_qs(urlparse(self.path).query)
+        locations = json.loads(query['json'][0])['locations']
+        results = [{
+            'providedLocation': {'street': location['street']},
+            'locations': [{
+                'street': location['street'],
+                'geocodeQualityCode': 'P1AAA',
+                'displayLatLng': {'lat': 39.765251, 'lng': -104.986138},
+                'adminArea5': 'Denver',
+                'adminArea5Type': 'City',
+            }],
+        } for location in locations]
+        body = json.dumps({'results': results}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class GeocodeCacheAndBatches(TestCase):
+    def setUp(self):
+        # the counted requests would be answered by the geocoding results cached by a previous run
+        clear_cache()
+
+        user_details = {
+            'username': 'test_user@demo.com',
+            'password': 'test_pass',
+        }
+        self.user = User.objects.create_superuser(
+            email='test_user@demo.com', **user_details
+        )
+        self.org, _, _ = create_organization(self.user)
+        self.org.mapquest_api_key = 'stubkey'
+        self.org.save()
+        self.property_state_factory = FakePropertyStateFactory(organization=self.org)
+
+        StubMapQuestHandler.received = []
+        StubMapQuestHandler.rate_limited = 0
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubMapQuestHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        url_patch = mock.patch(
+            'seed.utils.geocode.MAPQUEST_BATCH_URL', f'http://127.0.0.1:{self.server.server_port}/batch'
+        )
+        url_patch.start()
+        self.addCleanup(url_patch.stop)
+
+    def _properties(self, count):
+        ids = []
+        for i in range(count):
+            property_details = self.property_state_factory.get_details()
+            property_details['organization_id'] = self.org.id
+            property_details['address_line_1'] = f'{i} Brighton Blvd'
+            property_details['city'] = 'Denver'
+            property_details['state'] = 'Colorado'
+            property_details['postal_code'] = '80216'
+            ids.append(PropertyState.objects.create(**property_details).id)
+        return PropertyState.objects.filter(pk__in=ids)
+
+    def test_geocoding_results_are_cached_per_organization(self):
+        properties = self._properties(120)
+        geocode_buildings(properties)
+
+        # the 120 addresses are sent in 3 batches
+        self.assertEqual(len(StubMapQuestHandler.received), 3)
+        self.assertEqual(properties.filter(geocoding_confidence='High (P1AAA)').count(), 120)
+        self.assertEqual(properties.first().extra_data['geocoded_city'], 'Denver')
+
+        # geocoding the same addresses again doesn't send any request
+        geocode_buildings(properties)
+        self.assertEqual(len(StubMapQuestHandler.received), 3)
+        self.assertEqual(properties.filter(geocoding_confidence='High (P1AAA)').count(), 120)
+
+    def test_rate_limited_batches_are_retried(self):
+        StubMapQuestHandler.rate_limited = 1
+        properties = self._properties(2)
+        geocode_buildings(properties)
+
+        self.assertEqual(len(StubMapQuestHandler.received), 2)
+        self.assertEqual(properties.filter(geocoding_confidence='High (P1AAA)').count(), 2)
@@ -20,6 +20,7 @@ from past.builtins import basestring
 from rest_framework import exceptions, status
 
 from seed.landing.models import SEEDUser as User
+from seed.lib.superperms.orgs.org_cache import get_organization_user
 from seed.lib.superperms.orgs.permissions import get_org_id, get_user_org
 from seed.models import (
     VIEW_LIST,
@@ -318,11 +319,12 @@ class OrgMixin(object):
                 org = get_user_org(request.user)
                 org_id = int(getattr(org, 'pk'))
             if not org:
-                # ALWAYS check if user is member of org for the ID provided!
-                try:
-                    org = request.user.orgs.get(pk=org_id)
-                except ObjectDoesNotExist:
+                # ALWAYS check if user is member of org for the ID provided! The membership is
+                # usually resolved already by the permission checks of the request.
+                org_user = get_organization_user(request, org_id)
+                if org_user is None:
                     raise PermissionDenied('Incorrect org id.')
+                org = org_user.organization
             if return_obj:
                 # not sure why we are allowing _organization to be set as an id
                 # or model instance...
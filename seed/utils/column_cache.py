@@ -0,0 +1,209 @@
+# !/usr/bin/env python
+# encoding: utf-8
+"""
+SEED Platform (TM), Copyright (c) Alliance for Sustainable Energy, LLC, and other contributors.
+See also https://github.com/seed-platform/seed/main/LICENSE.md
+
+Cache of the column metadata of an organization: the serialized columns, the ids of the columns
+that are mapped to, and the merge priorities. The metadata is stored in the Django cache under a
+version key of the organization, which is replaced whenever a Column, ColumnMapping or
+DerivedColumn of the organization is written, so stale entries are never read and simply expire.
+A small in-process layer keeps the latest metadata of the most recently used organizations so
+that only the version key is read from the Django cache on each call.
+
+Metadata read inside a transaction which changed the columns of the organization is not cached,
+since it includes rows which are not committed and could be rolled back.
+"""
+from collections import OrderedDict
+from threading import Lock, local
+from uuid import uuid4
+
+from django.db import connection, transaction
+
+from seed.utils.cache import get_cache_raw, set_cache_raw
+
+COLUMN_METADATA_CACHE_TIMEOUT = 60 * 60 * 24
+
+# number of organizations kept in the in-process layer
+COLUMN_METADATA_LOCAL_SIZE = 32
+
+_local_metadata = OrderedDict()
+_local_lock = Lock()
+
+# organizations whose columns were changed by the transaction of the thread
+_uncommitted = local()
+
+
+def _organization_id(org_id):
+    # callers pass the Organization, or its id as an int or a str
+    return int(getattr(org_id, 'pk', org_id))
+
+
+def _version_key(org_id):
+    return f'column_metadata_version:{org_id}'
+
+
+def _metadata_key(org_id, version):
+    return f'column_metadata:{org_id}:{version}'
+
+
+def _bump_version(org_id):
+    set_cache_raw(_version_key(org_id), uuid4().hex, None)
+
+
+def _uncommitted_org_ids():
+    if not hasattr(_uncommitted, 'org_ids'):
+        _uncommitted.org_ids = set()
+    return _uncommitted.org_ids
+
+
+def _committed(org_id):
+    _uncommitted_org_ids().discard(org_id)
+    _bump_version(org_id)
+
+
+def _cacheable(org_id):
+    """Whether the metadata read from the database can be cached, i.e. the current transaction
+    did not change the columns of the organization
+    """
+    if not connection.in_atomic_block:
+        # the transactions which changed columns have committed or rolled back
+        _uncommitted_org_ids().clear()
+        return True
+    return org_id not in _uncommitted_org_ids()
+
+
+def invalidate_column_metadata(org_id):
+    """Invalidate the cached column metadata of an organization. The version is bumped right away,
+    so that the transaction reads its own changes, and again once the transaction commits, so that
+    metadata read from the database before the commit is not kept. Until then, the metadata of the
+    organization read by the transaction is not cached, so nothing is left behind by a rollback.
+
+    :param org_id: int or Organization
+    """
+    if org_id is None:
+        return
+    org_id = _organization_id(org_id)
+    _bump_version(org_id)
+    if connection.in_atomic_block:
+        _uncommitted_org_ids().add(org_id)
+    transaction.on_commit(lambda: _committed(org_id))
+
+
+def column_metadata_version(org_id):
+    """Current version of the column metadata of an organization. The version changes whenever
+    a Column, ColumnMapping or DerivedColumn of the organization is written, so it can be part of
+    the keys of other cached values which depend on the columns.
+
+    :param org_id: int or Organization
+    :return: str
+    """
+    org_id = _organization_id(org_id)
+    version = get_cache_raw(_version_key(org_id))
+    if version is None:
+        version = uuid4().hex
+        set_cache_raw(_version_key(org_id), version, None)
+    return version
+
+
+def _serialize_column(column):
+    from seed.models import Column
+    from seed.serializers.columns import ColumnSerializer
+
+    new_c = dict(ColumnSerializer(column).data)
+
+    new_c['sharedFieldType'] = new_c['shared_field_type']
+    del new_c['shared_field_type']
+
+    if (new_c['table_name'], new_c['column_name']) in Column.PINNED_COLUMNS:
+        new_c['pinnedLeft'] = True
+
+    # If no display name, use the column name (this is the display name as it was typed
+    # during mapping)
+    if not new_c['display_name']:
+        new_c['display_name'] = new_c['column_name']
+
+    # If no column_description, use the column name (this is the display name as it was typed
+    # during mapping) or display name
+    if not new_c['column_description']:
+        if not new_c['display_name']:
+            new_c['column_description'] = new_c['column_name']
+        else:
+            new_c['column_description'] = new_c['display_name']
+
+    return new_c
+
+
+def _build_column_metadata(org_id):
+    from seed.models import Column, ColumnMapping
+
+    # Order extra_data last so that extra data duplicate-checking will happen after processing
+    # standard columns
+    columns_db = Column.objects.filter(organization_id=org_id).exclude(
+        table_name='').exclude(table_name=None).select_related('unit').order_by('is_extra_data', 'column_name')
+    columns = [_serialize_column(c) for c in columns_db]
+
+    mapped_column_ids = set(
+        ColumnMapping.column_mapped.through.objects.filter(
+            column__organization_id=org_id
+        ).values_list('column_id', flat=True)
+    )
+
+    # The TaxLot and Property are not used in merging, they are just here to prevent errors
+    priorities = {
+        'PropertyState': {'extra_data': {}},
+        'TaxLotState': {'extra_data': {}},
+        'Property': {},
+        'TaxLot': {}
+    }
+    for column in columns:
+        if column['column_name'] in Column.EXCLUDED_COLUMN_RETURN_FIELDS:
+            continue
+        tn = column['table_name']
+        cn = column['column_name']
+        if column['is_extra_data']:
+            priorities[tn]['extra_data'][cn] = column.get('merge_protection', 'Favor New')
+        else:
+            priorities[tn][cn] = column.get('merge_protection', 'Favor New')
+
+    return {
+        'columns': columns,
+        'mapped_column_ids': mapped_column_ids,
+        'priorities': priorities,
+    }
+
+
+def column_metadata(org_id):
+    """Column metadata of an organization, from the in-process layer, the Django cache or the
+    database. The returned data is shared, callers must copy what they modify.
+
+    :param org_id: int or Organization
+    :return: dict, with keys
+        columns: list of dict, serialized columns with a table name, ordered by is_extra_data
+            and column_name
+        mapped_column_ids: set of the ids of the columns that are mapped to
+        priorities: dict, merge protection of the columns, see Column.retrieve_priorities
+    """
+    org_id = _organization_id(org_id)
+    version = column_metadata_version(org_id)
+
+    with _local_lock:
+        local = _local_metadata.get(org_id)
+        if local is not None and local[0] == version:
+            _local_metadata.move_to_end(org_id)
+            return local[1]
+
+    metadata = get_cache_raw(_metadata_key(org_id, version))
+    if metadata is None:
+        metadata = _build_column_metadata(org_id)
+        if not _cacheable(org_id):
+            return metadata
+        set_cache_raw(_metadata_key(org_id, version), metadata, COLUMN_METADATA_CACHE_TIMEOUT)
+
+    with _local_lock:
+        _local_metadata[org_id] = (version, metadata)
+        _local_metadata.move_to_end(org_id)
+        while len(_local_metadata) > COLUMN_METADATA_LOCAL_SIZE:
+            _local_metadata.popitem(last=False)
+
+    return metadata
@@ -0,0 +1,168 @@
+# !/usr/bin/env python
+# encoding: utf-8
+"""
+SEED Platform (TM), Copyright (c) Alliance for Sustainable Energy, LLC, and other contributors.
+See also https://github.com/seed-platform/seed/main/LICENSE.md
+
+Set-based rewrites of the data of a column on all the -States of an organization, used when a
+column is deleted or renamed. The data are moved with UPDATE statements on chunks of -States
+(using the JSONB operators for the extra_data) instead of saving each -State, and the hashes of
+the rewritten -States are then recomputed in bulk.
+"""
+from django.db import connection
+from django.db.models import F, FloatField
+from django.db.models.expressions import ExpressionWrapper, RawSQL
+from django.db.models.fields.json import KeyTransform
+from django.db.models.functions import Cast
+from django.utils import timezone
+from pint.errors import DimensionalityError
+from quantityfield.fields import QuantityField
+from quantityfield.units import ureg
+
+from seed.lib.mcm.utils import batch
+from seed.utils.address import normalize_address_str
+from seed.utils.search_document import (
+    affects_search_document,
+    refresh_search_documents
+)
+from seed.utils.state_hash import rehash_states
+
+# number of -States rewritten per UPDATE statement
+REWRITE_CHUNK_SIZE = 5000
+
+# fields which are synced by the save signals of the -States (the coordinates and the UBID
+# models), the data of these fields can't be moved without saving each -State
+SIGNAL_FIELDS = ['latitude', 'longitude', 'long_lat', 'ubid']
+
+
+def _chunks(queryset, chunk_size):
+    ids = list(queryset.order_by('id').values_list('id', flat=True))
+    for chunk_ids in batch(ids, chunk_size):
+        yield queryset.model.objects.filter(id__in=chunk_ids)
+
+
+def _refresh_normalized_address(states):
+    StateClass = states.model
+    changed_states = []
+    for state_id, address_line_1, normalized_address in states.values_list('id', 'address_line_1', 'normalized_address'):
+        new_normalized_address = normalize_address_str(address_line_1) if address_line_1 is not None else None
+        if new_normalized_address != normalized_address:
+            changed_states.append(StateClass(id=state_id, normalized_address=new_normalized_address))
+    StateClass.objects.bulk_update(changed_states, ['normalized_address'])
+
+
+def delete_extra_data_key(states, key):
+    """Remove a key from the extra_data of the -States and rehash them
+
+    :param states: QuerySet of PropertyState or TaxLotState
+    :param key: str, extra_data key
+    :return: int, number of -States which had the key
+    """
+    states = states.filter(extra_data__has_key=key)
+    StateClass = states.model
+    ids = list(states.values_list('id', flat=True))
+    if not ids:
+        return 0
+
+    StateClass.objects.filter(id__in=ids).update(extra_data=RawSQL('extra_data - %s::text', (key,)))
+    rehash_states(StateClass.objects.filter(id__in=ids))
+    if affects_search_document(StateClass, [key]):
+        refresh_search_documents(StateClass.objects.filter(id__in=ids))
+    return len(ids)
+
+
+def requires_state_save(old_column, new_column):
+    """Whether the data of the column must be moved by saving each -State, because one of the
+    columns is a field that the save signals of the -States keep in sync with other data
+
+    :param old_column: Column
+    :param new_column: Column
+    :return: bool
+    """
+    return any(
+        not column.is_extra_data and column.column_name in SIGNAL_FIELDS
+        for column in (old_column, new_column)
+    )
+
+
+def _field_to_field_value(old_field, new_field):
+    old_quantity = isinstance(old_field, QuantityField)
+    new_quantity = isinstance(new_field, QuantityField)
+    if old_quantity and new_quantity:
+        # the values are stored in the base units of the fields, raises a DimensionalityError if
+        # the units aren't compatible
+        factor = ureg.Quantity(1, old_field.base_units).to(new_field.base_units).magnitude
+        return ExpressionWrapper(F(old_field.name) * factor, output_field=FloatField())
+    if old_quantity:
+        # like assigning a Quantity to a field without units
+        raise DimensionalityError(old_field.base_units, 'dimensionless')
+    return Cast(F(old_field.name), output_field=new_field)
+
+
+def _rewrite_chunk(states, old_column, new_column, now):
+    StateClass = states.model
+    old_name, new_name = old_column.column_name, new_column.column_name
+
+    if old_column.is_extra_data and new_column.is_extra_data:
+        # a missing key is moved as null, like the other -States of the organization
+        states.update(
+            extra_data=RawSQL(
+                '(extra_data - %s::text) || jsonb_build_object(%s::text, extra_data -> %s::text)',
+                (old_name, new_name, old_name),
+            ),
+            updated=now,
+        )
+    elif new_column.is_extra_data:
+        old_field = StateClass._meta.get_field(old_name)
+        states.update(
+            extra_data=RawSQL(
+                'extra_data || jsonb_build_object(%s::text, to_jsonb({}))'.format(
+                    connection.ops.quote_name(old_field.column)
+                ),
+                (new_name,),
+            ),
+            **{old_name: None},
+            updated=now,
+        )
+    elif old_column.is_extra_data:
+        # the values are cast by the field, as when the -States are saved, so that invalid values
+        # raise the same errors
+        values = states.annotate(_renamed_value=KeyTransform(old_name, 'extra_data')).values_list('id', '_renamed_value')
+        StateClass.objects.bulk_update(
+            [StateClass(id=state_id, **{new_name: value}) for state_id, value in values],
+            [new_name],
+            batch_size=1000,
+        )
+        states.update(extra_data=RawSQL('extra_data - %s::text', (old_name,)), updated=now)
+    else:
+        old_field = StateClass._meta.get_field(old_name)
+        new_field = StateClass._meta.get_field(new_name)
+        states.update(**{
+            new_name: _field_to_field_value(old_field, new_field),
+            old_name: None,
+            'updated': now,
+        })
+
+    rewritten_fields = [column.column_name for column in (old_column, new_column) if not column.is_extra_data]
+    if 'address_line_1' in rewritten_fields:
+        _refresh_normalized_address(states)
+    if affects_search_document(StateClass, [old_name, new_name]):
+        refresh_search_documents(states)
+    rehash_states(states)
+
+
+def rewrite_state_column(states, old_column, new_column, chunk_size=REWRITE_CHUNK_SIZE):
+    """Move the data of a column to another column on the -States, in chunks. The data of the
+    old column are cleared. Must run in a transaction so that an invalid value leaves all the
+    -States unchanged.
+
+    :param states: QuerySet of PropertyState or TaxLotState
+    :param old_column: Column, the column which is renamed
+    :param new_column: Column, the column the data are moved to
+    :param chunk_size: int, number of -States per UPDATE statement
+    :raises: ValidationError or DataError if a value can't be cast for the new column,
+        DimensionalityError if the units of the columns are not compatible
+    """
+    now = timezone.now()
+    for chunk in _chunks(states, chunk_size):
+        _rewrite_chunk(chunk, old_column, new_column, now)
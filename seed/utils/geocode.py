@@ -4,18 +4,35 @@
 SEED Platform (TM), Copyright (c) Alliance for Sustainable Energy, LLC, and other contributors.
 See also https://github.com/seed-platform/seed/main/LICENSE.md
 """
+import hashlib
 import json
 import re
+from concurrent.futures import ThreadPoolExecutor
 from numbers import Number
 
 import requests
 from django.contrib.gis.geos import GEOSGeometry
+from django.core.cache import cache as django_cache
 from django.db.models import Q
+from requests.adapters import HTTPAdapter
 from shapely import geometry, wkt
+from urllib3.util.retry import Retry
 
 from seed.lib.superperms.orgs.models import Organization
 from seed.models.columns import Column
 
+MAPQUEST_BATCH_URL = 'https://www.mapquestapi.com/geocoding/v1/batch'
+
+# geocoding results are cached per organization and address for 30 days
+GEOCODING_CACHE_TIMEOUT = 60 * 60 * 24 * 30
+
+# number of batches of addresses sent to MapQuest at the same time
+GEOCODING_MAX_WORKERS = 4
+
+# retries of a batch that is rate limited, waiting GEOCODING_BACKOFF_FACTOR * 2 ** retry seconds
+GEOCODING_MAX_RETRIES = 3
+GEOCODING_BACKOFF_FACTOR = 0.5
+
 
 class MapQuestAPIKeyError(Exception):
     """Your MapQuest API Key is either invalid or at its limit."""
@@ -119,7 +136,7 @@ def geocode_buildings(buildings):
     if not id_addresses:
         return
 
-    address_geocoding_results = _address_geocoding_results(id_addresses, mapquest_api_key)
+    address_geocoding_results = _address_geocoding_results(id_addresses, mapquest_api_key, org.id)
 
     id_geocoding_results = _id_geocodings(id_addresses, address_geocoding_results)
 
@@ -236,39 +253,104 @@ def _full_address(building, geocoding_columns):
         return None
 
 
-def _address_geocoding_results(id_addresses, mapquest_api_key):
-    addresses = list(set(id_addresses.values()))
+def _normalized_address(address):
+    return ' '.join(address.lower().split())
 
-    batched_addresses = _batch_addresses(addresses)
-    results = []
 
-    for batch in batched_addresses:
-        locations = {"locations": []}
-        locations["locations"] = [{"street": address} for address in batch]
-        locations_json = json.dumps(locations)
+def _geocoding_cache_keys(org_id, addresses):
+    return {
+        address: f'geocoding:{org_id}:{hashlib.md5(_normalized_address(address).encode()).hexdigest()}'
+        for address in addresses
+    }
 
-        request_url = (
-            'https://www.mapquestapi.com/geocoding/v1/batch?' +
-            '&inFormat=json&outFormat=json&thumbMaps=false&maxResults=2' +
-            '&json=' + locations_json +
-            '&key=' + mapquest_api_key
-        )
 
-        response = requests.get(request_url)
-        try:
-            # Catch the invalide API key error before parsing the response
-            if response.status_code == 401:
-                raise MapQuestAPIKeyError(f'Failed geocoding property states due to MapQuest error. API Key is invalid with message: {response.content}.')
+def _geocoding_session():
+    """HTTP session with a connection pool for the concurrent batches, which retries the batches
+    that are rate limited with an exponential backoff (and the Retry-After header of the response)"""
+    retry = Retry(
+        total=GEOCODING_MAX_RETRIES,
+        status_forcelist=[429, 503],
+        backoff_factor=GEOCODING_BACKOFF_FACTOR,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=GEOCODING_MAX_WORKERS, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def _geocode_batch(session, batch, mapquest_api_key):
+    locations = {"locations": []}
+    locations["locations"] = [{"street": address} for address in batch]
+    locations_json = json.dumps(locations)
+
+    request_url = (
+        MAPQUEST_BATCH_URL + '?' +
+        '&inFormat=json&outFormat=json&thumbMaps=false&maxResults=2' +
+        '&json=' + locations_json +
+        '&key=' + mapquest_api_key
+    )
+
+    response = session.get(request_url)
+    try:
+        # Catch the invalide API key error before parsing the response
+        if response.status_code == 401:
+            raise MapQuestAPIKeyError(f'Failed geocoding property states due to MapQuest error. API Key is invalid with message: {response.content}.')
+
+        return response.json().get('results')
+
+    except Exception as e:
+        if response.status_code == 403:
+            raise MapQuestAPIKeyError('Failed geocoding property states due to MapQuest error. Your MapQuest API Key is either invalid or at its limit.')
+        else:
+            raise e
+
+
+def _address_geocoding_results(id_addresses, mapquest_api_key, org_id=None):
+    """Geocoding results of the addresses, from the geocoding cache of the organization or from
+    MapQuest. The batches of addresses that aren't cached are sent concurrently, and their results
+    are cached for GEOCODING_CACHE_TIMEOUT.
 
-            results += response.json().get('results')
+    :param id_addresses: dict, {id: address}
+    :param mapquest_api_key: str
+    :param org_id: int, optional, the results are cached only if provided
+    :return: dict, {address: geocoding result}
+    """
+    addresses = list(set(id_addresses.values()))
 
-        except Exception as e:
-            if response.status_code == 403:
-                raise MapQuestAPIKeyError('Failed geocoding property states due to MapQuest error. Your MapQuest API Key is either invalid or at its limit.')
-            else:
-                raise e
+    address_geocoding_results = {}
+    cache_keys = {}
+    if org_id is not None:
+        cache_keys = _geocoding_cache_keys(org_id, addresses)
+        cached = django_cache.get_many(cache_keys.values())
+        for address, cache_key in cache_keys.items():
+            if cache_key in cached:
+                address_geocoding_results[address] = cached[cache_key]
+        addresses = [address for address in addresses if address not in address_geocoding_results]
+
+    if not addresses:
+        return address_geocoding_results
+
+    batched_addresses = list(_batch_addresses(addresses))
+    results = []
+    with _geocoding_session() as session:
+        with ThreadPoolExecutor(max_workers=min(GEOCODING_MAX_WORKERS, len(batched_addresses))) as executor:
+            for batch_results in executor.map(
+                lambda batch: _geocode_batch(session, batch, mapquest_api_key), batched_addresses
+            ):
+                results += batch_results
+
+    new_results = {_response_address(result): _analyze_location(result) for result in results}
+    if cache_keys:
+        django_cache.set_many(
+            {cache_keys[address]: result for address, result in new_results.items() if address in cache_keys},
+            GEOCODING_CACHE_TIMEOUT
+        )
 
-    return {_response_address(result): _analyze_location(result) for result in results}
+    address_geocoding_results.update(new_results)
+    return address_geocoding_results
 
 
 def _response_address(result):
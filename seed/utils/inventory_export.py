@@ -0,0 +1,653 @@
+# !/usr/bin/env python
+# encoding: utf-8
+"""
+SEED Platform (TM), Copyright (c) Alliance for Sustainable Energy, LLC, and other contributors.
+See also https://github.com/seed-platform/seed/main/LICENSE.md
+
+Assembly and writing of the exported inventory. The related data (labels, notes and meters) of
+a batch of views is loaded with one query per kind of data and grouped by view in memory,
+instead of querying the related data of each view. The rows are written by format specific
+writers which can be fed one batch of rows at a time, so that large exports can be streamed to
+a file.
+"""
+import csv
+import datetime
+import json
+import logging
+import math
+import os
+from collections import OrderedDict, defaultdict
+
+import xlsxwriter
+from django.core.serializers.json import DjangoJSONEncoder
+from quantityfield.units import ureg
+
+from seed.lib.mcm.utils import batch
+from seed.models import (
+    ColumnListProfile,
+    Meter,
+    MeterReading,
+    Note,
+    PropertyView,
+    TaxLotProperty,
+    TaxLotView
+)
+from seed.models.property_measures import PropertyMeasure
+from seed.models.scenarios import Scenario
+from seed.serializers.meter_readings import MeterReadingSerializer
+from seed.serializers.meters import MeterSerializer
+
+_log = logging.getLogger(__name__)
+
+# number of views for which the related data is loaded at a time
+EXPORT_BATCH_SIZE = 1000
+
+INVENTORY_MODELS = {'properties': PropertyView, 'taxlots': TaxLotView}
+
+
+def _format_note(created, text):
+    return created.astimezone().strftime("%Y-%m-%d %I:%M:%S %p") + "\n" + text
+
+
+class InventoryExportRelatedData(object):
+    """Labels, notes and meters of a batch of views
+
+    usage:
+            related_data = InventoryExportRelatedData(PropertyView, views, include_notes=True)
+            for view in views:
+                labels = related_data.labels(view)
+    """
+
+    def __init__(self, view_klass, views, include_notes=True, include_meters=False):
+        """
+        :param view_klass: PropertyView or TaxLotView
+        :param views: list of views of the view_klass
+        :param include_notes: bool, load the notes of the views
+        :param include_meters: bool, load the meters and meter readings of the properties of
+            the views (PropertyView only)
+        """
+        self.view_klass = view_klass
+        view_ids = [view.id for view in views]
+
+        self._labels = self._load_labels(view_ids)
+        self._notes = self._load_notes(view_ids) if include_notes else {}
+        self._meters = {}
+        if include_meters and view_klass is PropertyView:
+            self._meters = self._load_meters([view.property_id for view in views])
+
+    def _load_labels(self, view_ids):
+        through = self.view_klass.labels.through
+        view_field = f'{self.view_klass._meta.model_name}_id'
+        labels = defaultdict(list)
+        for view_id, label_name in (
+            through.objects.filter(**{f'{view_field}__in': view_ids})
+            .order_by('statuslabel__name')
+            .values_list(view_field, 'statuslabel__name')
+        ):
+            labels[view_id].append(label_name)
+        return labels
+
+    def _load_notes(self, view_ids):
+        view_field = 'property_view_id' if self.view_klass is PropertyView else 'taxlot_view_id'
+        notes = defaultdict(list)
+        for view_id, created, text in (
+            Note.objects.filter(**{f'{view_field}__in': view_ids})
+            .order_by('created')
+            .values_list(view_field, 'created', 'text')
+        ):
+            notes[view_id].append(_format_note(created, text))
+        return notes
+
+    def _load_meters(self, property_ids):
+        meters = list(
+            Meter.objects.filter(property_id__in=property_ids)
+            .select_related('scenario')
+            .order_by('id')
+        )
+
+        readings = defaultdict(list)
+        for reading in MeterReading.objects.filter(meter__in=meters).order_by('meter_id', 'start_time'):
+            readings[reading.meter_id].append(reading)
+
+        meters_by_property = defaultdict(list)
+        for meter in meters:
+            meter_data = MeterSerializer(meter).data
+            meter_data['readings'] = MeterReadingSerializer(readings[meter.id], many=True).data
+            meters_by_property[meter.property_id].append(meter_data)
+        return meters_by_property
+
+    def labels(self, view):
+        """Names of the labels of the view, ordered by name"""
+        return self._labels.get(view.id, [])
+
+    def notes(self, view):
+        """Notes of the view formatted for the export, ordered by creation"""
+        return self._notes.get(view.id, [])
+
+    def meters(self, view):
+        """Serialized meters, with their readings, of the property of the view"""
+        return self._meters.get(view.property_id, [])
+
+
+def export_columns(org_id, profile_id, inventory_type):
+    """Columns of an export, in the order they are written
+
+    :param org_id: int, organization id
+    :param profile_id: int, ColumnListProfile id, or None to export all the columns
+    :param inventory_type: str, 'properties' or 'taxlots'
+    :return: tuple, (column_name_mappings, column_ids, columns_from_database, derived_columns)
+    """
+    column_profile = ColumnListProfile.objects.get(id=profile_id) if profile_id is not None else None
+
+    # Set the first column to be the ID
+    column_name_mappings = OrderedDict([('id', 'ID')])
+    column_ids, add_column_name_mappings, columns_from_database = ColumnListProfile.return_columns(
+        org_id,
+        profile_id,
+        inventory_type)
+    column_name_mappings.update(add_column_name_mappings)
+
+    # always export the labels and notes
+    if inventory_type == 'properties':
+        column_name_mappings['property_notes'] = 'Property Notes'
+        column_name_mappings['property_labels'] = 'Property Labels'
+    else:
+        column_name_mappings['taxlot_notes'] = 'Tax Lot Notes'
+        column_name_mappings['taxlot_labels'] = 'Tax Lot Labels'
+
+    derived_columns = list(column_profile.derived_columns.all()) if column_profile is not None else []
+    column_name_mappings.update({dc.name: dc.name for dc in derived_columns})
+
+    return column_name_mappings, column_ids, columns_from_database, derived_columns
+
+
+def export_views(view_klass, org_id, ids=None):
+    """Views of the organization to export, with the related objects needed to serialize them
+
+    :param view_klass: PropertyView or TaxLotView
+    :param org_id: int, organization id
+    :param ids: list of view ids, optional, defaults to all the views of the organization
+    :return: QuerySet, ordered by id
+    """
+    select_related = ['state', 'cycle']
+    filter_str = {}
+    if ids:
+        filter_str['id__in'] = ids
+    if view_klass is PropertyView:
+        select_related.append('property')
+        filter_str['property__organization_id'] = org_id
+    else:
+        select_related.append('taxlot')
+        filter_str['taxlot__organization_id'] = org_id
+
+    return view_klass.objects.select_related(*select_related).filter(**filter_str).order_by('id')
+
+
+def assemble_export_rows(view_klass, views, column_ids, columns_from_database, derived_columns=(),
+                         include_notes=True, include_meter_data=False, progress_data=None):
+    """Serialize views for the export, with their labels, notes, meters and derived columns
+
+    :param view_klass: PropertyView or TaxLotView
+    :param views: list of views, with their states and property or tax lot
+    :param column_ids: list of ids of the columns to export
+    :param columns_from_database: list of dict, columns of the organization
+    :param derived_columns: iterable of DerivedColumn to evaluate
+    :param include_notes: bool
+    :param include_meter_data: bool, add the meters and readings of the properties
+    :param progress_data: ProgressData, optional, stepped about 98 times over the views
+    :return: list of dict, one row per view
+    """
+    data = TaxLotProperty.serialize(views, column_ids, columns_from_database)
+
+    # evaluate each derived column for all the states at once
+    derived_column_values = {
+        dc.name: dc.evaluate_batch(view.state for view in views)
+        for dc in derived_columns
+    }
+
+    step_size = math.ceil(len(views) / 98)
+    for batch_start in range(0, len(views), EXPORT_BATCH_SIZE):
+        views_batch = views[batch_start:batch_start + EXPORT_BATCH_SIZE]
+        related_data = InventoryExportRelatedData(
+            view_klass, views_batch, include_notes=include_notes, include_meters=include_meter_data
+        )
+        for i, record in enumerate(views_batch, batch_start):
+            label_string = related_data.labels(record)
+            note_string = related_data.notes(record)
+
+            if hasattr(record, 'property'):
+                data[i]['property_labels'] = ','.join(label_string)
+                data[i]['property_notes'] = '\n----------\n'.join(note_string) if include_notes else '(excluded during export)'
+
+                if include_meter_data:
+                    data[i]['_meters'] = related_data.meters(record)
+            elif hasattr(record, 'taxlot'):
+                data[i]['taxlot_labels'] = ','.join(label_string)
+                data[i]['taxlot_notes'] = '\n----------\n'.join(note_string) if include_notes else '(excluded during export)'
+
+            # add derived columns
+            for derived_column_name, values in derived_column_values.items():
+                data[i][derived_column_name] = values[i]
+
+            if progress_data is not None and step_size > 0 and i % step_size == 0:
+                progress_data.step('Exporting Inventory...')
+
+    return data
+
+
+def sort_export_rows(data, ids, inventory_type):
+    """Sort the export rows in place into the same order as the view ids
+
+    :param data: list of dict, rows from assemble_export_rows
+    :param ids: list of view ids
+    :param inventory_type: str, 'properties' or 'taxlots'
+    """
+    order_dict = {obj_id: index for index, obj_id in enumerate(ids)}
+    if inventory_type == 'properties':
+        view_id_str = 'property_view_id'
+    else:
+        view_id_str = 'taxlot_view_id'
+    data.sort(key=lambda inventory_obj: order_dict[inventory_obj[view_id_str]])
+
+
+def _export_value(value):
+    # Convert quantities (this is typically handled in the JSON Encoder, but that isn't here).
+    if isinstance(value, ureg.Quantity):
+        return value.magnitude
+    elif isinstance(value, datetime.datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    elif isinstance(value, datetime.date):
+        return value.strftime("%Y-%m-%d")
+    return value
+
+
+def _row_value(datum, column):
+    value = datum.get(column, None)
+
+    # Try grabbing the value out of the related field if not found yet.
+    if value is None and datum.get('related'):
+        value = datum['related'][0].get(column, None)
+
+    return _export_value(value)
+
+
+def _header(column_name_mappings):
+    # check the first item in the header and make sure that it isn't ID (it can be id, or iD).
+    # excel doesn't like the first item to be ID
+    header = list(column_name_mappings.values())
+    if header and header[0] == 'ID':
+        header[0] = 'id'
+    return header
+
+
+class CSVExportWriter(object):
+    """Writes the export rows as CSV to a text file"""
+
+    def __init__(self, file, column_name_mappings):
+        self.column_name_mappings = column_name_mappings
+        self.writer = csv.writer(file)
+        self.writer.writerow(_header(column_name_mappings))
+
+    def write_rows(self, data):
+        # iterate over the results to preserve column order and write row.
+        for datum in data:
+            self.writer.writerow([_row_value(datum, column) for column in self.column_name_mappings])
+
+    def close(self):
+        pass
+
+
+class XLSXExportWriter(object):
+    """Writes the export rows, with the measures, scenarios and scenario meter readings of the
+    properties, to an XLSX workbook. Rows are only ever appended to the worksheets, so the
+    workbook can be written in constant_memory mode, which flushes each row to disk once the
+    next row is started.
+    """
+    SCENARIO_KEYS = (
+        'id', 'name', 'description', 'annual_site_energy_savings', 'annual_source_energy_savings',
+        'annual_cost_savings', 'annual_electricity_savings',
+        'annual_natural_gas_savings', 'annual_site_energy', 'annual_source_energy', 'annual_natural_gas_energy',
+        'annual_electricity_energy', 'annual_peak_demand', 'annual_site_energy_use_intensity',
+        'annual_source_energy_use_intensity'
+    )
+    SCENARIO_KEY_MAPPINGS = {
+        'annual_site_energy_savings': 'annual_site_energy_savings_mmbtu',
+        'annual_source_energy_savings': 'annual_source_energy_savings_mmbtu',
+        'annual_cost_savings': 'annual_cost_savings_dollars',
+        'annual_site_energy': 'annual_site_energy_kbtu',
+        'annual_site_energy_use_intensity': 'annual_site_energy_use_intensity_kbtu_ft2',
+        'annual_source_energy': 'annual_source_energy_kbtu',
+        'annual_source_energy_use_intensity': 'annual_source_energy_use_intensity_kbtu_ft2',
+        'annual_natural_gas_energy': 'annual_natural_gas_energy_mmbtu',
+        'annual_electricity_energy': 'annual_electricity_energy_mmbtu',
+        'annual_peak_demand': 'annual_peak_demand_kw',
+        'annual_electricity_savings': 'annual_electricity_savings_kbtu',
+        'annual_natural_gas_savings': 'annual_natural_gas_savings_kbtu'
+    }
+    PROPERTY_MEASURE_KEYS = (
+        'id', 'property_measure_name', 'measure_id', 'cost_mv', 'cost_total_first',
+        'cost_installation', 'cost_material', 'cost_capital_replacement', 'cost_residual_value'
+    )
+    MEASURE_KEYS = ('name', 'display_name', 'category', 'category_display_name')
+
+    def __init__(self, file, column_name_mappings, constant_memory=False):
+        """
+        :param file: str or binary file object
+        :param column_name_mappings: dict, column name to header
+        :param constant_memory: bool, flush the rows to disk as they are written
+        """
+        self.column_name_mappings = column_name_mappings
+        self.wb = xlsxwriter.Workbook(file, {'remove_timezone': True, 'constant_memory': constant_memory})
+
+        # add tabs
+        self.ws1 = self.wb.add_worksheet('Properties')
+        self.ws2 = self.wb.add_worksheet('Measures')
+        self.ws3 = self.wb.add_worksheet('Scenarios')
+        self.ws4 = self.wb.add_worksheet('Scenario Measure Join Table')
+        self.ws5 = self.wb.add_worksheet('Meter Readings')
+        self.bold = self.wb.add_format({'bold': True})
+        # datetime formatting
+        self.date_format = self.wb.add_format({'num_format': 'yyyy-mm-dd hh:mm:ss'})
+
+        self.row = 0
+        self.row2 = 0
+        self.row3 = 0
+        self.row4 = 0
+        self.row5 = 0
+        self.add_m_headers = True
+        self.add_s_headers = True
+
+        # Do not write the first element as ID, this causes weird issues with Excel.
+        for index, val in enumerate(_header(column_name_mappings)):
+            self.ws1.write(self.row, index, val, self.bold)
+
+        # join table
+        self.ws4.write('A1', 'property_id', self.bold)
+        self.ws4.write('B1', 'scenario_id', self.bold)
+        self.ws4.write('C1', 'measure_id', self.bold)
+
+        # scenario meter readings
+        for index, header in enumerate(('scenario_id', 'meter_id', 'type', 'start_time', 'end_time', 'reading', 'units', 'is_virtual')):
+            self.ws5.write(0, index, header, self.bold)
+
+    def write_rows(self, data):
+        # iterate over the results to preserve column order and write row.
+        for datum in data:
+            self.row += 1
+            id = datum.get('id', None) if 'id' in self.column_name_mappings else None
+            for index, column in enumerate(self.column_name_mappings):
+                self.ws1.write(self.row, index, _row_value(datum, column))
+
+            measures = PropertyMeasure.objects.filter(property_state_id=datum['property_state_id'])
+            scenarios = list(Scenario.objects.filter(property_state_id=datum['property_state_id']))
+            self._write_measures(measures)
+            self._write_scenarios(id, scenarios)
+            self._write_scenario_meter_readings(scenarios)
+
+    def _write_measures(self, measures):
+        ws2, bold = self.ws2, self.bold
+        for m in measures:
+            col2 = 0
+            if self.add_m_headers:
+                # grab headers
+                for key in self.PROPERTY_MEASURE_KEYS:
+                    ws2.write(self.row2, col2, key, bold)
+                    col2 += 1
+                for key in self.MEASURE_KEYS:
+                    ws2.write(self.row2, col2, 'measure ' + key, bold)
+                    col2 += 1
+                self.add_m_headers = False
+
+            self.row2 += 1
+            col2 = 0
+            for key in self.PROPERTY_MEASURE_KEYS:
+                ws2.write(self.row2, col2, getattr(m, key))
+                col2 += 1
+            for key in self.MEASURE_KEYS:
+                ws2.write(self.row2, col2, getattr(m.measure, key))
+                col2 += 1
+
+    def _write_scenarios(self, id, scenarios):
+        ws3, bold = self.ws3, self.bold
+        for s in scenarios:
+            col3 = 0
+            if self.add_s_headers:
+                # grab headers
+                for key in self.SCENARIO_KEYS:
+                    # double check scenario_key_mappings in case a different header is desired
+                    ws3.write(self.row3, col3, self.SCENARIO_KEY_MAPPINGS.get(key, key), bold)
+                    col3 += 1
+                self.add_s_headers = False
+            self.row3 += 1
+            col3 = 0
+            for key in self.SCENARIO_KEYS:
+                ws3.write(self.row3, col3, getattr(s, key))
+                col3 += 1
+
+            for sm in s.measures.all():
+                self.row4 += 1
+                self.ws4.write(self.row4, 0, id)
+                self.ws4.write(self.row4, 1, s.id)
+                self.ws4.write(self.row4, 2, sm.id)
+
+    def _write_scenario_meter_readings(self, scenarios):
+        ws5 = self.ws5
+        for s in scenarios:
+            # retrieve meters
+            for m in Meter.objects.filter(scenario_id=s.id):
+                the_type = next((item for item in Meter.ENERGY_TYPES if item[0] == m.type), None)
+                the_type = the_type[1] if the_type is not None else None
+                # retrieve readings
+                for r in MeterReading.objects.filter(meter_id=m.id).order_by('start_time'):
+                    self.row5 += 1
+                    ws5.write(self.row5, 0, s.id)
+                    ws5.write(self.row5, 1, m.id)
+                    ws5.write(self.row5, 2, the_type)  # use energy type enum to determine reading type
+                    ws5.write_datetime(self.row5, 3, r.start_time, self.date_format)
+                    ws5.write_datetime(self.row5, 4, r.end_time, self.date_format)
+                    ws5.write(self.row5, 5, r.reading)  # this is now a float field
+                    ws5.write(self.row5, 6, r.source_unit)
+                    ws5.write(self.row5, 7, m.is_virtual)
+
+    def close(self):
+        self.wb.close()
+
+
+def _serialized_coordinates(polygon_wkt):
+    string_coord_pairs = polygon_wkt.lstrip('POLYGON (').rstrip(')').split(', ')
+
+    coordinates = []
+    for coord_pair in string_coord_pairs:
+        float_coords = [float(coord) for coord in coord_pair.split(' ')]
+        coordinates.append(float_coords)
+
+    return coordinates
+
+
+def _serialized_point(point_wkt):
+    string_coords = point_wkt.lstrip('POINT (').rstrip(')').split(', ')
+
+    coordinates = []
+    for coord in string_coords[0].split(' '):
+        coordinates.append(float(coord))
+
+    return coordinates
+
+
+class GeoJSONExportWriter(object):
+    """Writes the export rows as a GeoJSON FeatureCollection to a text file, one feature at a
+    time. The related records (e.g., the tax lots of the exported properties) are written as
+    features after all the rows, once each.
+    """
+    POLYGON_FIELDS = ["bounding_box", "centroid", "property_footprint", "taxlot_footprint", "long_lat"]
+
+    def __init__(self, file, column_name_mappings, filename):
+        self.file = file
+        self.column_name_mappings = column_name_mappings
+        self.related_records = set()
+        self.feature_count = 0
+
+        # per geojsonlint.com, the CRS we were defining was the default and should not
+        # be included.
+        header = json.dumps({
+            "type": "FeatureCollection",
+            "name": f"SEED Export - {filename.replace('.geojson', '')}",
+        })
+        # open the features list in place of the closing brace
+        self.file.write(header[:-1] + ', "features": [')
+
+    def write_rows(self, data):
+        for datum in data:
+            # collect the related records, they are made unique and written on close
+            for record in datum.get("related") or []:
+                self.related_records.add(tuple(record.items()))
+            self._write_feature(datum)
+
+    def _write_feature(self, datum):
+        feature = {
+            "type": "Feature",
+            "properties": {}
+        }
+
+        feature_geometries = []
+        for key, value in datum.items():
+            if value is None:
+                continue
+
+            value = _export_value(value)
+
+            if value and any(k in key for k in self.POLYGON_FIELDS):
+                """
+                If object is a polygon and is populated, add the 'geometry'
+                key-value-pair in the appropriate GeoJSON format.
+                When the first geometry is added, the correct format is
+                established. When/If a second geometry is added, this is
+                appended alongside the previous geometry.
+                """
+
+                # long_lat
+                if key == 'long_lat':
+                    coordinates = _serialized_point(value)
+                    # point
+                    feature_geometries.append({
+                        "type": "Point",
+                        "coordinates": coordinates,
+                    })
+                else:
+                    # polygons
+                    coordinates = _serialized_coordinates(value)
+                    feature_geometries.append({
+                        "type": "Polygon",
+                        "coordinates": [coordinates],
+                    })
+            else:
+                """
+                Non-polygon data
+                """
+                if key == "_meters":
+                    if feature["properties"].get("meters") is None:
+                        feature["properties"]["meters"] = value
+                    else:
+                        _log.warning("meters already exists in properties, not adding")
+                else:
+                    display_key = self.column_name_mappings.get(key, key)
+                    feature["properties"][display_key] = value
+
+        # now add in the geometry data depending on how many geometries were found
+        if len(feature_geometries) == 0:
+            # no geometry found -- save an empty polygon geometry
+            feature["geometry"] = {
+                "type": "Polygon",
+                "coordinates": []
+            }
+        elif len(feature_geometries) == 1:
+            feature["geometry"] = feature_geometries[0]
+        else:
+            feature["geometry"] = {
+                "type": "GeometryCollection",
+                "geometries": feature_geometries
+            }
+
+        # add style information
+        if feature["properties"].get("property_state_id") is not None:
+            feature["properties"]["stroke"] = "#185189"  # buildings color
+        elif feature["properties"].get("taxlot_state_id") is not None:
+            feature["properties"]["stroke"] = "#10A0A0"  # buildings color
+        feature["properties"]["marker-color"] = "#E74C3C"
+        feature["properties"]["fill-opacity"] = 0
+
+        if self.feature_count > 0:
+            self.file.write(', ')
+        self.file.write(json.dumps(feature, cls=DjangoJSONEncoder))
+        self.feature_count += 1
+
+    def close(self):
+        for record in self.related_records:
+            self._write_feature(dict(record))
+        self.file.write(']}')
+
+
+def write_inventory_export(path, export_type, org_id, inventory_type, ids=None, profile_id=None,
+                           include_notes=True, include_meter_readings=False, progress_data=None):
+    """Write an export of the inventory to a file, EXPORT_BATCH_SIZE views at a time, so that
+    only one batch of rows is held in memory.
+
+    :param path: str, absolute path of the file to write
+    :param export_type: str, 'csv', 'geojson' or 'xlsx'
+    :param org_id: int, organization id
+    :param inventory_type: str, 'properties' or 'taxlots'
+    :param ids: list of view ids, optional, defaults to all the views of the organization
+    :param profile_id: int, ColumnListProfile id, optional
+    :param include_notes: bool
+    :param include_meter_readings: bool, only used by the geojson export
+    :param progress_data: ProgressData, optional, its total is set to the number of batches + 1
+        and it is stepped after each batch
+    :return: int, number of views requested for the export
+    """
+    if export_type not in ('csv', 'geojson', 'xlsx'):
+        raise ValueError(f'Unsupported export type: {export_type}')
+
+    view_klass = INVENTORY_MODELS[inventory_type]
+    column_name_mappings, column_ids, columns_from_database, derived_columns = export_columns(
+        org_id, profile_id, inventory_type
+    )
+    if ids:
+        view_ids = list(ids)
+    else:
+        view_ids = list(export_views(view_klass, org_id).values_list('id', flat=True))
+    include_meter_data = include_meter_readings and export_type == 'geojson'
+
+    if progress_data is not None:
+        progress_data.total = math.ceil(len(view_ids) / EXPORT_BATCH_SIZE) + 1
+        progress_data.save()
+
+    file = None
+    if export_type == 'xlsx':
+        writer = XLSXExportWriter(path, column_name_mappings, constant_memory=True)
+    else:
+        file = open(path, 'w', newline='')
+        if export_type == 'csv':
+            writer = CSVExportWriter(file, column_name_mappings)
+        else:
+            writer = GeoJSONExportWriter(file, column_name_mappings, os.path.basename(path))
+
+    try:
+        for chunk_ids in batch(view_ids, EXPORT_BATCH_SIZE):
+            views = list(export_views(view_klass, org_id, chunk_ids))
+            data = assemble_export_rows(
+                view_klass, views, column_ids, columns_from_database,
+                derived_columns=derived_columns,
+                include_notes=include_notes,
+                include_meter_data=include_meter_data,
+            )
+            sort_export_rows(data, chunk_ids, inventory_type)
+            writer.write_rows(data)
+
+            if progress_data is not None:
+                progress_data.step('Exporting Inventory...')
+        writer.close()
+    finally:
+        if file is not None:
+            file.close()
+
+    return len(view_ids)
@@ -7,6 +7,7 @@ from typing import Literal, Optional, Type, Union
 from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
 from django.db.utils import DataError
 from django.http import JsonResponse
+from django.utils.functional import cached_property
 from rest_framework import status
 from rest_framework.request import Request
 
@@ -24,15 +25,36 @@ from seed.models import (
     TaxLotView
 )
 from seed.serializers.pint import apply_display_unit_preferences
+from seed.utils.pagination import (
+    InvalidCursor,
+    cached_inventory_count,
+    keyset_page
+)
 from seed.utils.search import FilterException, build_view_filters_and_sorts
 
 
+class CachedCountPaginator(Paginator):
+    """Paginator which uses a count that was already computed instead of counting the objects"""
+
+    def __init__(self, object_list, per_page, count, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self._count = count
+
+    @cached_property
+    def count(self):
+        return self._count
+
+
 def get_filtered_results(request: Request, inventory_type: Literal['property', 'taxlot'], profile_id: int) -> JsonResponse:
     page = request.query_params.get('page')
     per_page = request.query_params.get('per_page')
     org_id = request.query_params.get('organization_id')
     cycle_id = request.query_params.get('cycle')
     ids_only = request.query_params.get('ids_only', 'false').lower() == 'true'
+    # pages are fetched by cursor (i.e., after the last view of the previous page) instead of by
+    # number when the `cursor` parameter is passed, empty for the first page
+    use_cursor = 'cursor' in request.query_params
+    cursor = request.query_params.get('cursor')
     # check if there is a query parameter for the profile_id. If so, then use that one
     profile_id = request.query_params.get('profile_id', profile_id)
     shown_column_ids = request.query_params.get('shown_column_ids')
@@ -60,10 +82,16 @@ def get_filtered_results(request: Request, inventory_type: Literal['property', '
             'results': []
         })
 
-    if ids_only and (per_page or page):
+    if ids_only and (per_page or page or use_cursor):
+        return JsonResponse({
+            'success': False,
+            'message': 'Cannot pass query parameter "ids_only" with "per_page", "page" or "cursor"'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    if use_cursor and page:
         return JsonResponse({
             'success': False,
-            'message': 'Cannot pass query parameter "ids_only" with "per_page" or "page"'
+            'message': 'Cannot pass query parameter "cursor" with "page"'
         }, status=status.HTTP_400_BAD_REQUEST)
 
     page = page or 1
@@ -126,17 +154,21 @@ def get_filtered_results(request: Request, inventory_type: Literal['property', '
         except ColumnListProfile.DoesNotExist:
             show_columns = None
 
-    # Retrieve all the columns that are in the db for this organization
-    columns_from_database = Column.retrieve_all(
+    # Retrieve all the columns that are in the db for this organization. Derived columns are
+    # computed in the database for filtering and sorting, but they are not serialized.
+    filter_columns = Column.retrieve_all(
         org_id=org_id,
         inventory_type=inventory_type,
         only_used=False,
         include_related=include_related,
-        exclude_derived=True,
         column_ids=show_columns
     )
+    columns_from_database = [column for column in filter_columns if not column['derived_column']]
+    # the cursor is not a filter
+    filter_params = request.query_params.copy()
+    filter_params.pop('cursor', None)
     try:
-        filters, annotations, order_by = build_view_filters_and_sorts(request.query_params, columns_from_database)
+        filters, annotations, order_by = build_view_filters_and_sorts(filter_params, filter_columns)
     except FilterException as e:
         return JsonResponse(
             {
@@ -166,11 +198,10 @@ def get_filtered_results(request: Request, inventory_type: Literal['property', '
             inventory_type=other_inventory_type,
             only_used=False,
             include_related=include_related,
-            exclude_derived=True,
             column_ids=show_columns
         )
         try:
-            filters, annotations, _ = build_view_filters_and_sorts(request.query_params, other_columns_from_database)
+            filters, annotations, _ = build_view_filters_and_sorts(filter_params, other_columns_from_database)
         except FilterException as e:
             return JsonResponse(
                 {
@@ -206,17 +237,55 @@ def get_filtered_results(request: Request, inventory_type: Literal['property', '
             'results': id_list
         })
 
-    paginator = Paginator(views_list, per_page)
+    if use_cursor:
+        try:
+            per_page = int(per_page)
+            if per_page < 1:
+                raise ValueError
+        except ValueError:
+            return JsonResponse({
+                'success': False,
+                'message': 'Query parameter "per_page" must be a positive integer'
+            }, status=status.HTTP_400_BAD_REQUEST)
 
     try:
-        views = paginator.page(page)
-        page = int(page)
-    except PageNotAnInteger:
-        views = paginator.page(1)
-        page = 1
-    except EmptyPage:
-        views = paginator.page(paginator.num_pages)
-        page = paginator.num_pages
+        total = cached_inventory_count(views_list, org.id, cycle.id)
+        if use_cursor:
+            views, next_cursor = keyset_page(views_list, order_by, per_page, cursor)
+            pagination = {
+                'per_page': per_page,
+                'next_cursor': next_cursor,
+                'has_next': next_cursor is not None,
+                'total': total,
+            }
+        else:
+            paginator = CachedCountPaginator(views_list, per_page, total)
+            try:
+                views = paginator.page(page)
+                page = int(page)
+            except PageNotAnInteger:
+                views = paginator.page(1)
+                page = 1
+            except EmptyPage:
+                views = paginator.page(paginator.num_pages)
+                page = paginator.num_pages
+            pagination = {
+                'page': page,
+                'start': views.start_index(),
+                'end': views.end_index(),
+                'num_pages': paginator.num_pages,
+                'has_next': views.has_next(),
+                'has_previous': views.has_previous(),
+                'total': total
+            }
+    except InvalidCursor as e:
+        return JsonResponse(
+            {
+                'status': 'error',
+                'message': f'Error paginating: {str(e)}'
+            },
+            status=status.HTTP_400_BAD_REQUEST
+        )
     except DataError as e:
         return JsonResponse(
             {
@@ -257,15 +326,7 @@ def get_filtered_results(request: Request, inventory_type: Literal['property', '
     unit_collapsed_results = [apply_display_unit_preferences(org, x) for x in related_results]
 
     response = {
-        'pagination': {
-            'page': page,
-            'start': paginator.page(page).start_index(),
-            'end': paginator.page(page).end_index(),
-            'num_pages': paginator.num_pages,
-            'has_next': paginator.page(page).has_next(),
-            'has_previous': paginator.page(page).has_previous(),
-            'total': paginator.count
-        },
+        'pagination': pagination,
         'cycle_id': cycle.id,
         'results': unit_collapsed_results
     }
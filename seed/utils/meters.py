@@ -4,11 +4,11 @@
 SEED Platform (TM), Copyright (c) Alliance for Sustainable Energy, LLC, and other contributors.
 See also https://github.com/seed-platform/seed/main/LICENSE.md
 """
-from calendar import monthrange
 from collections import defaultdict
-from datetime import datetime, time, timedelta
+from datetime import datetime
 
-from django.db.models import Q
+import numpy as np
+from django.db.models import F, FloatField, Func, Q
 from django.utils.timezone import make_aware
 from pytz import timezone
 
@@ -18,7 +18,7 @@ from seed.data_importer.utils import (
     usage_point_id
 )
 from seed.lib.superperms.orgs.models import Organization
-from seed.models import Meter
+from seed.models import Meter, MeterReadingRollup
 
 
 class PropertyMeterReadingsExporter():
@@ -87,18 +87,26 @@ class PropertyMeterReadingsExporter():
 
         time_format = "%Y-%m-%d %H:%M:%S"
 
+        # readings of different meters share most of their times, so each time is formatted once
+        formatted_times = {}
+
+        def format_time(reading_time):
+            if reading_time not in formatted_times:
+                formatted_times[reading_time] = reading_time.astimezone(tz=self.tz).strftime(time_format)
+            return formatted_times[reading_time]
+
         for meter in self.meters:
             field_name, conversion_factor = self._build_column_def(meter, column_defs)
 
-            for meter_reading in meter.meter_readings.all().order_by('start_time', 'end_time'):
-                start_time = meter_reading.start_time.astimezone(tz=self.tz).strftime(time_format)
-                end_time = meter_reading.end_time.astimezone(tz=self.tz).strftime(time_format)
-
-                times_key = "-".join([start_time, end_time])
+            meter_readings = meter.meter_readings.order_by('start_time', 'end_time').values_list('start_time', 'end_time', 'reading')
+            for start_time, end_time, reading in meter_readings.iterator():
+                start_time = format_time(start_time)
+                end_time = format_time(end_time)
 
-                start_end_times[times_key]['start_time'] = start_time
-                start_end_times[times_key]['end_time'] = end_time
-                start_end_times[times_key][field_name] = meter_reading.reading / conversion_factor
+                times = start_end_times[(start_time, end_time)]
+                times['start_time'] = start_time
+                times['end_time'] = end_time
+                times[field_name] = reading / conversion_factor
 
         return {
             'readings': list(start_end_times.values()),
@@ -110,13 +118,12 @@ class PropertyMeterReadingsExporter():
         Returns readings and column definitions formatted and aggregated to display all
         records in monthly intervals.
 
-        At a high-level, following algorithm is used to accomplish this:
-            - Identify the first start time and last end time
-            - Define a range of dates between start and end time that fall within a month
-            - For each month in the date range, aggregate the readings found in that month using a linear relationship down to the second.
+        The monthly totals are read from the monthly rollups of the meters (see
+        seed.models.reading_rollups), in which each reading is prorated into the months it
+        overlaps using a linear relationship down to the second.
         """
         # Used to consolidate different readings (types) within the same month
-        monthly_readings = defaultdict(lambda: {})
+        monthly_readings = {}
 
         # Construct column_defs using this dictionary's values for frontend to use
         column_defs = {
@@ -126,57 +133,46 @@ class PropertyMeterReadingsExporter():
             },
         }
 
-        for meter in self.meters:
-            field_name, conversion_factor = self._build_column_def(meter, column_defs)
+        meters = list(self.meters)
+        columns = {meter.id: self._build_column_def(meter, column_defs) for meter in meters}
+
+        rollups = MeterReadingRollup.objects.filter(
+            meter__in=meters,
+            interval=MeterReadingRollup.MONTH,
+        ).values_list('meter_id', 'period_start', 'reading')
+        for meter_id, period_start, total in rollups.iterator():
+            field_name, conversion_factor = columns[meter_id]
+            month_start = period_start.astimezone(self.tz)
+            monthly_readings.setdefault(month_start, {'month': month_start.strftime('%B %Y')})
+            monthly_readings[month_start][field_name] = round(total / conversion_factor, 2)
 
-            # iterate through each usage and assign to accumulator
-            for usage in meter.meter_readings.values():
-                st, et = usage['start_time'], usage['end_time']
-                total_seconds = round((et - st).total_seconds())
-                ranges = self._get_month_ranges(st, et)
-
-                # partial usages of the full usage are calculated from a linear relationship between the range_seconds to the total_seconds
-                for range in ranges:
-                    range_seconds = round((range[1] - range[0]).total_seconds())
-                    if range_seconds == 0:
-                        continue
-                    month_key = range[1].strftime('%B %Y')
-                    reading = usage['reading'] / total_seconds * range_seconds / conversion_factor
-                    if reading is not None:
-                        monthly_readings[month_key] = monthly_readings.get(month_key, {'month': month_key})
-                        monthly_readings[month_key][field_name] = round(monthly_readings[month_key].get(field_name, 0) + reading, 2)
-
-        sorted_readings = sorted(list(monthly_readings.values()), key=lambda reading: datetime.strptime(reading['month'], '%B %Y'))
+        sorted_readings = [monthly_readings[month_start] for month_start in sorted(monthly_readings)]
 
         return {
             'readings': sorted_readings,
             'column_defs': list(column_defs.values())
         }
 
-    def _get_month_ranges(self, st, et):
+    def _reading_arrays(self, meter):
         """
-        Given two dates start time (st) and end date time (et)
-        return a list of date ranges that are within a single month
-        ex:
-            st = may 15th 2020
-            et = july 10th 2020
-            ranges = [[may 15, may 31], [june 1, june 30], [july 1, july 10]]
+        Returns the start times and end times (as epoch seconds) and the readings of a meter
+        as arrays, ordered by end time.
         """
-        month_count = (et.year - st.year) * 12 + et.month - st.month + 1
-        start = st
-        ranges = []
-        for idx in range(0, month_count):
-            end_of_month = make_aware(datetime.combine(start.replace(day=monthrange(start.year, start.month)[1]), time.max), timezone=self.tz)
-            if end_of_month >= et:
-                end_of_month = et
-            ranges.append([start, end_of_month])
-            start = end_of_month + timedelta(microseconds=1)
-        return ranges
+        rows = meter.meter_readings.filter(reading__isnull=False).annotate(
+            start_epoch=_epoch('start_time'),
+            end_epoch=_epoch('end_time'),
+        ).order_by('end_time').values_list('start_epoch', 'end_epoch', 'reading')
+
+        data = np.array(list(rows), dtype=float).reshape(-1, 3)
+        return data[:, 0], data[:, 1], data[:, 2]
 
     def _usages_by_year(self):
         """
         Similarly to _usages_by_month, this returns readings and column definitions
         formatted and aggregated to display all records in yearly intervals.
+
+        The readings of a year are the readings fully contained within the year, and the total
+        of a year is the maximum total of the readings which do not overlap each other.
         """
         # Used to consolidate different readings (types) within the same year
         yearly_readings = defaultdict(lambda: {})
@@ -192,27 +188,29 @@ class PropertyMeterReadingsExporter():
         for meter in self.meters:
             field_name, conversion_factor = self._build_column_def(meter, column_defs)
 
-            min_time = meter.meter_readings.earliest('start_time').start_time.astimezone(tz=self.tz)
-            max_time = meter.meter_readings.latest('end_time').end_time.astimezone(tz=self.tz)
-
-            # Iterate through years
-            current_year_time = min_time
-            while current_year_time < max_time:
-                unaware_end = datetime((current_year_time.year + 1), 1, 1, 0, 0, 0)
-                end_of_year = make_aware(unaware_end, timezone=self.tz)
-
-                # Find all meters fully contained within this month (second-level granularity)
-                interval_readings = meter.meter_readings.filter(start_time__range=(current_year_time, end_of_year), end_time__range=(current_year_time, end_of_year))
-                if interval_readings.exists():
-                    readings_list = list(interval_readings.order_by('end_time'))
-                    reading_year_total = self._max_reading_total(readings_list)
-
-                    if reading_year_total > 0:
-                        year = current_year_time.year
-                        yearly_readings[year]['year'] = year
-                        yearly_readings[year][field_name] = reading_year_total / conversion_factor
-
-                current_year_time = end_of_year
+            starts, ends, readings = self._reading_arrays(meter)
+            if len(readings) == 0:
+                continue
+
+            first_year = datetime.fromtimestamp(starts.min(), tz=self.tz).year
+            last_year = datetime.fromtimestamp(ends.max(), tz=self.tz).year
+            years = list(range(first_year, last_year + 1))
+            edges = np.array([
+                make_aware(datetime(year, 1, 1), timezone=self.tz).timestamp() for year in years + [last_year + 1]
+            ])
+
+            # Find all readings fully contained within each year (second-level granularity)
+            year_index = np.searchsorted(edges, starts, side='right') - 1
+            contained = ends <= edges[year_index + 1]
+            for index, year in enumerate(years):
+                in_year = contained & (year_index == index)
+                if not in_year.any():
+                    continue
+
+                reading_year_total = self._max_reading_total(starts[in_year], ends[in_year], readings[in_year])
+                if reading_year_total > 0:
+                    yearly_readings[year]['year'] = year
+                    yearly_readings[year][field_name] = reading_year_total / conversion_factor
 
         return {
             'readings': list(yearly_readings.values()),
@@ -248,34 +246,7 @@ class PropertyMeterReadingsExporter():
 
         return field_name, conversion_factor
 
-    def _latest_nonintersecting_index(self, sorted_readings, start_index):
-        """
-        Using indexes, finds the latest reading before the current reading.
-        Specifically, this latest reading must not end after the current reading
-        starts. The index of the latest reading or -1, if none exists, is returned.
-
-        Note that the readings are expected to be sorted by ascending end_times.
-
-        This binary search is taken from
-        https://www.geeksforgeeks.org/weighted-job-scheduling-log-n-time/
-        """
-        lo = 0
-        hi = start_index - 1
-
-        while lo <= hi:
-            mid = (lo + hi) // 2
-            current_start_time = sorted_readings[start_index].start_time
-
-            if sorted_readings[mid].end_time <= current_start_time:
-                if sorted_readings[mid + 1].end_time <= current_start_time:
-                    lo = mid + 1
-                else:
-                    return mid
-            else:
-                hi = mid - 1
-        return -1
-
-    def _max_reading_total(self, sorted_readings):
+    def _max_reading_total(self, starts, ends, readings):
         """
         Method to find maximum possible total of readings that do not
         overlap each other within a given interval.
@@ -286,24 +257,36 @@ class PropertyMeterReadingsExporter():
 
         At a high level, a running maximum is tracked to ultimately find the max.
 
-        Note that the readings are expected to be sorted by ascending end_times.
+        Note that the readings are expected to be sorted by ascending end times.
         """
+        n = len(readings)
+
+        # For each reading, the index of the latest reading which ends before the reading
+        # starts, or -1 if none exists
+        latest_indexes = np.minimum(np.searchsorted(ends, starts, side='right') - 1, np.arange(n) - 1).tolist()
+        readings = readings.tolist()
+
         # Create list to track running maximum and prefill first entry
-        n = len(sorted_readings)
-        running_max = [0 for _ in range(n)]
-        running_max[0] = sorted_readings[0].reading
+        running_max = [0] * n
+        running_max[0] = readings[0]
 
         # Fill the remaining entries in running_max
         for i in range(1, n):
-            curr_max = sorted_readings[i].reading
-
-            latest_index = self._latest_nonintersecting_index(sorted_readings, i)
+            curr_max = readings[i]
 
             # If a latest index was found, add it's running_max value to curr_max
-            if (latest_index != -1):
-                curr_max += running_max[latest_index]
+            if latest_indexes[i] != -1:
+                curr_max += running_max[latest_indexes[i]]
 
             # Store maximum of curr_max and the prior running_max entry
             running_max[i] = max(curr_max, running_max[i - 1])
 
         return running_max[n - 1]
+
+
+def _epoch(field_name):
+    return Func(
+        F(field_name),
+        template='EXTRACT(EPOCH FROM %(expressions)s)::double precision',
+        output_field=FloatField(),
+    )
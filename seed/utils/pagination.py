@@ -5,11 +5,22 @@
 SEED Platform (TM), Copyright (c) Alliance for Sustainable Energy, LLC, and other contributors.
 See also https://github.com/seed-platform/seed/main/LICENSE.md
 """
+import base64
+import binascii
+import hashlib
+import operator
 from collections import OrderedDict
+from functools import reduce
+from uuid import uuid4
 
+from django.core.cache import cache as django_cache
+from django.core.exceptions import EmptyResultSet
+from django.db.models import F, OrderBy, Q
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 
+from seed.utils.cache import get_cache_raw, set_cache_raw
+
 
 class ResultsListPagination(PageNumberPagination):
     page_size_query_param = 'per_page'
@@ -27,3 +38,170 @@ class ResultsListPagination(PageNumberPagination):
             ('total', self.page.paginator.count),
             ('results', data)
         ]))
+
+
+# counts of filtered inventory are cached for a limited time, in case the inventory is changed
+# without sending the signals which invalidate the cached counts (e.g., with QuerySet.update)
+INVENTORY_COUNT_CACHE_TIMEOUT = 60 * 10
+
+
+def _inventory_count_version_key(scope, scope_id):
+    return f'inventory_count_version:{scope}:{scope_id}'
+
+
+def invalidate_inventory_counts(cycle_id=None, organization_id=None):
+    """Invalidate the cached counts of the inventory of a cycle (e.g., when a -View of the cycle
+    is added or removed) or of an organization (e.g., when a -State is changed, which can change
+    the results of the filters)
+
+    :param cycle_id: int, optional
+    :param organization_id: int, optional
+    """
+    if cycle_id is not None:
+        set_cache_raw(_inventory_count_version_key('cycle', cycle_id), uuid4().hex, None)
+    if organization_id is not None:
+        set_cache_raw(_inventory_count_version_key('org', organization_id), uuid4().hex, None)
+
+
+def inventory_version(organization_id, cycle_ids):
+    """Versions of the inventory of an organization and of its cycles, which change whenever
+    the counts of the inventory are invalidated. Used in the keys of cached values computed from
+    the inventory.
+
+    :param organization_id: int
+    :param cycle_ids: list of ints
+    :return: str
+    """
+    version_keys = [_inventory_count_version_key('org', organization_id)]
+    version_keys += [_inventory_count_version_key('cycle', cycle_id) for cycle_id in cycle_ids]
+    versions = django_cache.get_many(version_keys)
+    return ':'.join(versions.get(key, '') for key in version_keys)
+
+
+def cached_inventory_count(queryset, organization_id, cycle_id):
+    """Count of a filtered -View queryset, cached until the inventory of the cycle or the
+    organization changes. The queryset's SQL identifies the filters.
+
+    :param queryset: QuerySet of PropertyView or TaxLotView
+    :param organization_id: int
+    :param cycle_id: int
+    :return: int
+    """
+    version_keys = [
+        _inventory_count_version_key('cycle', cycle_id),
+        _inventory_count_version_key('org', organization_id),
+    ]
+    try:
+        sql = str(queryset.order_by().query)
+    except EmptyResultSet:
+        return 0
+
+    versions = django_cache.get_many(version_keys)
+    query_hash = hashlib.md5(sql.encode('utf-8')).hexdigest()
+    key = 'inventory_count:{}:{}:{}:{}:{}'.format(
+        organization_id,
+        cycle_id,
+        versions.get(version_keys[0], ''),
+        versions.get(version_keys[1], ''),
+        query_hash,
+    )
+
+    count = get_cache_raw(key)
+    if count is None:
+        count = queryset.count()
+        set_cache_raw(key, count, INVENTORY_COUNT_CACHE_TIMEOUT)
+    return count
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def encode_cursor(obj_id):
+    return base64.urlsafe_b64encode(str(obj_id).encode('utf-8')).decode('utf-8')
+
+
+def decode_cursor(cursor):
+    try:
+        return int(base64.urlsafe_b64decode(cursor.encode('utf-8')).decode('utf-8'))
+    except (ValueError, TypeError, binascii.Error):
+        raise InvalidCursor(f'Invalid cursor "{cursor}"')
+
+
+def _keyset_sorts(order_by):
+    """The expression and direction of each sort of an order_by list, ending with the id so
+    that the order is total
+
+    :param order_by: list of str (e.g., '-state__site_eui'), expressions or OrderBy
+    :return: list of tuples, (expression, descending)
+    """
+    sorts = []
+    for sort in order_by:
+        if isinstance(sort, str):
+            field_name = sort.lstrip('-')
+            sorts.append((F(field_name), sort.startswith('-')))
+            if field_name in ('id', 'pk'):
+                # ids are unique, later sorts never apply
+                return sorts
+        elif isinstance(sort, OrderBy):
+            sorts.append((sort.expression, sort.descending))
+        else:
+            sorts.append((sort, False))
+
+    sorts.append((F('id'), False))
+    return sorts
+
+
+def keyset_page(queryset, order_by, per_page, cursor=None):
+    """Page of a queryset which starts after the object of the cursor, in the order of order_by.
+
+    Unlike pages by number, which are fetched with an OFFSET that the database has to scan,
+    the page is fetched by filtering on the sort values of the cursor object. Null values are
+    sorted like postgres does by default: last in ascending order and first in descending order.
+
+    :param queryset: QuerySet
+    :param order_by: list, sorts as passed to QuerySet.order_by
+    :param per_page: int
+    :param cursor: str, `next_cursor` of the previous page, or None for the first page
+    :return: tuple, (list of objects, next_cursor or None if this is the last page)
+    """
+    sorts = _keyset_sorts(order_by)
+    aliases = [f'_keyset_{i}' for i in range(len(sorts))]
+    queryset = queryset.annotate(**{
+        alias: expression for alias, (expression, _) in zip(aliases, sorts)
+    }).order_by(*[
+        F(alias).desc(nulls_first=True) if descending else F(alias).asc(nulls_last=True)
+        for alias, (_, descending) in zip(aliases, sorts)
+    ])
+
+    if cursor:
+        cursor_values = queryset.filter(id=decode_cursor(cursor)).values(*aliases).first()
+        if cursor_values is None:
+            raise InvalidCursor('The cursor no longer matches the results, restart from the first page')
+
+        # (a > x) OR (a = x AND b > y) OR ...
+        after_cursor = []
+        previous_sorts_equal = Q()
+        for alias, (_, descending) in zip(aliases, sorts):
+            value = cursor_values[alias]
+            if value is None:
+                # only non-null values come after nulls, when they are first
+                after = Q(**{f'{alias}__isnull': False}) if descending else None
+                equal = Q(**{f'{alias}__isnull': True})
+            else:
+                after = Q(**{f'{alias}__lt' if descending else f'{alias}__gt': value})
+                if not descending:
+                    after |= Q(**{f'{alias}__isnull': True})
+                equal = Q(**{alias: value})
+
+            if after is not None:
+                after_cursor.append(previous_sorts_equal & after)
+            previous_sorts_equal &= equal
+
+        # the last sort is on the id, which is never null, so there is always a condition
+        queryset = queryset.filter(reduce(operator.or_, after_cursor))
+
+    # fetch one more object to know if there is a next page
+    objs = list(queryset[:per_page + 1])
+    next_cursor = encode_cursor(objs[per_page - 1].id) if len(objs) > per_page else None
+    return objs[:per_page], next_cursor
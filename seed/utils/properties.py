@@ -8,7 +8,13 @@ import itertools
 import json
 
 # Imports from Django
+from django.contrib.gis.db.models import GeometryField
+from django.db.models import Case, FloatField, When
+from django.db.models.fields.json import KeyTextTransform, KeyTransform
+from django.db.models.functions import Cast
 from django.http import JsonResponse
+from django.utils.timezone import make_naive
+from quantityfield.units import ureg
 from rest_framework import status
 
 # Local Imports
@@ -19,13 +25,19 @@ from seed.models import (
     Column,
     ColumnListProfile,
     ColumnListProfileColumn,
+    PropertyState,
     PropertyView,
     TaxLotProperty,
     TaxLotView
 )
-from seed.serializers.pint import apply_display_unit_preferences
+from seed.serializers.pint import DEFAULT_UNITS, apply_display_unit_preferences
 from seed.utils.search import build_view_filters_and_sorts
 
+# extra data values which are numbers, as accepted by float(). The digits and the exponent are
+# bounded so that the values cast in the database stay within the range of a double, the larger
+# and smaller values are returned as text
+NUMBER_REGEX = r'^\s*[-+]?([0-9]{1,100}(\.[0-9]{0,100})?|\.[0-9]{1,100})([eE][-+]?[0-9]{1,2})?\s*$'
+
 
 def get_changed_fields(old, new):
     """Return changed fields as json string"""
@@ -190,26 +202,119 @@ def properties_across_cycles(org_id, profile_id, cycle_ids=[]):
     return results
 
 
-def properties_across_cycles_with_filters(org_id, cycle_ids=[], query_dict={}, column_ids=[]):
-    # Identify column preferences to be used to scope fields/values
-    columns_from_database = Column.retrieve_all(org_id, 'property', False)
+def property_columns_across_cycles(org_id, cycle_ids, column_ids, views=None, columns_from_database=None):
+    """Values of the columns of the property views of the cycles, fetched for all the cycles in
+    one query and pivoted by property. Only the requested keys of the extra data are read, and
+    the numeric ones are cast to floats in the database.
+
+    The rows have the ids of the view and the values of the columns, keyed and converted to the
+    organization's display units like TaxLotProperty.serialize, without the related tax lots,
+    the notes and the other indicators of the inventory list.
+
+    :param org_id: int
+    :param cycle_ids: list of ints
+    :param column_ids: list of ints, ids of the PropertyState columns. Pass None for all the
+        columns excluding extra data
+    :param views: QuerySet of PropertyView, optional, the views to fetch (e.g., from
+        filtered_property_views). Defaults to all the views of the cycles
+    :param columns_from_database: list of dict, optional, columns from Column.retrieve_all
+    :return: dict, {property_id: {cycle_id: row}}, with the properties in the order of their
+        first view
+    """
     org = Organization.objects.get(pk=org_id)
+    if columns_from_database is None:
+        columns_from_database = Column.retrieve_all(org_id, 'property', False, include_related=False)
+    if views is None:
+        views = PropertyView.objects.filter(property__organization_id=org_id, cycle_id__in=cycle_ids)
+
+    state_fields = {f.name: f for f in PropertyState._meta.concrete_fields}
+    state_columns = []
+    extra_data_columns = []
+    annotations = {}
+    for column in columns_from_database:
+        if column['related'] or (column_ids is not None and column['id'] not in column_ids):
+            continue
+        if column['is_extra_data']:
+            if column_ids is None:
+                continue
+            value_name = f'_column_{column["id"]}'
+            annotations[value_name] = KeyTransform(column['column_name'], 'state__extra_data')
+            annotations[f'{value_name}_text'] = KeyTextTransform(column['column_name'], 'state__extra_data')
+            annotations[f'{value_name}_number'] = Case(
+                When(**{f'{value_name}_text__regex': NUMBER_REGEX}, then=Cast(f'{value_name}_text', output_field=FloatField())),
+                output_field=FloatField()
+            )
+            extra_data_columns.append((column['name'], DEFAULT_UNITS.get(column['data_type']), value_name))
+        else:
+            field = state_fields.get(column['column_name'])
+            # the same fields as TaxLotProperty.model_to_dict_with_mapping, and the timestamps
+            if field is not None and field.name != 'extra_data' and (field.editable or field.name in ['updated', 'created']):
+                state_columns.append((column['name'], field))
+
+    fields = ['id', 'property_id', 'cycle_id', 'state_id'] + [f'state__{field.name}' for _, field in state_columns]
+    for _, _, value_name in extra_data_columns:
+        fields += [value_name, f'{value_name}_number']
+    rows = views.annotate(**annotations).order_by('id').values_list(*fields)
 
-    results = {cycle_id: [] for cycle_id in cycle_ids}
-    property_views = _get_filter_group_views(org_id, cycle_ids, query_dict)
-    views_cycle_ids = [v.cycle_id for v in property_views]
-    related_results = TaxLotProperty.serialize(property_views, column_ids, columns_from_database, include_related=False)
-    unit_collapsed_results = [apply_display_unit_preferences(org, x) for x in related_results]
+    results = {}
+    for view_id, property_id, cycle_id, state_id, *values in rows.iterator():
+        row = {
+            'id': property_id,
+            'property_view_id': view_id,
+            'property_state_id': state_id,
+        }
+        for (name, field), value in zip(state_columns, values):
+            row[name] = _state_field_value(field, value)
+        extra_data_values = values[len(state_columns):]
+        for i, (name, units, _) in enumerate(extra_data_columns):
+            value, number = extra_data_values[2 * i:2 * i + 2]
+            if number is not None:
+                value = number * ureg(units) if units else number
+            row[name] = value
+
+        results.setdefault(property_id, {})[cycle_id] = apply_display_unit_preferences(org, row)
+
+    return results
+
+
+def _state_field_value(field, value):
+    # as converted by TaxLotProperty.model_to_dict_with_mapping
+    if not value:
+        return value
+    if field.name in ['recent_sale_date', 'release_date', 'generation_date']:
+        return make_naive(value).isoformat()
+    if isinstance(field, GeometryField):
+        return value.wkt
+    return value
 
-    for cycle_id, unit_collapsed_result in zip(views_cycle_ids, unit_collapsed_results):
-        results[cycle_id].append(unit_collapsed_result)
 
+def _rows_by_cycle(cycle_ids, rows_by_property):
+    results = {cycle_id: [] for cycle_id in cycle_ids}
+    for rows in rows_by_property.values():
+        for cycle_id, row in rows.items():
+            results[cycle_id].append(row)
+    for rows in results.values():
+        rows.sort(key=lambda row: row['property_view_id'])
     return results
 
 
-# helper function for getting filtered properties
-def _get_filter_group_views(org_id, cycles, query_dict):
+def properties_across_cycles_with_filters(org_id, cycle_ids=[], query_dict={}, column_ids=[]):
+    property_views = filtered_property_views(org_id, cycle_ids, query_dict)
+    if isinstance(property_views, JsonResponse):
+        return property_views
 
+    return _rows_by_cycle(cycle_ids, property_columns_across_cycles(org_id, cycle_ids, column_ids, views=property_views))
+
+
+def filtered_property_views(org_id, cycles, query_dict):
+    """Property views of the cycles which match the filters of the query dict (e.g., of a
+    filter group), ordered by id
+
+    :param org_id: int
+    :param cycles: list of ints or Cycles
+    :param query_dict: QueryDict
+    :return: QuerySet of PropertyView, or a JsonResponse if the filters are invalid
+    """
     columns = Column.retrieve_all(
         org_id=org_id,
         inventory_type='property',
@@ -237,21 +342,4 @@ def _get_filter_group_views(org_id, cycles, query_dict):
 
 
 def properties_across_cycles_with_columns(org_id, show_columns=[], cycle_ids=[]):
-    # Identify column preferences to be used to scope fields/values
-    columns_from_database = Column.retrieve_all(org_id, 'property', False)
-
-    results = {}
-    for cycle_id in cycle_ids:
-        # get -Views for this Cycle
-        property_views = PropertyView.objects.select_related('property', 'state', 'cycle') \
-            .filter(property__organization_id=org_id, cycle_id=cycle_id) \
-            .order_by('id')
-
-        related_results = TaxLotProperty.serialize(property_views, show_columns, columns_from_database)
-
-        org = Organization.objects.get(pk=org_id)
-        unit_collapsed_results = [apply_display_unit_preferences(org, x) for x in related_results]
-
-        results[cycle_id] = unit_collapsed_results
-
-    return results
+    return _rows_by_cycle(cycle_ids, property_columns_across_cycles(org_id, cycle_ids, show_columns))
@@ -0,0 +1,261 @@
+# !/usr/bin/env python
+# encoding: utf-8
+"""
+SEED Platform (TM), Copyright (c) Alliance for Sustainable Energy, LLC, and other contributors.
+See also https://github.com/seed-platform/seed/main/LICENSE.md
+
+Maintenance of the hourly, daily, monthly and yearly rollups of the meter and sensor readings
+(see seed.models.reading_rollups). When readings are saved, only the periods around them are
+refreshed: the hours and days of the days of the readings, the months of their months and the
+years of their years. The hours and months of the meters are computed from the readings, then
+each interval is rolled up from the finer one (days from hours, months from days and years from
+months).
+"""
+from datetime import datetime, timedelta
+
+import numpy as np
+from django.db import connection, transaction
+from django.utils.timezone import is_naive, make_aware
+from psycopg2.extras import execute_values
+from pytz import timezone
+
+from config.settings.common import TIME_ZONE
+
+HOUR = 'hour'
+DAY = 'day'
+MONTH = 'month'
+YEAR = 'year'
+
+METER_ROLLUP_TABLE = 'seed_meterreadingrollup'
+SENSOR_ROLLUP_TABLE = 'seed_sensorreadingrollup'
+
+
+def _aware(moment, tz):
+    return make_aware(moment, timezone=tz) if is_naive(moment) else moment
+
+
+def _period_start(moment, interval, tz):
+    """Start of the day, month or year of a time, in the timezone"""
+    local = moment.astimezone(tz)
+    if interval == DAY:
+        naive = datetime(local.year, local.month, local.day)
+    elif interval == MONTH:
+        naive = datetime(local.year, local.month, 1)
+    else:
+        naive = datetime(local.year, 1, 1)
+    return make_aware(naive, timezone=tz)
+
+
+def _next_period_start(period_start, interval, tz):
+    local = period_start.astimezone(tz)
+    if interval == DAY:
+        naive = datetime(local.year, local.month, local.day) + timedelta(days=1)
+    elif interval == MONTH:
+        naive = datetime(local.year + 1, 1, 1) if local.month == 12 else datetime(local.year, local.month + 1, 1)
+    else:
+        naive = datetime(local.year + 1, 1, 1)
+    return make_aware(naive, timezone=tz)
+
+
+def _window(start, end, interval, tz):
+    """Periods of the interval from the period of start to the period of end, included"""
+    return _period_start(start, interval, tz), _next_period_start(_period_start(end, interval, tz), interval, tz)
+
+
+def _period_starts(window, interval, tz):
+    period_starts = [window[0]]
+    while period_starts[-1] < window[1]:
+        period_starts.append(_next_period_start(period_starts[-1], interval, tz))
+    return period_starts
+
+
+def prorate(starts, ends, readings, edges):
+    """
+    Prorate readings into the intervals between consecutive edges, in proportion to the
+    seconds of each reading within each interval. The parts of the readings outside of the
+    edges are ignored.
+
+    :param starts: array, start times of the readings as epoch seconds
+    :param ends: array, end times of the readings as epoch seconds
+    :param readings: array, readings
+    :param edges: array, sorted boundaries of the intervals as epoch seconds
+    :return: tuple, (array of the total of each interval, array of the seconds of each interval
+        covered by the readings, boolean array of the intervals with a part of a reading)
+    """
+    interval_count = len(edges) - 1
+    total_seconds = np.rint(ends - starts)
+    spanned = total_seconds > 0
+    starts, ends, readings, total_seconds = starts[spanned], ends[spanned], readings[spanned], total_seconds[spanned]
+
+    # first and last interval of each reading, a reading ending on an edge doesn't reach the next interval
+    first = np.maximum(np.searchsorted(edges, starts, side='right') - 1, 0)
+    last = np.minimum(np.searchsorted(edges, ends, side='left') - 1, interval_count - 1)
+    counts = np.maximum(last - first + 1, 0)
+
+    # one row for each (reading, interval) overlap
+    reading_index = np.repeat(np.arange(len(readings)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    interval_index = first[reading_index] + offsets
+
+    overlap_seconds = np.rint(
+        np.minimum(ends[reading_index], edges[interval_index + 1]) - np.maximum(starts[reading_index], edges[interval_index])
+    )
+    has_overlap = overlap_seconds > 0
+    reading_index, interval_index, overlap_seconds = reading_index[has_overlap], interval_index[has_overlap], overlap_seconds[has_overlap]
+
+    # partial usages of the full usage are calculated from a linear relationship between the overlap seconds to the total seconds
+    partial_readings = readings[reading_index] / total_seconds[reading_index] * overlap_seconds
+    totals = np.bincount(interval_index, weights=partial_readings, minlength=interval_count)
+    seconds = np.bincount(interval_index, weights=overlap_seconds, minlength=interval_count)
+    has_usage = np.bincount(interval_index, minlength=interval_count) > 0
+    return totals, seconds, has_usage
+
+
+def _delete_rollups(cursor, table, id_column, ids, interval, window):
+    cursor.execute(
+        f'DELETE FROM {table} WHERE {id_column} = ANY(%s) AND interval = %s AND period_start >= %s AND period_start < %s',
+        [list(ids), interval, window[0], window[1]]
+    )
+
+
+def _roll_up(cursor, table, id_column, ids, from_interval, to_interval, window, key_columns, sum_columns, tz_name):
+    """Replace the rollups of an interval within the window by the sums of the rollups of the
+    finer interval
+    """
+    _delete_rollups(cursor, table, id_column, ids, to_interval, window)
+    keys = ''.join(f', {column}' for column in key_columns)
+    sums = ', '.join(sum_columns)
+    cursor.execute(
+        f"""
+        INSERT INTO {table} ({id_column}, interval, period_start{keys}, {sums})
+        SELECT
+            {id_column}, %s,
+            date_trunc(%s, period_start AT TIME ZONE %s) AT TIME ZONE %s AS rolled_up_period_start{keys},
+            {', '.join(f'SUM({column})' for column in sum_columns)}
+        FROM {table}
+        WHERE {id_column} = ANY(%s) AND interval = %s AND period_start >= %s AND period_start < %s
+        GROUP BY {id_column}, rolled_up_period_start{keys}
+        """,
+        [to_interval, to_interval, tz_name, tz_name, list(ids), from_interval, window[0], window[1]]
+    )
+
+
+def _refresh_meter(cursor, meter_id, start, end, tz):
+    day_window = _window(start, end, DAY, tz)
+    month_window = _window(start, end, MONTH, tz)
+    year_window = _window(start, end, YEAR, tz)
+
+    # the readings are ordered by end time, like the readings prorated by the meters exporter
+    cursor.execute(
+        """
+        SELECT EXTRACT(EPOCH FROM start_time)::double precision, EXTRACT(EPOCH FROM end_time)::double precision, reading
+        FROM seed_meterreading
+        WHERE meter_id = %s AND reading IS NOT NULL AND end_time > %s AND start_time < %s
+        ORDER BY end_time
+        """,
+        [meter_id, month_window[0], month_window[1]]
+    )
+    data = np.array(cursor.fetchall(), dtype=float).reshape(-1, 3)
+    starts, ends, readings = data[:, 0], data[:, 1], data[:, 2]
+
+    hour_edges = np.arange(day_window[0].timestamp(), day_window[1].timestamp() + 1, 3600)
+    month_starts = _period_starts(month_window, MONTH, tz)
+    for interval, window, edges in [
+        (HOUR, day_window, hour_edges),
+        (MONTH, month_window, np.array([month_start.timestamp() for month_start in month_starts])),
+    ]:
+        _delete_rollups(cursor, METER_ROLLUP_TABLE, 'meter_id', [meter_id], interval, window)
+        totals, seconds, has_usage = prorate(starts, ends, readings, edges)
+        rows = [
+            (meter_id, interval, datetime.fromtimestamp(edges[index], tz=tz), float(totals[index]), float(seconds[index]))
+            for index in np.flatnonzero(has_usage)
+        ]
+        execute_values(
+            cursor,
+            f'INSERT INTO {METER_ROLLUP_TABLE} (meter_id, interval, period_start, reading, seconds) VALUES %s',
+            rows,
+        )
+
+        if interval == HOUR:
+            _roll_up(cursor, METER_ROLLUP_TABLE, 'meter_id', [meter_id], HOUR, DAY, day_window, [], ['reading', 'seconds'], tz.zone)
+
+    _roll_up(cursor, METER_ROLLUP_TABLE, 'meter_id', [meter_id], MONTH, YEAR, year_window, [], ['reading', 'seconds'], tz.zone)
+
+
+def _reading_times(cursor, sql, ids):
+    cursor.execute(sql, [list(ids)])
+    return cursor.fetchone()
+
+
+def refresh_meter_rollups(meter_ids, start=None, end=None):
+    """Refresh the rollups of the meters for the periods of the readings between start and end.
+    Without start and end, all the rollups of the meters are rebuilt.
+
+    :param meter_ids: list of int
+    :param start: datetime, optional, start time of the first changed reading
+    :param end: datetime, optional, end time of the last changed reading
+    """
+    tz = timezone(TIME_ZONE)
+    with transaction.atomic(), connection.cursor() as cursor:
+        for meter_id in meter_ids:
+            meter_start, meter_end = start, end
+            if meter_start is None or meter_end is None:
+                cursor.execute(f'DELETE FROM {METER_ROLLUP_TABLE} WHERE meter_id = %s', [meter_id])
+                meter_start, meter_end = _reading_times(
+                    cursor,
+                    'SELECT MIN(start_time), MAX(end_time) FROM seed_meterreading WHERE meter_id = ANY(%s)',
+                    [meter_id]
+                )
+                if meter_start is None:
+                    continue
+
+            _refresh_meter(cursor, meter_id, _aware(meter_start, tz), _aware(meter_end, tz), tz)
+
+
+def refresh_sensor_rollups(sensor_ids, start=None, end=None):
+    """Refresh the rollups of the sensors for the periods of the readings between start and end.
+    Without start and end, all the rollups of the sensors are rebuilt.
+
+    :param sensor_ids: list of int
+    :param start: datetime, optional, timestamp of the first changed reading
+    :param end: datetime, optional, timestamp of the last changed reading
+    """
+    sensor_ids = list(sensor_ids)
+    if not sensor_ids:
+        return
+
+    tz = timezone(TIME_ZONE)
+    with transaction.atomic(), connection.cursor() as cursor:
+        if start is None or end is None:
+            cursor.execute(f'DELETE FROM {SENSOR_ROLLUP_TABLE} WHERE sensor_id = ANY(%s)', [sensor_ids])
+            start, end = _reading_times(
+                cursor,
+                'SELECT MIN(timestamp), MAX(timestamp) FROM seed_sensorreading WHERE sensor_id = ANY(%s)',
+                sensor_ids
+            )
+            if start is None:
+                return
+
+        start, end = _aware(start, tz), _aware(end, tz)
+        day_window = _window(start, end, DAY, tz)
+
+        _delete_rollups(cursor, SENSOR_ROLLUP_TABLE, 'sensor_id', sensor_ids, HOUR, day_window)
+        cursor.execute(
+            f"""
+            INSERT INTO {SENSOR_ROLLUP_TABLE} (sensor_id, interval, period_start, is_occupied, reading_sum, reading_count)
+            SELECT
+                sensor_id, %s,
+                date_trunc('hour', timestamp AT TIME ZONE 'UTC') AT TIME ZONE 'UTC' AS hour,
+                is_occupied, SUM(reading), COUNT(reading)
+            FROM seed_sensorreading
+            WHERE sensor_id = ANY(%s) AND timestamp >= %s AND timestamp < %s
+            GROUP BY sensor_id, hour, is_occupied
+            """,
+            [HOUR, sensor_ids, day_window[0], day_window[1]]
+        )
+
+        for from_interval, to_interval in [(HOUR, DAY), (DAY, MONTH), (MONTH, YEAR)]:
+            _roll_up(
+                cursor, SENSOR_ROLLUP_TABLE, 'sensor_id', sensor_ids, from_interval, to_interval,
+                _window(start, end, to_interval, tz), ['is_occupied'], ['reading_sum', 'reading_count'], tz.zone
+            )
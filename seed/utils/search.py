@@ -21,6 +21,7 @@ from django.http.request import QueryDict
 from past.builtins import basestring
 
 from seed.models.columns import Column
+from seed.models.derived_columns import DerivedColumn
 
 SUFFIXES = ['__lt', '__gt', '__lte', '__gte', '__isnull']
 DATE_FIELDS = ['year_ending']
@@ -313,6 +314,20 @@ def _build_extra_data_annotations(column_name: str, data_type: str) -> tuple[str
     return final_field_name, annotations
 
 
+def _build_derived_column_annotations(column: dict) -> tuple[str, AnnotationDict]:
+    """Creates a dictionary of annotations which computes the derived column in the
+    database, for usage like: `*View.annotate(**annotations)`
+
+    :param column: dict representation of a Column which has a derived column
+    :returns: the annotated field name which contains the result, along with
+              a dict of annotations
+    """
+    derived_column = DerivedColumn.objects.get(id=column['derived_column'])
+    final_field_name = f'_derived_column_{derived_column.id}_final'
+
+    return final_field_name, {final_field_name: derived_column.as_sql_expression()}
+
+
 def _parse_view_filter(filter_expression: str, filter_value: Union[str, bool], columns_by_name: dict[str, dict]) -> tuple[Q, AnnotationDict]:
     """Parse a filter expression into a Q object
 
@@ -332,7 +347,10 @@ def _parse_view_filter(filter_expression: str, filter_value: Union[str, bool], c
 
     column_name = column["column_name"]
     annotations: AnnotationDict = {}
-    if column['is_extra_data']:
+    if column.get('derived_column'):
+        new_field_name, annotations = _build_derived_column_annotations(column)
+        updated_filter = QueryFilter(new_field_name, filter.operator, filter.is_negated)
+    elif column['is_extra_data']:
         new_field_name, annotations = _build_extra_data_annotations(column['column_name'], column['data_type'])
         updated_filter = QueryFilter(new_field_name, filter.operator, filter.is_negated)
     else:
@@ -367,6 +385,9 @@ def _parse_view_sort(sort_expression: str, columns_by_name: dict[str, dict]) ->
         column_name = column["column_name"]
         if column['related']:
             return None, {}
+        elif column.get('derived_column'):
+            new_field_name, annotations = _build_derived_column_annotations(column)
+            return f'{direction}{new_field_name}', annotations
         elif column['is_extra_data']:
             new_field_name, annotations = _build_extra_data_annotations(column_name, column['data_type'])
             if column['data_type'] in ['None', 'string']:
@@ -411,9 +432,12 @@ def build_view_filters_and_sorts(filters: QueryDict, columns: list[dict]) -> tup
     - `?order_by=-site_eui` - sort by Site EUI in descending order
     - `?order_by=city&order_by=site_eui` - sort by City, then Site EUI
 
+    Derived columns are computed in the database (see `DerivedColumn.as_sql_expression`)
+    so they can be filtered and sorted on like the other numeric columns.
+
     This function basically does the following:
     - Ignore any filter/sort that doesn't have a corresponding column
-    - Handle cases for extra data
+    - Handle cases for extra data and derived columns
     - Convert filtering values into their proper types (e.g., str -> int)
 
     :param filters: QueryDict from a request
@@ -424,6 +448,9 @@ def build_view_filters_and_sorts(filters: QueryDict, columns: list[dict]) -> tup
     for column in columns:
         if (column['related']):
             continue
+        if column.get('derived_column'):
+            # derived columns are always evaluated to numbers
+            column = {**column, 'data_type': 'number'}
         columns_by_name[column['name']] = column
 
     new_filters = Q()
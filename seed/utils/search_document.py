@@ -0,0 +1,106 @@
+# !/usr/bin/env python
+# encoding: utf-8
+"""
+SEED Platform (TM), Copyright (c) Alliance for Sustainable Energy, LLC, and other contributors.
+See also https://github.com/seed-platform/seed/main/LICENSE.md
+
+Search document of the -States: the lowercased identifiers, name and address of a -State, and the
+values of a few extra_data keys, joined in one text field which is indexed with a pg_trgm GIN
+index (see seed.search.search_views). The document is derived on save like the normalized
+address, by save() and by StateManager.bulk_save_states.
+"""
+from django.conf import settings
+
+from seed.lib.mcm.utils import batch
+
+# extra_data keys whose values are added to the search documents
+SEARCH_EXTRA_DATA_KEYS = getattr(settings, 'SEED_SEARCH_EXTRA_DATA_KEYS', [])
+
+PROPERTY_SEARCH_FIELDS = [
+    'pm_property_id',
+    'pm_parent_property_id',
+    'jurisdiction_property_id',
+    'custom_id_1',
+    'ubid',
+    'property_name',
+    'address_line_1',
+    'address_line_2',
+    'city',
+    'postal_code',
+]
+
+TAXLOT_SEARCH_FIELDS = [
+    'jurisdiction_tax_lot_id',
+    'custom_id_1',
+    'ubid',
+    'block_number',
+    'address_line_1',
+    'address_line_2',
+    'city',
+    'postal_code',
+]
+
+# number of -States read and updated at once by refresh_search_documents
+REFRESH_CHUNK_SIZE = 5000
+
+
+def search_fields(StateClass):
+    """
+    :param StateClass: PropertyState or TaxLotState
+    :return: list of str, the fields of the -States in the search documents
+    """
+    return PROPERTY_SEARCH_FIELDS if StateClass.__name__ == 'PropertyState' else TAXLOT_SEARCH_FIELDS
+
+
+def _document(values):
+    document = ' '.join(str(value).strip() for value in values if value not in (None, ''))
+    return document.lower() or None
+
+
+def build_search_document(state):
+    """
+    :param state: PropertyState or TaxLotState
+    :return: str, the search document of the -State, None if it has nothing to search
+    """
+    extra_data = state.extra_data or {}
+    return _document(
+        [getattr(state, field) for field in search_fields(type(state))] +
+        [extra_data.get(key) for key in SEARCH_EXTRA_DATA_KEYS]
+    )
+
+
+def affects_search_document(StateClass, field_names):
+    """Whether changing the fields or the extra_data keys changes the search documents
+
+    :param StateClass: PropertyState or TaxLotState
+    :param field_names: iterable of str, fields or extra_data keys
+    :return: bool
+    """
+    searched = set(search_fields(StateClass)) | set(SEARCH_EXTRA_DATA_KEYS)
+    return any(field_name in searched for field_name in field_names)
+
+
+def refresh_search_documents(states, chunk_size=REFRESH_CHUNK_SIZE):
+    """Recompute the search documents of -States which were written without being saved (e.g.,
+    by UPDATE statements), and write the ones which changed
+
+    :param states: QuerySet of PropertyState or TaxLotState
+    :param chunk_size: int, number of -States read and updated at once
+    :return: int, number of -States whose search document changed
+    """
+    StateClass = states.model
+    fields = search_fields(StateClass)
+    rows = states.order_by('id').values_list('id', 'search_document', 'extra_data', *fields).iterator(chunk_size=chunk_size)
+
+    changed_count = 0
+    for rows_chunk in batch(rows, chunk_size):
+        changed_states = []
+        for state_id, search_document, extra_data, *values in rows_chunk:
+            extra_data = extra_data or {}
+            new_search_document = _document(values + [extra_data.get(key) for key in SEARCH_EXTRA_DATA_KEYS])
+            if new_search_document != search_document:
+                changed_states.append(StateClass(id=state_id, search_document=new_search_document))
+        StateClass.objects.bulk_update(changed_states, ['search_document'], batch_size=1000)
+        changed_count += len(changed_states)
+
+    return changed_count
@@ -8,12 +8,11 @@ from calendar import month_name
 from collections import defaultdict
 
 from django.core.paginator import Paginator
-from django.db.models import Avg
-from django.db.models.functions import TruncMonth, TruncYear
+from django.db.models import Sum
 from pytz import timezone
 
 from config.settings.common import TIME_ZONE
-from seed.models import Sensor, SensorReading
+from seed.models import Sensor, SensorReading, SensorReadingRollup
 
 
 class PropertySensorReadingsExporter():
@@ -51,7 +50,8 @@ class PropertySensorReadingsExporter():
         if self.showOnlyOccupiedReadings:
             sensor_readings = sensor_readings.filter(is_occupied=True)
 
-        timestamps = list(sensor_readings.distinct('timestamp').order_by('timestamp').values_list("timestamp", flat=True))
+        # only the timestamps of the page are fetched, the paginator counts them in the database
+        timestamps = sensor_readings.order_by('timestamp').values_list('timestamp', flat=True).distinct()
         paginator = Paginator(timestamps, per_page)
         timestamps_in_page = paginator.page(page)
 
@@ -116,25 +116,11 @@ class PropertySensorReadingsExporter():
             },
         }
 
-        for sensor in self.sensors:
-            field_name = self._build_column_def(sensor, column_defs)
+        for sensor, month_start, avg in self._averages_by_period(SensorReadingRollup.MONTH, column_defs):
+            month_year = '{} {}'.format(month_name[month_start.month], month_start.year)
 
-            sensor_readings = sensor.sensor_readings
-            if self.showOnlyOccupiedReadings:
-                sensor_readings = sensor_readings.filter(is_occupied=True)
-
-            # group by month and avg readings
-            readings_avg_by_month = sensor_readings \
-                .annotate(month=TruncMonth('timestamp')) \
-                .values('month').order_by('month') \
-                .annotate(avg=Avg('reading')) \
-                .values('month', 'avg')
-
-            for reading in readings_avg_by_month:
-                month_year = '{} {}'.format(month_name[reading['month'].month], reading['month'].year)
-
-                monthly_readings[month_year]['month'] = month_year
-                monthly_readings[month_year][field_name] = reading['avg']
+            monthly_readings[month_year]['month'] = month_year
+            monthly_readings[month_year][sensor] = avg
 
         return {
             'readings': list(monthly_readings.values()),
@@ -157,30 +143,45 @@ class PropertySensorReadingsExporter():
             },
         }
 
-        for sensor in self.sensors:
-            field_name = self._build_column_def(sensor, column_defs)
-
-            sensor_readings = sensor.sensor_readings
-            if self.showOnlyOccupiedReadings:
-                sensor_readings = sensor_readings.filter(is_occupied=True)
-
-            readings_avg_by_year = sensor_readings \
-                .annotate(year=TruncYear('timestamp')) \
-                .values('year').order_by('year') \
-                .annotate(avg=Avg('reading')) \
-                .values('year', 'avg')
-
-            for reading in readings_avg_by_year:
-                year = reading['year'].year
+        for sensor, year_start, avg in self._averages_by_period(SensorReadingRollup.YEAR, column_defs):
+            year = year_start.year
 
-                yearly_readings[year]['year'] = year
-                yearly_readings[year][field_name] = reading['avg']
+            yearly_readings[year]['year'] = year
+            yearly_readings[year][sensor] = avg
 
         return {
             'readings': list(yearly_readings.values()),
             'column_defs': list(column_defs.values())
         }
 
+    def _averages_by_period(self, interval, column_defs):
+        """
+        Returns the average reading of each sensor in each month or year from the rollups of
+        the readings (see seed.models.reading_rollups), as tuples of the field name of the
+        sensor, the local start of the period and the average, ordered by sensor then period.
+        """
+        sensors = list(self.sensors)
+        field_name_by_sensor_id = {sensor.id: self._build_column_def(sensor, column_defs) for sensor in sensors}
+
+        rollups = SensorReadingRollup.objects.filter(sensor__in=sensors, interval=interval)
+        if self.showOnlyOccupiedReadings:
+            rollups = rollups.filter(is_occupied=True)
+
+        totals = rollups \
+            .values('sensor_id', 'period_start').order_by('period_start') \
+            .annotate(reading_sum=Sum('reading_sum'), reading_count=Sum('reading_count'))
+
+        averages_by_sensor_id = defaultdict(list)
+        for total in totals:
+            avg = total['reading_sum'] / total['reading_count'] if total['reading_count'] else None
+            averages_by_sensor_id[total['sensor_id']].append((total['period_start'].astimezone(self.tz), avg))
+
+        return [
+            (field_name_by_sensor_id[sensor.id], period_start, avg)
+            for sensor in sensors
+            for period_start, avg in averages_by_sensor_id[sensor.id]
+        ]
+
     def _build_column_def(self, sensor, column_defs):
         field_name = sensor.display_name
         display_name = '{} ({})'.format(field_name, sensor.data_logger.display_name)
@@ -0,0 +1,144 @@
+# !/usr/bin/env python
+# encoding: utf-8
+"""
+SEED Platform (TM), Copyright (c) Alliance for Sustainable Energy, LLC, and other contributors.
+See also https://github.com/seed-platform/seed/main/LICENSE.md
+
+Hashing of PropertyState and TaxLotState objects. The hash is stored in the `hash_object`
+field of the states and is used to find duplicate states during matching, so the digest that
+is generated here must not change between releases without rehashing the existing states (see
+`rehash_states` and the `rehash` management command).
+"""
+import hashlib
+from datetime import datetime
+from functools import lru_cache
+
+from django.apps import apps
+from django.contrib.gis.geos import GEOSGeometry
+from django.utils import timezone as tz
+from django.utils.timezone import make_naive
+
+from seed.lib.mcm.cleaners import normalize_unicode_and_characters
+
+# Value used for the fields that do not exist on the state class so that a missing field can be
+# distinguished from a field that is None.
+MISSING_FIELD_VALUE = 'FOO'
+
+
+@lru_cache(maxsize=None)
+def hash_comparison_fields():
+    """
+    Names of the database fields that are hashed, encoded for the hash. The fields are defined
+    by the models, not by the organization's columns, so they are only computed once per process.
+
+    :return: tuple of tuples, (field name, encoded field name)
+    """
+    Column = apps.get_model('seed', 'Column')
+    return tuple(
+        (field, field.encode('utf-8'))
+        for field in Column.retrieve_db_field_name_for_hash_comparison()
+    )
+
+
+@lru_cache(maxsize=10000)
+def _normalized_key(key):
+    """extra_data keys repeat across every state of an import, so cache their normalized form"""
+    return str(normalize_unicode_and_characters(key)).encode('utf-8')
+
+
+def _field_value_repr(value):
+    if isinstance(value, datetime):
+        # if this is a datetime, then make sure to save the string as a naive datetime.
+        # Somehow, somewhere the data are being saved in mapping with a timezone,
+        # then in matching they are removed (but the time is updated correctly)
+        return str(make_naive(value).astimezone(tz.utc).isoformat()).encode('utf-8')
+    elif isinstance(value, GEOSGeometry):
+        return GEOSGeometry(value, srid=4326).wkt.encode('utf-8')
+    else:
+        return str(value).encode('utf-8')
+
+
+def _extra_data_parts(parts, dict_obj):
+    assert isinstance(dict_obj, dict)
+
+    for key in sorted(dict_obj):
+        value = dict_obj[key]
+        if isinstance(value, dict):
+            _extra_data_parts(parts, value)
+        else:
+            parts.append(_normalized_key(key))
+            if isinstance(value, str):
+                parts.append(normalize_unicode_and_characters(value).encode('utf-8'))
+            else:
+                parts.append(str(value).encode('utf-8'))
+    return parts
+
+
+def hash_state_object(obj, include_extra_data=True):
+    """
+    MD5 of the database fields (and optionally the extra_data) of a state.
+
+    The canonical representation of the state is built as a list of byte strings and hashed
+    with a single update, which produces the same digest as hashing each piece separately.
+
+    :param obj: PropertyState or TaxLotState instance
+    :param include_extra_data: bool, whether to include the extra_data in the hash
+    :return: str, hex digest
+    """
+    parts = []
+    for field, encoded_field in hash_comparison_fields():
+        parts.append(encoded_field)
+        parts.append(_field_value_repr(getattr(obj, field, MISSING_FIELD_VALUE)))
+
+    if include_extra_data:
+        _extra_data_parts(parts, obj.extra_data)
+
+    return hashlib.md5(b''.join(parts)).hexdigest()
+
+
+@lru_cache(maxsize=None)
+def _empty_state_hash(table_name):
+    StateClass = apps.get_model('seed', table_name)
+    return hash_state_object(StateClass(), include_extra_data=False)
+
+
+def empty_state_hash(StateClass):
+    """
+    Hash (without extra_data) of a state that has no data. Mapped rows with this hash are
+    skipped. The organization and the other foreign keys are not part of the hash, so the value
+    only depends on the state class and is computed once per process for each class.
+
+    :param StateClass: PropertyState or TaxLotState
+    :return: str, hex digest
+    """
+    return _empty_state_hash(StateClass.__name__)
+
+
+def rehash_states(queryset, batch_size=1000):
+    """
+    Recompute the hash_object of existing states and write the hashes that changed in bulk.
+    Unlike state.save(), this does not recompute the normalized address nor send the save signals.
+
+    :param queryset: QuerySet of PropertyState or TaxLotState
+    :param batch_size: int, number of states to load and update at a time
+    :return: int, number of states whose hash changed
+    """
+    StateClass = queryset.model
+    updated = 0
+    changed_states = []
+    for state in queryset.order_by('id').iterator(chunk_size=batch_size):
+        new_hash = hash_state_object(state)
+        if state.hash_object != new_hash:
+            state.hash_object = new_hash
+            changed_states.append(state)
+
+        if len(changed_states) >= batch_size:
+            StateClass.objects.bulk_update(changed_states, ['hash_object'])
+            updated += len(changed_states)
+            changed_states = []
+
+    if changed_states:
+        StateClass.objects.bulk_update(changed_states, ['hash_object'])
+        updated += len(changed_states)
+
+    return updated
@@ -0,0 +1,175 @@
+# !/usr/bin/env python
+# encoding: utf-8
+"""
+SEED Platform (TM), Copyright (c) Alliance for Sustainable Energy, LLC, and other contributors.
+See also https://github.com/seed-platform/seed/main/LICENSE.md
+
+History of PropertyStates and TaxLotStates from their audit logs. The audit logs form a tree
+(each merge has two parent logs), which is loaded for any number of -States with a single
+recursive query and then traversed in memory.
+"""
+import re
+from os import path
+
+from django.conf import settings
+from django.db import connection
+
+from seed.utils.time import convert_to_js_timestamp
+
+MERGE_LOG_NAMES = ['Manual Match', 'System Match', 'Merge current state in migration']
+RECORD_LOG_NAMES = ['Import Creation', 'Manual Edit']
+
+TEMPORARY_FILE_SUFFIX = re.compile('(.*?)(_[a-zA-Z0-9]{7})$')
+
+
+def _audit_log_tree(AuditLogClass, state_ids):
+    """Latest audit log of each -State and all of their ancestors
+
+    :param AuditLogClass: PropertyAuditLog or TaxLotAuditLog
+    :param state_ids: list of ints
+    :return: dict, audit log id to audit log
+    """
+    table = connection.ops.quote_name(AuditLogClass._meta.db_table)
+    sql = f"""
+        WITH RECURSIVE latest AS (
+            SELECT DISTINCT ON (state_id) id
+            FROM {table}
+            WHERE state_id = ANY(%s)
+            ORDER BY state_id, id DESC
+        ), tree AS (
+            SELECT log.id, log.parent1_id, log.parent2_id
+            FROM {table} log
+            JOIN latest ON latest.id = log.id
+            UNION
+            SELECT parent.id, parent.parent1_id, parent.parent2_id
+            FROM {table} parent
+            JOIN tree ON parent.id IN (tree.parent1_id, tree.parent2_id)
+        )
+        SELECT id FROM tree
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [list(state_ids)])
+        log_ids = [row[0] for row in cursor.fetchall()]
+
+    return AuditLogClass.objects.in_bulk(log_ids)
+
+
+def _record_dict(log, states_by_id, include_file):
+    filename = file = None
+    if log.import_filename:
+        filename = path.basename(log.import_filename)
+        file = settings.MEDIA_URL + '/'.join(log.import_filename.split('/')[-2:])
+
+    if filename:
+        # Attempt to remove NamedTemporaryFile suffix
+        name, ext = path.splitext(filename)
+        match = TEMPORARY_FILE_SUFFIX.match(name)
+        if match:
+            filename = match.groups()[0] + ext
+
+    record = {
+        'state_id': log.state_id,
+        'state_data': states_by_id[log.state_id],
+        'date_edited': convert_to_js_timestamp(log.created),
+        'source': log.get_record_type_display(),
+        'filename': filename,
+    }
+    if include_file:
+        record['file'] = file
+    return record
+
+
+def _record_logs(log, logs_by_id, max_records):
+    """Audit logs of the history of the latest audit log of a -State, most recent first. In the
+    records, parent2 is most recent, so parent2 is navigated first.
+    """
+    def parent(log, number):
+        return logs_by_id.get(getattr(log, f'parent{number}_id'))
+
+    def is_import_matched_within_file(log):
+        # an import file which matched within itself, and then matched with existing records
+        parent1, parent2 = parent(log, 1), parent(log, 2)
+        return log.name == 'System Match' and parent1 is not None and parent1.name == 'Import Creation' and \
+            parent2 is not None and parent2.name == 'Import Creation'
+
+    records = []
+    if log.name in MERGE_LOG_NAMES:
+        while True:
+            # if there is no parents, then break out immediately
+            if (log.parent1_id is None and log.parent2_id is None) or log.name == 'Manual Edit':
+                break
+
+            # If no new tree is found, then we will not iterate
+            tree = None
+            for number in (2, 1):
+                parent_log = parent(log, number)
+                if parent_log is None:
+                    continue
+                if parent_log.name in RECORD_LOG_NAMES:
+                    records.append(parent_log)
+                elif is_import_matched_within_file(parent_log):
+                    records.append(parent(parent_log, 2))
+                    records.append(parent(parent_log, 1))
+                else:
+                    tree = parent_log
+
+            if max_records is not None and len(records) >= max_records:
+                records = records[:max_records]
+                break
+
+            if tree is None:
+                break
+            log = tree
+
+    elif log.name == 'Manual Edit':
+        if parent(log, 1) is not None:
+            records.append(parent(log, 1))
+    elif log.name == 'Import Creation':
+        records.append(log)
+
+    return records
+
+
+def state_histories(AuditLogClass, states, max_records=None, include_file=False):
+    """History of many -States at once, from their audit logs. The audit logs are loaded in one
+    query and the -States of the history records in another.
+
+    :param AuditLogClass: PropertyAuditLog or TaxLotAuditLog
+    :param states: list or QuerySet of PropertyState or TaxLotState
+    :param max_records: int, optional, maximum number of history records per -State
+    :param include_file: bool, whether to include the media url of the import files
+    :return: dict, -State id to a tuple, (history as a list most recent first, the main record)
+    """
+    states = list(states)
+    if not states:
+        return {}
+    StateClass = states[0].__class__
+
+    logs_by_id = _audit_log_tree(AuditLogClass, [state.id for state in states])
+
+    latest_logs = {}
+    for log in logs_by_id.values():
+        if log.state_id not in latest_logs or log.id > latest_logs[log.state_id].id:
+            latest_logs[log.state_id] = log
+
+    record_logs = {}
+    for state in states:
+        log = latest_logs.get(state.id)
+        record_logs[state.id] = _record_logs(log, logs_by_id, max_records) if log else []
+
+    record_state_ids = {log.state_id for logs in record_logs.values() for log in logs}
+    states_by_id = StateClass.objects.in_bulk(record_state_ids)
+    states_by_id.update({state.id: state for state in states})
+
+    histories = {}
+    for state in states:
+        log = latest_logs.get(state.id)
+        main = {
+            'state_id': state.id,
+            'state_data': state,
+            'date_edited': convert_to_js_timestamp(log.created) if log else None,
+        }
+        history = [_record_dict(record_log, states_by_id, include_file) for record_log in record_logs[state.id]]
+        histories[state.id] = (history, main)
+
+    return histories
@@ -10,6 +10,9 @@ from buildingid.code import decode
 from django.contrib.gis.geos import GEOSGeometry
 from django.db import connection
 
+from seed.lib.mcm.utils import batch
+from seed.utils.ubid_batch import jaccard_indexes
+
 _log = logging.getLogger(__name__)
 
 
@@ -21,9 +24,48 @@ def centroid_wkt(state):
         return GEOSGeometry(state.centroid, srid=4326).wkt
 
 
+def decode_state_ubid(state):
+    """Set the bounding box, centroid, latitude and longitude of a PropertyState or TaxLotState
+    from its UBID, without saving it
+
+    :param state: PropertyState or TaxLotState, with a UBID
+    :return: bool, whether the UBID could be decoded
+    """
+    try:
+        bounding_box_obj = decode(getattr(state, 'ubid'))
+    except ValueError:
+        _log.error(f"Could not decode UBID '{getattr(state, 'ubid')}'")
+        return False  # state with an incorrectly formatted UBID is skipped
+
+    # Starting with the SE point, list the points in counter-clockwise order
+    bounding_box_polygon = (
+        f"POLYGON (({bounding_box_obj.longitudeHi} {bounding_box_obj.latitudeLo}, "
+        f"{bounding_box_obj.longitudeHi} {bounding_box_obj.latitudeHi}, "
+        f"{bounding_box_obj.longitudeLo} {bounding_box_obj.latitudeHi}, "
+        f"{bounding_box_obj.longitudeLo} {bounding_box_obj.latitudeLo}, "
+        f"{bounding_box_obj.longitudeHi} {bounding_box_obj.latitudeLo}))"
+    )
+    state.bounding_box = bounding_box_polygon
+
+    # Starting with the SE point, list the points in counter-clockwise order
+    centroid_polygon = (
+        f"POLYGON (({bounding_box_obj.centroid.longitudeHi} {bounding_box_obj.centroid.latitudeLo}, "
+        f"{bounding_box_obj.centroid.longitudeHi} {bounding_box_obj.centroid.latitudeHi}, "
+        f"{bounding_box_obj.centroid.longitudeLo} {bounding_box_obj.centroid.latitudeHi}, "
+        f"{bounding_box_obj.centroid.longitudeLo} {bounding_box_obj.centroid.latitudeLo}, "
+        f"{bounding_box_obj.centroid.longitudeHi} {bounding_box_obj.centroid.latitudeLo}))"
+    )
+    state.centroid = centroid_polygon
+
+    state.latitude, state.longitude = bounding_box_obj.latlng()
+
+    return True
+
+
 # Decode UBIDs from queryset or individual PropertyState/TaxLotState
 def decode_unique_ids(qs):
     # import here to prevent circular reference
+    from seed.models.managers import BULK_SAVE_BATCH_SIZE
     from seed.models.properties import PropertyState
     from seed.models.tax_lots import TaxLotState
 
@@ -41,36 +83,11 @@ def decode_unique_ids(qs):
 
     filtered_qs = qs.exclude(ubid__isnull=True)
 
-    for state in filtered_qs.iterator():
-        try:
-            bounding_box_obj = decode(getattr(state, 'ubid'))
-        except ValueError:
-            _log.error(f"Could not decode UBID '{getattr(state, 'ubid')}'")
-            continue  # state with an incorrectly formatted UBID is skipped
-
-        # Starting with the SE point, list the points in counter-clockwise order
-        bounding_box_polygon = (
-            f"POLYGON (({bounding_box_obj.longitudeHi} {bounding_box_obj.latitudeLo}, "
-            f"{bounding_box_obj.longitudeHi} {bounding_box_obj.latitudeHi}, "
-            f"{bounding_box_obj.longitudeLo} {bounding_box_obj.latitudeHi}, "
-            f"{bounding_box_obj.longitudeLo} {bounding_box_obj.latitudeLo}, "
-            f"{bounding_box_obj.longitudeHi} {bounding_box_obj.latitudeLo}))"
-        )
-        state.bounding_box = bounding_box_polygon
-
-        # Starting with the SE point, list the points in counter-clockwise order
-        centroid_polygon = (
-            f"POLYGON (({bounding_box_obj.centroid.longitudeHi} {bounding_box_obj.centroid.latitudeLo}, "
-            f"{bounding_box_obj.centroid.longitudeHi} {bounding_box_obj.centroid.latitudeHi}, "
-            f"{bounding_box_obj.centroid.longitudeLo} {bounding_box_obj.centroid.latitudeHi}, "
-            f"{bounding_box_obj.centroid.longitudeLo} {bounding_box_obj.centroid.latitudeLo}, "
-            f"{bounding_box_obj.centroid.longitudeHi} {bounding_box_obj.centroid.latitudeLo}))"
-        )
-        state.centroid = centroid_polygon
-
-        state.latitude, state.longitude = bounding_box_obj.latlng()
-
-        state.save()
+    # the decoded -States are saved in batches, which also syncs their coordinates and UBID models
+    for states in batch(filtered_qs.iterator(), BULK_SAVE_BATCH_SIZE):
+        decoded_states = [state for state in states if decode_state_ubid(state)]
+        if decoded_states:
+            filtered_qs.model.objects.bulk_save_states(decoded_states, ['bounding_box', 'centroid'])
 
 
 def get_jaccard_index(ubid1, ubid2):
@@ -84,26 +101,7 @@ def get_jaccard_index(ubid1, ubid2):
     @param ubid2 [text] A Property State Ubid
     @return [numeric] The Jaccard index.
     """
-    if (not ubid1 or not ubid2) or (ubid1 == ubid2):
-        return 1.0
-
-    if not validate_ubid(ubid1) or not validate_ubid(ubid2):
-        return 0.0
-
-    sql = """ WITH decoded AS (
-                SELECT
-                    UBID_Decode(%s) AS left_code_area,
-                    UBID_Decode(%s) AS right_code_area
-            )
-            SELECT
-                UBID_CodeArea_Jaccard(left_code_area, right_code_area)
-            FROM
-                decoded """
-
-    with connection.cursor() as cursor:
-        cursor.execute(sql, [ubid1, ubid2])
-        result = cursor.fetchone()[0]
-    return result
+    return jaccard_indexes([(ubid1, ubid2)])[0]
 
 
 def validate_ubid(ubid):
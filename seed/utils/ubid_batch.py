@@ -0,0 +1,191 @@
+# !/usr/bin/env python
+# encoding: utf-8
+"""
+SEED Platform (TM), Copyright (c) Alliance for Sustainable Energy, LLC, and other contributors.
+See also https://github.com/seed-platform/seed/main/LICENSE.md
+
+UBID comparisons in batches. The UBIDs are decoded to their code areas with one query per batch
+(using the same UBID_Decode database function as get_jaccard_index), and the Jaccard indexes are
+then computed in Python with the same numeric arithmetic as UBID_CodeArea_Jaccard. A grid index of
+the code areas limits the comparisons to the code areas which overlap.
+"""
+import math
+from collections import defaultdict, namedtuple
+
+from django.db import connection
+
+from seed.lib.mcm.utils import batch
+
+CodeArea = namedtuple('CodeArea', ['lat_lo', 'lng_lo', 'lat_hi', 'lng_hi'])
+
+# number of UBIDs decoded per query
+DECODE_BATCH_SIZE = 5000
+
+# size, in degrees, of the cells of the grid index, about the size of a city block
+GRID_CELL_SIZE = 0.001
+
+# code areas covering more cells than this are not gridded but compared with every code area
+GRID_MAX_CELLS = 64
+
+
+def decode_code_areas(ubids):
+    """Decode UBIDs to their code areas, with one query per batch of UBIDs
+
+    :param ubids: iterable of str
+    :return: dict, UBID to CodeArea, without the UBIDs that aren't valid
+    """
+    # invalid UBIDs are filtered before they are decoded, as UBID_Decode raises on them
+    sql = """
+        SELECT valid.code, decoded.lat_lo, decoded.lng_lo, decoded.lat_hi, decoded.lng_hi
+        FROM (
+            SELECT code
+            FROM unnest(%s::text[]) AS ubids(code)
+            WHERE pluscode_isvalid(split_part(code, '-', 1)) AND UBID_IsValid(code)
+        ) AS valid,
+        LATERAL UBID_Decode(valid.code) AS decoded(
+            lat_lo numeric, lng_lo numeric, lat_hi numeric, lng_hi numeric,
+            centroid_lat_lo numeric, centroid_lng_lo numeric, centroid_lat_hi numeric, centroid_lng_hi numeric,
+            centroid_code_length integer
+        )
+    """
+    code_areas = {}
+    ubids = sorted({ubid for ubid in ubids if ubid})
+    with connection.cursor() as cursor:
+        for ubids_batch in batch(ubids, DECODE_BATCH_SIZE):
+            cursor.execute(sql, [ubids_batch])
+            for code, *bounds in cursor.fetchall():
+                code_areas[code] = CodeArea(*bounds)
+    return code_areas
+
+
+def code_areas_overlap(left, right):
+    return left.lat_lo < right.lat_hi and right.lat_lo < left.lat_hi and \
+        left.lng_lo < right.lng_hi and right.lng_lo < left.lng_hi
+
+
+def code_area_jaccard(left, right):
+    """Jaccard index of two code areas, see UBID_CodeArea_Jaccard
+
+    :param left: CodeArea
+    :param right: CodeArea
+    :return: Decimal, or 0 if the code areas don't overlap
+    """
+    intersection_lat_lo = max(left.lat_lo, right.lat_lo)
+    intersection_lat_hi = min(left.lat_hi, right.lat_hi)
+    intersection_lng_lo = max(left.lng_lo, right.lng_lo)
+    intersection_lng_hi = min(left.lng_hi, right.lng_hi)
+    if intersection_lat_lo > intersection_lat_hi or intersection_lng_lo > intersection_lng_hi:
+        return 0
+
+    intersection_area = (intersection_lat_hi - intersection_lat_lo) * (intersection_lng_hi - intersection_lng_lo)
+    left_area = (left.lat_hi - left.lat_lo) * (left.lng_hi - left.lng_lo)
+    right_area = (right.lat_hi - right.lat_lo) * (right.lng_hi - right.lng_lo)
+    return intersection_area / (left_area + right_area - intersection_area)
+
+
+def jaccard_indexes(pairs, code_areas=None):
+    """Jaccard indexes of many pairs of UBIDs, with the same special cases as get_jaccard_index:
+    1.0 if a UBID is empty or if the UBIDs are equal, 0.0 if a UBID is invalid.
+
+    :param pairs: list of tuples, (ubid, ubid)
+    :param code_areas: dict, optional, UBID to CodeArea of already decoded UBIDs
+    :return: list, Jaccard index of each pair
+    """
+    code_areas = code_areas if code_areas is not None else {}
+    compared = [(ubid1, ubid2) for ubid1, ubid2 in pairs if ubid1 and ubid2 and ubid1 != ubid2]
+    missing = {ubid for pair in compared for ubid in pair if ubid not in code_areas}
+    decoded = decode_code_areas(missing) if missing else {}
+
+    results = []
+    for ubid1, ubid2 in pairs:
+        if (not ubid1 or not ubid2) or (ubid1 == ubid2):
+            results.append(1.0)
+            continue
+        left = code_areas.get(ubid1) or decoded.get(ubid1)
+        right = code_areas.get(ubid2) or decoded.get(ubid2)
+        if left is None or right is None:
+            results.append(0.0)
+        else:
+            results.append(code_area_jaccard(left, right))
+    return results
+
+
+def is_jaccard_match(jaccard_index, ubid_threshold):
+    # If threshold is 0 then it will match any UBID with overlap
+    if ubid_threshold == 0:
+        return jaccard_index > ubid_threshold
+    else:
+        return jaccard_index >= ubid_threshold
+
+
+class CodeAreaIndex(object):
+    """Grid index of the code areas of items (e.g., -State ids), to find the items whose code area
+    overlaps a given code area without comparing it with every code area.
+
+    usage:
+            index = CodeAreaIndex()
+            index.add(state.id, code_area)
+            state_ids = index.overlapping(other_code_area)
+    """
+
+    def __init__(self, cell_size=GRID_CELL_SIZE):
+        self.cell_size = cell_size
+        self._cells = defaultdict(set)
+        self._large = set()
+        self._areas = {}
+
+    def _cell_range(self, code_area):
+        return (
+            range(math.floor(float(code_area.lat_lo) / self.cell_size), math.floor(float(code_area.lat_hi) / self.cell_size) + 1),
+            range(math.floor(float(code_area.lng_lo) / self.cell_size), math.floor(float(code_area.lng_hi) / self.cell_size) + 1),
+        )
+
+    def add(self, item, code_area):
+        """
+        :param item: hashable
+        :param code_area: CodeArea
+        """
+        self.remove(item)
+        self._areas[item] = code_area
+        lat_cells, lng_cells = self._cell_range(code_area)
+        if len(lat_cells) * len(lng_cells) > GRID_MAX_CELLS:
+            self._large.add(item)
+            return
+        for lat_cell in lat_cells:
+            for lng_cell in lng_cells:
+                self._cells[(lat_cell, lng_cell)].add(item)
+
+    def remove(self, item):
+        code_area = self._areas.pop(item, None)
+        if code_area is None:
+            return
+        if item in self._large:
+            self._large.discard(item)
+            return
+        lat_cells, lng_cells = self._cell_range(code_area)
+        for lat_cell in lat_cells:
+            for lng_cell in lng_cells:
+                cell = self._cells.get((lat_cell, lng_cell))
+                if cell is not None:
+                    cell.discard(item)
+                    if not cell:
+                        del self._cells[(lat_cell, lng_cell)]
+
+    def overlapping(self, code_area):
+        """Items whose code area overlaps the code area
+
+        :param code_area: CodeArea
+        :return: set of items
+        """
+        items = set(self._large)
+        lat_cells, lng_cells = self._cell_range(code_area)
+        if len(lat_cells) * len(lng_cells) > GRID_MAX_CELLS:
+            items.update(self._areas)
+        else:
+            for lat_cell in lat_cells:
+                for lng_cell in lng_cells:
+                    items.update(self._cells.get((lat_cell, lng_cell), ()))
+        return {item for item in items if code_areas_overlap(self._areas[item], code_area)}
+
+    def __len__(self):
+        return len(self._areas)
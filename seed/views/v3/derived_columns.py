@@ -22,6 +22,7 @@ from seed.utils.api_schema import (
     AutoSchemaHelper,
     swagger_auto_schema_org_query_param
 )
+from seed.utils.column_cache import invalidate_column_metadata
 
 
 class DerivedColumnViewSet(viewsets.ViewSet, OrgMixin):
@@ -142,6 +143,7 @@ class DerivedColumnViewSet(viewsets.ViewSet, OrgMixin):
         try:
             serializer.save()
             Column.objects.filter(derived_column=pk).update(column_name=data['name'], display_name=data['name'], column_description=data['name'])
+            invalidate_column_metadata(org_id)
             return JsonResponse({
                 'status': 'success',
                 'derived_column': serializer.data,
@@ -239,11 +241,12 @@ class DerivedColumnViewSet(viewsets.ViewSet, OrgMixin):
             'cycle_id': cycle_id,
         }).prefetch_related('state', inventory_name)
 
+        values = derived_column.evaluate_batch(view.state for view in inventory_views)
         results = []
-        for view in inventory_views:
+        for view, value in zip(inventory_views, values):
             results.append({
                 'id': getattr(view, inventory_name).id,
-                'value': derived_column.evaluate(view.state)
+                'value': value
             })
 
         return JsonResponse({
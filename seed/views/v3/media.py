@@ -76,6 +76,15 @@ def check_file_permission(user, filepath):
             raise ModelForFileNotFound('AnalysisOutputFile not found')
         organization = analysis_property_view.cycle.organization
 
+    elif base_dir == 'inventory_exports':
+        try:
+            _, organization_id, _, _ = filepath_parts
+            organization = Organization.objects.get(id=organization_id)
+        except ValueError:
+            raise ModelForFileNotFound('File path for inventory_exports was an unexpected structure')
+        except Organization.DoesNotExist:
+            raise ModelForFileNotFound('Organization for inventory export not found')
+
     elif base_dir == 'inventory_documents':
         try:
             inventory_document = InventoryDocument.objects.get(file__in=[absolute_filepath, filepath])
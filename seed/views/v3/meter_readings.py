@@ -13,6 +13,7 @@ from rest_framework.renderers import JSONRenderer
 from seed.models import MeterReading, PropertyView
 from seed.serializers.meter_readings import MeterReadingSerializer
 from seed.utils.api_schema import AutoSchemaHelper
+from seed.utils.reading_rollups import refresh_meter_rollups
 from seed.utils.viewsets import SEEDOrgModelViewSet
 
 
@@ -100,6 +101,29 @@ class MeterReadingViewSet(SEEDOrgModelViewSet):
 
         # check permissions?
         if self.meter_pk:
-            serializer.save(meter_id=self.meter_pk)
+            readings = serializer.save(meter_id=self.meter_pk)
         else:
             raise Exception('No meter_pk provided in URL to create the meter reading')
+
+        # the readings are upserted in bulk without signals, so their rollups are refreshed here
+        readings = readings if isinstance(readings, list) else [readings]
+        if readings:
+            refresh_meter_rollups(
+                [self.meter_pk],
+                min(reading.start_time for reading in readings),
+                max(reading.end_time for reading in readings),
+            )
+
+    def perform_update(self, serializer):
+        previous_reading = serializer.instance
+        previous_times = (previous_reading.start_time, previous_reading.end_time)
+        reading = serializer.save()
+
+        # the rollups of the new times are refreshed when the reading is saved
+        refresh_meter_rollups([reading.meter_id], *previous_times)
+
+    def perform_destroy(self, instance):
+        # start_time is the primary key, which is cleared by the delete
+        meter_id, start_time, end_time = instance.meter_id, instance.start_time, instance.end_time
+        instance.delete()
+        refresh_meter_rollups([meter_id], start_time, end_time)
@@ -62,6 +62,7 @@ from seed.models import (
 )
 from seed.models import StatusLabel as Label
 from seed.models import TaxLotProperty, TaxLotView
+from seed.search import QUICK_SEARCH_LIMIT, search_views
 from seed.serializers.analyses import AnalysisSerializer
 from seed.serializers.pint import PintJSONEncoder
 from seed.serializers.properties import (
@@ -405,6 +406,11 @@ class PropertyViewSet(generics.GenericAPIView, viewsets.ViewSet, OrgMixin, Profi
                 required=False,
                 description='Page to fetch'
             ),
+            AutoSchemaHelper.query_string_field(
+                'cursor',
+                required=False,
+                description='Fetch the page after this cursor (the "next_cursor" of the previous page) instead of fetching by page number. Pass an empty cursor for the first page'
+            ),
             AutoSchemaHelper.query_boolean_field(
                 'include_related',
                 required=False,
@@ -476,6 +482,11 @@ class PropertyViewSet(generics.GenericAPIView, viewsets.ViewSet, OrgMixin, Profi
                 required=False,
                 description='Page to fetch'
             ),
+            AutoSchemaHelper.query_string_field(
+                'cursor',
+                required=False,
+                description='Fetch the page after this cursor (the "next_cursor" of the previous page) instead of fetching by page number. Pass an empty cursor for the first page'
+            ),
             AutoSchemaHelper.query_boolean_field(
                 'include_related',
                 required=False,
@@ -521,6 +532,51 @@ class PropertyViewSet(generics.GenericAPIView, viewsets.ViewSet, OrgMixin, Profi
 
         return get_filtered_results(request, 'property', profile_id=profile_id)
 
+    @swagger_auto_schema(
+        manual_parameters=[
+            AutoSchemaHelper.query_org_id_field(required=True),
+            AutoSchemaHelper.query_integer_field(
+                'cycle',
+                required=True,
+                description='The ID of the cycle to search'
+            ),
+            AutoSchemaHelper.query_string_field(
+                'q',
+                required=True,
+                description='Search string, matched against the identifiers, name and address of the properties'
+            ),
+            AutoSchemaHelper.query_integer_field(
+                'limit',
+                required=False,
+                description=f'Maximum number of views returned, from 1 to {QUICK_SEARCH_LIMIT} (default is {QUICK_SEARCH_LIMIT})'
+            ),
+        ]
+    )
+    @api_endpoint_class
+    @ajax_request_class
+    @has_perm_class('requires_viewer')
+    @action(detail=False, methods=['GET'])
+    def quick_search(self, request):
+        """
+        Search the properties of a cycle, returning the IDs of the matching Property views, best match first
+        """
+        org_id = self.get_organization(request)
+        try:
+            cycle_id = int(request.query_params['cycle'])
+            limit = max(1, min(int(request.query_params.get('limit', QUICK_SEARCH_LIMIT)), QUICK_SEARCH_LIMIT))
+        except (KeyError, ValueError):
+            return JsonResponse({
+                'status': 'error',
+                'message': 'Query parameter "cycle" must be an ID and "limit" must be an integer'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        view_ids, timed_out = search_views('property', org_id, cycle_id, request.query_params.get('q', ''), limit=limit)
+        return JsonResponse({
+            'status': 'success',
+            'view_ids': view_ids,
+            'timed_out': timed_out,
+        })
+
     @swagger_auto_schema(
         manual_parameters=[AutoSchemaHelper.query_org_id_field(required=True)],
         request_body=AutoSchemaHelper.schema_factory(
@@ -29,6 +29,7 @@ from seed.models import (
     TaxLotState,
     TaxLotView
 )
+from seed.search import QUICK_SEARCH_LIMIT, search_views
 from seed.serializers.properties import PropertyViewSerializer
 from seed.serializers.taxlots import (
     TaxLotSerializer,
@@ -108,6 +109,11 @@ class TaxlotViewSet(viewsets.ViewSet, OrgMixin, ProfileIdMixin):
                 required=False,
                 description='The number of items per page to return'
             ),
+            AutoSchemaHelper.query_string_field(
+                'cursor',
+                required=False,
+                description='Fetch the page after this cursor (the "next_cursor" of the previous page) instead of fetching by page number. Pass an empty cursor for the first page'
+            ),
             AutoSchemaHelper.query_integer_field(
                 'profile_id',
                 required=False,
@@ -185,6 +191,11 @@ class TaxlotViewSet(viewsets.ViewSet, OrgMixin, ProfileIdMixin):
                 required=False,
                 description='The number of items per page to return'
             ),
+            AutoSchemaHelper.query_string_field(
+                'cursor',
+                required=False,
+                description='Fetch the page after this cursor (the "next_cursor" of the previous page) instead of fetching by page number. Pass an empty cursor for the first page'
+            ),
             AutoSchemaHelper.query_boolean_field(
                 'include_related',
                 required=False,
@@ -225,6 +236,51 @@ class TaxlotViewSet(viewsets.ViewSet, OrgMixin, ProfileIdMixin):
 
         return get_filtered_results(request, 'taxlot', profile_id=profile_id)
 
+    @swagger_auto_schema(
+        manual_parameters=[
+            AutoSchemaHelper.query_org_id_field(required=True),
+            AutoSchemaHelper.query_integer_field(
+                'cycle',
+                required=True,
+                description='The ID of the cycle to search'
+            ),
+            AutoSchemaHelper.query_string_field(
+                'q',
+                required=True,
+                description='Search string, matched against the identifiers, name and address of the tax lots'
+            ),
+            AutoSchemaHelper.query_integer_field(
+                'limit',
+                required=False,
+                description=f'Maximum number of views returned, from 1 to {QUICK_SEARCH_LIMIT} (default is {QUICK_SEARCH_LIMIT})'
+            ),
+        ]
+    )
+    @api_endpoint_class
+    @ajax_request_class
+    @has_perm_class('requires_viewer')
+    @action(detail=False, methods=['GET'])
+    def quick_search(self, request):
+        """
+        Search the tax lots of a cycle, returning the IDs of the matching TaxLot views, best match first
+        """
+        org_id = self.get_organization(request)
+        try:
+            cycle_id = int(request.query_params['cycle'])
+            limit = max(1, min(int(request.query_params.get('limit', QUICK_SEARCH_LIMIT)), QUICK_SEARCH_LIMIT))
+        except (KeyError, ValueError):
+            return JsonResponse({
+                'status': 'error',
+                'message': 'Query parameter "cycle" must be an ID and "limit" must be an integer'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        view_ids, timed_out = search_views('taxlot', org_id, cycle_id, request.query_params.get('q', ''), limit=limit)
+        return JsonResponse({
+            'status': 'success',
+            'view_ids': view_ids,
+            'timed_out': timed_out,
+        })
+
     @swagger_auto_schema(
         manual_parameters=[
             AutoSchemaHelper.query_org_id_field(),
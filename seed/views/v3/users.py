@@ -24,6 +24,7 @@ from seed.lib.superperms.orgs.models import (
     Organization,
     OrganizationUser
 )
+from seed.lib.superperms.orgs.org_cache import invalidate_organization
 from seed.models.data_quality import Rule
 from seed.tasks import invite_to_seed
 from seed.utils.api import OrgMixin, api_endpoint_class
@@ -200,6 +201,7 @@ class UserViewSet(viewsets.ViewSet, OrgMixin):
                 organization_id=org.pk,
                 user_id=user.pk
             ).update(role_level=get_role_from_js(role))
+            invalidate_organization(org.pk)
 
         if created:
             user.set_unusable_password()